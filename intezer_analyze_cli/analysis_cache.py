@@ -0,0 +1,117 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+from typing import Optional
+
+from intezer_analyze_cli import key_store
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    api_url TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    analysis_id TEXT NOT NULL,
+    analyzed_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (api_url, sha256)
+);
+CREATE INDEX IF NOT EXISTS analyses_accessed_at ON analyses (accessed_at);
+'''
+
+
+class CachedAnalysis(NamedTuple):
+    analysis_id: str
+    analyzed_at: float
+
+
+class AnalysisCache:
+    """
+    A persistent cache of the latest analysis of every hash, by the account API URL and the SHA256.
+    Entries older than the TTL are removed, and when there are more than max_entries the least recently used
+    entries are removed. The cache may be used by several threads, updates are committed in batches.
+    """
+
+    def __init__(self,
+                 api_url: str,
+                 cache_path: str = None,
+                 ttl: float = None,
+                 max_entries: int = None,
+                 commit_interval: int = None):
+        self.api_url = api_url
+        self.cache_path = cache_path or key_store.get_key_file_path(default_config.analysis_cache_file_name)
+        self.ttl = ttl or default_config.analysis_cache_ttl
+        self.max_entries = max_entries or default_config.analysis_cache_max_entries
+        self.commit_interval = commit_interval or default_config.file_index_commit_interval
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._uncommitted_number = 0
+
+    def __enter__(self) -> 'AnalysisCache':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, sha256: str, max_age: float) -> Optional[CachedAnalysis]:
+        """The cached analysis of the hash, unless it's older than max_age seconds"""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT analysis_id, analyzed_at FROM analyses WHERE api_url = ? AND sha256 = ? AND analyzed_at >= ?',
+                (self.api_url, sha256.lower(), now - min(max_age, self.ttl))).fetchone()
+            if not row:
+                return None
+            self._connection.execute('UPDATE analyses SET accessed_at = ? WHERE api_url = ? AND sha256 = ?',
+                                     (now, self.api_url, sha256.lower()))
+            self._count_update()
+        return CachedAnalysis(*row)
+
+    def set(self, sha256: str, analysis_id: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO analyses (api_url, sha256, analysis_id, analyzed_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self.api_url, sha256.lower(), analysis_id, now, now))
+            self._count_update()
+
+    def _count_update(self):
+        self._uncommitted_number += 1
+        if self._uncommitted_number >= self.commit_interval:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._uncommitted_number = 0
+
+    def evict(self) -> int:
+        """
+        Remove the expired entries, and the least recently used entries above max_entries.
+
+        :return: The number of removed entries
+        """
+        with self._lock:
+            removed_number = self._connection.execute('DELETE FROM analyses WHERE analyzed_at < ?',
+                                                      (time.time() - self.ttl,)).rowcount
+            removed_number += self._connection.execute(
+                'DELETE FROM analyses WHERE rowid IN '
+                '(SELECT rowid FROM analyses ORDER BY accessed_at LIMIT max((SELECT COUNT(*) FROM analyses) - ?, 0))',
+                (self.max_entries,)).rowcount
+            self._commit()
+        if removed_number:
+            logger.info('Analysis cache entries evicted', extra=dict(count=removed_number))
+        return removed_number
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._connection.close()
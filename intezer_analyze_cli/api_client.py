@@ -0,0 +1,232 @@
+import contextlib
+import logging
+import threading
+import time
+from http import HTTPStatus
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+import requests.adapters
+from intezer_sdk import errors as sdk_errors
+from intezer_sdk.api import IntezerApiClient
+from requests import Response
+
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import key_store
+from intezer_analyze_cli import multipart
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+_upload_progress = threading.local()
+
+
+class FileTooLargeError(sdk_errors.IntezerError):
+    def __init__(self, file_name: str, size: int, max_size: int):
+        super().__init__(f'{file_name} is {size} bytes, larger than the upload limit of {max_size} bytes')
+
+
+@contextlib.contextmanager
+def track_upload_progress(callback: Callable[[int], None]) -> Iterator[None]:
+    """Call callback with the number of bytes of every chunk that the uploads of this thread send"""
+    _upload_progress.callback = callback
+    try:
+        yield
+    finally:
+        _upload_progress.callback = None
+
+
+class CliApiClient(IntezerApiClient):
+    """
+    Intezer API client that shares its access token with the other CLI processes through a cache file next to
+    the stored key, so a short-lived invocation authenticates only when the cached token is about to expire.
+
+    The client is safe to share between worker threads: a single thread refreshes the token while the others
+    wait for it, and a request rejected because its token was replaced meanwhile is sent again once.
+
+    It overrides private methods and attributes of IntezerApiClient, such as _request and _set_access_token, which is
+    why the SDK is pinned to its minor version in setup.py.
+
+    The requests are cut to the deadline of the run the client was created in, also when they are sent from threads
+    that don't run in its context, such as the threads of the server.
+    """
+
+    def __init__(self, *, use_token_cache: bool = None, pool_maxsize: int = None, **kwargs):
+        kwargs.setdefault('renew_token_window', default_config.token_renew_window)
+        super().__init__(**kwargs)
+        self.pool_maxsize = pool_maxsize or default_config.connection_pool_size
+        if use_token_cache is None:
+            use_token_cache = default_config.use_token_cache
+        self._token_cache_path = key_store.get_token_cache_path(self.api_key, self.full_url) if use_token_cache \
+            else None
+        self._token_lock = threading.RLock()
+        self._token_generation = 0
+        self._deadline = deadlines.get_deadline()
+
+    def _request(self,
+                 method: str,
+                 path: str,
+                 data: dict = None,
+                 headers: dict = None,
+                 files: dict = None,
+                 stream: bool = None,
+                 base_url: str = None,
+                 timeout_in_seconds: Optional[int] = None) -> Response:
+        self._check_deadline()
+        timeout = self._get_timeout(timeout_in_seconds, is_upload=bool(files))
+        try:
+            return self._send_request(method, path, data, headers, files, stream, base_url, timeout)
+        except requests.exceptions.Timeout:
+            # The timeout may have been cut to the deadline of the run
+            self._check_deadline()
+            raise
+
+    def _check_deadline(self):
+        if self._deadline:
+            self._deadline.check()
+
+    def _get_timeout(self, timeout_in_seconds: Optional[int], is_upload: bool) -> Tuple[float, float]:
+        """The connect and read timeouts of a request, cut to the deadline of the run"""
+        read_timeout = (timeout_in_seconds or
+                        self.timeout_in_seconds or
+                        (default_config.upload_timeout if is_upload else default_config.read_timeout))
+        if not self._deadline:
+            return default_config.connect_timeout, read_timeout
+        return self._deadline.limit_timeout(default_config.connect_timeout), self._deadline.limit_timeout(read_timeout)
+
+    def _send_request(self,
+                      method: str,
+                      path: str,
+                      data: Optional[dict],
+                      headers: Optional[dict],
+                      files: Optional[dict],
+                      stream: Optional[bool],
+                      base_url: Optional[str],
+                      timeout: Tuple[float, float]) -> Response:
+        self._ensure_session()
+        if not files or any(multipart.get_stream_size(file_value[1]) is None
+                            for file_value in files.values() if not isinstance(file_value[1], (bytes, str))):
+            return super()._request(method, path, data, headers, files, stream, base_url, timeout)
+
+        # Stream the files from the disk in chunks, requests would have built the whole body in memory
+        body = multipart.MultipartStream(data,
+                                         files,
+                                         progress_callback=getattr(_upload_progress, 'callback', None))
+        max_size = default_config.max_upload_size
+        if max_size and body.file_size > max_size:
+            file_name = next(iter(files.values()))[0]
+            raise FileTooLargeError(file_name, body.file_size, max_size)
+
+        url = f'{base_url}{path}' if base_url else f'{self.full_url}{path}'
+        headers = dict(headers or {}, **{'Content-Type': body.content_type, 'Content-Length': str(len(body))})
+        return self._session.request(method,
+                                     url,
+                                     data=body,
+                                     headers=headers,
+                                     stream=stream,
+                                     timeout=timeout)
+
+    def _ensure_session(self):
+        if not self._session:
+            with self._token_lock:
+                if not self._session:
+                    self._set_session()
+
+    def _set_session(self):
+        with self._token_lock:
+            super()._set_session()
+            # Keep a connection open for every concurrent worker instead of the default pool of 10
+            adapter = requests.adapters.HTTPAdapter(max_retries=self.max_retry, pool_maxsize=self.pool_maxsize)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+
+    def _refresh_token_if_needed(self) -> int:
+        """
+        Refresh the token if it's about to expire.
+
+        :return: The generation of the token the next request is sent with
+        """
+        if self._token_expiration and not self._is_token_fresh(self._token_expiration):
+            with self._token_lock:
+                super()._refresh_token_if_needed()
+        return self._token_generation
+
+    def _refresh_access_token(self, stale_generation: int):
+        """Refresh the token, unless another thread already replaced the stale token while this one waited"""
+        with self._token_lock:
+            if self._token_generation == stale_generation:
+                self._set_access_token()
+
+    def request_with_refresh_expired_access_token(self,
+                                                  method: str,
+                                                  path: str,
+                                                  data: dict = None,
+                                                  headers: dict = None,
+                                                  files: dict = None,
+                                                  stream: bool = None,
+                                                  base_url: str = None,
+                                                  timeout_in_seconds: Optional[int] = None) -> Response:
+        for retry_count in range(self.max_retry):
+            try:
+                self._ensure_session()
+                token_generation = self._refresh_token_if_needed()
+                response = self._request(method, path, data, headers, files, stream, base_url, timeout_in_seconds)
+
+                if response.status_code == HTTPStatus.UNAUTHORIZED:
+                    self._refresh_access_token(token_generation)
+                    response = self._request(method, path, data, headers, files, stream, base_url,
+                                             timeout_in_seconds)
+
+                return response
+            except requests.exceptions.ConnectionError:
+                if self.max_retry - retry_count <= 1:
+                    raise
+                logger.warning('Encountered connection error, retrying', exc_info=True)
+
+    def _set_access_token(self):
+        with self._token_lock:
+            self._set_shared_access_token()
+            self._token_generation += 1
+
+    def _set_shared_access_token(self):
+        if not self._token_cache_path:
+            super()._set_access_token()
+            return
+
+        # Only one process refreshes the token, the others wait for the lock and take the refreshed token
+        with key_store.token_cache_lock(self._token_cache_path) as is_locked:
+            if not is_locked:
+                super()._set_access_token()
+                return
+
+            cached_token = key_store.get_cached_token(self._token_cache_path)
+            if (cached_token and
+                    self._is_token_fresh(cached_token['expire_at']) and
+                    self._session.headers.get('Authorization') != f'Bearer {cached_token["token"]}'):
+                logger.debug('Using cached access token')
+                self._session.headers['Authorization'] = f'Bearer {cached_token["token"]}'
+                self._token_expiration = cached_token['expire_at']
+                return
+
+            super()._set_access_token()
+            self._store_access_token()
+
+    def _store_access_token(self):
+        token = self._get_session_token()
+        if not token or not self._token_expiration:
+            return
+        try:
+            key_store.store_cached_token(self._token_cache_path, token, self._token_expiration)
+        except OSError:
+            logger.warning('Failed to store the access token cache', exc_info=True)
+
+    def _get_session_token(self) -> Optional[str]:
+        authorization = self._session.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):]
+        return None
+
+    def _is_token_fresh(self, expire_at: float) -> bool:
+        return expire_at - time.time() > self._renew_token_window
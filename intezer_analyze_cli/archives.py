@@ -0,0 +1,200 @@
+import io
+import logging
+import os
+import tarfile
+import zipfile
+import zlib
+from typing import BinaryIO
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+MEMBER_PATH_SEPARATOR = '!'
+_HEADER_SIZE = 512
+_READ_CHUNK_SIZE = 1024 * 1024
+_ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError, RuntimeError)
+
+
+class ArchiveMember(NamedTuple):
+    path: str  # The archive path and the member path inside it, joined with MEMBER_PATH_SEPARATOR
+    name: str
+    stream: BinaryIO
+
+
+class _SizeLimitExceeded(Exception):
+    pass
+
+
+def _is_zip_header(header: bytes) -> bool:
+    return header[:4] == b'\x50\x4b\x03\x04'
+
+
+def _is_tar_header(header: bytes) -> bool:
+    return header[257:262] == b'ustar'
+
+
+def _is_compressed_header(header: bytes) -> bool:
+    return header[:3] == b'\x1f\x8b\x08' or header[:3] == b'BZh' or header[:6] == b'\xfd7zXZ\x00'
+
+
+def is_expandable_archive(file_path: str) -> bool:
+    """Whether the file is a zip or tar (optionally compressed) archive, and not an APK"""
+    try:
+        with open(file_path, 'rb') as archive_file:
+            header = archive_file.read(_HEADER_SIZE)
+    except OSError:
+        return False
+
+    if _is_zip_header(header):
+        return zipfile.is_zipfile(file_path) and not utilities.is_apk(file_path)
+    if _is_tar_header(header) or _is_compressed_header(header):
+        try:
+            return tarfile.is_tarfile(file_path)
+        except _ARCHIVE_ERRORS:
+            return False
+    return False
+
+
+def member_name_of(member_path: str) -> str:
+    """The path of the member inside the innermost archive"""
+    return member_path.rsplit(MEMBER_PATH_SEPARATOR, 1)[-1]
+
+
+def _is_expandable_content(content: BinaryIO, header: bytes) -> bool:
+    try:
+        if _is_zip_header(header):
+            return not utilities.is_apk(content)
+        if _is_tar_header(header):
+            return True
+        # A compressed file may be a compressed tar archive or a single compressed file
+        with tarfile.open(fileobj=content, mode='r:*') as archive:
+            return archive.next() is not None
+    except _ARCHIVE_ERRORS:
+        return False
+    finally:
+        content.seek(0)
+
+
+class ArchiveExpander:
+    """
+    Read the members of zip and tar archives in memory, without extracting them to the disk.
+
+    Only members of a supported file type are read completely, the type of every member is decided by its
+    first bytes. Archives inside the archive are expanded as well, up to max_depth levels. APKs are yielded as
+    files. A member larger than max_member_size is skipped, and once max_total_size bytes were decompressed
+    from a single archive the rest of its members are skipped, which protects from decompression bombs.
+    """
+
+    def __init__(self, max_depth: int = None, max_member_size: int = None, max_total_size: int = None):
+        self.max_depth = max_depth or default_config.archive_max_depth
+        self.max_member_size = max_member_size or default_config.archive_max_member_size
+        self.max_total_size = max_total_size or default_config.archive_max_total_size
+        self.skipped_members: List[Tuple[str, str]] = []
+        self._total_size = 0
+
+    def iter_members(self, archive_path: str) -> Iterator[ArchiveMember]:
+        """
+        Yield the supported members of the archive. The skipped members are listed in skipped_members with
+        the reason they were skipped.
+        """
+        self._total_size = 0
+        try:
+            with open(archive_path, 'rb') as archive_file:
+                yield from self._iter_archive(archive_file, archive_path, depth=1)
+        except _SizeLimitExceeded:
+            self._skip(archive_path, f'more than {self.max_total_size} bytes were decompressed from the archive')
+        except _ARCHIVE_ERRORS as e:
+            self._skip(archive_path, f'failed to read the archive: {e}')
+
+    def _iter_archive(self, archive_file: BinaryIO, archive_path: str, depth: int) -> Iterator[ArchiveMember]:
+        header = archive_file.read(_HEADER_SIZE)
+        archive_file.seek(0)
+        if _is_zip_header(header):
+            members = self._iter_zip_members(archive_file)
+        else:
+            members = self._iter_tar_members(archive_file)
+
+        for member_name, member_size, open_member in members:
+            member_path = f'{archive_path}{MEMBER_PATH_SEPARATOR}{member_name}'
+            if member_size > self.max_member_size:
+                self._skip(member_path, f'larger than {self.max_member_size} bytes')
+                continue
+            try:
+                with open_member() as member_stream:
+                    yield from self._iter_member(member_stream, member_path, depth)
+            except _ARCHIVE_ERRORS as e:
+                self._skip(member_path, f'failed to read the member: {e}')
+
+    def _iter_member(self, member_stream: BinaryIO, member_path: str, depth: int) -> Iterator[ArchiveMember]:
+        header = member_stream.read(_HEADER_SIZE)
+        may_be_archive = _is_zip_header(header) or _is_tar_header(header) or _is_compressed_header(header)
+        if not may_be_archive and not utilities.is_supported_header(header):
+            self._skip(member_path, 'unsupported file type')
+            return
+
+        content = self._read_limited(member_stream, header, member_path)
+        if content is None:
+            return
+
+        if may_be_archive and _is_expandable_content(content, header):
+            if depth >= self.max_depth:
+                self._skip(member_path, f'archive nested deeper than {self.max_depth} levels')
+                return
+            yield from self._iter_archive(content, member_path, depth + 1)
+            return
+
+        if not utilities.is_supported_header(header):
+            self._skip(member_path, 'unsupported file type')
+            return
+
+        yield ArchiveMember(member_path, os.path.basename(member_name_of(member_path)), content)
+
+    def _read_limited(self, member_stream: BinaryIO, header: bytes, member_path: str) -> Optional[io.BytesIO]:
+        content = io.BytesIO(header)
+        content.seek(0, io.SEEK_END)
+        self._add_to_total_size(len(header))
+        while True:
+            chunk = member_stream.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                content.seek(0)
+                return content
+            self._add_to_total_size(len(chunk))
+            if content.tell() + len(chunk) > self.max_member_size:
+                # The size in the archive headers can't be trusted
+                self._skip(member_path, f'larger than {self.max_member_size} bytes')
+                return None
+            content.write(chunk)
+
+    def _add_to_total_size(self, size: int):
+        self._total_size += size
+        if self._total_size > self.max_total_size:
+            raise _SizeLimitExceeded()
+
+    def _skip(self, member_path: str, reason: str):
+        logger.info('Archive member skipped', extra=dict(member_path=member_path, reason=reason))
+        self.skipped_members.append((member_path, reason))
+
+    @staticmethod
+    def _iter_zip_members(archive_file: BinaryIO) -> Iterator[Tuple[str, int, Callable[[], BinaryIO]]]:
+        with zipfile.ZipFile(archive_file) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                yield member.filename, member.file_size, lambda member=member: archive.open(member)
+
+    @staticmethod
+    def _iter_tar_members(archive_file: BinaryIO) -> Iterator[Tuple[str, int, Callable[[], BinaryIO]]]:
+        # Stream mode reads the archive once from start to end, the members are never seeked back to
+        with tarfile.open(fileobj=archive_file, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                yield member.name, member.size, lambda member=member: archive.extractfile(member)
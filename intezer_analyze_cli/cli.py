@@ -1,5 +1,9 @@
+import contextlib
+import functools
 import logging
 import os
+import re
+from typing import Optional
 
 import click
 from intezer_sdk import api
@@ -8,12 +12,27 @@ from intezer_sdk import errors as sdk_errors
 from intezer_sdk.consts import CodeItemType
 
 from intezer_analyze_cli import __version__
+from intezer_analyze_cli import api_client
 from intezer_analyze_cli import commands
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import estimates
+from intezer_analyze_cli import hash_index
+from intezer_analyze_cli import jobs
 from intezer_analyze_cli import key_store
+from intezer_analyze_cli import metrics
+from intezer_analyze_cli import pipeline
+from intezer_analyze_cli import profiles
+from intezer_analyze_cli import results
+from intezer_analyze_cli import server
+from intezer_analyze_cli import sharding
 from intezer_analyze_cli import utilities
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli import work_queue
 from intezer_analyze_cli.config import default_config
 
-utilities.init_log('intezer_cli', os.environ.get('INTEZER_DEBUG') == '1')
+utilities.init_log('intezer_cli',
+                   os.environ.get('INTEZER_DEBUG') == '1',
+                   os.environ.get('INTEZER_LOG_FORMAT') == 'json')
 logger = logging.getLogger('intezer_cli')
 
 
@@ -35,9 +54,241 @@ class AliasedGroup(click.Group):
         _, cmd, args = super().resolve_command(ctx, args)
         return cmd.name, cmd, args
 
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except deadlines.DeadlineExceeded:
+            logger.warning('The run was stopped by the deadline')
+            click.echo('The deadline of the run passed, the run was stopped')
+            ctx.exit(deadlines.EXIT_CODE)
+
+
+class ShardParamType(click.ParamType):
+    name = 'I/N'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, sharding.Shard):
+            return value
+        try:
+            return sharding.Shard.parse(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+class SizeParamType(click.ParamType):
+    name = 'SIZE'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return walk_filters.parse_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+class DurationParamType(click.ParamType):
+    name = 'DURATION'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return deadlines.parse_duration(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+class StageWorkersParamType(click.ParamType):
+    name = 'STAGE=N'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, tuple):
+            return value
+        try:
+            return pipeline.parse_stage_workers(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+def shard_option(command):
+    """Pass the shard of the run to the command, the results of a sharded run are written to a results file"""
+    @click.option('--shard',
+                  type=ShardParamType(),
+                  default=None,
+                  help='Handle only the I-th of N disjoint parts of the items, chosen by a stable hash of their path '
+                       '(relative to the directory) or hash, and write the results to '
+                       'intezer-results-shard-I-of-N.jsonl.')
+    @functools.wraps(command)
+    def run_with_shard(*args, shard: Optional[sharding.Shard], **kwargs):
+        if not shard:
+            return command(*args, shard=None, **kwargs)
+
+        results_path = os.path.join(os.getcwd(), default_config.shard_results_file_name_template.format(
+            index=shard.index, count=shard.count))
+        try:
+            with results.ResultsWriter(results_path, shard=str(shard)):
+                return command(*args, shard=shard, **kwargs)
+        finally:
+            click.echo(f'The results of shard {shard} are in {results_path}')
+
+    return run_with_shard
+
+
+def status_options(command):
+    """Report the live counters of the run of the command to a status file or on a metrics port"""
+    @click.option('--status-file', 'status_file_path',
+                  type=click.Path(dir_okay=False, writable=True),
+                  default=None,
+                  help=f'Rewrite this JSON file with the live counters of the run every '
+                       f'{default_config.status_file_interval:g} seconds.')
+    @click.option('--metrics-port',
+                  type=click.IntRange(min=0, max=65535),
+                  default=None,
+                  help='Serve the live counters of the run in the Prometheus text format on '
+                       'http://<host>:<port>/metrics.')
+    @click.option('--metrics-host',
+                  default=default_config.metrics_host,
+                  show_default=True,
+                  help='The address the metrics port listens on, e.g. 0.0.0.0 to let other hosts scrape it.')
+    @functools.wraps(command)
+    def run_with_status(*args,
+                        status_file_path: Optional[str],
+                        metrics_port: Optional[int],
+                        metrics_host: str,
+                        **kwargs):
+        if not status_file_path and metrics_port is None:
+            return command(*args, **kwargs)
+
+        ctx = click.get_current_context()
+        with metrics.RunMetrics(ctx.info_name) as run_metrics, contextlib.ExitStack() as reporters:
+            if status_file_path:
+                status_file_writer = metrics.StatusFileWriter(status_file_path, run_metrics)
+                try:
+                    status_file_writer.start()
+                except OSError as e:
+                    raise click.BadParameter(f'Cant write the status file: {e}', ctx, param_hint='--status-file')
+                reporters.callback(status_file_writer.stop)
+            if metrics_port is not None:
+                try:
+                    metrics_server = metrics.MetricsServer(metrics_port, run_metrics, metrics_host)
+                except OSError as e:
+                    raise click.BadParameter(f'Cant listen on {metrics_host}:{metrics_port}: {e}',
+                                             ctx,
+                                             param_hint='--metrics-port')
+                metrics_server.start()
+                reporters.callback(metrics_server.stop)
+            return command(*args, **kwargs)
+
+    return run_with_status
+
+
+def walk_filter_options(command):
+    """Pass the walk filter of the run to the command, the files and directories the walk of a directory skips"""
+    @click.option('--max-size', type=SizeParamType(), default=None,
+                  help='Skip the files that are larger than this size, e.g. 100M.')
+    @click.option('--min-size', type=SizeParamType(), default=None,
+                  help='Skip the files that are smaller than this size, e.g. 1K.')
+    @click.option('--prune', multiple=True, metavar='PATTERN',
+                  help='Skip the directories whose name or relative path matches this glob, e.g. node_modules. '
+                       'Can be repeated.')
+    @click.option('--exclude', multiple=True, metavar='PATTERN',
+                  help='Skip the files whose name or relative path matches this glob or extension, e.g. *.log. '
+                       'Can be repeated.')
+    @click.option('--include', multiple=True, metavar='PATTERN',
+                  help='Handle only the files whose name or relative path matches this glob or extension, '
+                       'e.g. *.exe or .dll. Can be repeated.')
+    @functools.wraps(command)
+    def run_with_walk_filter(*args,
+                             max_size: Optional[int],
+                             min_size: Optional[int],
+                             prune: tuple,
+                             exclude: tuple,
+                             include: tuple,
+                             **kwargs):
+        walk_filter = walk_filters.WalkFilter(include=include,
+                                              exclude=exclude,
+                                              prune=prune,
+                                              min_size=min_size,
+                                              max_size=max_size)
+        return command(*args, walk_filter=walk_filter, **kwargs)
+
+    return run_with_walk_filter
+
+
+def hash_lists_options(command):
+    """Pass the allowlists and blocklists of the run to the command, they are closed when the command returns"""
+    @click.option('--blocklist', 'blocklist_paths',
+                  type=click.Path(exists=True, dir_okay=False),
+                  multiple=True,
+                  help='A hash index of known bad files, built with build-hash-index. The files that are in it are '
+                       'reported and are not sent. Can be repeated.')
+    @click.option('--allowlist', 'allowlist_paths',
+                  type=click.Path(exists=True, dir_okay=False),
+                  multiple=True,
+                  help='A hash index of known good files, built with build-hash-index. The files that are in it are '
+                       'not sent. Can be repeated.')
+    @functools.wraps(command)
+    def run_with_hash_lists(*args, blocklist_paths: tuple, allowlist_paths: tuple, **kwargs):
+        if not blocklist_paths and not allowlist_paths:
+            return command(*args, hash_lists=None, **kwargs)
+
+        with contextlib.closing(hash_index.HashLists()) as hash_lists:
+            for option_name, index_paths, lists in (('--blocklist', blocklist_paths, hash_lists.blocklists),
+                                                    ('--allowlist', allowlist_paths, hash_lists.allowlists)):
+                for index_path in index_paths:
+                    try:
+                        lists.append(hash_index.HashIndex(index_path))
+                    except (OSError, ValueError) as e:
+                        raise click.BadParameter(str(e), click.get_current_context(), param_hint=option_name)
+            return command(*args, hash_lists=hash_lists, **kwargs)
+
+    return run_with_hash_lists
+
+
+def dry_run_options(command):
+    """Pass whether the run is a dry run to the command, and the throughput model its duration is projected with"""
+    default_bandwidth = default_config.dry_run_upload_bytes_per_second // (1024 * 1024)
+
+    @click.option('--dry-run',
+                  is_flag=True,
+                  help='Walk, filter and classify the items without logging in or sending anything, and print the '
+                       'projected quota use and duration of the run.')
+    @click.option('--assume-rate', 'submissions_per_second',
+                  type=click.FloatRange(min=0.001),
+                  default=None,
+                  help=f'With --dry-run, the submissions per second the duration is projected with '
+                       f'(default: {default_config.dry_run_submissions_per_second:g}).')
+    @click.option('--assume-bandwidth', 'upload_bytes_per_second',
+                  type=SizeParamType(),
+                  default=None,
+                  help=f'With --dry-run, the upload bytes per second the duration is projected with, '
+                       f'e.g. 10M (default: {default_bandwidth}M).')
+    @functools.wraps(command)
+    def run_with_dry_run(*args,
+                         dry_run: bool,
+                         submissions_per_second: Optional[float],
+                         upload_bytes_per_second: Optional[int],
+                         **kwargs):
+        if upload_bytes_per_second is not None and upload_bytes_per_second <= 0:
+            raise click.BadParameter('Should be positive', click.get_current_context(), param_hint='--assume-bandwidth')
+
+        throughput_model = None
+        if dry_run:
+            throughput_model = estimates.ThroughputModel(
+                submissions_per_second or default_config.dry_run_submissions_per_second,
+                upload_bytes_per_second or default_config.dry_run_upload_bytes_per_second)
+        return command(*args, dry_run=dry_run, throughput_model=throughput_model, **kwargs)
+
+    return run_with_dry_run
+
 
 def create_global_api():
     try:
+        if default_config.profile_names:
+            _create_profiles_api(default_config.profile_names)
+            return
+
         api_key = key_store.get_stored_api_key()
         api_url = key_store.get_stored_default_url()
 
@@ -50,8 +301,10 @@ def create_global_api():
             default_config.api_url = api_url
             default_config.is_cloud = False
 
-        api.set_global_api(api_key, default_config.api_version, default_config.api_url)
-        sdk_consts.USER_AGENT += f'/CLI-{__version__}'
+        api.set_global_api_custom_instance(api_client.CliApiClient(api_key=api_key,
+                                                                   api_version=default_config.api_version,
+                                                                   base_url=default_config.api_url))
+        _add_cli_to_user_agent()
 
     except sdk_errors.InvalidApiKey:
         logger.exception('Invalid api key error')
@@ -60,16 +313,100 @@ def create_global_api():
         raise click.Abort()
 
 
+def _create_profiles_api(profile_names):
+    """Create an API for every profile, the work is spread between them and the first one is the global API"""
+    profiles_to_balance = []
+    profiles_urls = []
+    for profile_name in profile_names:
+        profile = key_store.get_stored_profile(profile_name)
+        if not profile:
+            logger.error('Cant find profile', extra=dict(profile_name=profile_name))
+            click.echo(f'Cant find profile {profile_name}, please login with --profile {profile_name}')
+            raise click.Abort()
+
+        profile_api = api_client.CliApiClient(api_key=profile['api_key'],
+                                              api_version=default_config.api_version,
+                                              base_url=profile['api_url'] or default_config.api_url)
+        profiles_to_balance.append(profiles.Profile(profile_name, profile_api, profile['weight']))
+        profiles_urls.append(profile['api_url'])
+
+    if profiles_urls[0]:
+        default_config.api_url = profiles_urls[0]
+        default_config.is_cloud = False
+
+    api.set_global_api_custom_instance(profiles_to_balance[0].api)
+    profiles.set_global_balancer(profiles.ProfileBalancer(profiles_to_balance))
+    _add_cli_to_user_agent()
+
+
+def _add_cli_to_user_agent():
+    """The API may be created again in the same process, e.g. in tests, so the suffix is added once"""
+    user_agent_suffix = f'/CLI-{__version__}'
+    if not sdk_consts.USER_AGENT.endswith(user_agent_suffix):
+        sdk_consts.USER_AGENT += user_agent_suffix
+
+
+def _echo_unexpected_error():
+    """Log the error that is being handled and ask the user to send the log file"""
+    logger.exception('Unexpected error occurred')
+    click.echo('Unexpected error occurred, please contact us at support@intezer.com '
+               f'and attach the log file in {utilities.log_file_path}')
+
+
 @click.group(cls=AliasedGroup, context_settings=dict(help_option_names=['-h', '--help'], max_content_width=120),
              help=f'Intezer Labs Ltd. Intezer Analyze CLI {__version__}')
-def main_cli():
-    pass
+@click.option('--profile', 'profile_names', multiple=True, metavar='NAME',
+              help='Use the stored profile, repeat to spread the work between several profiles.')
+@click.option('--deadline', type=DurationParamType(), default=None,
+              help='Stop the run after this duration, e.g. 45m or 2h. The items that were not done are recorded, '
+                   f'and the exit code is {deadlines.EXIT_CODE}.')
+@click.option('--connect-timeout', type=DurationParamType(), default=default_config.connect_timeout,
+              show_default=True, help='Seconds to wait for a connection to the service.')
+@click.option('--upload-timeout', type=DurationParamType(), default=default_config.upload_timeout,
+              show_default=True, help='Seconds an upload may make no progress before it fails.')
+@click.option('--operation-timeout', type=DurationParamType(), default=default_config.operation_timeout,
+              show_default=True, help='Seconds to wait for an operation, such as an index, to complete before it '
+                                      'fails.')
+@click.option('--stage-workers', type=StageWorkersParamType(), multiple=True,
+              help='The number of workers of a stage of the directory commands, e.g. submit=8. Can be repeated for '
+                   f'the stages {", ".join(pipeline.WORKER_STAGE_NAMES)}.')
+@click.pass_context
+def main_cli(ctx: click.Context,
+             profile_names,
+             deadline: float,
+             connect_timeout: float,
+             upload_timeout: float,
+             operation_timeout: float,
+             stage_workers):
+    default_config.profile_names = list(profile_names)
+    for name, timeout in (('--connect-timeout', connect_timeout),
+                          ('--upload-timeout', upload_timeout),
+                          ('--operation-timeout', operation_timeout),
+                          ('--deadline', deadline)):
+        if timeout is not None and timeout <= 0:
+            raise click.BadParameter('Should be positive', ctx, param_hint=name)
+    default_config.connect_timeout = connect_timeout
+    default_config.upload_timeout = upload_timeout
+    default_config.operation_timeout = operation_timeout
+    if deadline:
+        # The deadline is entered until the context of the group closes, after the subcommand returned
+        run_deadline = contextlib.ExitStack()
+        run_deadline.enter_context(deadlines.Deadline(deadline))
+        ctx.call_on_close(run_deadline.close)
+    if stage_workers:
+        pipeline_workers = default_config.pipeline_workers
+        default_config.pipeline_workers = {**pipeline_workers, **dict(stage_workers)}
+        ctx.call_on_close(lambda: setattr(default_config, 'pipeline_workers', pipeline_workers))
 
 
 @main_cli.command('login', short_help='Login to Intezer Analyze')
 @click.argument('api_key', type=click.UUID)
 @click.argument('api_url', required=False, default=None, type=click.STRING)
-def login(api_key: str, api_url: str):
+@click.option('--profile', 'profile_name', default=None, type=click.STRING,
+              help='Store the API key as a named profile instead of the default one.')
+@click.option('--weight', default=1, type=click.IntRange(min=1), show_default=True,
+              help='The share of the work sent with the profile when several profiles are used.')
+def login(api_key: str, api_url: str, profile_name: str, weight: int):
     """Login to Intezer Analyze to perform analyses.
 
     \b
@@ -79,22 +416,64 @@ def login(api_key: str, api_url: str):
     API_URL: Intezer Analyze URL in case you have on premise deployment.
 
     \b
-    Example:
+    Examples:
       $ intezer-analyze login edb45d954da54e8e980078001d8921cc
+      \b
+      Store named profiles and spread the work between them:
+      $ intezer-analyze login --profile main --weight 3 edb45d954da54e8e980078001d8921cc
+      $ intezer-analyze login --profile secondary 5dc1b0e1c1a0498ba0d2e9b6c6d3c6e1
+      $ intezer-analyze --profile main --profile secondary analyze ~/files/files-to-analyze
     """
+    if profile_name and not re.fullmatch(r'[\w.-]+', profile_name):
+        raise click.BadParameter('Profile name can contain only letters, digits, ".", "_" and "-"',
+                                 param_hint='--profile')
     try:
         if api_url:
             if api_url[-1] != '/':
                 api_url += '/'
             if not api_url.endswith('/api/'):
                 api_url += 'api/'
-        commands.login(str(api_key), api_url)
+        commands.login(str(api_key), api_url, profile_name=profile_name, weight=weight)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
+
+@main_cli.command('profiles', short_help='List the stored profiles')
+def list_profiles():
+    """List the profiles stored with login --profile.
+
+    \b
+    Examples:
+      $ intezer-analyze profiles
+    """
+    profile_names = key_store.list_profiles()
+    if not profile_names:
+        click.echo('No profiles are stored')
+        return
+    for profile_name in profile_names:
+        profile = key_store.get_stored_profile(profile_name)
+        click.echo(f'{profile_name}\t{profile["api_url"] or default_config.api_url}\tweight {profile["weight"]}')
+
+
+@main_cli.command('delete-profile', short_help='Delete a stored profile')
+@click.argument('profile_name', type=click.STRING)
+def delete_profile(profile_name: str):
+    """Delete a profile stored with login --profile, with its API key.
+
+    \b
+    PROFILE_NAME: The name of the profile.
+
+    \b
+    Examples:
+      $ intezer-analyze delete-profile secondary
+    """
+    if profile_name not in key_store.list_profiles():
+        click.echo(f'Cant find profile {profile_name}')
+        raise click.Abort()
+    key_store.delete_profile(profile_name)
+    click.echo(f'Profile {profile_name} was deleted')
 
 
 @main_cli.command('analyze', short_help='Send a file or a directory for analysis')
@@ -105,16 +484,58 @@ def login(api_key: str, api_url: str):
 @click.option('--ignore-directory-count-limit',
               is_flag=True,
               help='ignore directory count limit ({} files)'.format(default_config.unusual_amount_in_dir))
-@click.argument('path', type=click.Path(exists=True))
+@click.option('--watch',
+              is_flag=True,
+              help='Keep running and send the files that are added to the directory, until interrupted.')
+@click.option('--settle-time',
+              default=default_config.watch_settle_time,
+              type=click.FloatRange(min=0),
+              show_default=True,
+              help='With --watch, seconds a file size should stay unchanged before sending it, '
+                   'when the directory is polled.')
+@click.option('--expand-archives',
+              is_flag=True,
+              help='Send the members of zip and tar archives for analysis instead of the archives, '
+                   f'up to {default_config.archive_max_depth} nested archives deep.')
+@click.option('--dedup',
+              is_flag=True,
+              help='Send every unique file of the directory once, and write the analysis of every file to a mapping '
+                   'file.')
+@click.option('--dedup-mapping', 'dedup_mapping_path',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=f'With --dedup, the CSV mapping file (default: {default_config.dedup_mapping_file_name} '
+                   f'in the current directory).')
+@click.option('--incremental',
+              is_flag=True,
+              help='Send only the files of the directory that are new or changed since the last incremental run.')
+@shard_option
+@status_options
+@walk_filter_options
+@hash_lists_options
+@dry_run_options
+@click.argument('path', type=click.Path(exists=True, allow_dash=True))
 def analyze(path: str,
             no_unpacking: bool,
             no_static_extraction: bool,
             code_item_type: str,
-            ignore_directory_count_limit: bool):
+            ignore_directory_count_limit: bool,
+            watch: bool,
+            settle_time: float,
+            expand_archives: bool,
+            dedup: bool,
+            dedup_mapping_path: str,
+            incremental: bool,
+            dry_run: bool,
+            throughput_model: Optional[estimates.ThroughputModel],
+            shard: Optional[sharding.Shard],
+            walk_filter: walk_filters.WalkFilter,
+            hash_lists: Optional[hash_index.HashLists]):
     """ Send a file or a directory for analysis in Intezer Analyze.
 
     \b
-    PATH: Path to file or directory to send the files inside for analysis.
+    PATH: Path to file or directory to send the files inside for analysis,
+          or - to read newline or NUL separated file paths from stdin.
 
     \b
     Examples:
@@ -123,66 +544,192 @@ def analyze(path: str,
       \b
       Send all files in directory for analysis:
       $ intezer-analyze analyze ~/files/files-to-analyze
+      \b
+      Send the files that are added to a directory for analysis, until interrupted:
+      $ intezer-analyze analyze --watch ~/files/drop-folder
+      \b
+      Send the files that find outputs for analysis:
+      $ find ~/files -newer ~/files/last-run -type f -print0 | intezer-analyze analyze -
+      \b
+      Send the files inside an archive for analysis, without extracting it:
+      $ intezer-analyze analyze --expand-archives ~/files/evidence.tar.gz
+      \b
+      Send every unique file in directory for analysis once:
+      $ intezer-analyze analyze --dedup --dedup-mapping ~/mapping.csv ~/files/evidence
+      \b
+      Send the files in directory that changed since the last incremental run:
+      $ intezer-analyze analyze --incremental /mnt/share
+      \b
+      Estimate the quota use and duration of sending a directory, without sending it:
+      $ intezer-analyze analyze --dry-run /mnt/share
     """
+    directory_options = [name for name, is_set in (('--watch', watch),
+                                                   ('--dedup', dedup),
+                                                   ('--incremental', incremental)) if is_set]
+    if directory_options and not os.path.isdir(path):
+        click.echo(f'{directory_options[0]} requires a directory')
+        raise click.Abort()
+    if sum([watch, expand_archives, dedup, incremental, path == '-']) > 1:
+        click.echo('Only one of --watch, --expand-archives, --dedup, --incremental and - can be used')
+        raise click.Abort()
+    if dry_run and (directory_options or expand_archives or not os.path.isdir(path)):
+        click.echo('--dry-run requires a directory, and cant be used with --watch, --expand-archives, --dedup '
+                   'and --incremental')
+        raise click.Abort()
+
     try:
-        create_global_api()
+        if not dry_run:
+            create_global_api()
 
         if not no_unpacking:
             no_unpacking = None
         if not no_static_extraction:
             no_static_extraction = None
 
-        if os.path.isfile(path):
+        if path == '-':
+            commands.analyze_paths_stream_command(utilities.read_stream_items(click.get_binary_stream('stdin')),
+                                                  disable_dynamic_unpacking=no_unpacking,
+                                                  disable_static_unpacking=no_static_extraction,
+                                                  code_item_type=code_item_type,
+                                                  shard=shard,
+                                                  hash_lists=hash_lists)
+        elif incremental:
+            commands.analyze_directory_incremental_command(
+                path=path,
+                disable_dynamic_unpacking=no_unpacking,
+                disable_static_unpacking=no_static_extraction,
+                code_item_type=code_item_type,
+                ignore_directory_count_limit=ignore_directory_count_limit,
+                shard=shard,
+                walk_filter=walk_filter,
+                hash_lists=hash_lists)
+        elif dedup:
+            commands.analyze_directory_dedup_command(path=path,
+                                                     disable_dynamic_unpacking=no_unpacking,
+                                                     disable_static_unpacking=no_static_extraction,
+                                                     code_item_type=code_item_type,
+                                                     ignore_directory_count_limit=ignore_directory_count_limit,
+                                                     mapping_path=dedup_mapping_path,
+                                                     shard=shard,
+                                                     walk_filter=walk_filter,
+                                                     hash_lists=hash_lists)
+        elif expand_archives:
+            commands.analyze_expanding_archives_command(path=path,
+                                                        disable_dynamic_unpacking=no_unpacking,
+                                                        disable_static_unpacking=no_static_extraction,
+                                                        code_item_type=code_item_type,
+                                                        ignore_directory_count_limit=ignore_directory_count_limit,
+                                                        shard=shard,
+                                                        walk_filter=walk_filter,
+                                                        hash_lists=hash_lists)
+        elif watch:
+            commands.analyze_directory_watch_command(path=path,
+                                                     disable_dynamic_unpacking=no_unpacking,
+                                                     disable_static_unpacking=no_static_extraction,
+                                                     code_item_type=code_item_type,
+                                                     settle_time=settle_time,
+                                                     shard=shard,
+                                                     walk_filter=walk_filter,
+                                                     hash_lists=hash_lists)
+        elif os.path.isfile(path):
             commands.analyze_file_command(file_path=path,
                                           disable_dynamic_unpacking=no_unpacking,
                                           disable_static_unpacking=no_static_extraction,
-                                          code_item_type=code_item_type)
+                                          code_item_type=code_item_type,
+                                          hash_lists=hash_lists)
         else:
             commands.analyze_directory_command(path=path,
                                                disable_dynamic_unpacking=no_unpacking,
                                                disable_static_unpacking=no_static_extraction,
                                                code_item_type=code_item_type,
-                                               ignore_directory_count_limit=ignore_directory_count_limit)
+                                               ignore_directory_count_limit=ignore_directory_count_limit,
+                                               dry_run=dry_run,
+                                               throughput_model=throughput_model,
+                                               shard=shard,
+                                               walk_filter=walk_filter,
+                                               hash_lists=hash_lists)
     except click.Abort:
         raise
     except sdk_errors.InsufficientQuota:
         logger.exception('Insufficient quota')
         click.echo('Insufficient quota, please contact us at support@intezer.com ')
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
 
 
 @main_cli.command('analyze-by-list', short_help='Send a text file with list of hashes')
-@click.argument('path', type=click.Path(exists=True, dir_okay=False))
-def analyze_by_list(path):
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--max-age',
+              default=None,
+              type=click.IntRange(min=0),
+              help='Answer a hash that was analyzed within this many seconds from the local cache instead of '
+                   'analyzing it again. By default every hash is analyzed again.')
+@shard_option
+@status_options
+@dry_run_options
+def analyze_by_list(path: str,
+                    max_age: Optional[int],
+                    dry_run: bool,
+                    throughput_model: Optional[estimates.ThroughputModel],
+                    shard: Optional[sharding.Shard]):
     """ Send a text file with hashes for analysis in Intezer Analyze.
 
     \b
-    PATH: Path to txt file.
+    PATH: Path to txt file, or - to read newline or NUL separated hashes from stdin.
 
     \b
     Examples:
       Send txt file with hashes for analysis:
       $ intezer-analyze analyze-by-list ~/files/hashes.txt
+      \b
+      Send txt file with hashes, reusing the analyses of the hashes that were analyzed in the last day:
+      $ intezer-analyze analyze-by-list --max-age 86400 ~/files/hashes.txt
+      \b
+      Send the hashes of another tool for analysis:
+      $ cut -d, -f1 detections.csv | intezer-analyze analyze-by-list -
+      \b
+      Estimate the quota use of a list of hashes, without sending it:
+      $ intezer-analyze analyze-by-list --dry-run ~/files/hashes.txt
     """
+    if dry_run and path == '-':
+        click.echo('--dry-run requires a file')
+        raise click.Abort()
+
     try:
+        if dry_run:
+            commands.analyze_by_txt_file_command(path=path,
+                                                 max_age=max_age,
+                                                 dry_run=True,
+                                                 throughput_model=throughput_model,
+                                                 shard=shard)
+            return
         create_global_api()
 
-        commands.analyze_by_txt_file_command(path=path)
+        if path == '-':
+            commands.analyze_hashes_stream_command(utilities.read_stream_items(click.get_binary_stream('stdin')),
+                                                   max_age=max_age,
+                                                   shard=shard)
+        else:
+            commands.analyze_by_txt_file_command(path=path, max_age=max_age, shard=shard)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
 
 @main_cli.command('index-by-list', short_help='Send a text file with list of hashes, verdict, family name if malicious')
 @click.argument('path', type=click.Path(exists=True, dir_okay=False))
 @click.option('--index-as', type=click.Choice(['malicious', 'trusted'], case_sensitive=True))
 @click.argument('family_name', required=False, type=click.STRING, default=None)
-def index_by_list(path: str, index_as: str, family_name: str):
+@shard_option
+@status_options
+@dry_run_options
+def index_by_list(path: str,
+                  index_as: str,
+                  family_name: str,
+                  dry_run: bool,
+                  throughput_model: Optional[estimates.ThroughputModel],
+                  shard: Optional[sharding.Shard]):
     """
     Send a text file with hashes for indexing in Intezer Analyze.
 
@@ -201,28 +748,46 @@ def index_by_list(path: str, index_as: str, family_name: str):
             click.echo('family_name is mandatory if the index type is malicious')
             return
 
-        create_global_api()
+        if not dry_run:
+            create_global_api()
 
-        commands.index_by_txt_file_command(path=path, index_as=index_as, family_name=family_name)
+        commands.index_by_txt_file_command(path=path,
+                                           index_as=index_as,
+                                           family_name=family_name,
+                                           dry_run=dry_run,
+                                           throughput_model=throughput_model,
+                                           shard=shard)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
 
 @main_cli.command('index', short_help='index a file or a directory')
-@click.argument('path', type=click.Path(exists=True))
+@click.argument('path', type=click.Path(exists=True, allow_dash=True))
 @click.option('--index-as', type=click.Choice(['malicious', 'trusted'], case_sensitive=True))
 @click.argument('family_name', required=False, type=click.STRING, default=None)
 @click.option('--ignore-directory-count-limit',
               is_flag=True,
               help='ignore directory count limit ({} files)'.format(default_config.unusual_amount_in_dir))
-def index(path: str, index_as: str, family_name: str, ignore_directory_count_limit: bool):
+@shard_option
+@status_options
+@walk_filter_options
+@hash_lists_options
+@dry_run_options
+def index(path: str,
+          index_as: str,
+          family_name: str,
+          ignore_directory_count_limit: bool,
+          dry_run: bool,
+          throughput_model: Optional[estimates.ThroughputModel],
+          shard: Optional[sharding.Shard],
+          walk_filter: walk_filters.WalkFilter,
+          hash_lists: Optional[hash_index.HashLists]):
     """ Send a file or a directory for indexing
 
     \b
-    PATH: Path to file or directory to index
+    PATH: Path to file or directory to index, or - to read newline or NUL separated file paths from stdin
 
     \b
     Examples:
@@ -231,7 +796,14 @@ def index(path: str, index_as: str, family_name: str, ignore_directory_count_lim
       \b
       index all files in directory:
       $ intezer-analyze index ~/files/files-to-index trusted
+      \b
+      index the files that find outputs:
+      $ find ~/files -name '*.dll' -print0 | intezer-analyze index - trusted
     """
+    if dry_run and not os.path.isdir(path):
+        click.echo('--dry-run requires a directory')
+        raise click.Abort()
+
     try:
         index_type = sdk_consts.IndexType.from_str(index_as)
 
@@ -239,21 +811,34 @@ def index(path: str, index_as: str, family_name: str, ignore_directory_count_lim
             click.echo('family_name is mandatory if the index type is malicious')
             return
 
-        create_global_api()
-
-        if os.path.isfile(path):
-            commands.index_file_command(file_path=path, index_as=index_as, family_name=family_name)
+        if not dry_run:
+            create_global_api()
+
+        if path == '-':
+            commands.index_paths_stream_command(utilities.read_stream_items(click.get_binary_stream('stdin')),
+                                                index_as=index_as,
+                                                family_name=family_name,
+                                                shard=shard,
+                                                hash_lists=hash_lists)
+        elif os.path.isfile(path):
+            commands.index_file_command(file_path=path,
+                                        index_as=index_as,
+                                        family_name=family_name,
+                                        hash_lists=hash_lists)
         else:
             commands.index_directory_command(directory_path=path,
                                              index_as=index_as,
                                              family_name=family_name,
-                                             ignore_directory_count_limit=ignore_directory_count_limit)
+                                             ignore_directory_count_limit=ignore_directory_count_limit,
+                                             dry_run=dry_run,
+                                             throughput_model=throughput_model,
+                                             shard=shard,
+                                             walk_filter=walk_filter,
+                                             hash_lists=hash_lists)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
 
 
 @main_cli.command('upload-endpoint-scan', short_help='upload a directory with offline endpoint scan results')
@@ -280,16 +865,22 @@ def upload_endpoint_scan(offline_scan_directory: str, force: bool, max_concurren
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
 
 @main_cli.command('upload-endpoint-scans-in-directory',
               short_help='upload all subdirectories with offline endpoint scan results')
 @click.argument('offline_scans_root_directory', type=click.Path(exists=True))
 @click.option('--force', is_flag=True, default=False, help='Upload scans even if they were already uploaded')
 @click.option('--max-concurrent', default=0, type=int, help='Maximum number of concurrent uploads.')
-def upload_endpoint_scans_in_directory(offline_scans_root_directory: str, force: bool = False, max_concurrent: int = 0):
+@shard_option
+@status_options
+@walk_filter_options
+def upload_endpoint_scans_in_directory(offline_scans_root_directory: str,
+                                       force: bool = False,
+                                       max_concurrent: int = 0,
+                                       shard: sharding.Shard = None,
+                                       walk_filter: walk_filters.WalkFilter = None):
     """ Upload all subdirectories with offline endpoint scan results
 
 
@@ -300,18 +891,23 @@ def upload_endpoint_scans_in_directory(offline_scans_root_directory: str, force:
       upload a directory with offline endpoint scan results:
 
       $ intezer-analyze upload-endpoint-scans-in-directory /path/to/endpoint_scan_results_root
+
+      upload the scans whose directory name doesn't match a pattern:
+
+      $ intezer-analyze upload-endpoint-scans-in-directory --prune 'test-*' /path/to/endpoint_scan_results_root
     """
     try:
         create_global_api()
         commands.upload_multiple_offline_endpoint_scans(offline_scans_root_directory=offline_scans_root_directory,
                                                         force=force,
-                                                        max_concurrent_uploads=max_concurrent)
+                                                        max_concurrent_uploads=max_concurrent,
+                                                        shard=shard,
+                                                        walk_filter=walk_filter)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
 
 @main_cli.command('upload-emails-in-directory',
               short_help='upload all subdirectories with .emal files')
@@ -319,7 +915,25 @@ def upload_endpoint_scans_in_directory(offline_scans_root_directory: str, force:
 @click.option('--ignore-directory-count-limit',
               is_flag=True,
               help='ignore directory count limit ({} files)'.format(default_config.unusual_amount_in_dir))
-def upload_emails_in_directory(emails_root_directory: str, ignore_directory_count_limit: bool = False):
+@click.option('--watch',
+              is_flag=True,
+              help='Keep running and send the files that are added to the directory, until interrupted.')
+@click.option('--settle-time',
+              default=default_config.watch_settle_time,
+              type=click.FloatRange(min=0),
+              show_default=True,
+              help='With --watch, seconds a file size should stay unchanged before sending it, '
+                   'when the directory is polled.')
+@status_options
+@walk_filter_options
+@dry_run_options
+def upload_emails_in_directory(emails_root_directory: str,
+                               ignore_directory_count_limit: bool = False,
+                               watch: bool = False,
+                               settle_time: float = None,
+                               dry_run: bool = False,
+                               throughput_model: estimates.ThroughputModel = None,
+                               walk_filter: walk_filters.WalkFilter = None):
     """ Upload all subdirectories with .eml files to analyze
 
 
@@ -330,17 +944,37 @@ def upload_emails_in_directory(emails_root_directory: str, ignore_directory_coun
       upload a directory with .eml files:
 
       $ intezer-analyze upload-emails-in-directory /path/to/emails_root_directory
+
+      upload the .eml files that are added to a directory, until interrupted:
+
+      $ intezer-analyze upload-emails-in-directory --watch /path/to/emails_root_directory
+
+      estimate the quota use and duration of uploading a directory, without uploading it:
+
+      $ intezer-analyze upload-emails-in-directory --dry-run /path/to/emails_root_directory
     """
+    if dry_run and watch:
+        click.echo('--dry-run cant be used with --watch')
+        raise click.Abort()
+
     try:
-        create_global_api()
-        commands.send_phishing_emails_from_directory_command(path=emails_root_directory,
-                                                             ignore_directory_count_limit=ignore_directory_count_limit)
+        if not dry_run:
+            create_global_api()
+        if watch:
+            commands.send_phishing_emails_watch_command(path=emails_root_directory,
+                                                        settle_time=settle_time,
+                                                        walk_filter=walk_filter)
+        else:
+            commands.send_phishing_emails_from_directory_command(
+                path=emails_root_directory,
+                ignore_directory_count_limit=ignore_directory_count_limit,
+                dry_run=dry_run,
+                throughput_model=throughput_model,
+                walk_filter=walk_filter)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
 
 
 @main_cli.group('alerts', short_help='Alert management commands')
@@ -351,7 +985,32 @@ def alerts():
 
 @alerts.command('notify-from-csv', short_help='Notify alerts from CSV file')
 @click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
-def notify_from_csv(csv_path: str):
+@click.option('--max-concurrent',
+              default=default_config.max_concurrent_alert_notifications,
+              type=click.IntRange(min=1),
+              help='Maximum number of concurrent notifications.')
+@click.option('--in-progress-deadline',
+              default=default_config.alerts_in_progress_deadline,
+              type=click.IntRange(min=0),
+              show_default=True,
+              help='Seconds to keep retrying alerts that are still in progress. By default they are counted as '
+                   'failed right away.')
+@click.option('--in-progress-retry-interval',
+              default=default_config.alerts_in_progress_retry_interval,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Seconds between retries of an alert that is still in progress.')
+@click.option('--replay-file',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help='CSV file to write the alerts that are still in progress at the deadline '
+                   f'(default: {default_config.alerts_replay_file_name} in the current directory).')
+@status_options
+def notify_from_csv(csv_path: str,
+                    max_concurrent: int,
+                    in_progress_deadline: int,
+                    in_progress_retry_interval: int,
+                    replay_file: str):
     """Notify alerts from a CSV file containing alert IDs and environments.
 
     \b
@@ -363,6 +1022,12 @@ def notify_from_csv(csv_path: str):
       - id: Alert ID (required)
       - environment: Environment name (required)
 
+    \b
+    Duplicated (id, environment) rows are notified only once.
+    Alerts that are still in progress are counted as failed. With --in-progress-deadline they are
+    retried until the deadline while the rest of the alerts are notified, the ones still in
+    progress at the deadline are written to a replay file.
+
     \b
     Examples:
       Notify alerts from CSV file:
@@ -370,13 +1035,293 @@ def notify_from_csv(csv_path: str):
     """
     try:
         create_global_api()
-        commands.notify_alerts_from_csv_command(csv_path=csv_path)
+        commands.notify_alerts_from_csv_command(csv_path=csv_path,
+                                                max_concurrent=max_concurrent,
+                                                in_progress_deadline=in_progress_deadline,
+                                                in_progress_retry_interval=in_progress_retry_interval,
+                                                replay_file_path=replay_file)
     except click.Abort:
         raise
     except Exception:
-        logger.exception('Unexpected error occurred')
-        click.echo('Unexpected error occurred, please contact us at support@intezer.com '
-                   f'and attach the log file in {utilities.log_file_path}')
+        _echo_unexpected_error()
+
+
+@main_cli.command('run-jobs', short_help='Run many operations listed in a job file in one process')
+@click.argument('job_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--max-concurrent',
+              default=default_config.max_concurrent_jobs,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Maximum number of jobs to run at the same time.')
+@click.option('--report', 'report_path',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=f'JSON report file (default: {default_config.jobs_report_file_name} in the current directory).')
+@status_options
+def run_jobs(job_file: str, max_concurrent: int, report_path: str):
+    """Run the operations listed in a JSON or YAML job file with one authenticated session.
+
+    \b
+    JOB_FILE: Path to a JSON or YAML (requires PyYAML) file with a list of jobs. Every job has a "command",
+    one of: analyze, analyze-by-list, index, index-by-list, upload-endpoint-scan,
+    upload-endpoint-scans-in-directory, upload-emails-in-directory, alerts-notify-from-csv,
+    a "path" and the command options.
+
+    \b
+    Job file example:
+      {"jobs": [{"command": "analyze", "path": "/files/to/analyze", "no_unpacking": true},
+                {"command": "index-by-list", "path": "/files/hashes.txt", "index_as": "trusted"}]}
+
+    \b
+    Examples:
+      $ intezer-analyze run-jobs ~/jobs.json --report ~/jobs-report.json
+    """
+    try:
+        jobs_to_run = jobs.read_job_file(job_file)
+    except ValueError as e:
+        click.echo(f'Invalid job file: {e}')
+        raise click.Abort()
+
+    try:
+        create_global_api()
+        jobs.run_jobs_command(jobs_to_run, max_concurrent=max_concurrent, report_path=report_path)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('serve', short_help='Serve submissions of local clients with one warm session')
+@click.option('--socket', 'socket_path',
+              type=click.Path(dir_okay=False),
+              default=None,
+              help='Listen on this Unix socket instead of the loopback interface.')
+@click.option('--port',
+              default=default_config.server_default_port,
+              type=click.IntRange(min=0, max=65535),
+              show_default=True,
+              help='Loopback port to listen on when no socket is given.')
+@click.option('--max-in-flight',
+              default=default_config.server_max_in_flight,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Maximum number of submissions to send at the same time, '
+                   'more submissions are rejected with 503 and Retry-After.')
+@click.option('--token-file', 'token_path',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help='On the loopback interface, the file the token of the server is written to '
+                   f'(default: {default_config.server_token_file_name_template} in the key directory).')
+def serve(socket_path: str, port: int, max_in_flight: int, token_path: str):
+    """Keep an authenticated session open and send the files and hashes that local clients submit.
+
+    \b
+    POST /analyze with {"path": "/file/to/analyze"} or {"hash": "<sha256>"} returns {"analysis_id": "..."},
+    "no_unpacking", "no_static_extraction" and "code_item_type" are optional. The body should be sent as
+    application/json. On the loopback interface, every request should also carry the token of the server, that is
+    written to a file only the user can read, as "Authorization: Bearer <token>".
+    GET /health returns the state of the server.
+
+    \b
+    Examples:
+      $ intezer-analyze serve --socket /run/intezer/analyze.sock
+      $ curl --unix-socket /run/intezer/analyze.sock -H 'Content-Type: application/json' \\
+          -d '{"path": "/tmp/file.exe"}' http://localhost/analyze
+      $ intezer-analyze serve --port 8643 --token-file ~/.intezer/server-token
+      $ curl -H "Authorization: Bearer $(cat ~/.intezer/server-token)" -H 'Content-Type: application/json' \\
+          -d '{"hash": "<sha256>"}' http://127.0.0.1:8643/analyze
+    """
+    try:
+        create_global_api()
+        try:
+            submission_server = server.create_server(socket_path, port, max_in_flight, token_path)
+        except (ValueError, OSError) as e:
+            click.echo(f'Cant start the server: {e}')
+            raise click.Abort()
+
+        click.echo(f'Serving on {submission_server.address}')
+        if isinstance(submission_server, server.LoopbackSubmissionServer):
+            click.echo(f'The token of the server is in {submission_server.token_path}')
+        server.serve_command(submission_server)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('enqueue', short_help='Add files, hashes, endpoint scans or alerts to a shared work queue')
+@click.argument('queue_path', type=click.Path(dir_okay=False))
+@click.argument('kind', type=click.Choice(work_queue.ITEM_KINDS))
+@click.argument('source', type=click.Path(exists=True, allow_dash=True))
+@click.option('--no-unpacking', is_flag=True, help='For files, should the analysis skip unpacking')
+@click.option('--no-static-extraction', is_flag=True, help='For files, should the analysis skip static extraction')
+@click.option('--code-item-type', type=click.Choice([c.value for c in CodeItemType]), default=None,
+              help='For files, the type of the binary file uploaded')
+@click.option('--force', is_flag=True, default=False, help='For endpoint scans, upload scans even if they were '
+                                                           'already uploaded')
+@walk_filter_options
+def enqueue(queue_path: str,
+            kind: str,
+            source: str,
+            no_unpacking: bool,
+            no_static_extraction: bool,
+            code_item_type: str,
+            force: bool,
+            walk_filter: walk_filters.WalkFilter):
+    """Add work items to a shared work queue, to be processed by any number of `intezer-analyze worker` processes.
+
+    \b
+    QUEUE_PATH: The SQLite queue file, created if it doesn't exist. Workers on other hosts can share it over
+    a shared filesystem.
+    KIND: The kind of the items, one of:
+      file: SOURCE is a file, a directory of files, or - to read file paths from stdin.
+      hash: SOURCE is a text file of hashes, or - to read hashes from stdin.
+      endpoint-scan: SOURCE is a directory of offline endpoint scans.
+      alert: SOURCE is a CSV file with 'id' and 'environment' columns.
+
+    \b
+    Examples:
+      $ intezer-analyze enqueue /shared/queue.sqlite file ~/files/directory --no-unpacking
+      $ intezer-analyze enqueue /shared/queue.sqlite alert ~/alerts.csv
+      $ intezer-analyze worker /shared/queue.sqlite
+    """
+    if source == '-' and kind not in ('file', 'hash'):
+        click.echo('Only file paths and hashes can be read from stdin')
+        raise click.Abort()
+    if kind == 'endpoint-scan' and not os.path.isdir(source):
+        click.echo('Endpoint scans should be enqueued from a directory of offline endpoint scans')
+        raise click.Abort()
+    if kind in ('hash', 'alert') and os.path.isdir(source):
+        click.echo(f'{kind.capitalize()} items should be enqueued from a file')
+        raise click.Abort()
+
+    if kind == 'file':
+        options = dict(no_unpacking=no_unpacking,
+                       no_static_extraction=no_static_extraction,
+                       code_item_type=code_item_type)
+    elif kind == 'endpoint-scan':
+        options = dict(force=force)
+    else:
+        options = {}
+
+    try:
+        commands.enqueue_command(queue_path, kind, source, walk_filter=walk_filter, **options)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('worker', short_help='Process the items of a shared work queue')
+@click.argument('queue_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--max-concurrent',
+              default=default_config.work_queue_max_concurrent,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Maximum number of items to process at the same time.')
+@click.option('--lease-duration',
+              default=default_config.work_queue_lease_duration,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Seconds an item stays leased to this worker without being extended. The items of a worker '
+                   'that died are leased by other workers once their lease expires.')
+@click.option('--exit-when-empty',
+              is_flag=True,
+              help='Exit once no items are pending or leased, instead of waiting for new items.')
+@status_options
+def worker(queue_path: str, max_concurrent: int, lease_duration: int, exit_when_empty: bool):
+    """Lease items from a shared work queue, process them and mark them as done.
+
+    \b
+    QUEUE_PATH: The SQLite queue file that items are added to with `intezer-analyze enqueue`.
+
+    \b
+    A failed item, or an item whose worker died, is retried a limited number of times.
+
+    \b
+    Examples:
+      Run a worker on every host that mounts the shared filesystem:
+      $ intezer-analyze worker /shared/queue.sqlite --max-concurrent 8
+    """
+    try:
+        create_global_api()
+        commands.run_worker_command(queue_path,
+                                    max_concurrent=max_concurrent,
+                                    lease_duration=lease_duration,
+                                    exit_when_empty=exit_when_empty)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('queue-status', short_help='Show the number of items of a shared work queue by status')
+@click.argument('queue_path', type=click.Path(exists=True, dir_okay=False))
+def queue_status(queue_path: str):
+    """Show the number of pending, leased, done and failed items of a shared work queue, and the failed items.
+
+    \b
+    Examples:
+      $ intezer-analyze queue-status /shared/queue.sqlite
+    """
+    try:
+        commands.queue_status_command(queue_path)
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('retry-failed', short_help='Retry only the items that failed in a previous run')
+@click.argument('failures_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--max-concurrent',
+              default=default_config.retry_failed_max_concurrent,
+              type=click.IntRange(min=1),
+              show_default=True,
+              help='Maximum number of items to retry at the same time.')
+@status_options
+def retry_failed(failures_path: str, max_concurrent: int):
+    """Retry the items of a failures file with the options of the run that failed them.
+
+    \b
+    FAILURES_PATH: A failures file written by analyze, index-by-list, upload-emails-in-directory or
+    alerts notify-from-csv, or by a previous retry-failed. The items that fail again are written to a new
+    failures file.
+
+    \b
+    Examples:
+      $ intezer-analyze retry-failed intezer-failures-analyze-20240101-120000-000000.jsonl
+    """
+    try:
+        create_global_api()
+        commands.retry_failed_command(failures_path, max_concurrent=max_concurrent)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
+
+@main_cli.command('build-hash-index', short_help='Build a hash index for --allowlist or --blocklist')
+@click.argument('index_path', type=click.Path(dir_okay=False, writable=True))
+@click.argument('sources', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def build_hash_index(index_path: str, sources: tuple):
+    """Build a compact hash index from text files of SHA256 hashes, to use with --allowlist or --blocklist.
+
+    \b
+    INDEX_PATH: The hash index file to write.
+    SOURCES: Text files with a SHA256 hash in every line, such as the NSRL hash lists. The first SHA256 of every
+    line is indexed, other columns are ignored.
+
+    \b
+    Examples:
+      $ intezer-analyze build-hash-index ~/known-good.idx ~/nsrl/hashes.txt ~/our-allowlist.txt
+      $ intezer-analyze analyze --allowlist ~/known-good.idx ~/files/files-to-analyze
+    """
+    try:
+        commands.build_hash_index_command(list(sources), index_path)
+    except click.Abort:
+        raise
+    except Exception:
+        _echo_unexpected_error()
+
 
 if __name__ == '__main__':
     try:
@@ -1,10 +1,27 @@
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
 import csv
+import hashlib
+import itertools
 import logging
 import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
 from io import BytesIO
+from typing import BinaryIO
+from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import TypeVar
 from email.utils import parsedate_to_datetime
 
 import click
@@ -16,16 +33,43 @@ from intezer_sdk.analysis import FileAnalysis
 from intezer_sdk.endpoint_analysis import EndpointAnalysis
 from intezer_sdk.index import Index
 
+from intezer_analyze_cli import analysis_cache
+from intezer_analyze_cli import api_client
+from intezer_analyze_cli import archives
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import estimates
+from intezer_analyze_cli import failures
+from intezer_analyze_cli import file_index
+from intezer_analyze_cli import hash_index
 from intezer_analyze_cli import key_store
+from intezer_analyze_cli import metrics
+from intezer_analyze_cli import pipeline
+from intezer_analyze_cli import profiles
+from intezer_analyze_cli import progress
+from intezer_analyze_cli import results
+from intezer_analyze_cli import sharding
 from intezer_analyze_cli import utilities
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli import watcher as directory_watcher
+from intezer_analyze_cli import work_queue
 from intezer_analyze_cli.config import default_config
 from intezer_analyze_cli.utilities import is_hidden
 
 logger = logging.getLogger('intezer_cli')
 
+T = TypeVar('T')
 
-def login(api_key: str, api_url: str):
+
+def login(api_key: str, api_url: str, profile_name: str = None, weight: int = 1):
     try:
+        if profile_name:
+            api.set_global_api(api_key, default_config.api_version, api_url or default_config.api_url)
+            api.get_global_api().authenticate()
+            _delete_replaced_cached_tokens(api_key, (key_store.get_stored_profile(profile_name) or {}).get('api_key'))
+            key_store.store_profile(profile_name, api_key, api_url, weight)
+            click.echo(f'You have successfully logged in to profile {profile_name}')
+            return
+
         if api_url:
             key_store.store_default_url(api_url)
         else:
@@ -34,6 +78,7 @@ def login(api_key: str, api_url: str):
 
         api.set_global_api(api_key, default_config.api_version, api_url)
         api.get_global_api().authenticate()
+        _delete_replaced_cached_tokens(api_key, key_store.get_stored_api_key())
         key_store.store_api_key(api_key)
         click.echo('You have successfully logged in')
     except sdk_errors.InvalidApiKey:
@@ -42,26 +87,228 @@ def login(api_key: str, api_url: str):
         raise click.Abort()
 
 
+def _delete_replaced_cached_tokens(api_key: str, replaced_api_key: Optional[str]):
+    """Drop the cached access tokens of the key that logged in and of the key it replaces, if any"""
+    for cached_api_key in {api_key, replaced_api_key} - {None}:
+        key_store.delete_cached_tokens(cached_api_key)
+
+
+def _send_with_profiles(send: Callable[[Optional[api.IntezerApiClient]], T]) -> T:
+    """
+    Send an operation with the API of the next profile in the rotation, when the profile is out of quota or
+    throttled the operation is sent again with another profile.
+
+    :param send: Creates and sends the operation with the given API, None means the global API
+    :return: The return value of send
+    """
+    with metrics.track_submission():
+        while True:
+            profile_api = profiles.next_api()
+            try:
+                return send(profile_api)
+            except (sdk_errors.InsufficientQuota, sdk_errors.AnalysisRateLimitError) as e:
+                if isinstance(e, sdk_errors.InsufficientQuota):
+                    metrics.increment('quota_errors')
+                if not profiles.remove_from_rotation(profile_api, e):
+                    raise
+                logger.info('Sending again with another profile', extra=dict(error=str(e)))
+
+
+def _get_system_url(used_api: Optional[api.IntezerApiClient] = None) -> str:
+    """The url of the web app of the API an operation was sent with, None means the global API"""
+    if used_api is None:
+        try:
+            used_api = api.get_global_api()
+        except sdk_errors.GlobalApiIsNotInitializedError:
+            return default_config.api_url.replace('/api/', '')
+    return used_api.base_url.replace('/api/', '')
+
+
+def _get_system_urls() -> List[str]:
+    """The urls of the web apps the run sends to, the profiles of the run may be on several"""
+    return list(dict.fromkeys(_get_system_url(profile_api) for profile_api in profiles.get_apis() or [None]))
+
+
+def _get_history_page_url(tab_name: str) -> str:
+    return ' '.join(default_config.history_page_url_template.format(system_url=system_url, tab_name=tab_name)
+                    for system_url in _get_system_urls())
+
+
+def _send_file_analysis(profile_api: Optional[api.IntezerApiClient] = None, **kwargs) -> FileAnalysis:
+    analysis = FileAnalysis(api=profile_api, **kwargs)
+    analysis.send()
+    return analysis
+
+
+def _send_index(profile_api: Optional[api.IntezerApiClient] = None, wait: bool = False, **kwargs) -> Index:
+    index = Index(api=profile_api, **kwargs)
+    index.send()
+    if wait:
+        _wait_for_index(index, sleep_before_first_check=True)
+    return index
+
+
+def _wait_for_index(index: Index, sleep_before_first_check: bool = False):
+    """
+    Index.wait_for_completion, that gives up on the index after the operation timeout and stops at the deadline of
+    the run, instead of polling forever.
+
+    :raises deadlines.OperationTimeoutError: If the index didn't complete within the operation timeout
+    """
+    if index.status not in (sdk_consts.IndexStatusCode.CREATED, sdk_consts.IndexStatusCode.IN_PROGRESS):
+        return
+
+    started_at = time.monotonic()
+    if sleep_before_first_check:
+        deadlines.sleep(default_config.operation_poll_interval)
+    while index.check_status() != sdk_consts.IndexStatusCode.FINISHED:
+        if time.monotonic() - started_at >= default_config.operation_timeout:
+            raise deadlines.OperationTimeoutError(index.index_id, default_config.operation_timeout)
+        deadlines.sleep(default_config.operation_poll_interval)
+
+
+@contextlib.contextmanager
+def _record_not_done_on_deadline(command: str,
+                                 pending_items: Iterable[str],
+                                 failures_writer: Optional[failures.FailuresWriter],
+                                 progress_renderer: progress.ProgressRenderer = None) -> Iterator[None]:
+    """
+    When the deadline of the run passes, record the items that are still pending as not done, in the results and in
+    the failures file so they can be retried.
+
+    :param pending_items: The items that were not done yet, read only when the deadline passes
+    :param failures_writer: None when the items can't be retried
+    :param progress_renderer: The progress of the run, the message is shown above it
+    """
+    try:
+        yield
+    except deadlines.DeadlineExceeded as e:
+        pending_items = list(pending_items)
+        for item in pending_items:
+            results.record_result(command, item, 'not_done')
+            if failures_writer:
+                failures_writer.record(item, e)
+        logger.warning('Run stopped by the deadline', extra=dict(command=command, not_done=len(pending_items)))
+        message = f'The deadline passed, {len(pending_items)} items were not done'
+        if progress_renderer:
+            progress_renderer.echo(message)
+        else:
+            click.echo(message)
+        raise
+
+
+def _send_phishing_email(raw_email: BytesIO, profile_api: Optional[api.IntezerApiClient] = None):
+    raw_email.seek(0)
+    return Alert.send_phishing_email(raw_email=raw_email, api=profile_api)
+
+
+def send_file_for_analysis(file_path: Optional[str],
+                           disable_dynamic_unpacking: bool = None,
+                           disable_static_unpacking: bool = None,
+                           code_item_type: str = None,
+                           file_stream: BinaryIO = None,
+                           file_name: str = None) -> str:
+    """
+    Send a file, or a stream of a file that isn't on the disk, for analysis.
+
+    :return: The analysis id
+    """
+    analysis_id, _ = _send_file_for_analysis(file_path,
+                                             disable_dynamic_unpacking=disable_dynamic_unpacking,
+                                             disable_static_unpacking=disable_static_unpacking,
+                                             code_item_type=code_item_type,
+                                             file_stream=file_stream,
+                                             file_name=file_name)
+    return analysis_id
+
+
+def _send_file_for_analysis(file_path: Optional[str],
+                            disable_dynamic_unpacking: bool = None,
+                            disable_static_unpacking: bool = None,
+                            code_item_type: str = None,
+                            file_stream: BinaryIO = None,
+                            file_name: str = None) -> Tuple[str, str]:
+    """
+    Send a file for analysis, like send_file_for_analysis.
+
+    :return: The analysis id, and the url of the analysis page on the web app of the profile it was sent with
+    """
+    used_apis = []
+
+    def send(profile_api: Optional[api.IntezerApiClient]) -> FileAnalysis:
+        used_apis.append(profile_api)
+        if file_stream:
+            # The stream is read again when the analysis is sent with another profile
+            file_stream.seek(0)
+        return _send_file_analysis(profile_api,
+                                   file_path=file_path,
+                                   file_stream=file_stream,
+                                   file_name=file_name,
+                                   code_item_type=code_item_type,
+                                   disable_dynamic_unpacking=disable_dynamic_unpacking,
+                                   disable_static_unpacking=disable_static_unpacking)
+
+    analysis = _send_with_profiles(send)
+    metrics.increment('bytes_sent', file_stream.seek(0, os.SEEK_END) if file_stream else _get_file_size(file_path))
+    analysis_page_url = default_config.file_analysis_url_template.format(system_url=_get_system_url(used_apis[-1]),
+                                                                         analysis_id=analysis.analysis_id)
+    return analysis.analysis_id, analysis_page_url
+
+
+def send_hash_for_analysis(file_hash: str) -> str:
+    """
+    Send a file hash for analysis.
+
+    :return: The analysis id
+    """
+    analysis = _send_with_profiles(lambda profile_api: _send_file_analysis(profile_api, file_hash=file_hash))
+    return analysis.analysis_id
+
+
+def _send_hash_with_cache(file_hash: str,
+                          cache: Optional[analysis_cache.AnalysisCache],
+                          max_age: float) -> Tuple[str, bool]:
+    """
+    Send a file hash for analysis, unless the cache has an analysis of the hash that isn't older than max_age.
+
+    :return: The analysis id, and whether it was taken from the cache
+    """
+    if cache and max_age:
+        cached_analysis = cache.get(file_hash, max_age)
+        if cached_analysis:
+            return cached_analysis.analysis_id, True
+
+    analysis_id = send_hash_for_analysis(file_hash)
+    if cache and analysis_id:
+        cache.set(file_hash, analysis_id)
+    return analysis_id, False
+
+
 def analyze_file_command(file_path: str,
                          disable_dynamic_unpacking: bool,
                          disable_static_unpacking: bool,
-                         code_item_type: str):
-    if disable_dynamic_unpacking and not utilities.is_supported_file(file_path):
+                         code_item_type: str,
+                         hash_lists: hash_index.HashLists = None):
+    """
+    :param hash_lists: The allowlists and blocklists the file is matched with, a file that matches isn't sent
+    """
+    if disable_dynamic_unpacking and not _is_supported_file(file_path):
         click.echo('File is not PE, ELF, DEX or APK')
         return
+    if _is_in_hash_lists(file_path, hash_lists):
+        return
 
     try:
-        analysis = FileAnalysis(file_path=file_path,
-                                code_item_type=code_item_type,
-                                disable_dynamic_unpacking=disable_dynamic_unpacking,
-                                disable_static_unpacking=disable_static_unpacking)
-        analysis.send()
-        analysis_page_url = default_config.file_analysis_url_template.format(
-            system_url=default_config.api_url.replace('/api/', ''),
-            analysis_id=analysis.analysis_id
-        )
+        with _track_upload_progress(file_path):
+            analysis_id, analysis_page_url = _send_file_for_analysis(
+                file_path,
+                disable_dynamic_unpacking=disable_dynamic_unpacking,
+                disable_static_unpacking=disable_static_unpacking,
+                code_item_type=code_item_type)
+        results.record_result('analyze', file_path, 'success', analysis_id=analysis_id)
         click.echo(f'Analysis created. In order to check its result, go to: {analysis_page_url}')
     except sdk_errors.IntezerError as e:
+        results.record_result('analyze', file_path, 'failed', error=str(e))
         click.echo(f'Analyze error: {e}')
 
 
@@ -69,54 +316,746 @@ def analyze_directory_command(path: str,
                               disable_dynamic_unpacking: bool,
                               disable_static_unpacking: bool,
                               code_item_type: str,
-                              ignore_directory_count_limit: bool):
-    success_number = 0
-    failed_number = 0
-    unsupported_number = 0
+                              ignore_directory_count_limit: bool,
+                              dry_run: bool = False,
+                              throughput_model: estimates.ThroughputModel = None,
+                              shard: sharding.Shard = None,
+                              walk_filter: walk_filters.WalkFilter = None,
+                              hash_lists: hash_index.HashLists = None):
+    """
+    :param dry_run: Walk, filter and classify the files without sending them, and estimate the cost of the run
+    :param throughput_model: In a dry run, the throughput of the service the duration is projected with
+    :param shard: Send only the files of this shard of the directory
+    :param walk_filter: The files and subdirectories of the directory to skip
+    :param hash_lists: The allowlists and blocklists the files are matched with, the files that match aren't sent
+    """
+    cost_estimate = estimates.CostEstimate('analyses', throughput_model) if dry_run else None
+    failures_writer = failures.FailuresWriter('analyze',
+                                              no_unpacking=disable_dynamic_unpacking,
+                                              no_static_extraction=disable_static_unpacking,
+                                              code_item_type=code_item_type)
+
+    with failures_writer, progress.ProgressRenderer('Sending files for analysis', length=0) as progress_renderer:
+        report = pipeline.Report('analyze', progress_renderer, failures_writer, cost_estimate)
+        stages = [pipeline.shard_filter(progress_renderer, shard)]
+        if disable_dynamic_unpacking:
+            stages.append(pipeline.Stage('classify', _classify_supported_file))
+        stages.append(_hash_lists_stage(hash_lists))
+        if not dry_run:
+            stages.append(_submit_analysis_stage(failures_writer,
+                                                 disable_dynamic_unpacking,
+                                                 disable_static_unpacking,
+                                                 code_item_type))
+        _run_directory_pipeline('analyze',
+                                pipeline.discover(path, walk_filter, ignore_directory_count_limit, progress_renderer),
+                                stages,
+                                report,
+                                progress_renderer,
+                                failures_writer)
+
+    if cost_estimate:
+        _echo_dry_run_summary(cost_estimate, report.results_counter['unsupported'], report.hash_lists_results)
+        return
+    _echo_analyses_summary(report.results_counter['success'],
+                           report.results_counter['failed'],
+                           report.results_counter['unsupported'])
+    _echo_hash_lists_summary(report.hash_lists_results)
+
+
+def _run_directory_pipeline(command: str,
+                            items: Iterable[pipeline.PipelineItem],
+                            stages: List[pipeline.Stage],
+                            report: Callable[[pipeline.PipelineItem], None],
+                            progress_renderer: progress.ProgressRenderer,
+                            failures_writer: Optional[failures.FailuresWriter],
+                            queue_size: int = None):
+    """Run the stages of a directory command on the discovered files"""
+    directory_pipeline = pipeline.Pipeline(stages, report, queue_size, progress_renderer)
+    with _record_not_done_on_deadline(command,
+                                      directory_pipeline.pending_paths,
+                                      failures_writer,
+                                      progress_renderer):
+        directory_pipeline.run(items)
+
+
+def _submit_analysis_stage(failures_writer: Optional[failures.FailuresWriter],
+                           disable_dynamic_unpacking: bool,
+                           disable_static_unpacking: bool,
+                           code_item_type: str) -> pipeline.Stage:
+    """The submit stage of the analyze directory commands, items that were read in memory are sent as streams"""
+    def submit(item: pipeline.PipelineItem):
+        try:
+            analysis_id = send_file_for_analysis(None if item.data else item.path,
+                                                 disable_dynamic_unpacking=disable_dynamic_unpacking,
+                                                 disable_static_unpacking=disable_static_unpacking,
+                                                 code_item_type=code_item_type,
+                                                 file_stream=item.data,
+                                                 file_name=item.file_name if item.data else None)
+            item.finish('success', analysis_id=analysis_id)
+        except sdk_errors.InsufficientQuota as e:
+            # We cannot continue analyzing the directory if the account is out of quota
+            logger.error('Failed to analyze %s', item.path)
+            results.record_result('analyze', item.path, 'failed', error=str(e))
+            if failures_writer:
+                failures_writer.record(item.path, e)
+            raise
+        except Exception as e:
+            logger.exception('Failed to analyze %s', item.path)
+            item.finish('failed', e)
+        item.data = None
+
+    return pipeline.Stage('submit', submit)
+
+
+def _hash_lists_stage(hash_lists: Optional[hash_index.HashLists]) -> pipeline.Stage:
+    """The hash stage of the directory commands, the files that are in the hash lists are not sent"""
+    def match_hash_lists(item: pipeline.PipelineItem):
+        if not hash_lists:
+            return
+        if item.data:
+            item.sha256 = hashlib.sha256(item.data.getbuffer()).hexdigest()
+        else:
+            try:
+                item.sha256 = utilities.get_file_sha256(item.path)
+            except OSError:
+                logger.exception('Failed to hash file', extra=dict(file_path=item.path))
+                return
+        _finish_in_hash_lists(item, hash_lists)
+
+    return pipeline.Stage('hash', match_hash_lists)
+
+
+def _match_hash_lists(file_path: str,
+                      hash_lists: Optional[hash_index.HashLists]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Match the hash of a file with the allowlists and blocklists, a file that matches isn't sent.
+
+    :return: hash_index.KNOWN_GOOD, hash_index.KNOWN_BAD or None when the file doesn't match or there are no lists,
+             and the SHA256 of the file when it was hashed
+    """
+    if not hash_lists:
+        return None, None
+    try:
+        sha256 = utilities.get_file_sha256(file_path)
+    except OSError:
+        logger.exception('Failed to hash file', extra=dict(file_path=file_path))
+        return None, None
+
+    return _match_sha256(file_path, sha256, hash_lists), sha256
+
+
+def _match_sha256(file_path: str, sha256: str, hash_lists: Optional[hash_index.HashLists]) -> Optional[str]:
+    """Match the hash of a file that was already hashed with the allowlists and blocklists"""
+    if not hash_lists:
+        return None
+    result = hash_lists.match(sha256)
+    if result == hash_index.KNOWN_GOOD:
+        logger.info('File is in the allowlist', extra=dict(file_path=file_path, sha256=sha256))
+    return result
+
+
+def _finish_in_hash_lists(item: pipeline.PipelineItem, hash_lists: Optional[hash_index.HashLists]):
+    """Finish an item whose SHA256 the hash stage computed when it's in the hash lists"""
+    hash_lists_result = _match_sha256(item.path, item.sha256, hash_lists)
+    if hash_lists_result == hash_index.KNOWN_BAD:
+        item.message = _get_blocklist_message(item.path, item.sha256)
+    if hash_lists_result:
+        item.finish(hash_lists_result)
+
+
+def _is_in_hash_lists(file_path: str, hash_lists: Optional[hash_index.HashLists]) -> bool:
+    """Match a single file with the hash lists, and tell why it isn't sent when it matches"""
+    hash_lists_result, sha256 = _match_hash_lists(file_path, hash_lists)
+    if hash_lists_result == hash_index.KNOWN_BAD:
+        click.echo(_get_blocklist_message(file_path, sha256))
+    elif hash_lists_result == hash_index.KNOWN_GOOD:
+        click.echo('File is in the allowlist, it was not sent')
+    return bool(hash_lists_result)
+
+
+def _record_hash_lists_match(command: str,
+                             file_path: str,
+                             hash_lists: Optional[hash_index.HashLists]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Match a file of a stream or of a watched directory with the hash lists, a file that matches is recorded in the
+    results and isn't sent.
+
+    :return: The hash lists result, None when the file doesn't match, and the message to echo or None
+    """
+    hash_lists_result, sha256 = _match_hash_lists(file_path, hash_lists)
+    if not hash_lists_result:
+        return None, None
+    results.record_result(command, file_path, hash_lists_result, sha256=sha256)
+    if hash_lists_result == hash_index.KNOWN_BAD:
+        return hash_lists_result, _get_blocklist_message(file_path, sha256)
+    return hash_lists_result, None
+
+
+def _get_blocklist_message(file_path: str, sha256: str) -> str:
+    return f'{file_path} is in the blocklist, sha256: {sha256}'
+
+
+def _echo_hash_lists_summary(hash_lists_results: collections.Counter):
+    if hash_lists_results[hash_index.KNOWN_GOOD]:
+        click.echo(f'{hash_lists_results[hash_index.KNOWN_GOOD]} files are in the allowlist and were not sent')
+    if hash_lists_results[hash_index.KNOWN_BAD]:
+        click.echo(f'{hash_lists_results[hash_index.KNOWN_BAD]} files are in the blocklist and were not sent')
+
+
+def _echo_dry_run_summary(cost_estimate: estimates.CostEstimate,
+                          unsupported_number: int,
+                          hash_lists_results: collections.Counter = None):
+    if unsupported_number:
+        cost_estimate.add_skipped('unsupported files', unsupported_number)
+    for hash_lists_result, count in (hash_lists_results or {}).items():
+        cost_estimate.add_skipped(f'{hash_lists_result} files', count)
+    cost_estimate.echo()
+
 
-    for root, dirs, files in os.walk(path):
-        files = [f for f in files if not is_hidden(os.path.join(root, f))]
-        dirs[:] = [d for d in dirs if not is_hidden(os.path.join(root, d))]
+def _is_supported_file(file_path: str) -> bool:
+    """utilities.is_supported_file, that counts the unsupported files in the run metrics"""
+    if utilities.is_supported_file(file_path):
+        return True
+    metrics.increment('unsupported')
+    return False
+
+
+def _get_file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+@contextlib.contextmanager
+def _track_upload_progress(file_path: str) -> Iterator[None]:
+    """Show the bytes progress of the upload of a large file"""
+    file_size = _get_file_size(file_path)
+    if file_size < default_config.upload_progress_min_size:
+        yield
+        return
 
-        number_of_files = len(files)
+    with progress.ProgressRenderer(f'Uploading {os.path.basename(file_path)}',
+                                   length=file_size,
+                                   unit='bytes') as progress_renderer, \
+            api_client.track_upload_progress(progress_renderer.update):
+        yield
+
+
+def _iter_directory_files(path: str,
+                          ignore_directory_count_limit: bool,
+                          shard: sharding.Shard = None,
+                          walk_filter: walk_filters.WalkFilter = None) -> Iterator[str]:
+    for root, _, files in walk_filters.walk(path, walk_filter):
         if not ignore_directory_count_limit:
-            utilities.check_should_continue_for_large_dir(number_of_files, default_config.unusual_amount_in_dir)
-        if not files:
-            continue
+            utilities.check_should_continue_for_large_dir(len(files), default_config.unusual_amount_in_dir)
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if sharding.is_in_shard(sharding.get_path_key(file_path, path), shard):
+                yield file_path
+
+
+def analyze_expanding_archives_command(path: str,
+                                       disable_dynamic_unpacking: bool,
+                                       disable_static_unpacking: bool,
+                                       code_item_type: str,
+                                       ignore_directory_count_limit: bool,
+                                       shard: sharding.Shard = None,
+                                       walk_filter: walk_filters.WalkFilter = None,
+                                       hash_lists: hash_index.HashLists = None):
+    """
+    Send a file or the files of a directory for analysis, the members of archives are sent instead of them.
+    The classify stage replaces every archive with its members, that are read in memory and aren't retried from
+    the failures file.
+
+    :param shard: Send only the files of this shard of the directory
+    :param walk_filter: The files and subdirectories of the directory to skip
+    :param hash_lists: The allowlists and blocklists the files and members are matched with, the ones that match
+                       aren't sent
+    """
+    skipped_members = []
+    skipped_members_lock = threading.Lock()
+
+    def iter_members(item: pipeline.PipelineItem) -> Iterator[pipeline.PipelineItem]:
+        # The archive is replaced by its members in the progress
+        progress_renderer.add_length(-1)
+        expander = archives.ArchiveExpander()
+        try:
+            for member in expander.iter_members(item.path):
+                member_item = pipeline.PipelineItem(member.path, item.top)
+                member_item.data = member.stream
+                member_item.size = len(member.stream.getbuffer())
+                progress_renderer.add_length(1)
+                yield member_item
+        finally:
+            with skipped_members_lock:
+                skipped_members.extend(expander.skipped_members)
+
+    def classify(item: pipeline.PipelineItem) -> Optional[Iterator[pipeline.PipelineItem]]:
+        if archives.is_expandable_archive(item.path):
+            return iter_members(item)
+        if disable_dynamic_unpacking and not _is_supported_file(item.path):
+            item.finish('unsupported')
+        return None
+
+    with progress.ProgressRenderer('Sending files for analysis', length=0) as progress_renderer:
+        if os.path.isfile(path):
+            items = [pipeline.PipelineItem(path, os.path.dirname(path))]
+        else:
+            items = pipeline.discover(path, walk_filter, ignore_directory_count_limit, progress_renderer)
+        report = pipeline.Report('analyze', progress_renderer, None)
+        stages = [pipeline.shard_filter(progress_renderer, shard),
+                  pipeline.Stage('classify', classify),
+                  _hash_lists_stage(hash_lists),
+                  _submit_analysis_stage(None, disable_dynamic_unpacking, disable_static_unpacking, code_item_type)]
+        # Every pending member is held in memory, so only a few members wait in the queues
+        _run_directory_pipeline('analyze',
+                                items,
+                                stages,
+                                report,
+                                progress_renderer,
+                                None,
+                                default_config.archive_queue_size)
+
+    _echo_analyses_summary(report.results_counter['success'],
+                           report.results_counter['failed'],
+                           report.results_counter['unsupported'])
+    _echo_hash_lists_summary(report.hash_lists_results)
+    if skipped_members:
+        click.echo(f'{len(skipped_members)} archive members skipped, '
+                   f'the reasons are listed in the log file {utilities.log_file_path}')
+
+
+def analyze_directory_dedup_command(path: str,
+                                    disable_dynamic_unpacking: bool,
+                                    disable_static_unpacking: bool,
+                                    code_item_type: str,
+                                    ignore_directory_count_limit: bool,
+                                    mapping_path: str = None,
+                                    shard: sharding.Shard = None,
+                                    walk_filter: walk_filters.WalkFilter = None,
+                                    hash_lists: hash_index.HashLists = None):
+    """
+    Send every unique file of the directory for analysis once. Hard links are collapsed by their inode without
+    reading them again, the other files by their SHA256 in the dedup stage. The analysis of every path is written
+    to the mapping file.
 
-        with click.progressbar(length=number_of_files,
-                               label='Sending files for analysis',
-                               show_pos=True) as progressbar:
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                if disable_dynamic_unpacking and not utilities.is_supported_file(file_path):
-                    unsupported_number += 1
-                else:
-                    try:
-                        FileAnalysis(file_path=file_path,
-                                     code_item_type=code_item_type,
-                                     disable_dynamic_unpacking=disable_dynamic_unpacking,
-                                     disable_static_unpacking=disable_static_unpacking).send()
-                        success_number += 1
-                    except sdk_errors.IntezerError as ex:
-                        # We cannot continue analyzing the directory if the account is out of quota
-                        if isinstance(ex, sdk_errors.InsufficientQuota):
-                            logger.error('Failed to analyze %s', file_path)
-                            raise
-
-                        logger.exception('Error while analyzing directory')
-                        failed_number += 1
-                    except Exception:
-                        logger.exception('Failed to analyze %s', file_path)
-                        failed_number += 1
-
-                progressbar.update(1)
+    :param shard: Send only the files of this shard of the directory
+    :param walk_filter: The files and subdirectories of the directory to skip
+    :param hash_lists: The allowlists and blocklists the files are matched with, the files that match aren't sent
+    """
+    mapping_path = mapping_path or os.path.join(os.getcwd(), default_config.dedup_mapping_file_name)
+    failures_writer = failures.FailuresWriter('analyze',
+                                              no_unpacking=disable_dynamic_unpacking,
+                                              no_static_extraction=disable_static_unpacking,
+                                              code_item_type=code_item_type)
+    lock = threading.Lock()
+    inodes_hashes: Dict[Tuple[int, int], str] = {}
+    hashes_paths: Dict[str, str] = {}
+
+    def hash_file(item: pipeline.PipelineItem):
+        try:
+            file_stat = os.stat(item.path)
+            inode = (file_stat.st_dev, file_stat.st_ino)
+            with lock:
+                sha256 = inodes_hashes.get(inode)
+            if not sha256:
+                sha256 = utilities.get_file_sha256(item.path)
+                with lock:
+                    inodes_hashes[inode] = sha256
+        except OSError as e:
+            logger.exception('Failed to read %s', item.path)
+            item.finish('failed', e)
+            return
+        item.sha256 = sha256
+        item.fields['sha256'] = sha256
+        _finish_in_hash_lists(item, hash_lists)
+
+    def dedup(item: pipeline.PipelineItem):
+        with lock:
+            unique_path = hashes_paths.setdefault(item.sha256, item.path)
+        if unique_path != item.path:
+            item.finish('duplicate')
+
+    # The items of the unique files by their hash once they were reported, and the duplicates that were reported
+    # before their unique file
+    unique_items: Dict[str, pipeline.PipelineItem] = {}
+    held_duplicates: Dict[str, List[pipeline.PipelineItem]] = {}
+    mapping = []
+
+    def add_to_mapping(item: pipeline.PipelineItem, result: str, analysis_id: Optional[str]):
+        mapping.append(dict(file_path=item.path,
+                            sha256=item.sha256 or '',
+                            analysis_id=analysis_id or '',
+                            status=result))
+
+    def report_duplicate(item: pipeline.PipelineItem, unique_item: pipeline.PipelineItem):
+        analysis_id = unique_item.fields.get('analysis_id')
+        results.record_result('analyze', item.path, unique_item.result, sha256=item.sha256, analysis_id=analysis_id)
+        add_to_mapping(item, unique_item.result, analysis_id)
+        progress_renderer.update(1, result='duplicate')
+
+    def report_file(item: pipeline.PipelineItem):
+        if item.result == 'duplicate':
+            if item.sha256 in unique_items:
+                report_duplicate(item, unique_items[item.sha256])
+            else:
+                held_duplicates.setdefault(item.sha256, []).append(item)
+            return
+
+        report(item)
+        add_to_mapping(item, item.result, item.fields.get('analysis_id'))
+        if item.sha256:
+            unique_items[item.sha256] = item
+            for duplicate_item in held_duplicates.pop(item.sha256, []):
+                report_duplicate(duplicate_item, item)
+
+    with failures_writer, progress.ProgressRenderer('Sending files for analysis', length=0) as progress_renderer:
+        report = pipeline.Report('analyze', progress_renderer, failures_writer)
+        stages = [pipeline.shard_filter(progress_renderer, shard)]
+        if disable_dynamic_unpacking:
+            stages.append(pipeline.Stage('classify', _classify_supported_file))
+        stages.extend([pipeline.Stage('hash', hash_file),
+                       pipeline.Stage('dedup', dedup),
+                       _submit_analysis_stage(failures_writer,
+                                              disable_dynamic_unpacking,
+                                              disable_static_unpacking,
+                                              code_item_type)])
+        try:
+            _run_directory_pipeline('analyze',
+                                    pipeline.discover(path,
+                                                      walk_filter,
+                                                      ignore_directory_count_limit,
+                                                      progress_renderer),
+                                    stages,
+                                    report_file,
+                                    progress_renderer,
+                                    failures_writer)
+        finally:
+            # The run stopped before the unique files of these duplicates were done
+            for duplicate_item in itertools.chain.from_iterable(held_duplicates.values()):
+                results.record_result('analyze', duplicate_item.path, 'not_done', sha256=duplicate_item.sha256)
+                add_to_mapping(duplicate_item, 'not_done', None)
+            mapping.sort(key=lambda file_mapping: file_mapping['file_path'])
+            utilities.export_to_csv(mapping_path, mapping, keys=['file_path', 'sha256', 'analysis_id', 'status'])
+
+    files_number = sum(1 for file_mapping in mapping if file_mapping['sha256'])
+    click.echo(f'{files_number} files, {len(unique_items)} unique')
+    _echo_analyses_summary(report.results_counter['success'],
+                           report.results_counter['failed'],
+                           report.results_counter['unsupported'])
+    _echo_hash_lists_summary(report.hash_lists_results)
+    click.echo(f'The analysis of every file is listed in {mapping_path}')
+
+
+def analyze_directory_incremental_command(path: str,
+                                          disable_dynamic_unpacking: bool,
+                                          disable_static_unpacking: bool,
+                                          code_item_type: str,
+                                          ignore_directory_count_limit: bool,
+                                          index_path: str = None,
+                                          shard: sharding.Shard = None,
+                                          walk_filter: walk_filters.WalkFilter = None,
+                                          hash_lists: hash_index.HashLists = None):
+    """
+    Send the files of the directory that are new or changed since the last run. The classify stage skips a file
+    whose size, modification time and inode didn't change without opening it, the hash stage skips a file whose
+    content didn't change.
+
+    :param shard: Send only the files of this shard of the directory
+    :param walk_filter: The files and subdirectories of the directory to skip
+    :param hash_lists: The allowlists and blocklists the changed files are matched with, the files that match
+                       aren't sent
+    """
+    failures_writer = failures.FailuresWriter('analyze',
+                                              no_unpacking=disable_dynamic_unpacking,
+                                              no_static_extraction=disable_static_unpacking,
+                                              code_item_type=code_item_type)
+    # The stat and the stored state of the files that may have changed, until they are reported
+    changed_files: Dict[str, Tuple[os.stat_result, Optional[file_index.FileState]]] = {}
+
+    def classify(item: pipeline.PipelineItem):
+        try:
+            file_stat = os.stat(item.path)
+        except OSError as e:
+            logger.exception('Failed to read %s', item.path)
+            item.finish('failed', e)
+            return
+
+        stored_state = index.get(item.path)
+        if stored_state and stored_state.is_unchanged(file_stat):
+            item.finish('unchanged', analysis_id=stored_state.analysis_id)
+            return
+        changed_files[item.path] = (file_stat, stored_state)
+        if disable_dynamic_unpacking:
+            _classify_supported_file(item)
+
+    def hash_file(item: pipeline.PipelineItem):
+        _, stored_state = changed_files[item.path]
+        try:
+            item.sha256 = utilities.get_file_sha256(item.path)
+        except OSError as e:
+            logger.exception('Failed to read %s', item.path)
+            item.finish('failed', e)
+            return
+        if stored_state and stored_state.sha256 == item.sha256:
+            # The file was touched, but its content was already sent
+            item.finish('unchanged', analysis_id=stored_state.analysis_id)
+            return
+        _finish_in_hash_lists(item, hash_lists)
+
+    def report_file(item: pipeline.PipelineItem):
+        report(item)
+        file_stat, _ = changed_files.pop(item.path, (None, None))
+        if file_stat and item.result in ('success', 'unchanged', 'unsupported'):
+            index.set(item.path, file_index.FileState.from_stat(file_stat,
+                                                                item.sha256,
+                                                                item.fields.get('analysis_id')))
+
+    with failures_writer, \
+            file_index.FileStateIndex(default_config.api_url, index_path) as index, \
+            progress.ProgressRenderer('Sending files for analysis', length=0) as progress_renderer:
+        report = pipeline.Report('analyze', progress_renderer, failures_writer)
+        stages = [pipeline.shard_filter(progress_renderer, shard),
+                  pipeline.Stage('classify', classify),
+                  pipeline.Stage('hash', hash_file),
+                  _submit_analysis_stage(failures_writer,
+                                         disable_dynamic_unpacking,
+                                         disable_static_unpacking,
+                                         code_item_type)]
+        # The paths are kept in the index as absolute paths
+        _run_directory_pipeline('analyze',
+                                pipeline.discover(os.path.abspath(path),
+                                                  walk_filter,
+                                                  ignore_directory_count_limit,
+                                                  progress_renderer),
+                                stages,
+                                report_file,
+                                progress_renderer,
+                                failures_writer)
+
+    click.echo(f'{report.results_counter["unchanged"]} unchanged files skipped')
+    _echo_analyses_summary(report.results_counter['success'],
+                           report.results_counter['failed'],
+                           report.results_counter['unsupported'])
+    _echo_hash_lists_summary(report.hash_lists_results)
+
+
+def _classify_supported_file(item: pipeline.PipelineItem):
+    """The classify stage of the analyze directory commands without dynamic unpacking"""
+    if not _is_supported_file(item.path):
+        item.finish('unsupported')
+
+
+def _watch_directory(watcher: directory_watcher.DirectoryWatcher,
+                     send_file: Callable[[str], Tuple[str, str]],
+                     max_concurrent: int = None,
+                     shard: sharding.Shard = None) -> collections.Counter:
+    """
+    Send the new files of the watched directory until interrupted.
 
+    :param send_file: Sends a single file, runs on a worker thread. Returns (result, message to echo or None)
+    :param shard: Send only the new files of this shard of the directory
+    :return: The number of files of every result
+    """
+    results_counter = collections.Counter()
+    click.echo(f'Watching {watcher.path} for new files, press Ctrl+C to stop')
+    try:
+        with contextlib.closing(watcher.watch()) as new_files_batches:
+            for new_files in new_files_batches:
+                new_files = [file_path for file_path in new_files
+                             if sharding.is_in_shard(sharding.get_path_key(file_path, watcher.path), shard)]
+                for result, message in utilities.imap_unordered_bounded(
+                        send_file,
+                        new_files,
+                        max_concurrent or default_config.watch_max_concurrent):
+                    results_counter[result] += 1
+                    if message:
+                        click.echo(message)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+    return results_counter
+
+
+def analyze_directory_watch_command(path: str,
+                                    disable_dynamic_unpacking: bool,
+                                    disable_static_unpacking: bool,
+                                    code_item_type: str,
+                                    settle_time: float = None,
+                                    max_concurrent: int = None,
+                                    shard: sharding.Shard = None,
+                                    walk_filter: walk_filters.WalkFilter = None,
+                                    hash_lists: hash_index.HashLists = None):
+    """
+    :param shard: Send only the new files of this shard of the directory
+    :param walk_filter: Send only the new files the filter accepts
+    :param hash_lists: The allowlists and blocklists the new files are matched with, the files that match aren't sent
+    """
+    failures_writer = failures.FailuresWriter('analyze',
+                                              no_unpacking=disable_dynamic_unpacking,
+                                              no_static_extraction=disable_static_unpacking,
+                                              code_item_type=code_item_type)
+
+    def analyze_new_file(file_path: str) -> Tuple[str, Optional[str]]:
+        if disable_dynamic_unpacking and not _is_supported_file(file_path):
+            results.record_result('analyze', file_path, 'unsupported')
+            return 'unsupported', f'{file_path} is not PE, ELF, DEX or APK'
+        hash_lists_result, message = _record_hash_lists_match('analyze', file_path, hash_lists)
+        if hash_lists_result:
+            return hash_lists_result, message
+        try:
+            analysis_id, analysis_page_url = _send_file_for_analysis(
+                file_path,
+                disable_dynamic_unpacking=disable_dynamic_unpacking,
+                disable_static_unpacking=disable_static_unpacking,
+                code_item_type=code_item_type)
+        except sdk_errors.InsufficientQuota as e:
+            # We cannot continue watching the directory if the account is out of quota
+            logger.error('Failed to analyze %s', file_path)
+            results.record_result('analyze', file_path, 'failed', error=str(e))
+            failures_writer.record(file_path, e)
+            raise
+        except Exception as e:
+            logger.exception('Failed to analyze %s', file_path)
+            results.record_result('analyze', file_path, 'failed', error=str(e))
+            failures_writer.record(file_path, e)
+            return 'failed', f'Failed to analyze {file_path}'
+
+        results.record_result('analyze', file_path, 'success', analysis_id=analysis_id)
+        return 'success', f'Analysis of {file_path} created: {analysis_page_url}'
+
+    with failures_writer:
+        results_counter = _watch_directory(directory_watcher.DirectoryWatcher(path,
+                                                                              settle_time=settle_time,
+                                                                              walk_filter=walk_filter),
+                                           analyze_new_file,
+                                           max_concurrent,
+                                           shard)
+    click.echo(f'{results_counter["success"]} analysis created, {results_counter["failed"]} analysis failed, '
+               f'{results_counter["unsupported"]} unsupported files')
+    _echo_hash_lists_summary(results_counter)
+
+
+def _send_stream_items(items: Iterable[str],
+                       send_item: Callable[[str], Tuple[str, Optional[str]]],
+                       max_concurrent: int = None) -> collections.Counter:
+    """
+    Send every item of the stream as soon as it arrives.
+
+    :param send_item: Sends a single item, runs on a worker thread. Returns (result, message to echo or None)
+    :return: The number of items of every result
+    """
+    results_counter = collections.Counter()
+    for result, message in utilities.imap_unordered_bounded(send_item,
+                                                            items,
+                                                            max_concurrent or default_config.stream_max_concurrent):
+        results_counter[result] += 1
+        if message:
+            click.echo(message)
+    return results_counter
+
+
+def analyze_paths_stream_command(file_paths: Iterable[str],
+                                 disable_dynamic_unpacking: bool,
+                                 disable_static_unpacking: bool,
+                                 code_item_type: str,
+                                 max_concurrent: int = None,
+                                 shard: sharding.Shard = None,
+                                 hash_lists: hash_index.HashLists = None):
+    """
+    :param shard: Send only the paths of this shard
+    :param hash_lists: The allowlists and blocklists the files are matched with, the files that match aren't sent
+    """
+    failures_writer = failures.FailuresWriter('analyze',
+                                              no_unpacking=disable_dynamic_unpacking,
+                                              no_static_extraction=disable_static_unpacking,
+                                              code_item_type=code_item_type)
+
+    def analyze_path(file_path: str) -> Tuple[str, Optional[str]]:
+        if not os.path.isfile(file_path):
+            results.record_result('analyze', file_path, 'failed', error='Not a file')
+            return 'failed', f'{file_path} is not a file'
+        if disable_dynamic_unpacking and not _is_supported_file(file_path):
+            results.record_result('analyze', file_path, 'unsupported')
+            return 'unsupported', None
+        hash_lists_result, message = _record_hash_lists_match('analyze', file_path, hash_lists)
+        if hash_lists_result:
+            return hash_lists_result, message
+        try:
+            analysis_id = send_file_for_analysis(file_path,
+                                                 disable_dynamic_unpacking=disable_dynamic_unpacking,
+                                                 disable_static_unpacking=disable_static_unpacking,
+                                                 code_item_type=code_item_type)
+        except sdk_errors.InsufficientQuota as e:
+            # We cannot continue reading the stream if the account is out of quota
+            logger.error('Failed to analyze %s', file_path)
+            results.record_result('analyze', file_path, 'failed', error=str(e))
+            failures_writer.record(file_path, e)
+            raise
+        except Exception as e:
+            logger.exception('Failed to analyze %s', file_path)
+            results.record_result('analyze', file_path, 'failed', error=str(e))
+            failures_writer.record(file_path, e)
+            return 'failed', f'Failed to analyze {file_path}'
+        results.record_result('analyze', file_path, 'success', analysis_id=analysis_id)
+        return 'success', None
+
+    file_paths = (file_path for file_path in file_paths if sharding.is_in_shard(file_path, shard))
+    with failures_writer:
+        results_counter = _send_stream_items(file_paths, analyze_path, max_concurrent)
+    _echo_analyses_summary(results_counter['success'], results_counter['failed'], results_counter['unsupported'])
+    _echo_hash_lists_summary(results_counter)
+
+
+def analyze_hashes_stream_command(hashes: Iterable[str],
+                                  max_concurrent: int = None,
+                                  max_age: float = None,
+                                  cache_path: str = None,
+                                  shard: sharding.Shard = None):
+    """
+    :param max_age: Seconds a cached analysis of a hash is used instead of analyzing the hash again, by default
+                    every hash is analyzed again
+    :param shard: Send only the hashes of this shard
+    """
+
+    def analyze_hash(file_hash: str) -> Tuple[str, Optional[str]]:
+        try:
+            analysis_id, is_cached = _send_hash_with_cache(file_hash, cache, max_age)
+            results.record_result('analyze-by-list', file_hash, 'success', analysis_id=analysis_id, cached=is_cached)
+            if is_cached:
+                return 'cached', None
+        except sdk_errors.HashDoesNotExistError:
+            logger.info('Hash not exists', extra=dict(file_hash=file_hash))
+            results.record_result('analyze-by-list', file_hash, 'not_found')
+            return 'failed', f'Hash: {file_hash} does not exist in the system'
+        except sdk_errors.InsufficientQuota as e:
+            logger.error('Error occurred with hash', extra=dict(file_hash=file_hash))
+            results.record_result('analyze-by-list', file_hash, 'failed', error=str(e))
+            raise
+        except sdk_errors.IntezerError as e:
+            logger.exception('Error occurred with hash', extra=dict(file_hash=file_hash))
+            results.record_result('analyze-by-list', file_hash, 'failed', error=str(e))
+            return 'failed', f'Error occurred with hash: {file_hash}'
+        return 'success', None
+
+    hashes = (file_hash for file_hash in hashes if sharding.is_in_shard(sharding.get_hash_key(file_hash), shard))
+    with analysis_cache.AnalysisCache(default_config.api_url, cache_path) as cache:
+        results_counter = _send_stream_items(hashes, analyze_hash, max_concurrent)
+    _echo_analyses_summary(results_counter['success'], results_counter['failed'], 0)
+    _echo_cached_summary(results_counter['cached'])
+
+
+def _echo_cached_summary(cached_number: int):
+    if cached_number:
+        click.echo(f'{cached_number} hashes were analyzed recently, their cached analyses were used')
+
+
+def _echo_analyses_summary(success_number: int, failed_number: int, unsupported_number: int):
     if success_number != 0:
-        analyses_page_url = default_config.history_page_url_template.format(
-            system_url=default_config.api_url.replace('/api/', ''),
-            tab_name=default_config.file_analyses_tab_name
-        )
+        analyses_page_url = _get_history_page_url(default_config.file_analyses_tab_name)
         click.echo(f'{success_number} analysis created. In order to check their results, go to: {analyses_page_url}')
 
     if failed_number != 0:
@@ -126,75 +1065,133 @@ def analyze_directory_command(path: str,
         click.echo(f'{unsupported_number} unsupported files')
 
 
-def analyze_by_txt_file_command(path: str):
+def analyze_by_txt_file_command(path: str,
+                                max_age: float = None,
+                                cache_path: str = None,
+                                dry_run: bool = False,
+                                throughput_model: estimates.ThroughputModel = None,
+                                shard: sharding.Shard = None):
+    """
+    :param max_age: Seconds a cached analysis of a hash is used instead of analyzing the hash again, by default
+                    every hash is analyzed again
+    :param dry_run: Look the hashes up in the cache without sending them, and estimate the cost of the run
+    :param throughput_model: In a dry run, the throughput of the service the duration is projected with
+    :param shard: Send only the hashes of this shard
+    """
+    cost_estimate = estimates.CostEstimate('analyses', throughput_model) if dry_run else None
     try:
-        hashes = get_hashes_from_file(path)
-        with click.progressbar(length=len(hashes),
-                               label='Analyze files',
-                               show_pos=True,
-                               width=0) as progressbar:
+        hashes = _get_shard_hashes(get_hashes_from_file(path), shard)
+        cached_number = 0
+        with analysis_cache.AnalysisCache(default_config.api_url, cache_path) as cache, \
+                progress.ProgressRenderer('Analyze files', length=len(hashes), unit='hashes') as progress_renderer:
             for file_hash in hashes:
+                if cost_estimate:
+                    if max_age and cache.get(file_hash, max_age):
+                        cost_estimate.add_skipped('cached hashes')
+                        progress_renderer.update(1, result='skipped')
+                    else:
+                        cost_estimate.add_submission()
+                        progress_renderer.update(1)
+                    continue
+
+                result = 'success'
                 try:
-                    FileAnalysis(file_hash=file_hash).send()
+                    analysis_id, is_cached = _send_hash_with_cache(file_hash, cache, max_age)
+                    cached_number += is_cached
+                    results.record_result('analyze-by-list',
+                                          file_hash,
+                                          'success',
+                                          analysis_id=analysis_id,
+                                          cached=is_cached)
                 except sdk_errors.HashDoesNotExistError:
                     click.echo(f'Hash: {file_hash} does not exist in the system')
                     logger.info('Hash not exists', extra=dict(file_hash=file_hash))
-                except sdk_errors.IntezerError:
+                    result = 'not_found'
+                    results.record_result('analyze-by-list', file_hash, 'not_found')
+                except sdk_errors.IntezerError as e:
                     click.echo(f'Error occurred with hash: {file_hash}')
                     logger.exception('Error occurred with hash', extra=dict(file_hash=file_hash))
-                progressbar.update(1)
-            analyses_page_url = default_config.history_page_url_template.format(
-                system_url=default_config.api_url.replace('/api/', ''),
-                tab_name=default_config.file_analyses_tab_name
-            )
-            click.echo(f'analysis created. In order to check their results, go to: {analyses_page_url}')
+                    result = 'failed'
+                    results.record_result('analyze-by-list', file_hash, 'failed', error=str(e))
+                progress_renderer.update(1, result=result)
+
+        if cost_estimate:
+            cost_estimate.echo()
+            return
+        analyses_page_url = _get_history_page_url(default_config.file_analyses_tab_name)
+        click.echo(f'analysis created. In order to check their results, go to: {analyses_page_url}')
+        _echo_cached_summary(cached_number)
     except IOError:
         click.echo(f'No read permissions for {path}')
         logger.exception('Error reading hashes file', extra=dict(path=path))
         raise click.Abort()
 
 
-def index_by_txt_file_command(path: str, index_as: str, family_name: str):
+def index_by_txt_file_command(path: str,
+                              index_as: str,
+                              family_name: str,
+                              dry_run: bool = False,
+                              throughput_model: estimates.ThroughputModel = None,
+                              shard: sharding.Shard = None):
+    """
+    :param dry_run: Read the hashes without sending them, and estimate the cost of the run
+    :param throughput_model: In a dry run, the throughput of the service the duration is projected with
+    :param shard: Send only the hashes of this shard
+    """
     try:
-        hashes = get_hashes_from_file(path)
+        hashes = _get_shard_hashes(get_hashes_from_file(path), shard)
+        if dry_run:
+            cost_estimate = estimates.CostEstimate('indexes', throughput_model)
+            for _ in hashes:
+                cost_estimate.add_submission()
+            cost_estimate.echo()
+            return
+
         index_exceptions = []
         index_operations = []
-        with click.progressbar(length=len(hashes),
-                               label='Indexing files',
-                               show_pos=True,
-                               width=0) as upload_progress:
+        # The hashes that were neither indexed nor failed, in case the deadline passes
+        pending_hashes = dict.fromkeys(hashes)
+        failures_writer = failures.FailuresWriter('index-by-list', index_as=index_as, family_name=family_name)
+        with failures_writer, \
+                _record_not_done_on_deadline('index-by-list', pending_hashes, failures_writer), \
+                progress.ProgressRenderer('Indexing files', length=len(hashes), unit='hashes') as progress_renderer:
             for sha256 in hashes:
                 index_operation, index_exception = index_hash_command(sha256, index_as, family_name)
                 if index_operation:
                     index_operations.append((index_operation, sha256))
                 else:
                     index_exceptions.append(index_exception)
-                upload_progress.update(1)
-        click.echo('Indexing sent')
-
-        echo_exceptions(index_exceptions)
-        index_exceptions = []
-        with click.progressbar(length=len(index_operations),
-                               label='Waiting for indexing to finish',
-                               show_pos=True,
-                               width=0) as index_progress:
+                    results.record_result('index-by-list', sha256, 'failed', error=index_exception)
+                    failures_writer.record(sha256, index_exception)
+                    pending_hashes.pop(sha256, None)
+                progress_renderer.update(1, result='success' if index_operation else 'failed')
+            click.echo('Indexing sent')
+
+            echo_exceptions(index_exceptions)
+            index_exceptions = []
+            progress_renderer.start_phase('Waiting for indexing to finish', length=len(index_operations))
             for index_operation, sha256 in index_operations:
+                result = 'failed'
                 try:
-                    index_operation.wait_for_completion()
+                    _wait_for_index(index_operation)
+                    result = 'success'
+                    results.record_result('index-by-list', sha256, 'success', index_id=index_operation.index_id)
                 except sdk_errors.IntezerError as e:
                     index_exceptions.append(f'Failed to index hash: {sha256} error: {e}')
                     logger.exception('Failed to index hash', extra=dict(sha256=sha256))
+                    results.record_result('index-by-list', sha256, 'failed', error=str(e))
+                    failures_writer.record(sha256, e)
                 except sdk_errors.IndexFailed as e:
                     index_exceptions.append(f'Failed to index hash: {sha256} error: {e}')
                     logger.exception('Failed to index hash', extra=dict(sha256=sha256))
-                index_progress.update(1)
+                    results.record_result('index-by-list', sha256, 'failed', error=str(e))
+                    failures_writer.record(sha256, e)
+                pending_hashes.pop(sha256, None)
+                progress_renderer.update(1, result=result)
 
         echo_exceptions(index_exceptions)
 
-        private_index_page_url = default_config.history_page_url_template.format(
-            system_url=default_config.api_url.replace('/api/', ''),
-            tab_name=default_config.index_results_tab_name
-        )
+        private_index_page_url = _get_history_page_url(default_config.index_results_tab_name)
         click.echo(f'Index updated. In order to check their results, go to: {private_index_page_url}')
 
     except IOError:
@@ -216,78 +1213,166 @@ def get_hashes_from_file(path):
         return hashes
 
 
+def _get_shard_hashes(hashes: List[str], shard: Optional[sharding.Shard]) -> List[str]:
+    return [file_hash for file_hash in hashes if sharding.is_in_shard(sharding.get_hash_key(file_hash), shard)]
+
+
 def index_hash_command(sha256: str, index_as: str, family_name: Optional[str]):
     try:
-        index_operation = Index(index_as=sdk_consts.IndexType.from_str(index_as),
-                                sha256=sha256,
-                                family_name=family_name)
-        index_operation.send(wait=False)
+        index_operation = _send_with_profiles(lambda profile_api: _send_index(
+            profile_api,
+            index_as=sdk_consts.IndexType.from_str(index_as),
+            sha256=sha256,
+            family_name=family_name))
         return index_operation, None
     except sdk_errors.IntezerError as e:
         logger.exception('Failed to index hash', extra=dict(sha256=sha256))
         return None, f'Index error: {e} Error occurred with hash: {sha256}'
 
 
-def index_file_command(file_path: str, index_as: str, family_name: Optional[str]):
-    if not utilities.is_supported_file(file_path):
+def index_file_command(file_path: str,
+                       index_as: str,
+                       family_name: Optional[str],
+                       hash_lists: hash_index.HashLists = None):
+    """
+    :param hash_lists: The allowlists and blocklists the file is matched with, a file that matches isn't sent
+    """
+    if not _is_supported_file(file_path):
         click.echo('File is not PE, ELF, DEX or APK')
         return
+    if _is_in_hash_lists(file_path, hash_lists):
+        return
     try:
-        index = Index(index_as=sdk_consts.IndexType.from_str(index_as), file_path=file_path, family_name=family_name)
-        index.send(wait=True)
+        with _track_upload_progress(file_path):
+            index = _send_with_profiles(lambda profile_api: _send_index(
+                profile_api,
+                wait=True,
+                index_as=sdk_consts.IndexType.from_str(index_as),
+                file_path=file_path,
+                family_name=family_name))
+        results.record_result('index', file_path, 'success', index_id=index.index_id)
         click.echo(f'Finish index: {index.index_id} with status: {index.status}')
     except sdk_errors.IntezerError as e:
         logger.exception('Failed to index file', extra=dict(file_path=file_path))
+        results.record_result('index', file_path, 'failed', error=str(e))
         click.echo(f'Index error: {e}')
 
 
+def index_paths_stream_command(file_paths: Iterable[str],
+                               index_as: str,
+                               family_name: Optional[str],
+                               max_concurrent: int = None,
+                               shard: sharding.Shard = None,
+                               hash_lists: hash_index.HashLists = None):
+    """
+    :param shard: Send only the paths of this shard
+    :param hash_lists: The allowlists and blocklists the files are matched with, the files that match aren't sent
+    """
+    failures_writer = failures.FailuresWriter('index', index_as=index_as, family_name=family_name)
+
+    def index_path(file_path: str) -> Tuple[str, Optional[str]]:
+        if not os.path.isfile(file_path):
+            results.record_result('index', file_path, 'failed', error='Not a file')
+            return 'failed', f'{file_path} is not a file'
+        if not _is_supported_file(file_path):
+            results.record_result('index', file_path, 'unsupported')
+            return 'unsupported', f'Could not open {file_path} because it is not a supported file type'
+        hash_lists_result, message = _record_hash_lists_match('index', file_path, hash_lists)
+        if hash_lists_result:
+            return hash_lists_result, message
+        try:
+            index = _send_with_profiles(lambda profile_api: _send_index(
+                profile_api,
+                wait=True,
+                index_as=sdk_consts.IndexType.from_str(index_as),
+                file_path=file_path,
+                family_name=family_name))
+        except Exception as e:
+            logger.exception('Failed to index file', extra=dict(file_path=file_path))
+            results.record_result('index', file_path, 'failed', error=str(e))
+            failures_writer.record(file_path, e)
+            return 'failed', f'Error occurred during indexing of {file_path}: {e}'
+        results.record_result('index', file_path, 'success', index_id=index.index_id)
+        return 'success', f'Index: {index.index_id} , File: {file_path} , finished with status: {index.status}'
+
+    file_paths = (file_path for file_path in file_paths if sharding.is_in_shard(file_path, shard))
+    with failures_writer:
+        results_counter = _send_stream_items(file_paths, index_path, max_concurrent)
+    click.echo(f'{results_counter["success"]} files indexed, {results_counter["failed"]} failed, '
+               f'{results_counter["unsupported"]} unsupported files')
+    _echo_hash_lists_summary(results_counter)
+
+
 def index_directory_command(directory_path: str,
                             index_as: str,
                             family_name: Optional[str],
-                            ignore_directory_count_limit: bool):
-    indexes_results = []
-
-    for root, dirs, files in os.walk(directory_path):
-        files = [f for f in files if not is_hidden(os.path.join(root, f))]
-        dirs[:] = [d for d in dirs if not is_hidden(os.path.join(root, d))]
-
-        number_of_files = len(files)
-        if not ignore_directory_count_limit:
-            utilities.check_should_continue_for_large_dir(number_of_files, default_config.unusual_amount_in_dir)
-        with click.progressbar(length=number_of_files,
-                               label='Index files',
-                               show_pos=True,
-                               width=0) as progressbar:
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-
-                if not utilities.is_supported_file(file_path):
-                    click.echo(f'Could not open {file_name} because it is not a supported file type')
-                    progressbar.update(1)
-                    continue
-
-                try:
-                    index = Index(index_as=sdk_consts.IndexType.from_str(index_as),
-                                  file_path=file_path,
-                                  family_name=family_name)
-                    index.send()
-                    indexes_results.append({'file_name': file_name, 'index': index})
-                except sdk_errors.IntezerError:
-                    logger.exception('Failed to index file', extra=dict(file_name=file_name))
-                    click.echo(f'Error occurred during indexing of {file_name}')
-                    progressbar.update(1)
-
-            for index_result in indexes_results:
-                try:
-                    index_result['index'].wait_for_completion()
-                    click.echo(f'Index: {index_result["index"].index_id} ,'
-                               f' File: {index_result["file_name"]} ,'
-                               f' finished with status: {index_result["index"].status}')
-                    progressbar.update(1)
-                except Exception:
-                    logger.exception('Failed to index file', extra=dict(file_name=index_result['file_name']))
-                    click.echo(f'Error occurred during indexing of {index_result["file_name"]}')
-                    progressbar.update(1)
+                            ignore_directory_count_limit: bool,
+                            dry_run: bool = False,
+                            throughput_model: estimates.ThroughputModel = None,
+                            shard: sharding.Shard = None,
+                            walk_filter: walk_filters.WalkFilter = None,
+                            hash_lists: hash_index.HashLists = None):
+    """
+    :param dry_run: Walk, filter and classify the files without sending them, and estimate the cost of the run
+    :param throughput_model: In a dry run, the throughput of the service the duration is projected with
+    :param shard: Send only the files of this shard of the directory
+    :param walk_filter: The files and subdirectories of the directory to skip
+    :param hash_lists: The allowlists and blocklists the files are matched with, the files that match aren't sent
+    """
+    cost_estimate = estimates.CostEstimate('indexes', throughput_model) if dry_run else None
+    failures_writer = failures.FailuresWriter('index', index_as=index_as, family_name=family_name)
+
+    def classify(item: pipeline.PipelineItem):
+        if not _is_supported_file(item.path):
+            if not dry_run:
+                item.message = f'Could not open {item.file_name} because it is not a supported file type'
+            item.finish('unsupported')
+
+    def fail(item: pipeline.PipelineItem, error: Exception):
+        logger.exception('Failed to index file', extra=dict(file_name=item.file_name))
+        item.message = f'Error occurred during indexing of {item.file_name}'
+        item.finish('failed', error)
+
+    def submit(item: pipeline.PipelineItem):
+        try:
+            item.operation = _send_with_profiles(lambda profile_api: _send_index(
+                profile_api,
+                index_as=sdk_consts.IndexType.from_str(index_as),
+                file_path=item.path,
+                family_name=family_name))
+        except Exception as e:
+            fail(item, e)
+
+    def poll(item: pipeline.PipelineItem):
+        index = item.operation
+        try:
+            _wait_for_index(index, sleep_before_first_check=True)
+            item.message = f'Index: {index.index_id} , File: {item.file_name} , finished with status: {index.status}'
+            item.finish('success', index_id=index.index_id)
+        except Exception as e:
+            fail(item, e)
+
+    with failures_writer, progress.ProgressRenderer('Index files', length=0) as progress_renderer:
+        report = pipeline.Report('index', progress_renderer, failures_writer, cost_estimate)
+        stages = [pipeline.shard_filter(progress_renderer, shard),
+                  pipeline.Stage('classify', classify),
+                  _hash_lists_stage(hash_lists)]
+        if not dry_run:
+            stages.extend([pipeline.Stage('submit', submit), pipeline.Stage('poll', poll)])
+        _run_directory_pipeline('index',
+                                pipeline.discover(directory_path,
+                                                  walk_filter,
+                                                  ignore_directory_count_limit,
+                                                  progress_renderer),
+                                stages,
+                                report,
+                                progress_renderer,
+                                failures_writer)
+
+    if cost_estimate:
+        _echo_dry_run_summary(cost_estimate, report.results_counter['unsupported'], report.hash_lists_results)
+        return
+    _echo_hash_lists_summary(report.hash_lists_results)
 
 
 def upload_offline_endpoint_scan(offline_scan_directory: str, force: bool = False, max_concurrent_uploads: int = 0):
@@ -297,13 +1382,14 @@ def upload_offline_endpoint_scan(offline_scan_directory: str, force: bool = Fals
         click.echo(f'Uploading: {os.path.basename(os.path.abspath(offline_scan_directory))}')
         endpoint_analysis = EndpointAnalysis(offline_scan_directory=offline_scan_directory,
                                              max_concurrent_uploads=max_concurrent_uploads)
-        endpoint_analysis.send(wait=False)
+        with metrics.track_submission():
+            endpoint_analysis.send(wait=False)
         if not endpoint_analysis.analysis_id:
             raise RuntimeError('Error encountered while sending offline scan, server did not return analysis id')
         _create_analysis_id_file(offline_scan_directory, endpoint_analysis.analysis_id)
 
         endpoint_analysis_page_url = default_config.endpoint_analysis_url_template.format(
-            system_url=default_config.api_url.replace('/api/', ''),
+            system_url=_get_system_url(),
             endpoint_analysis_id=endpoint_analysis.analysis_id
         )
 
@@ -318,33 +1404,44 @@ def upload_offline_endpoint_scan(offline_scan_directory: str, force: bool = Fals
 
 def upload_multiple_offline_endpoint_scans(offline_scans_root_directory: str,
                                            force: bool = False,
-                                           max_concurrent_uploads: int = 0):
+                                           max_concurrent_uploads: int = 0,
+                                           shard: sharding.Shard = None,
+                                           walk_filter: walk_filters.WalkFilter = None):
+    """
+    :param shard: Upload only the scans of this shard
+    :param walk_filter: Upload only the scan directories the filter doesn't prune or exclude
+    """
     success_number = 0
     failed_number = 0
 
-    directories = _get_scan_subdirectories(offline_scans_root_directory)
+    directories = [scan_dir for scan_dir in _get_scan_subdirectories(offline_scans_root_directory, walk_filter)
+                   if sharding.is_in_shard(scan_dir, shard)]
 
-    with click.progressbar(length=len(directories),
-                           label='Sending offline endpoint scans for analysis',
-                           show_pos=True) as progressbar:
+    with progress.ProgressRenderer('Sending offline endpoint scans for analysis',
+                                   length=len(directories),
+                                   unit='scans') as progress_renderer:
         for scan_dir in directories:
             offline_scan_directory = os.path.join(offline_scans_root_directory, scan_dir)
+            result = 'failed'
             try:
                 upload_offline_endpoint_scan(offline_scan_directory,
                                              force,
                                              max_concurrent_uploads=max_concurrent_uploads)
                 success_number += 1
+                result = 'success'
+                results.record_result('upload-endpoint-scans-in-directory', offline_scan_directory, 'success')
             except Exception as e:
                 logger.exception(f'Error while analyzing directory {scan_dir}: {str(e)}')
                 failed_number += 1
+                results.record_result('upload-endpoint-scans-in-directory',
+                                      offline_scan_directory,
+                                      'failed',
+                                      error=str(e) or e.__class__.__name__)
             finally:
-                progressbar.update(1)
+                progress_renderer.update(1, result=result)
 
     if success_number != 0:
-        endpoint_analyses_page_url = default_config.history_page_url_template.format(
-            system_url=default_config.api_url.replace('/api/', ''),
-            tab_name=default_config.endpoint_analyses_tab_name
-        )
+        endpoint_analyses_page_url = _get_history_page_url(default_config.endpoint_analyses_tab_name)
         click.echo(
             f'{success_number} analysis created. In order to check their results, go to: {endpoint_analyses_page_url}')
     if failed_number != 0:
@@ -352,72 +1449,130 @@ def upload_multiple_offline_endpoint_scans(offline_scans_root_directory: str,
 
 
 def send_phishing_emails_from_directory_command(path: str,
-                                                ignore_directory_count_limit: bool = False):
-    success_number = 0
-    failed_number = 0
-    unsupported_number = 0
-    emails_dates = []
-
-    for root, _, files in os.walk(path):
-        files = [f for f in files if not is_hidden(os.path.join(root, f))]
-
-        number_of_files = len(files)
-        if not ignore_directory_count_limit:
-            utilities.check_should_continue_for_large_dir(number_of_files, default_config.unusual_amount_in_dir)
-        if not files:
-            continue
-
-        with click.progressbar(length=number_of_files,
-                               label='Sending files for analysis',
-                               show_pos=True) as progressbar:
-            for file_name in files:
-                email_path = os.path.join(root, file_name)
-                with open(email_path, 'rb') as email_file:
-                    binary_data = BytesIO(email_file.read())
-                is_eml, date = utilities.is_eml_file(binary_data)
-                if not is_eml:
-                    unsupported_number += 1
-                    continue
-                try:
-                    Alert.send_phishing_email(raw_email=binary_data)
-                    success_number += 1
-                    if date:
-                        try:
-                            timestamp = parsedate_to_datetime(date).timestamp()
-                            emails_dates.append(timestamp)
-                        except Exception:
-                            continue
-
-                except sdk_errors.IntezerError:
-                    logger.exception('Error while analyzing directory')
-                    failed_number += 1
-                except Exception:
-                    logger.exception(f'Failed to analyze {email_path}')
-                    failed_number += 1
-
-                progressbar.update(1)
+                                                ignore_directory_count_limit: bool = False,
+                                                dry_run: bool = False,
+                                                throughput_model: estimates.ThroughputModel = None,
+                                                walk_filter: walk_filters.WalkFilter = None):
+    """
+    :param dry_run: Walk, filter and classify the files without sending them, and estimate the cost of the run
+    :param throughput_model: In a dry run, the throughput of the service the duration is projected with
+    :param walk_filter: The files and subdirectories of the directory to skip
+    """
+    cost_estimate = estimates.CostEstimate('emails', throughput_model) if dry_run else None
+    failures_writer = failures.FailuresWriter('upload-emails-in-directory')
+
+    def classify(item: pipeline.PipelineItem):
+        try:
+            with open(item.path, 'rb') as email_file:
+                item.data = BytesIO(email_file.read())
+        except OSError as e:
+            logger.exception(f'Failed to read {item.path}')
+            item.finish('failed', e)
+            return
+        item.size = len(item.data.getbuffer())
+        is_eml, date = utilities.is_eml_file(item.data)
+        if not is_eml:
+            metrics.increment('unsupported')
+            item.finish('unsupported')
+        elif date:
+            try:
+                item.fields['email_time'] = int(parsedate_to_datetime(date).timestamp())
+            except Exception:
+                pass
+
+    def submit(item: pipeline.PipelineItem):
+        try:
+            _send_with_profiles(lambda profile_api: _send_phishing_email(item.data, profile_api))
+            item.finish('success')
+        except Exception as e:
+            logger.exception(f'Failed to analyze {item.path}')
+            item.finish('failed', e)
+        item.data = None
+
+    emails_times = []
+
+    def report_email(item: pipeline.PipelineItem):
+        report(item)
+        if item.result == 'success' and 'email_time' in item.fields:
+            emails_times.append(item.fields['email_time'])
+
+    with failures_writer, progress.ProgressRenderer('Sending files for analysis', length=0) as progress_renderer:
+        report = pipeline.Report('upload-emails-in-directory', progress_renderer, failures_writer, cost_estimate)
+        stages = [pipeline.shard_filter(progress_renderer, None), pipeline.Stage('classify', classify)]
+        if not dry_run:
+            stages.append(pipeline.Stage('submit', submit))
+        _run_directory_pipeline('upload-emails-in-directory',
+                                pipeline.discover(path, walk_filter, ignore_directory_count_limit, progress_renderer),
+                                stages,
+                                report_email,
+                                progress_renderer,
+                                failures_writer)
+
+    if cost_estimate:
+        _echo_dry_run_summary(cost_estimate, report.results_counter['unsupported'])
+        return
 
+    success_number = report.results_counter['success']
     if success_number != 0:
-        alerts_page_url = default_config.phishing_alerts_by_time_template.format(
-            system_url=default_config.api_url.replace('/api/', '')
-        )
-        earliest_email_timestamp = int(min(emails_dates)) if emails_dates else None
-        latest_email_timestamp = int(max(emails_dates)) if emails_dates else None
-        if earliest_email_timestamp and latest_email_timestamp:
-            alerts_page_url = f'{alerts_page_url}&start_time={earliest_email_timestamp}&end_time={latest_email_timestamp}'
+        time_range = f'&start_time={min(emails_times)}&end_time={max(emails_times)}' if emails_times else ''
+        alerts_page_url = ' '.join(default_config.phishing_alerts_by_time_template.format(system_url=system_url) +
+                                   time_range
+                                   for system_url in _get_system_urls())
         click.echo(f'{success_number} alerts created. In order to check their results, go to: {alerts_page_url}')
 
-    if failed_number != 0:
-        click.echo(f'{failed_number} scans failed')
+    if report.results_counter['failed'] != 0:
+        click.echo(f'{report.results_counter["failed"]} scans failed')
 
-    if unsupported_number != 0:
-        click.echo(f'{unsupported_number} unsupported files')
+    if report.results_counter['unsupported'] != 0:
+        click.echo(f'{report.results_counter["unsupported"]} unsupported files')
 
 
-def _get_scan_subdirectories(offline_scans_root_directory):
+def send_phishing_emails_watch_command(path: str,
+                                       settle_time: float = None,
+                                       max_concurrent: int = None,
+                                       walk_filter: walk_filters.WalkFilter = None):
+    """
+    :param walk_filter: Send only the new emails the filter accepts
+    """
+    failures_writer = failures.FailuresWriter('upload-emails-in-directory')
+
+    def send_new_email(email_path: str) -> Tuple[str, str]:
+        with open(email_path, 'rb') as email_file:
+            binary_data = BytesIO(email_file.read())
+        is_eml, _ = utilities.is_eml_file(binary_data)
+        if not is_eml:
+            metrics.increment('unsupported')
+            results.record_result('upload-emails-in-directory', email_path, 'unsupported')
+            return 'unsupported', f'{email_path} is not an email'
+        try:
+            _send_with_profiles(lambda profile_api: _send_phishing_email(binary_data, profile_api))
+        except Exception as e:
+            logger.exception(f'Failed to analyze {email_path}')
+            results.record_result('upload-emails-in-directory', email_path, 'failed', error=str(e))
+            failures_writer.record(email_path, e)
+            return 'failed', f'Failed to send {email_path}'
+        results.record_result('upload-emails-in-directory', email_path, 'success')
+        return 'success', f'Alert created for {email_path}'
+
+    with failures_writer:
+        results_counter = _watch_directory(directory_watcher.DirectoryWatcher(path,
+                                                                              settle_time=settle_time,
+                                                                              walk_filter=walk_filter),
+                                           send_new_email,
+                                           max_concurrent)
+    click.echo(f'{results_counter["success"]} alerts created, {results_counter["failed"]} emails failed, '
+               f'{results_counter["unsupported"]} unsupported files')
+
+
+def _get_scan_subdirectories(offline_scans_root_directory, walk_filter: walk_filters.WalkFilter = None):
+    """The scan directories under the root, a scan directory is skipped if the walk filter prunes or excludes it"""
+    walk_filter = walk_filter or walk_filters.WalkFilter()
     directories = [d for d in os.listdir(offline_scans_root_directory) if
                    os.path.isdir(os.path.join(offline_scans_root_directory, d)) and
-                   not is_hidden(os.path.join(offline_scans_root_directory, d))]
+                   not is_hidden(os.path.join(offline_scans_root_directory, d)) and
+                   not walk_filter.should_prune_path(os.path.join(offline_scans_root_directory, d),
+                                                     offline_scans_root_directory) and
+                   walk_filter.accepts_name(d, d)]
     for directory in ('files', 'fileless', 'memory_modules', 'logs'):
         if directory in directories:
             directories.remove(directory)
@@ -430,7 +1585,7 @@ def _was_directory_already_sent(path: str) -> bool:
                 analysis_id = f.read()
 
             endpoint_analysis_page_url = default_config.endpoint_analysis_url_template.format(
-                system_url=default_config.api_url.replace('/api/', ''),
+                system_url=_get_system_url(),
                 endpoint_analysis_id=analysis_id
             )
 
@@ -454,63 +1609,92 @@ def _create_analysis_id_file(directory: str, analysis_id: str):
         raise
 
 
-def notify_alerts_from_csv_command(csv_path: str):
+def notify_alerts_from_csv_command(csv_path: str,
+                                   max_concurrent: int = None,
+                                   in_progress_deadline: int = None,
+                                   in_progress_retry_interval: int = None,
+                                   replay_file_path: str = None):
     """
     Notify alerts from a CSV file containing alert IDs and environments.
-    
+    The file is streamed, duplicated (id, environment) pairs are notified only once and the notifications
+    are sent concurrently.
+
     :param csv_path: Path to CSV file with 'id' and 'environment' columns
+    :param max_concurrent: Maximum number of concurrent notifications
+    :param in_progress_deadline: Seconds to keep retrying alerts that are still in progress, if not set these
+                                 alerts are counted as failed
+    :param in_progress_retry_interval: Seconds between retries of an alert that is still in progress
+    :param replay_file_path: Path of the CSV file to write the alerts that are still in progress at the deadline
     """
     try:
-        alerts_data = _read_alerts_from_csv(csv_path)
-        success_number = 0
-        failed_number = 0
-        no_channels_number = 0
-        
-        with click.progressbar(length=len(alerts_data),
-                               label='Notifying alerts',
-                               show_pos=True,
-                               width=0) as progressbar:
-            for alert_data in alerts_data:
-                alert_id = alert_data['id']
-                environment = alert_data['environment']
-                
-                try:
-                    alert = Alert(alert_id=alert_id, environment=environment)
-                    notified_channels = alert.notify()
-                    
-                    if notified_channels:
-                        success_number += 1
-                    else:
-                        no_channels_number += 1
-                        logger.info('Alert notified but no channels configured', 
-                                  extra=dict(alert_id=alert_id, environment=environment))
-                        
-                except sdk_errors.AlertNotFoundError:
-                    click.echo(f'Alert {alert_id} not found')
-                    logger.info('Alert not found', extra=dict(alert_id=alert_id, environment=environment))
-                    failed_number += 1
-                except sdk_errors.AlertInProgressError:
-                    click.echo(f'Alert {alert_id} is still in progress')
-                    logger.info('Alert in progress', extra=dict(alert_id=alert_id, environment=environment))
-                    failed_number += 1
-                except sdk_errors.IntezerError as e:
-                    logger.exception('Error while notifying alert', extra=dict(alert_id=alert_id, environment=environment))
-                    failed_number += 1
-                except Exception:
-                    logger.exception('Unexpected error while notifying alert', extra=dict(alert_id=alert_id, environment=environment))
-                    failed_number += 1
-                
-                progressbar.update(1)
-        
-        if success_number > 0:
-            click.echo(f'{success_number} alerts notified successfully')
-        
-        if no_channels_number > 0:
-            click.echo(f'{no_channels_number} alerts didn\'t triggered any notification')
-            
-        if failed_number > 0:
-            click.echo(f'{failed_number} alerts failed to notify')
-            
+        results_counter = collections.Counter()
+        alerts_data = _read_alerts_from_csv(csv_path, on_duplicate=lambda _: results_counter.update(['duplicate']))
+        retry_queue = None
+        if in_progress_deadline:
+            retry_queue = utilities.RetryQueue(
+                in_progress_retry_interval or default_config.alerts_in_progress_retry_interval,
+                in_progress_deadline)
+        failures_writer = failures.FailuresWriter('alerts-notify-from-csv')
+
+        with failures_writer, progress.ProgressRenderer('Notifying alerts',
+                                                        length=_count_csv_rows(csv_path),
+                                                        unit='alerts') as progress_renderer:
+            for result, alert_data in utilities.imap_unordered_bounded(
+                    progress_renderer.track_in_flight(_notify_alert),
+                    alerts_data,
+                    max_concurrent or default_config.max_concurrent_alert_notifications,
+                    retry_queue=retry_queue):
+                if result == 'in_progress':
+                    if retry_queue is not None and retry_queue.schedule(alert_data):
+                        progress_renderer.set_retrying(len(retry_queue))
+                        continue
+                    if retry_queue is None:
+                        click.echo(f'Alert {alert_data["id"]} is still in progress')
+                        failures_writer.record(alert_data['id'],
+                                               'The alert is still in progress',
+                                               environment=alert_data['environment'])
+                        result = 'failed'
+                elif result == 'failed':
+                    failures_writer.record(alert_data['id'],
+                                           'Failed to notify the alert',
+                                           environment=alert_data['environment'])
+
+                results_counter[result] += 1
+                results.record_result('alerts-notify-from-csv',
+                                      alert_data['id'],
+                                      result,
+                                      environment=alert_data['environment'])
+                progress_renderer.update(1, result=result)
+                duplicate_number = results_counter.pop('duplicate', 0)
+                if duplicate_number:
+                    progress_renderer.update(duplicate_number, result='duplicate')
+                if retry_queue is not None:
+                    progress_renderer.set_retrying(len(retry_queue))
+
+        if results_counter['success'] > 0:
+            click.echo(f'{results_counter["success"]} alerts notified successfully')
+
+        if results_counter['no_channels'] > 0:
+            click.echo(f'{results_counter["no_channels"]} alerts didn\'t triggered any notification')
+
+        if results_counter['not_found'] > 0:
+            click.echo(f'{results_counter["not_found"]} alerts were not found')
+
+        if results_counter['failed'] > 0:
+            click.echo(f'{results_counter["failed"]} alerts failed to notify')
+
+        if retry_queue is not None and retry_queue.expired:
+            replay_file_path = replay_file_path or os.path.join(os.getcwd(),
+                                                                default_config.alerts_replay_file_name)
+            _write_alerts_to_csv(replay_file_path, retry_queue.expired)
+            for alert_data in retry_queue.expired:
+                results.record_result('alerts-notify-from-csv',
+                                      alert_data['id'],
+                                      'in_progress',
+                                      environment=alert_data['environment'])
+            click.echo(f'{len(retry_queue.expired)} alerts are still in progress, '
+                       f'in order to notify them later run: intezer-analyze alerts notify-from-csv {replay_file_path}')
+
     except IOError:
         click.echo(f'No read permissions for {csv_path}')
         logger.exception('Error reading CSV file', extra=dict(path=csv_path))
@@ -521,29 +1705,399 @@ def notify_alerts_from_csv_command(csv_path: str):
         raise click.Abort()
 
 
-def _read_alerts_from_csv(csv_path: str) -> List[Dict[str, Optional[str]]]:
+def _notify_alert(alert_data: Dict[str, Optional[str]]) -> Tuple[str, Dict[str, Optional[str]]]:
     """
-    Read alert IDs and environments from CSV file.
-    
+    Notify a single alert, runs on a worker thread.
+
+    :param alert_data: Dictionary with 'id' and 'environment' keys
+    :return: The notification result, one of 'success', 'no_channels', 'not_found', 'in_progress' or 'failed', and
+             the alert data
+    """
+    alert_id = alert_data['id']
+    environment = alert_data['environment']
+
+    try:
+        alert = Alert(alert_id=alert_id, environment=environment)
+        notified_channels = alert.notify()
+
+        if notified_channels:
+            return 'success', alert_data
+
+        logger.info('Alert notified but no channels configured',
+                    extra=dict(alert_id=alert_id, environment=environment))
+        return 'no_channels', alert_data
+    except sdk_errors.AlertNotFoundError:
+        click.echo(f'Alert {alert_id} not found')
+        logger.info('Alert not found', extra=dict(alert_id=alert_id, environment=environment))
+        return 'not_found', alert_data
+    except sdk_errors.AlertInProgressError:
+        logger.info('Alert in progress', extra=dict(alert_id=alert_id, environment=environment))
+        return 'in_progress', alert_data
+    except sdk_errors.IntezerError:
+        logger.exception('Error while notifying alert', extra=dict(alert_id=alert_id, environment=environment))
+    except Exception:
+        logger.exception('Unexpected error while notifying alert',
+                         extra=dict(alert_id=alert_id, environment=environment))
+    return 'failed', alert_data
+
+
+def _count_csv_rows(csv_path: str) -> int:
+    """
+    Count the data rows of a CSV file without loading it, used as the progress length.
+    Rows are counted by the CSV reader, so a quoted field that spans several lines is counted once.
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+        return max(sum(1 for _ in csv.reader(csvfile)) - 1, 0)
+
+
+def _write_alerts_to_csv(csv_path: str, alerts_data: List[Dict[str, Optional[str]]]):
+    """
+    Write alert IDs and environments to a CSV file that can be read by `notify_alerts_from_csv_command`.
+
     :param csv_path: Path to CSV file
-    :return: List of dictionaries with 'id' and 'environment' keys
+    :param alerts_data: List of dictionaries with 'id' and 'environment' keys
+    """
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['id', 'environment'])
+        writer.writeheader()
+        writer.writerows(alerts_data)
+
+
+def _read_alerts_from_csv(csv_path: str,
+                          on_duplicate: Callable[[Dict[str, Optional[str]]], None] = None
+                          ) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    Stream alert IDs and environments from CSV file, skipping (id, environment) pairs that were already read.
+
+    :param csv_path: Path to CSV file
+    :param on_duplicate: Called with every skipped duplicated row
+    :return: Iterator of dictionaries with 'id' and 'environment' keys
     :raises ValueError: If required columns are missing
     """
-    alerts_data = []
-    
+    seen_alerts = set()
+
     with open(csv_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
         reader = csv.DictReader(csvfile)
-        
+
         if not reader.fieldnames or 'id' not in reader.fieldnames:
             raise ValueError('CSV file must contain an "id" column')
-        
+
         for row in reader:
             alert_id = row['id'].strip()
             environment = row['environment'].strip()
-            
-            alerts_data.append({'id': alert_id, 'environment': environment})
-    
-    if not alerts_data:
+            alert_key = (alert_id, environment)
+
+            if alert_key in seen_alerts:
+                if on_duplicate:
+                    on_duplicate({'id': alert_id, 'environment': environment})
+                continue
+
+            seen_alerts.add(alert_key)
+            yield {'id': alert_id, 'environment': environment}
+
+    if not seen_alerts:
         raise ValueError('No valid alert data found in CSV file')
-    
-    return alerts_data
+
+
+def _iter_work_item_payloads(kind: str,
+                             source: str,
+                             options: dict,
+                             walk_filter: Optional[walk_filters.WalkFilter]) -> Iterator[dict]:
+    if kind == 'alert':
+        yield from _read_alerts_from_csv(source)
+        return
+
+    if source == '-':
+        names = utilities.read_stream_items(click.get_binary_stream('stdin'))
+    elif kind == 'hash':
+        names = (file_hash.strip() for file_hash in get_hashes_from_file(source))
+    elif kind == 'endpoint-scan':
+        names = (os.path.join(source, scan_dir) for scan_dir in _get_scan_subdirectories(source, walk_filter))
+    elif os.path.isdir(source):
+        names = _iter_directory_files(source, ignore_directory_count_limit=True, walk_filter=walk_filter)
+    else:
+        names = [source]
+
+    for name in names:
+        if not name:
+            continue
+        if kind == 'hash':
+            yield dict(hash=name, **options)
+        else:
+            # Absolute paths, so workers on other hosts that mount the same filesystem can find them
+            yield dict(path=os.path.abspath(name), **options)
+
+
+def enqueue_command(queue_path: str,
+                    kind: str,
+                    source: str,
+                    walk_filter: walk_filters.WalkFilter = None,
+                    **options):
+    """
+    Add work items to a shared work queue, to be processed by `run_worker_command` workers.
+
+    :param kind: One of work_queue.ITEM_KINDS
+    :param source: A file or a directory of files, a text file of hashes, a directory of offline endpoint scans
+                   or a CSV file of alerts, by the kind. '-' reads the paths or the hashes from stdin
+    :param walk_filter: The files and subdirectories of a directory of files, or the endpoint scans, to skip
+    :param options: Options that are stored with every item, only the ones that were set
+    """
+    options = {key: value for key, value in options.items() if value}
+    try:
+        with work_queue.WorkQueue(queue_path) as queue:
+            enqueued_number = queue.enqueue(kind, _iter_work_item_payloads(kind, source, options, walk_filter))
+    except ValueError as e:
+        click.echo(f'Cant enqueue {source}: {e}')
+        raise click.Abort()
+    except sqlite3.Error as e:
+        click.echo(f'Cant write to the work queue {queue_path}: {e}')
+        logger.exception('Failed to enqueue work items', extra=dict(queue_path=queue_path))
+        raise click.Abort()
+
+    click.echo(f'{enqueued_number} items were added to {queue_path}')
+
+
+def _process_work_item(item: work_queue.WorkItem) -> Tuple[str, dict]:
+    """
+    Process a single work item, runs on a worker thread.
+
+    :return: The result, one of 'done', 'failed' or 'in_progress', and the result fields or the error.
+             Errors that are worth a retry are raised.
+    """
+    payload = item.payload
+    if item.kind == 'hash':
+        try:
+            return 'done', dict(analysis_id=send_hash_for_analysis(payload['hash']))
+        except sdk_errors.HashDoesNotExistError:
+            return 'failed', dict(error='Hash does not exist in the system')
+
+    if item.kind == 'alert':
+        result, _ = _notify_alert(payload)
+        if result == 'in_progress':
+            return 'in_progress', {}
+        if result == 'not_found':
+            return 'failed', dict(error='The alert was not found')
+        if result == 'failed':
+            raise RuntimeError('Failed to notify the alert')
+        return 'done', dict(notification=result)
+
+    path = payload['path']
+    if item.kind == 'endpoint-scan':
+        if not os.path.isdir(path):
+            return 'failed', dict(error='The offline scan directory does not exist')
+        try:
+            return 'done', dict(analysis_id=upload_offline_endpoint_scan(path, force=payload.get('force', False)))
+        except click.Abort:
+            return 'failed', dict(error='The offline scan was already uploaded')
+
+    if not os.path.isfile(path):
+        return 'failed', dict(error='The file does not exist')
+    if payload.get('no_unpacking') and not _is_supported_file(path):
+        return 'failed', dict(error='The file is not PE, ELF, DEX or APK')
+    analysis_id = send_file_for_analysis(path,
+                                         disable_dynamic_unpacking=payload.get('no_unpacking'),
+                                         disable_static_unpacking=payload.get('no_static_extraction'),
+                                         code_item_type=payload.get('code_item_type'))
+    return 'done', dict(analysis_id=analysis_id)
+
+
+def run_worker_command(queue_path: str,
+                       max_concurrent: int = None,
+                       lease_duration: int = None,
+                       poll_interval: float = None,
+                       exit_when_empty: bool = False):
+    """
+    Lease items from a shared work queue and process them, until the queue is empty when exit_when_empty is set.
+    Any number of workers may process the same queue, the leases of the items that are still processed are
+    extended, and the items of a worker that died are leased again once their lease expires.
+    """
+    max_concurrent = max_concurrent or default_config.work_queue_max_concurrent
+    lease_duration = lease_duration or default_config.work_queue_lease_duration
+    poll_interval = poll_interval or default_config.work_queue_poll_interval
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    results_counter = collections.Counter()
+    out_of_quota = False
+
+    with work_queue.WorkQueue(queue_path) as queue, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        in_flight: Dict[concurrent.futures.Future, work_queue.WorkItem] = {}
+        leases_extended_at = time.monotonic()
+        while True:
+            if not out_of_quota and len(in_flight) < max_concurrent:
+                for item in queue.lease(owner, max_concurrent - len(in_flight), lease_duration):
+                    # The item is processed in the context of the run, e.g. to count in its metrics
+                    in_flight[executor.submit(contextvars.copy_context().run, _process_work_item, item)] = item
+
+            if not in_flight:
+                if out_of_quota or (exit_when_empty and not queue.has_unfinished_items()):
+                    break
+                deadlines.sleep(poll_interval)
+                continue
+
+            done, _ = concurrent.futures.wait(in_flight,
+                                              timeout=poll_interval,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result, fields = future.result()
+                except sdk_errors.InsufficientQuota:
+                    # Leave the item to a worker with quota
+                    queue.release(item, owner)
+                    if not out_of_quota:
+                        click.echo('The account is out of quota, stopping once the items in progress are done')
+                    out_of_quota = True
+                    continue
+                except Exception as e:
+                    logger.exception('Failed to process work item', extra=dict(kind=item.kind, item=item.name))
+                    result, fields = 'retry', dict(error=str(e) or e.__class__.__name__)
+
+                if result == 'done':
+                    queue.ack(item, owner, fields)
+                elif result == 'in_progress':
+                    queue.release(item, owner, delay=default_config.alerts_in_progress_retry_interval)
+                elif result == 'retry':
+                    result = queue.fail(item, owner, fields['error'], retry_delay=default_config.work_queue_retry_delay)
+                else:
+                    queue.fail(item, owner, fields['error'])
+
+                results_counter[result] += 1
+                if result in ('done', 'failed'):
+                    results.record_result('worker',
+                                          item.name,
+                                          'success' if result == 'done' else 'failed',
+                                          kind=item.kind,
+                                          **fields)
+                if result == 'failed':
+                    click.echo(f'Failed to process {item.kind} {item.name}: {fields["error"]}')
+
+            if in_flight and time.monotonic() - leases_extended_at > lease_duration / 3:
+                queue.extend_leases(in_flight.values(), owner, lease_duration)
+                leases_extended_at = time.monotonic()
+
+    click.echo(f'{results_counter["done"]} items were processed, {results_counter["failed"]} items failed')
+
+
+def queue_status_command(queue_path: str):
+    with work_queue.WorkQueue(queue_path) as queue:
+        counts = queue.count_by_status()
+        failed_items = queue.get_failed_items()
+
+    click.echo(', '.join(f'{status}: {count}' for status, count in counts.items()))
+    for kind, name, error in failed_items:
+        click.echo(f'Failed {kind} {name}: {error}')
+
+
+def _retry_analyze(file_path: str, options: dict):
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f'{file_path} does not exist')
+    if options.get('no_unpacking') and not _is_supported_file(file_path):
+        raise ValueError('The file is not PE, ELF, DEX or APK')
+    send_file_for_analysis(file_path,
+                           disable_dynamic_unpacking=options.get('no_unpacking'),
+                           disable_static_unpacking=options.get('no_static_extraction'),
+                           code_item_type=options.get('code_item_type'))
+
+
+def _retry_index(sha256: str, options: dict):
+    _send_with_profiles(lambda profile_api: _send_index(profile_api,
+                                                        wait=True,
+                                                        index_as=sdk_consts.IndexType.from_str(options['index_as']),
+                                                        sha256=sha256,
+                                                        family_name=options.get('family_name')))
+
+
+def _retry_index_file(file_path: str, options: dict):
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f'{file_path} does not exist')
+    if not _is_supported_file(file_path):
+        raise ValueError('The file is not PE, ELF, DEX or APK')
+    _send_with_profiles(lambda profile_api: _send_index(profile_api,
+                                                        wait=True,
+                                                        index_as=sdk_consts.IndexType.from_str(options['index_as']),
+                                                        file_path=file_path,
+                                                        family_name=options.get('family_name')))
+
+
+def _retry_phishing_email(email_path: str, options: dict):
+    with open(email_path, 'rb') as email_file:
+        binary_data = BytesIO(email_file.read())
+    _send_with_profiles(lambda profile_api: _send_phishing_email(binary_data, profile_api))
+
+
+def _retry_alert_notification(alert_id: str, options: dict):
+    result, _ = _notify_alert(dict(id=alert_id, environment=options.get('environment')))
+    if result == 'in_progress':
+        raise RuntimeError('The alert is still in progress')
+    if result == 'not_found':
+        raise RuntimeError('The alert was not found')
+    if result == 'failed':
+        raise RuntimeError('Failed to notify the alert')
+
+
+# The commands that write failures files, and how to retry a single item of each. A retry raises when it fails.
+_FAILURE_RETRIES: Dict[str, Callable[[str, dict], None]] = {
+    'analyze': _retry_analyze,
+    'index': _retry_index_file,
+    'index-by-list': _retry_index,
+    'upload-emails-in-directory': _retry_phishing_email,
+    'alerts-notify-from-csv': _retry_alert_notification,
+}
+
+
+def retry_failed_command(failures_path: str, max_concurrent: int = None):
+    """
+    Retry only the items of a failures file, concurrently. The items that fail again are written to a new
+    failures file with their attempt count increased, so the retry can be repeated.
+    """
+    try:
+        failed_items = failures.read_failures(failures_path, commands=list(_FAILURE_RETRIES))
+    except IOError:
+        click.echo(f'No read permissions for {failures_path}')
+        logger.exception('Error reading failures file', extra=dict(path=failures_path))
+        raise click.Abort()
+    except ValueError as e:
+        click.echo(f'Invalid failures file {failures_path}: {e}')
+        raise click.Abort()
+
+    def retry(failure: dict) -> Tuple[dict, Optional[Exception]]:
+        try:
+            _FAILURE_RETRIES[failure['command']](failure['item'], failure['options'])
+        except Exception as ex:
+            logger.exception('Failed to retry item', extra=dict(command=failure['command'], item=failure['item']))
+            return failure, ex
+        return failure, None
+
+    results_counter = collections.Counter()
+    with failures.FailuresWriter('retry-failed') as failures_writer, \
+            progress.ProgressRenderer('Retrying failed items', length=len(failed_items), unit='items') as renderer:
+        for failure, error in utilities.imap_unordered_bounded(
+                renderer.track_in_flight(retry),
+                failed_items,
+                max_concurrent or default_config.retry_failed_max_concurrent):
+            result = 'failed' if error else 'success'
+            results_counter[result] += 1
+            results.record_result(failure['command'],
+                                  failure['item'],
+                                  result,
+                                  **(dict(error=str(error)) if error else {}))
+            if error:
+                failures_writer.record(failure['item'],
+                                       error,
+                                       attempts=failure['attempts'] + 1,
+                                       command=failure['command'],
+                                       **failure['options'])
+            renderer.update(1, result=result)
+
+    click.echo(f'{results_counter["success"]} items were retried successfully, '
+               f'{results_counter["failed"]} items failed again')
+
+
+def build_hash_index_command(source_paths: List[str], index_path: str):
+    try:
+        count = hash_index.build_hash_index(source_paths, index_path)
+    except IOError:
+        click.echo(f'Failed to build the hash index {index_path}')
+        logger.exception('Error building hash index', extra=dict(path=index_path))
+        raise click.Abort()
+    click.echo(f'Hash index {index_path} was built with {count} unique hashes')
@@ -3,6 +3,85 @@ class Config(object):
         # Client
         self.unusual_amount_in_dir = 1000
         self.verify_ssl = True
+        self.connection_pool_size = 32
+        self.connect_timeout = 30
+        self.read_timeout = 120
+        self.upload_timeout = 300
+        self.operation_timeout = 30 * 60
+        self.operation_poll_interval = 1
+        self.max_upload_size = 150 * 1024 * 1024
+        self.upload_chunk_size = 1024 * 1024
+        self.upload_progress_min_size = 16 * 1024 * 1024
+        self.max_concurrent_alert_notifications = 10
+        self.alerts_in_progress_deadline = 0
+        self.alerts_in_progress_retry_interval = 30
+        self.alerts_replay_file_name = 'alerts-in-progress.csv'
+        self.max_concurrent_jobs = 4
+        self.jobs_report_file_name = 'intezer-jobs-report.json'
+        self.failures_file_name_template = 'intezer-failures-{command}-{time}.jsonl'
+        self.retry_failed_max_concurrent = 4
+
+        # Progress
+        self.progress_redraw_interval = 0.2
+        self.progress_log_interval = 10.0
+
+        # Status
+        self.status_file_interval = 5.0
+        self.metrics_rate_window = 60
+        self.metrics_host = '127.0.0.1'
+
+        # Watch
+        self.watch_settle_time = 2.0
+        self.watch_poll_interval = 2.0
+        self.watch_max_concurrent = 4
+
+        # Pipeline
+        self.pipeline_queue_size = 100
+        self.pipeline_workers = dict(filter=1, classify=1, hash=1, dedup=1, submit=1, poll=1)
+
+        # Stdin streams
+        self.stream_max_concurrent = 4
+
+        # Sharding
+        self.shard_results_file_name_template = 'intezer-results-shard-{index}-of-{count}.jsonl'
+
+        # Dedup
+        self.dedup_mapping_file_name = 'intezer-dedup-mapping.csv'
+
+        # Archives
+        self.archive_max_depth = 3
+        self.archive_max_member_size = 100 * 1024 * 1024
+        self.archive_max_total_size = 4 * 1024 * 1024 * 1024
+        # The members of archives are held in memory while they wait in the queues of the pipeline
+        self.archive_queue_size = 4
+
+        # Server
+        self.server_default_port = 8643
+        self.server_max_in_flight = 16
+        self.server_max_request_size = 1024 * 1024
+        self.server_busy_retry_after = 1
+        self.server_token_file_name_template = 'server-token-{port}'
+
+        # Hash index
+        self.hash_index_sort_chunk_size = 1000000
+
+        # Dry run
+        self.dry_run_submissions_per_second = 2.0
+        self.dry_run_upload_bytes_per_second = 5 * 1024 * 1024
+
+        # Work queue
+        self.work_queue_lease_duration = 300
+        self.work_queue_poll_interval = 5.0
+        self.work_queue_busy_timeout = 30.0
+        self.work_queue_max_attempts = 3
+        self.work_queue_retry_delay = 60
+        self.work_queue_max_concurrent = 4
+        self.work_queue_enqueue_batch_size = 1000
+
+        # Log
+        self.log_max_bytes = 10 * 1024 * 1024
+        self.log_backup_count = 5
+        self.log_duplicate_traceback_interval = 60
 
         # Urls
         self.api_url = 'https://analyze.intezer.com/api/'
@@ -21,6 +100,20 @@ class Config(object):
         self.key_dir_name = '.intezer'
         self.key_file_name = 'key'
         self.url_file_name = 'url'
+        self.weight_file_name = 'weight'
+        self.profiles_dir_name = 'profiles'
+        self.token_cache_dir_name = 'tokens'
+        self.use_token_cache = True
+        self.token_renew_window = 60
+        self.file_index_file_name = 'file-index.sqlite'
+        self.file_index_commit_interval = 1000
+        self.analysis_cache_file_name = 'analysis-cache.sqlite'
+        self.analysis_cache_ttl = 30 * 24 * 60 * 60
+        self.analysis_cache_max_entries = 1000000
+
+        # Profiles
+        self.profile_names = []
+        self.profile_throttling_cooldown = 60
 
         # Other
         self.is_cloud = True
@@ -0,0 +1,122 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+from intezer_sdk import errors as sdk_errors
+
+logger = logging.getLogger('intezer_cli')
+
+# The exit code of a run that was stopped by its deadline, the same as timeout(1)
+EXIT_CODE = 124
+
+_DURATION_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$', re.IGNORECASE)
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+_deadline: contextvars.ContextVar[Optional['Deadline']] = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(BaseException):
+    """
+    The deadline of the run passed. Like KeyboardInterrupt it isn't an Exception, so the handlers that count an
+    item as failed and continue with the next item let it through, and the whole run stops.
+    """
+
+    def __init__(self):
+        super().__init__('The deadline of the run passed')
+
+
+class OperationTimeoutError(sdk_errors.IntezerError):
+    """An operation didn't complete within the operation timeout, only its item fails"""
+
+    def __init__(self, operation_id: str, timeout: float):
+        super().__init__(f'Operation {operation_id} did not complete within {timeout:g} seconds')
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a duration in seconds, with an optional s, m, h or d suffix, e.g. 90, 45m or 2h.
+
+    :raises ValueError: If the value is not a valid duration
+    """
+    match = _DURATION_PATTERN.match(value)
+    if not match:
+        raise ValueError(f'{value} is not a duration, e.g. 90, 45m or 2h')
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2).lower()]
+
+
+class Deadline:
+    """
+    The time the whole run should end by. The work checks it cooperatively: before every request, while waiting
+    for operations and between directories, and the timeouts of the requests are cut to the time that is left.
+    Once it passes, every thread raises DeadlineExceeded at its next check.
+
+    The deadline is the deadline of the run while it's entered, for the calling thread and the threads it starts
+    with its context.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self._expired = threading.Event()
+        self._token = None
+
+    def __enter__(self) -> 'Deadline':
+        self._token = _deadline.set(self)
+        return self
+
+    def __exit__(self, *args):
+        _deadline.reset(self._token)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0)
+
+    def is_expired(self) -> bool:
+        if not self._expired.is_set() and self.remaining() <= 0:
+            logger.warning('Deadline passed', extra=dict(deadline=self.seconds))
+            self._expired.set()
+        return self._expired.is_set()
+
+    def check(self):
+        """:raises DeadlineExceeded: If the deadline passed"""
+        if self.is_expired():
+            raise DeadlineExceeded()
+
+    def sleep(self, seconds: float):
+        """Sleep, but no longer than the deadline, and raise DeadlineExceeded if it passed meanwhile"""
+        self._expired.wait(min(seconds, self.remaining()))
+        self.check()
+
+    def limit_timeout(self, timeout: Optional[float]) -> float:
+        """The timeout, cut to the time left until the deadline"""
+        remaining = max(self.remaining(), 0.001)
+        return min(timeout, remaining) if timeout else remaining
+
+
+def get_deadline() -> Optional[Deadline]:
+    """The deadline of the run, None when the run has no deadline"""
+    return _deadline.get()
+
+
+def check():
+    """Raise DeadlineExceeded if the deadline of this run passed, a run without a deadline never expires"""
+    deadline = _deadline.get()
+    if deadline:
+        deadline.check()
+
+
+def sleep(seconds: float):
+    """time.sleep that is cut short by the deadline of this run"""
+    deadline = _deadline.get()
+    if deadline:
+        deadline.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def limit_timeout(timeout: Optional[float]) -> Optional[float]:
+    """The timeout, cut to the time left until the deadline of this run"""
+    deadline = _deadline.get()
+    return deadline.limit_timeout(timeout) if deadline else timeout
@@ -0,0 +1,81 @@
+import collections
+import datetime
+import logging
+import time
+from typing import NamedTuple
+
+import click
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+
+class ThroughputModel(NamedTuple):
+    """The assumed throughput of the service, that the duration of a run is projected from"""
+    submissions_per_second: float
+    upload_bytes_per_second: float
+
+    @classmethod
+    def from_config(cls) -> 'ThroughputModel':
+        return cls(default_config.dry_run_submissions_per_second, default_config.dry_run_upload_bytes_per_second)
+
+    def project_duration(self, submissions: int, upload_bytes: int) -> float:
+        return submissions / self.submissions_per_second + upload_bytes / self.upload_bytes_per_second
+
+
+def _format_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f}{unit}' if unit != 'B' else f'{size}B'
+        size /= 1024
+    return f'{size:.1f}TB'
+
+
+class CostEstimate:
+    """
+    The counters of a dry run: the run walks, filters and classifies the items as usual, and every item that would
+    have been sent is counted here instead. At the end the quota use and the duration of the real run are projected.
+    """
+
+    def __init__(self, submission_name: str, throughput_model: ThroughputModel = None):
+        """
+        :param submission_name: What a submission is, e.g. analyses, that the quota use is shown in
+        :param throughput_model: Defaults to the model of the config
+        """
+        self.submission_name = submission_name
+        self.throughput_model = throughput_model or ThroughputModel.from_config()
+        self.submissions = 0
+        self.upload_bytes = 0
+        self.skipped = collections.Counter()
+        self._started_at = time.monotonic()
+
+    def add_submission(self, size: int = 0):
+        self.submissions += 1
+        self.upload_bytes += size
+
+    def add_skipped(self, description: str, count: int = 1):
+        """Count items that would not have been sent, e.g. add_skipped('unsupported files')"""
+        self.skipped[description] += count
+
+    @property
+    def projected_duration(self) -> float:
+        return self.throughput_model.project_duration(self.submissions, self.upload_bytes)
+
+    def echo(self):
+        local_duration = time.monotonic() - self._started_at
+        logger.info('Dry run finished', extra=dict(submissions=self.submissions,
+                                                   upload_bytes=self.upload_bytes,
+                                                   skipped=dict(self.skipped),
+                                                   projected_duration=self.projected_duration))
+        click.echo('Dry run, nothing was sent')
+        click.echo(f'{self.submissions} {self.submission_name} would be sent, '
+                   f'{_format_size(self.upload_bytes)} would be uploaded')
+        for description, count in sorted(self.skipped.items()):
+            click.echo(f'{count} {description.replace("_", " ")} would not be sent')
+        click.echo(f'Projected quota use: {self.submissions} {self.submission_name}')
+        click.echo(f'Projected duration: {datetime.timedelta(seconds=int(self.projected_duration))} at '
+                   f'{self.throughput_model.submissions_per_second:g} submissions/s and '
+                   f'{_format_size(self.throughput_model.upload_bytes_per_second)}/s '
+                   f'(the local work took {datetime.timedelta(seconds=int(local_duration))})')
+
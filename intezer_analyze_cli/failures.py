@@ -0,0 +1,105 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import List
+from typing import Optional
+from typing import Union
+
+import click
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+
+class FailuresWriter:
+    """
+    Write the items that failed in a run to a JSON lines file, one line per item, with everything that is needed
+    to retry the item: the command, the item, the command options, the error and the number of attempts.
+    The file is created with the first failure, a run without failures leaves no file behind.
+    """
+
+    def __init__(self, command: str, failures_path: str = None, **options):
+        self.command = command
+        self.options = options
+        if not failures_path:
+            failures_file_name = default_config.failures_file_name_template.format(
+                command=command,
+                time=datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+            failures_path = os.path.join(os.getcwd(), failures_file_name)
+        self.failures_path = failures_path
+        self.failed_number = 0
+        self._lock = threading.Lock()
+        self._failures_file = None
+
+    def __enter__(self) -> 'FailuresWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.failed_number:
+            click.echo(f'{self.failed_number} failed items were written to {self.failures_path}, '
+                       f'in order to retry them run: intezer-analyze retry-failed {self.failures_path}')
+
+    def record(self,
+               item: str,
+               error: Union[BaseException, str],
+               attempts: int = 1,
+               command: str = None,
+               **item_options):
+        """
+        :param error: The exception the item failed with, or a description of the failure
+        :param command: The command of the item, when it isn't the command of the writer
+        :param item_options: Options of this item only, in addition to the command options
+        """
+        failure = dict(time=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       command=command or self.command,
+                       item=item,
+                       options=dict(self.options, **item_options),
+                       error_class=error.__class__.__name__ if isinstance(error, BaseException) else None,
+                       error=str(error) or error.__class__.__name__,
+                       attempts=attempts)
+        with self._lock:
+            try:
+                if not self._failures_file:
+                    self._failures_file = open(self.failures_path, 'a', encoding='utf-8')
+                self._failures_file.write(json.dumps(failure, default=str) + '\n')
+                self._failures_file.flush()
+            except OSError:
+                logger.exception('Failed to record failure', extra=dict(command=self.command, item=item))
+                return
+            self.failed_number += 1
+
+    def close(self):
+        with self._lock:
+            if self._failures_file:
+                self._failures_file.close()
+                self._failures_file = None
+
+
+def read_failures(failures_path: str, commands: Optional[List[str]] = None) -> List[dict]:
+    """
+    Read the failures written by FailuresWriter.
+
+    :param commands: The commands that can be retried, a failure of another command is invalid
+    :raises ValueError: If the failures file is invalid
+    """
+    failures = []
+    with open(failures_path, 'r', encoding='utf-8') as failures_file:
+        for line_number, line in enumerate(failures_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                failure = json.loads(line)
+            except ValueError:
+                raise ValueError(f'Line {line_number} is not valid JSON')
+            if not isinstance(failure, dict) or not failure.get('item') or not failure.get('command'):
+                raise ValueError(f'Line {line_number} should be an object with "command" and "item"')
+            if commands is not None and failure['command'] not in commands:
+                raise ValueError(f'Line {line_number} has a command that cant be retried: "{failure["command"]}"')
+            failure.setdefault('options', {})
+            failure.setdefault('attempts', 1)
+            failures.append(failure)
+    return failures
@@ -0,0 +1,98 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+from typing import Optional
+
+from intezer_analyze_cli import key_store
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    api_url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sha256 TEXT,
+    analysis_id TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (api_url, path)
+)
+'''
+
+
+class FileState(NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
+    sha256: Optional[str]
+    analysis_id: Optional[str]
+
+    @classmethod
+    def from_stat(cls, file_stat: os.stat_result, sha256: str = None, analysis_id: str = None) -> 'FileState':
+        return cls(file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, sha256, analysis_id)
+
+    def is_unchanged(self, file_stat: os.stat_result) -> bool:
+        return (self.size, self.mtime_ns, self.inode) == (file_stat.st_size,
+                                                          file_stat.st_mtime_ns,
+                                                          file_stat.st_ino)
+
+
+class FileStateIndex:
+    """
+    A persistent index of the files that were already sent, by the account API URL and the file path.
+    The index is shared by the threads of a pipeline, updates are committed in batches.
+    """
+
+    def __init__(self, api_url: str, index_path: str = None, commit_interval: int = None):
+        self.api_url = api_url
+        self.index_path = index_path or key_store.get_key_file_path(default_config.file_index_file_name)
+        self.commit_interval = commit_interval or default_config.file_index_commit_interval
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(_SCHEMA)
+        self._uncommitted_number = 0
+
+    def __enter__(self) -> 'FileStateIndex':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, path: str) -> Optional[FileState]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT size, mtime_ns, inode, sha256, analysis_id FROM files WHERE api_url = ? AND path = ?',
+                (self.api_url, path)).fetchone()
+        return FileState(*row) if row else None
+
+    def set(self, path: str, file_state: FileState):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO files (api_url, path, size, mtime_ns, inode, sha256, analysis_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.api_url, path, *file_state, time.time()))
+            self._uncommitted_number += 1
+            if self._uncommitted_number >= self.commit_interval:
+                self._commit()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._uncommitted_number = 0
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._connection.close()
@@ -0,0 +1,168 @@
+import contextlib
+import heapq
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+from typing import BinaryIO
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+_MAGIC = b'INTZHIX1'
+_HEADER = struct.Struct('>8sQ')  # Magic and the number of hashes
+_DIGEST_SIZE = 32
+_SHA256_PATTERN = re.compile(r'(?<![0-9a-fA-F])[0-9a-fA-F]{64}(?![0-9a-fA-F])')
+
+KNOWN_GOOD = 'known_good'
+KNOWN_BAD = 'known_bad'
+
+
+class HashIndex:
+    """
+    A compact, read only set of SHA256 hashes: a file with the sorted 32 bytes digests, that is memory mapped
+    and binary searched, so an index of tens of millions of hashes is opened instantly and takes no memory
+    besides the pages the searches touch.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._file = open(index_path, 'rb')
+        try:
+            header = self._file.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f'{index_path} is not a hash index')
+            magic, self._count = _HEADER.unpack(header)
+            if magic != _MAGIC or os.fstat(self._file.fileno()).st_size != _HEADER.size + self._count * _DIGEST_SIZE:
+                raise ValueError(f'{index_path} is not a hash index, build it with build-hash-index')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, sha256: str) -> bool:
+        try:
+            digest = bytes.fromhex(sha256)
+        except (TypeError, ValueError):
+            return False
+        if len(digest) != _DIGEST_SIZE:
+            return False
+
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _HEADER.size + middle * _DIGEST_SIZE
+            middle_digest = self._mmap[offset:offset + _DIGEST_SIZE]
+            if middle_digest < digest:
+                low = middle + 1
+            elif middle_digest > digest:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'HashIndex':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _iter_digests(source_paths: Iterable[str]) -> Iterator[bytes]:
+    """The first SHA256 of every line, so both plain hash lists and CSV files such as NSRL are read"""
+    for source_path in source_paths:
+        with open(source_path, 'r', encoding='utf-8', errors='replace') as source_file:
+            for line in source_file:
+                match = _SHA256_PATTERN.search(line)
+                if match:
+                    yield bytes.fromhex(match.group())
+
+
+def _iter_run(run_file: BinaryIO) -> Iterator[bytes]:
+    run_file.seek(0)
+    return iter(lambda: run_file.read(_DIGEST_SIZE), b'')
+
+
+def build_hash_index(source_paths: List[str], index_path: str, chunk_size: int = None) -> int:
+    """
+    Build a hash index from text files of SHA256 hashes. The hashes are sorted in runs of chunk_size hashes
+    that are merged on the disk, so lists larger than the memory can be indexed.
+
+    :return: The number of unique hashes in the index
+    """
+    chunk_size = chunk_size or default_config.hash_index_sort_chunk_size
+    index_directory = os.path.dirname(os.path.abspath(index_path))
+
+    with contextlib.ExitStack() as exit_stack:
+        runs = []
+
+        def write_run(digests: List[bytes]):
+            run_file = exit_stack.enter_context(tempfile.TemporaryFile(dir=index_directory))
+            run_file.write(b''.join(sorted(set(digests))))
+            runs.append(run_file)
+
+        digests = []
+        for digest in _iter_digests(source_paths):
+            digests.append(digest)
+            if len(digests) >= chunk_size:
+                write_run(digests)
+                digests = []
+        if digests or not runs:
+            write_run(digests)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir=index_directory, prefix='.hash-index-')
+        try:
+            count = 0
+            with os.fdopen(file_descriptor, 'wb') as index_file:
+                index_file.write(_HEADER.pack(_MAGIC, 0))
+                previous_digest = None
+                for digest in heapq.merge(*(_iter_run(run_file) for run_file in runs)):
+                    if digest != previous_digest:
+                        index_file.write(digest)
+                        previous_digest = digest
+                        count += 1
+                index_file.seek(0)
+                index_file.write(_HEADER.pack(_MAGIC, count))
+            os.replace(temp_path, index_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+
+    logger.info('Hash index built', extra=dict(path=index_path, count=count))
+    return count
+
+
+class HashLists:
+    """The allowlists of known good hashes and the blocklists of known bad hashes of a run"""
+
+    def __init__(self):
+        self.allowlists: List[HashIndex] = []
+        self.blocklists: List[HashIndex] = []
+
+    def match(self, sha256: str) -> Optional[str]:
+        """:return: KNOWN_BAD or KNOWN_GOOD when the hash is in one of the lists, a blocklist match comes first"""
+        if any(sha256 in blocklist for blocklist in self.blocklists):
+            return KNOWN_BAD
+        if any(sha256 in allowlist for allowlist in self.allowlists):
+            return KNOWN_GOOD
+        return None
+
+    def close(self):
+        for hash_index in self.allowlists + self.blocklists:
+            hash_index.close()
+
@@ -0,0 +1,281 @@
+import contextlib
+import contextvars
+import datetime
+import inspect
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import click
+from intezer_sdk import consts as sdk_consts
+
+from intezer_analyze_cli import commands
+from intezer_analyze_cli import progress
+from intezer_analyze_cli import results
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+# The results that fail a job, e.g. an item that failed or that the deadline stopped before it was done
+JOB_FAILED_RESULTS = progress.FAILED_RESULTS | {'not_done'}
+
+# What the job that runs in the context writes to stdout, while several jobs run at the same time
+_job_output: contextvars.ContextVar[Optional[io.BytesIO]] = contextvars.ContextVar('job_output', default=None)
+
+
+def _run_analyze_job(path: str,
+                     no_unpacking: bool = False,
+                     no_static_extraction: bool = False,
+                     code_item_type: str = None):
+    if os.path.isfile(path):
+        return commands.analyze_file_command(file_path=path,
+                                             disable_dynamic_unpacking=no_unpacking or None,
+                                             disable_static_unpacking=no_static_extraction or None,
+                                             code_item_type=code_item_type)
+    return commands.analyze_directory_command(path=path,
+                                              disable_dynamic_unpacking=no_unpacking or None,
+                                              disable_static_unpacking=no_static_extraction or None,
+                                              code_item_type=code_item_type,
+                                              ignore_directory_count_limit=True)
+
+
+def _run_analyze_by_list_job(path: str):
+    return commands.analyze_by_txt_file_command(path=path)
+
+
+def _assert_index_arguments(index_as: str, family_name: str):
+    index_type = sdk_consts.IndexType.from_str(index_as)
+    if index_type == sdk_consts.IndexType.MALICIOUS and family_name is None:
+        raise ValueError('family_name is mandatory if the index type is malicious')
+
+
+def _run_index_job(path: str, index_as: str, family_name: str = None):
+    _assert_index_arguments(index_as, family_name)
+    if os.path.isfile(path):
+        return commands.index_file_command(file_path=path, index_as=index_as, family_name=family_name)
+    return commands.index_directory_command(directory_path=path,
+                                            index_as=index_as,
+                                            family_name=family_name,
+                                            ignore_directory_count_limit=True)
+
+
+def _run_index_by_list_job(path: str, index_as: str, family_name: str = None):
+    _assert_index_arguments(index_as, family_name)
+    return commands.index_by_txt_file_command(path=path, index_as=index_as, family_name=family_name)
+
+
+def _run_upload_endpoint_scan_job(path: str, force: bool = False, max_concurrent: int = 0):
+    return commands.upload_offline_endpoint_scan(offline_scan_directory=path,
+                                                 force=force,
+                                                 max_concurrent_uploads=max_concurrent)
+
+
+def _run_upload_endpoint_scans_in_directory_job(path: str, force: bool = False, max_concurrent: int = 0):
+    return commands.upload_multiple_offline_endpoint_scans(offline_scans_root_directory=path,
+                                                           force=force,
+                                                           max_concurrent_uploads=max_concurrent)
+
+
+def _run_upload_emails_in_directory_job(path: str):
+    return commands.send_phishing_emails_from_directory_command(path=path, ignore_directory_count_limit=True)
+
+
+def _run_alerts_notify_from_csv_job(path: str,
+                                    max_concurrent: int = None,
+                                    in_progress_deadline: int = None,
+                                    in_progress_retry_interval: int = None,
+                                    replay_file: str = None):
+    return commands.notify_alerts_from_csv_command(csv_path=path,
+                                                   max_concurrent=max_concurrent,
+                                                   in_progress_deadline=in_progress_deadline,
+                                                   in_progress_retry_interval=in_progress_retry_interval,
+                                                   replay_file_path=replay_file)
+
+
+JOB_RUNNERS: Dict[str, Callable[..., Any]] = {
+    'analyze': _run_analyze_job,
+    'analyze-by-list': _run_analyze_by_list_job,
+    'index': _run_index_job,
+    'index-by-list': _run_index_by_list_job,
+    'upload-endpoint-scan': _run_upload_endpoint_scan_job,
+    'upload-endpoint-scans-in-directory': _run_upload_endpoint_scans_in_directory_job,
+    'upload-emails-in-directory': _run_upload_emails_in_directory_job,
+    'alerts-notify-from-csv': _run_alerts_notify_from_csv_job,
+}
+
+
+def read_job_file(job_file_path: str) -> List[dict]:
+    """
+    Read the jobs from a JSON or YAML job file, either a list of jobs or an object with a "jobs" list.
+    Every job is an object with a "command" and the command arguments, for example:
+    {"command": "index", "path": "/files/to/index", "index_as": "trusted"}
+
+    :raises ValueError: If the job file is invalid
+    """
+    with open(job_file_path, 'r', encoding='utf-8') as job_file:
+        if job_file_path.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('Reading YAML job files requires PyYAML, install it with: pip install pyyaml')
+            content = yaml.safe_load(job_file)
+        else:
+            content = json.load(job_file)
+
+    if isinstance(content, dict):
+        content = content.get('jobs')
+    if not isinstance(content, list) or not content:
+        raise ValueError('The job file should contain a non empty list of jobs')
+
+    for job_number, job in enumerate(content, start=1):
+        if not isinstance(job, dict):
+            raise ValueError(f'Job {job_number} should be an object')
+        command = str(job.get('command', '')).replace('_', '-')
+        if command not in JOB_RUNNERS:
+            raise ValueError(f'Job {job_number} has unknown command "{job.get("command")}", '
+                             f'choose from: {", ".join(JOB_RUNNERS)}')
+        if not job.get('path'):
+            raise ValueError(f'Job {job_number} is missing "path"')
+        parameters = inspect.signature(JOB_RUNNERS[command]).parameters
+        unknown_keys = [key for key in job if key != 'command' and key not in parameters]
+        if unknown_keys:
+            raise ValueError(f'Job {job_number} has unknown options for {command}: {", ".join(unknown_keys)}, '
+                             f'choose from: {", ".join(parameters)}')
+        missing_keys = [name for name, parameter in parameters.items()
+                        if parameter.default is inspect.Parameter.empty and name not in job]
+        if missing_keys:
+            raise ValueError(f'Job {job_number} is missing options for {command}: {", ".join(missing_keys)}')
+
+    return content
+
+
+class _JobsOutputStream(io.RawIOBase):
+    """
+    The binary stream under stdout while several jobs run at the same time. What a job writes, on its own thread or
+    on the threads it starts, is held until the job ends and is written in one piece, instead of the output of the
+    jobs being interleaved. It isn't a TTY, so the progress of the jobs is written as lines.
+    """
+
+    def __init__(self, stream: io.RawIOBase):
+        super().__init__()
+        self._stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        job_output = _job_output.get()
+        if job_output is not None:
+            return job_output.write(data)
+        written = self._stream.write(data)
+        self._stream.flush()
+        return written
+
+
+@contextlib.contextmanager
+def _hold_jobs_output() -> Iterator[None]:
+    stdout = sys.stdout
+    if not hasattr(stdout, 'buffer'):
+        yield
+        return
+    sys.stdout = io.TextIOWrapper(_JobsOutputStream(stdout.buffer),
+                                  encoding=stdout.encoding,
+                                  errors=stdout.errors,
+                                  write_through=True)
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+def run_job(numbered_job: Tuple[int, dict]) -> dict:
+    """Run a single job, runs on a worker thread. Returns the job report entry."""
+    job_number, job = numbered_job
+    arguments = {key: value for key, value in job.items() if key != 'command'}
+    command = job['command'].replace('_', '-')
+    job_report = dict(job_number=job_number, command=command, arguments=arguments)
+    start_time = time.monotonic()
+    try:
+        with results.ResultsCounter() as results_counter:
+            result = JOB_RUNNERS[command](**arguments)
+        if results_counter.counter:
+            job_report['results'] = dict(results_counter.counter)
+        failed_number = sum(results_counter.counter[status] for status in JOB_FAILED_RESULTS)
+        if failed_number:
+            job_report['status'] = 'failed'
+            job_report['error'] = f'{failed_number} items failed'
+        else:
+            job_report['status'] = 'succeeded'
+        if result is not None:
+            job_report['result'] = result
+    except click.Abort:
+        logger.info('Job aborted', extra=dict(command=command, arguments=arguments))
+        job_report['status'] = 'failed'
+        job_report['error'] = 'Aborted'
+    except Exception as e:
+        logger.exception('Job failed', extra=dict(command=command, arguments=arguments))
+        job_report['status'] = 'failed'
+        job_report['error'] = f'{e.__class__.__name__}: {e}'
+
+    job_report['duration'] = round(time.monotonic() - start_time, 3)
+    return job_report
+
+
+def _run_job_with_held_output(numbered_job: Tuple[int, dict]) -> Tuple[dict, bytes]:
+    job_output = io.BytesIO()
+    token = _job_output.set(job_output)
+    try:
+        return run_job(numbered_job), job_output.getvalue()
+    finally:
+        _job_output.reset(token)
+
+
+def run_jobs_command(jobs: List[dict], max_concurrent: int = None, report_path: str = None):
+    """
+    Run the jobs in this process with the global API, several jobs at a time, and write a combined report.
+
+    :param jobs: The jobs read from the job file
+    :param max_concurrent: Maximum number of jobs to run at the same time
+    :param report_path: Path of the JSON report file
+    """
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    max_concurrent = max_concurrent or default_config.max_concurrent_jobs
+    jobs_reports = []
+    if max_concurrent == 1 or len(jobs) == 1:
+        for job_report in map(run_job, enumerate(jobs, start=1)):
+            jobs_reports.append(job_report)
+            click.echo(f'Job {job_report["job_number"]} ({job_report["command"]}) {job_report["status"]}')
+    else:
+        with _hold_jobs_output():
+            for job_report, job_output in utilities.imap_unordered_bounded(_run_job_with_held_output,
+                                                                            enumerate(jobs, start=1),
+                                                                            max_concurrent):
+                jobs_reports.append(job_report)
+                click.echo(job_output.decode(sys.stdout.encoding, errors='replace'), nl=False)
+                click.echo(f'Job {job_report["job_number"]} ({job_report["command"]}) {job_report["status"]}')
+
+    jobs_reports.sort(key=lambda job_report: job_report['job_number'])
+    succeeded_number = sum(1 for job_report in jobs_reports if job_report['status'] == 'succeeded')
+    report = dict(started_at=started_at.isoformat(),
+                  finished_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                  succeeded=succeeded_number,
+                  failed=len(jobs_reports) - succeeded_number,
+                  jobs=jobs_reports)
+
+    report_path = report_path or os.path.join(os.getcwd(), default_config.jobs_report_file_name)
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+
+    click.echo(f'{succeeded_number} jobs succeeded, {len(jobs_reports) - succeeded_number} jobs failed. '
+               f'Report: {report_path}')
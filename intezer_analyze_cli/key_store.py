@@ -1,5 +1,13 @@
+import contextlib
+import hashlib
+import json
 import logging
 import os
+import shutil
+import tempfile
+from typing import Iterator
+from typing import List
+from typing import Optional
 
 from intezer_analyze_cli.config import default_config as config_
 
@@ -62,3 +70,120 @@ def store_default_url(key):
 
 def delete_default_url():
     delete_key(config_.url_file_name)
+
+
+def get_profile_key_file_name(profile_name, key_file_name):
+    return os.path.join(config_.profiles_dir_name, profile_name, key_file_name)
+
+
+def store_profile(profile_name: str, api_key: str, api_url: Optional[str] = None, weight: int = 1):
+    store_key(api_key, get_profile_key_file_name(profile_name, config_.key_file_name))
+    if api_url:
+        store_key(api_url, get_profile_key_file_name(profile_name, config_.url_file_name))
+    else:
+        delete_key(get_profile_key_file_name(profile_name, config_.url_file_name))
+    store_key(str(weight), get_profile_key_file_name(profile_name, config_.weight_file_name))
+
+
+def get_stored_profile(profile_name: str) -> Optional[dict]:
+    api_key = get_stored_key(get_profile_key_file_name(profile_name, config_.key_file_name))
+    if not api_key:
+        return None
+
+    weight = get_stored_key(get_profile_key_file_name(profile_name, config_.weight_file_name))
+    return dict(name=profile_name,
+                api_key=api_key,
+                api_url=get_stored_key(get_profile_key_file_name(profile_name, config_.url_file_name)),
+                weight=int(weight) if weight else 1)
+
+
+def list_profiles() -> List[str]:
+    profiles_dir_path = get_key_file_path(config_.profiles_dir_name)
+    if not os.path.isdir(profiles_dir_path):
+        return []
+
+    return sorted(profile_name for profile_name in os.listdir(profiles_dir_path)
+                  if get_stored_profile(profile_name))
+
+
+def delete_profile(profile_name: str):
+    profile = get_stored_profile(profile_name)
+    if profile:
+        delete_cached_tokens(profile['api_key'])
+    profile_dir_path = get_key_file_path(os.path.join(config_.profiles_dir_name, profile_name))
+    if os.path.isdir(profile_dir_path):
+        shutil.rmtree(profile_dir_path)
+        logger.info('Profile deleted', extra=dict(profile_name=profile_name))
+
+
+def _get_api_key_token_cache_dir_path(api_key: str) -> str:
+    """The directory of the access token caches of the API key, the key itself is not part of the path"""
+    api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    return get_key_file_path(os.path.join(config_.token_cache_dir_name, api_key_hash))
+
+
+def get_token_cache_path(api_key: str, api_url: str) -> str:
+    """The access token cache file of the API key and url"""
+    api_url_hash = hashlib.sha256(api_url.encode()).hexdigest()[:32]
+    return os.path.join(_get_api_key_token_cache_dir_path(api_key), f'{api_url_hash}.json')
+
+
+@contextlib.contextmanager
+def token_cache_lock(token_cache_path: str) -> Iterator[bool]:
+    """
+    Exclusive lock of the token cache between processes, held while the cache is checked and refreshed.
+
+    :return: Whether the lock was taken, on Windows waiting for the lock gives up after about 10 seconds
+    """
+    os.makedirs(os.path.dirname(token_cache_path), mode=0o700, exist_ok=True)
+    lock_fd = os.open(f'{token_cache_path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            try:
+                msvcrt.locking(lock_fd, msvcrt.LK_LOCK, 1)
+            except OSError:
+                logger.warning('Timed out waiting for the token cache lock', extra=dict(path=token_cache_path))
+                yield False
+                return
+        else:
+            import fcntl
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        yield True
+    finally:
+        os.close(lock_fd)
+
+
+def get_cached_token(token_cache_path: str) -> Optional[dict]:
+    try:
+        with open(token_cache_path, 'r') as f:
+            cached_token = json.load(f)
+        if cached_token.get('token') and cached_token.get('expire_at'):
+            return cached_token
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.info('Invalid token cache file', extra=dict(path=token_cache_path))
+    return None
+
+
+def store_cached_token(token_cache_path: str, token: str, expire_at: float):
+    """Replace the token cache file atomically, readable only by the user"""
+    cache_dir_path = os.path.dirname(token_cache_path)
+    os.makedirs(cache_dir_path, mode=0o700, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir_path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(token=token, expire_at=expire_at), f)
+        os.replace(temp_path, token_cache_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def delete_cached_tokens(api_key: str):
+    """Delete the access tokens cached for the API key, with any of the API urls"""
+    token_cache_dir_path = _get_api_key_token_cache_dir_path(api_key)
+    if os.path.isdir(token_cache_dir_path):
+        # A lock file may be open by a running process, e.g. on Windows, its token is refreshed on its next run
+        shutil.rmtree(token_cache_dir_path, ignore_errors=True)
@@ -0,0 +1,221 @@
+import collections
+import contextlib
+import contextvars
+import datetime
+import http.server
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Iterator
+from typing import Optional
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+COUNTERS = ('submitted', 'succeeded', 'failed', 'unsupported', 'bytes_sent', 'quota_errors')
+_COUNTERS_HELP = {
+    'submitted': 'Operations submitted to Intezer Analyze',
+    'succeeded': 'Submitted operations that succeeded',
+    'failed': 'Submitted operations that failed',
+    'unsupported': 'Files that were skipped because their type is not supported',
+    'bytes_sent': 'Bytes of the files that were sent',
+    'quota_errors': 'Submissions rejected because the account was out of quota',
+}
+
+_run_metrics: contextvars.ContextVar[Optional['RunMetrics']] = contextvars.ContextVar('run_metrics', default=None)
+
+
+class RunMetrics:
+    """
+    Live counters of a run, updated by the command loops from any thread. The rate is the number of operations
+    that completed per second during the last rate_window seconds. The work counts in the metrics while they're
+    entered, from the calling thread and from the threads it starts with its context.
+    """
+
+    def __init__(self, command: str, rate_window: float = None):
+        self.command = command
+        self.rate_window = rate_window or default_config.metrics_rate_window
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._in_flight = 0
+        self._completed_per_second = collections.deque()  # [second, completed number] pairs, oldest first
+        self._started_at = time.monotonic()
+        self._started_at_utc = datetime.datetime.now(datetime.timezone.utc)
+        self._token = None
+
+    def __enter__(self) -> 'RunMetrics':
+        self._token = _run_metrics.set(self)
+        return self
+
+    def __exit__(self, *args):
+        _run_metrics.reset(self._token)
+
+    def increment(self, counter: str, value: int = 1):
+        with self._lock:
+            self._counters[counter] += value
+
+    @contextlib.contextmanager
+    def track_submission(self) -> Iterator[None]:
+        """Count a submission as submitted and in flight while it runs, then as succeeded or failed"""
+        with self._lock:
+            self._counters['submitted'] += 1
+            self._in_flight += 1
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._counters['succeeded' if succeeded else 'failed'] += 1
+                self._count_completed()
+
+    def _count_completed(self):
+        second = int(time.monotonic())
+        if self._completed_per_second and self._completed_per_second[-1][0] == second:
+            self._completed_per_second[-1][1] += 1
+        else:
+            self._completed_per_second.append([second, 1])
+        self._trim_completed(second)
+
+    def _trim_completed(self, now_second: int):
+        while self._completed_per_second and self._completed_per_second[0][0] <= now_second - self.rate_window:
+            self._completed_per_second.popleft()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._trim_completed(int(now))
+            window = min(self.rate_window, max(now - self._started_at, 1))
+            completed_in_window = sum(completed for _, completed in self._completed_per_second)
+            return dict(command=self.command,
+                        started_at=self._started_at_utc.isoformat(),
+                        updated_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                        elapsed=round(now - self._started_at, 3),
+                        in_flight=self._in_flight,
+                        rate=round(completed_in_window / window, 3),
+                        **{counter: self._counters[counter] for counter in COUNTERS})
+
+    def format_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        labels = '{command="%s"}' % self.command.replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+        for counter in COUNTERS:
+            name = f'intezer_cli_{counter}_total'
+            lines.extend([f'# HELP {name} {_COUNTERS_HELP[counter]}',
+                          f'# TYPE {name} counter',
+                          f'{name}{labels} {snapshot[counter]}'])
+        for gauge, help_text in (('in_flight', 'Operations that are being submitted'),
+                                 ('rate', f'Operations completed per second in the last {self.rate_window:g} '
+                                          f'seconds')):
+            name = f'intezer_cli_{gauge}'
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name}{labels} {snapshot[gauge]}'])
+        return '\n'.join(lines) + '\n'
+
+
+class StatusFileWriter:
+    """
+    Rewrite a JSON status file with the run metrics every interval seconds. The file is replaced atomically,
+    so readers never see a partially written file.
+    """
+
+    def __init__(self, status_file_path: str, run_metrics: RunMetrics, interval: float = None):
+        self.status_file_path = os.path.abspath(status_file_path)
+        self.run_metrics = run_metrics
+        self.interval = interval or default_config.status_file_interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='status-file-writer', daemon=True)
+
+    def start(self):
+        self.write()
+        self._thread.start()
+
+    def stop(self):
+        """Stop rewriting the file, and write the final status"""
+        self._stop_event.set()
+        self._thread.join()
+        self.write(finished=True)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                logger.exception('Failed to write the status file', extra=dict(path=self.status_file_path))
+
+    def write(self, finished: bool = False):
+        status = dict(self.run_metrics.snapshot(), finished=finished)
+        status_directory = os.path.dirname(self.status_file_path)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=status_directory, prefix='.status-', suffix='.json')
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as status_file:
+                json.dump(status, status_file, indent=2)
+            os.replace(temp_path, self.status_file_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    server: 'MetricsServer'
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.run_metrics.format_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format_: str, *args):
+        logger.debug(format_ % args, extra=dict(client=self.client_address[0]))
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """Serve the run metrics to Prometheus on GET /metrics, from a background thread"""
+    daemon_threads = True
+
+    def __init__(self, port: int, run_metrics: RunMetrics, host: str = None):
+        self.run_metrics = run_metrics
+        super().__init__((default_config.metrics_host if host is None else host, port), _MetricsHandler)
+        self._thread = threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def get_run_metrics() -> Optional[RunMetrics]:
+    """The metrics of this run, None when the run doesn't report them"""
+    return _run_metrics.get()
+
+
+def increment(counter: str, value: int = 1):
+    """Increment a counter of the run metrics, when the run reports them"""
+    run_metrics = _run_metrics.get()
+    if run_metrics:
+        run_metrics.increment(counter, value)
+
+
+def track_submission() -> contextlib.AbstractContextManager:
+    """Track a submission in the run metrics, when the run reports them"""
+    run_metrics = _run_metrics.get()
+    if run_metrics:
+        return run_metrics.track_submission()
+    return contextlib.nullcontext()
@@ -0,0 +1,149 @@
+import io
+import os
+import uuid
+from typing import BinaryIO
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from intezer_analyze_cli.config import default_config
+
+_Part = Union[bytes, Tuple[BinaryIO, int, int]]  # Bytes, or a (file, start offset, length) region of a file
+
+
+def _quote_header_param(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _iter_form_values(data: Optional[dict]):
+    for name, value in (data or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for single_value in values:
+            if single_value is not None:
+                yield name, single_value
+
+
+def get_stream_size(file_stream: BinaryIO) -> Optional[int]:
+    """The number of bytes from the current position to the end of the stream, None if it isn't seekable"""
+    try:
+        if not file_stream.seekable():
+            return None
+        position = file_stream.tell()
+        size = file_stream.seek(0, os.SEEK_END) - position
+        file_stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class MultipartStream(io.RawIOBase):
+    """
+    A multipart/form-data request body that is read from the files in chunks as it's sent, instead of being
+    built in memory, so a large file takes no more memory than a chunk.
+
+    It's built from the data and files arguments of requests, and it's seekable so the request can be sent again.
+    """
+
+    def __init__(self,
+                 data: Optional[dict],
+                 files: dict,
+                 chunk_size: int = None,
+                 progress_callback: Callable[[int], None] = None):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size or default_config.upload_chunk_size
+        self._progress_callback = progress_callback
+        self._parts: List[_Part] = []
+        self._position = 0
+        self.file_size = 0
+
+        for name, value in _iter_form_values(data):
+            if not isinstance(value, bytes):
+                value = str(value).encode()
+            self._parts.append(self._part_header(name) + value + b'\r\n')
+
+        for name, file_value in files.items():
+            file_name, file_stream = file_value[0], file_value[1]
+            content_type = file_value[2] if len(file_value) > 2 else None
+            if isinstance(file_stream, (bytes, str)):
+                file_stream = io.BytesIO(file_stream.encode() if isinstance(file_stream, str) else file_stream)
+            size = get_stream_size(file_stream)
+            if size is None:
+                raise ValueError(f'The stream of {file_name} is not seekable')
+            self._parts.append(self._part_header(name, file_name, content_type))
+            self._parts.append((file_stream, file_stream.tell(), size))
+            self._parts.append(b'\r\n')
+            self.file_size += size
+
+        self._parts.append(f'--{self.boundary}--\r\n'.encode())
+        self._length = sum(len(part) if isinstance(part, bytes) else part[2] for part in self._parts)
+
+    def _part_header(self, name: str, file_name: str = None, content_type: str = None) -> bytes:
+        disposition = f'form-data; name="{_quote_header_param(name)}"'
+        if file_name is not None:
+            disposition += f'; filename="{_quote_header_param(file_name)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        if content_type:
+            header += f'Content-Type: {content_type}\r\n'
+        return (header + '\r\n').encode()
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self._length
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._position = min(max(offset, 0), self._length)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+        size = min(size, self.chunk_size, self._length - self._position)
+        if size <= 0:
+            return b''
+
+        # Find the part the position is in, the number of parts is small
+        part_start = 0
+        for part in self._parts:
+            part_length = len(part) if isinstance(part, bytes) else part[2]
+            if self._position < part_start + part_length:
+                break
+            part_start += part_length
+        offset = self._position - part_start
+        size = min(size, part_length - offset)
+
+        if isinstance(part, bytes):
+            chunk = part[offset:offset + size]
+        else:
+            file_stream, file_start, _ = part
+            file_stream.seek(file_start + offset)
+            chunk = file_stream.read(size)
+            if len(chunk) != size:
+                raise IOError('The file was truncated while it was uploaded')
+            if self._progress_callback:
+                self._progress_callback(len(chunk))
+
+        self._position += len(chunk)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
@@ -0,0 +1,358 @@
+import collections
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import threading
+from io import BytesIO
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from intezer_analyze_cli import estimates
+from intezer_analyze_cli import failures
+from intezer_analyze_cli import hash_index
+from intezer_analyze_cli import progress
+from intezer_analyze_cli import results
+from intezer_analyze_cli import sharding
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+# The stages of a pipeline in order. Discover runs on the calling thread and report on a single thread of its own,
+# the stages between them run on their own workers and a pipeline leaves out the stages it doesn't need
+STAGE_NAMES = ('discover', 'filter', 'classify', 'hash', 'dedup', 'submit', 'poll', 'report')
+WORKER_STAGE_NAMES = STAGE_NAMES[1:-1]
+# The stages whose items wait on the service, they are counted as in flight in the progress
+IN_FLIGHT_STAGE_NAMES = ('submit', 'poll')
+
+# The result of an item the filter stage dropped, it isn't reported or counted in the progress
+DROPPED = 'dropped'
+
+# How often a thread that waits on a full or an empty queue checks whether the pipeline stopped
+_STOP_CHECK_INTERVAL = 0.1
+
+# Put on a queue after its last item, once for every worker of the next stage
+_END = object()
+
+
+def parse_stage_workers(value: str) -> Tuple[str, int]:
+    """
+    Parse the worker count of a stage, e.g. submit=8.
+
+    :raises ValueError: If the value is not a stage that has workers and a positive count
+    """
+    stage_name, _, workers = value.partition('=')
+    stage_name = stage_name.strip().lower()
+    if stage_name not in WORKER_STAGE_NAMES or not workers.strip().isdigit() or int(workers) < 1:
+        raise ValueError(f'{value} is not a stage and a worker count, e.g. submit=8, '
+                         f'the stages are {", ".join(WORKER_STAGE_NAMES)}')
+    return stage_name, int(workers)
+
+
+class _Stopped(Exception):
+    """The pipeline stopped, the thread should exit"""
+
+
+class PipelineItem:
+    """
+    A file that moves through the stages of a pipeline. A stage that finishes the item ends its way through the
+    stages and the item goes straight to the report stage.
+    """
+
+    def __init__(self, path: str, top: str):
+        """
+        :param path: The path of the file
+        :param top: The directory the file was discovered in, the shard of the file is picked by the path under it
+        """
+        self.path = path
+        self.top = top
+        # The content of the file, for stages that read it whole, e.g. emails or the members of archives
+        self.data: Optional[BytesIO] = None
+        # The SHA256 of the file, once the hash stage computed it
+        self.sha256: Optional[str] = None
+        # What the submit stage sent, e.g. the index the poll stage waits for
+        self.operation = None
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        # Recorded in the results of the run with the result
+        self.fields = {}
+        # Shown above the progress by the report stage, so the stages don't write over the progress line
+        self.message: Optional[str] = None
+        self._size: Optional[int] = None
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            try:
+                self._size = os.path.getsize(self.path)
+            except OSError:
+                self._size = 0
+        return self._size
+
+    @size.setter
+    def size(self, size: int):
+        self._size = size
+
+    def finish(self, result: str, error: BaseException = None, **fields):
+        self.result = result
+        self.error = error
+        self.fields.update(fields)
+
+
+class Stage(NamedTuple):
+    """
+    A stage of a pipeline, process is called on the workers of the stage with every item that reaches it.
+    It should finish the item when it fails, an error it raises stops the whole pipeline. It may return the items
+    that replace the item, e.g. the members of an archive, and they continue from the next stage instead of it.
+    """
+    name: str
+    process: Callable[[PipelineItem], Optional[Iterable[PipelineItem]]]
+    # Defaults to the worker count of the stage in the config
+    workers: Optional[int] = None
+
+    def get_workers(self) -> int:
+        return max(self.workers or default_config.pipeline_workers.get(self.name, 1), 1)
+
+
+class Pipeline:
+    """
+    Passes the items of a run through its stages, every stage on its own workers. The queues between the stages are
+    bounded, so a slow stage holds back the stages before it, down to the discovery, instead of the items piling up
+    in memory.
+    """
+
+    def __init__(self,
+                 stages: List[Stage],
+                 report: Callable[[PipelineItem], None],
+                 queue_size: int = None,
+                 progress_renderer: progress.ProgressRenderer = None):
+        """
+        :param stages: The stages between discover and report, in the order of WORKER_STAGE_NAMES
+        :param report: Called on a single thread with every item that went through the stages or was finished
+        :param queue_size: The number of items every queue holds, defaults to the queue size in the config
+        :param progress_renderer: Counts the items in the stages of IN_FLIGHT_STAGE_NAMES as in flight
+        """
+        stage_names = [stage.name for stage in stages]
+        unknown_stage_names = set(stage_names) - set(WORKER_STAGE_NAMES)
+        if unknown_stage_names:
+            raise ValueError(f'Unknown pipeline stages: {", ".join(sorted(unknown_stage_names))}')
+        if stage_names != sorted(set(stage_names), key=WORKER_STAGE_NAMES.index):
+            raise ValueError(f'The stages of a pipeline should be in the order {" -> ".join(STAGE_NAMES)}')
+
+        self.stages = stages
+        self.report = report
+        self._processes = [progress_renderer.track_in_flight(stage.process)
+                           if progress_renderer and stage.name in IN_FLIGHT_STAGE_NAMES else stage.process
+                           for stage in stages]
+        self.queue_size = queue_size or default_config.pipeline_queue_size
+        # The items that were discovered and were not reported yet, e.g. to record them as not done at the deadline
+        self.pending_paths: Dict[str, None] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def run(self, items: Iterable[PipelineItem]):
+        """
+        Discover the items on the calling thread and pass them through the stages, returns once all of them were
+        reported.
+
+        :param items: The discover stage, it may be a generator of unknown length
+        :raises: The first error that a stage, the report or the discovery raised, the pipeline stops on it
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        # The report is the last stage and has a single worker
+        workers_numbers = [stage.get_workers() for stage in self.stages] + [1]
+        running_workers = list(workers_numbers)
+        logger.info('Pipeline started', extra=dict(stages={stage.name: workers
+                                                           for stage, workers in zip(self.stages, workers_numbers)}))
+
+        # The threads run in the context of the caller, e.g. to count the results of a job of run-jobs
+        threads = [threading.Thread(target=contextvars.copy_context().run,
+                                    args=(self._work, stage_index, queues, workers_numbers, running_workers),
+                                    name=f'pipeline-{stage.name}-{worker_index}',
+                                    daemon=True)
+                   for stage_index, stage in enumerate(self.stages)
+                   for worker_index in range(workers_numbers[stage_index])]
+        report_thread = threading.Thread(target=contextvars.copy_context().run,
+                                         args=(self._report_items, queues[-1]),
+                                         name='pipeline-report',
+                                         daemon=True)
+        threads.append(report_thread)
+        for thread in threads:
+            thread.start()
+
+        try:
+            for item in items:
+                self.pending_paths[item.path] = None
+                self._put(queues[0], item)
+            for _ in range(workers_numbers[0]):
+                self._put(queues[0], _END)
+            while report_thread.is_alive():
+                report_thread.join(_STOP_CHECK_INTERVAL)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._stop(e)
+
+        for thread in threads:
+            thread.join()
+        if self._error:
+            raise self._error
+
+    def _work(self, stage_index: int, queues: List[queue.Queue], workers_numbers: List[int],
+              running_workers: List[int]):
+        process = self._processes[stage_index]
+        next_queue = queues[stage_index + 1]
+        try:
+            while True:
+                item = self._get(queues[stage_index])
+                if item is _END:
+                    break
+                replacing_items = process(item)
+                if replacing_items is None:
+                    self._put(queues[-1] if item.result else next_queue, item)
+                    continue
+                for replacing_item in replacing_items:
+                    self.pending_paths[replacing_item.path] = None
+                    self._put(queues[-1] if replacing_item.result else next_queue, replacing_item)
+                self.pending_paths.pop(item.path, None)
+
+            with self._lock:
+                running_workers[stage_index] -= 1
+                is_last_worker = not running_workers[stage_index]
+            # The next stage ends only after every worker of this stage passed on its items
+            if is_last_worker:
+                for _ in range(workers_numbers[stage_index + 1]):
+                    self._put(next_queue, _END)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._stop(e)
+
+    def _report_items(self, report_queue: queue.Queue):
+        try:
+            while True:
+                item = self._get(report_queue)
+                if item is _END:
+                    return
+                if item.result != DROPPED:
+                    self.report(item)
+                self.pending_paths.pop(item.path, None)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._stop(e)
+
+    def _stop(self, error: BaseException):
+        with self._lock:
+            if self._error is None:
+                logger.info('Pipeline stopped', extra=dict(error=repr(error)))
+                self._error = error
+        self._stopped.set()
+
+    def _put(self, item_queue: queue.Queue, item):
+        while not self._stopped.is_set():
+            try:
+                item_queue.put(item, timeout=_STOP_CHECK_INTERVAL)
+                return
+            except queue.Full:
+                pass
+        raise _Stopped()
+
+    def _get(self, item_queue: queue.Queue):
+        while not self._stopped.is_set():
+            try:
+                return item_queue.get(timeout=_STOP_CHECK_INTERVAL)
+            except queue.Empty:
+                pass
+        raise _Stopped()
+
+
+def discover(top: str,
+             walk_filter: walk_filters.WalkFilter = None,
+             ignore_directory_count_limit: bool = True,
+             progress_renderer: progress.ProgressRenderer = None) -> Iterator[PipelineItem]:
+    """
+    The discover stage: the files of the directory tree, with the walk filter applied.
+
+    :param ignore_directory_count_limit: Unless set, the user is asked whether to continue the first time a directory
+                                         with an unusual amount of files turns up, with the progress paused
+    """
+    should_check_directory_count = not ignore_directory_count_limit
+    for root, _, file_names in walk_filters.walk(top, walk_filter):
+        if should_check_directory_count and len(file_names) > default_config.unusual_amount_in_dir:
+            should_check_directory_count = False
+            with progress_renderer.paused() if progress_renderer else contextlib.nullcontext():
+                utilities.check_should_continue_for_large_dir(len(file_names), default_config.unusual_amount_in_dir)
+        for file_name in file_names:
+            yield PipelineItem(os.path.join(root, file_name), top)
+
+
+def shard_filter(progress_renderer: progress.ProgressRenderer, shard: Optional[sharding.Shard]) -> Stage:
+    """The filter stage: drops the files that are not in the shard, and counts the rest in the progress"""
+    def filter_item(item: PipelineItem):
+        if sharding.is_in_shard(sharding.get_path_key(item.path, item.top), shard):
+            progress_renderer.add_length(1)
+        else:
+            item.finish(DROPPED)
+
+    return Stage('filter', filter_item)
+
+
+class Report:
+    """
+    The report stage: records the result of every item in the results of the run, in the failures file and in the
+    progress, and counts the results for the summary of the command.
+    """
+
+    def __init__(self,
+                 command: str,
+                 progress_renderer: progress.ProgressRenderer,
+                 failures_writer: Optional[failures.FailuresWriter],
+                 cost_estimate: estimates.CostEstimate = None):
+        """
+        :param failures_writer: Where the failed items are written to be retried, None when they can't be retried
+        :param cost_estimate: In a dry run, the items that went through all the stages without a result are the
+                              items that would have been sent, and they are counted in it
+        """
+        self.command = command
+        self.progress_renderer = progress_renderer
+        self.failures_writer = failures_writer
+        self.cost_estimate = cost_estimate
+        self.results_counter = collections.Counter()
+
+    def __call__(self, item: PipelineItem):
+        if item.message:
+            self.progress_renderer.echo(item.message)
+        if self.cost_estimate and not item.result:
+            self.cost_estimate.add_submission(item.size)
+            self.progress_renderer.update(1, size=item.size)
+            return
+
+        self.results_counter[item.result] += 1
+        if item.result == 'failed':
+            results.record_result(self.command, item.path, item.result, error=str(item.error), **item.fields)
+            if self.failures_writer:
+                self.failures_writer.record(item.path, item.error)
+        else:
+            results.record_result(self.command, item.path, item.result, **item.fields)
+        self.progress_renderer.update(1, result=item.result, size=item.size if item.result == 'success' else 0)
+
+    @property
+    def hash_lists_results(self) -> collections.Counter:
+        return collections.Counter({result: self.results_counter[result]
+                                    for result in (hash_index.KNOWN_GOOD, hash_index.KNOWN_BAD)
+                                    if self.results_counter[result]})
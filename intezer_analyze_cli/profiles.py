@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import List
+from typing import Optional
+
+from intezer_sdk import errors as sdk_errors
+from intezer_sdk.api import IntezerApiClient
+
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+_global_balancer: Optional['ProfileBalancer'] = None
+
+
+class Profile:
+    def __init__(self, name: str, api: IntezerApiClient, weight: int = 1):
+        self.name = name
+        self.api = api
+        self.weight = max(weight, 1)
+        self.current_weight = 0
+        self.is_exhausted = False
+        self.suspended_until = 0.0
+
+
+class ProfileBalancer:
+    """
+    Spreads the work between the APIs of several profiles using smooth weighted round-robin.
+    A profile that runs out of quota is dropped from the rotation, a throttled profile is suspended until
+    the service allows it to send again.
+    """
+
+    def __init__(self, profiles: List[Profile]):
+        if not profiles:
+            raise ValueError('At least one profile is required')
+        self.profiles = profiles
+        self._lock = threading.Lock()
+
+    def next_api(self) -> IntezerApiClient:
+        """
+        Pick the API of the next profile in the rotation, waits if all the remaining profiles are throttled.
+
+        :raises: :data:`intezer_sdk.errors.IntezerError` when no profile is left in the rotation
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                remaining_profiles = [p for p in self.profiles if not p.is_exhausted]
+                if not remaining_profiles:
+                    raise sdk_errors.IntezerError('All the profiles are out of quota')
+
+                active_profiles = [p for p in remaining_profiles if p.suspended_until <= now]
+                if active_profiles:
+                    total_weight = sum(p.weight for p in active_profiles)
+                    for profile in active_profiles:
+                        profile.current_weight += profile.weight
+                    selected_profile = max(active_profiles, key=lambda p: p.current_weight)
+                    selected_profile.current_weight -= total_weight
+                    return selected_profile.api
+
+                wait_time = min(p.suspended_until for p in remaining_profiles) - now
+
+            logger.info('All profiles are throttled, waiting', extra=dict(wait_time=wait_time))
+            deadlines.sleep(wait_time)
+
+    def remove_from_rotation(self, api: IntezerApiClient, error: sdk_errors.IntezerError) -> bool:
+        """
+        Take the profile of the API out of the rotation because of the error.
+
+        :return: Whether there are profiles left to continue the work with
+        """
+        with self._lock:
+            for profile in self.profiles:
+                if profile.api is api:
+                    if isinstance(error, sdk_errors.AnalysisRateLimitError):
+                        cooldown = _get_retry_after(error) or default_config.profile_throttling_cooldown
+                        profile.suspended_until = time.monotonic() + cooldown
+                        logger.info('Profile is throttled', extra=dict(profile_name=profile.name, cooldown=cooldown))
+                    else:
+                        profile.is_exhausted = True
+                        logger.info('Profile removed from rotation', extra=dict(profile_name=profile.name,
+                                                                                error=str(error)))
+                    break
+
+            return any(not p.is_exhausted for p in self.profiles)
+
+
+def _get_retry_after(error: sdk_errors.AnalysisRateLimitError) -> Optional[float]:
+    try:
+        return float(error.retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+def set_global_balancer(balancer: Optional[ProfileBalancer]):
+    global _global_balancer
+    _global_balancer = balancer
+
+
+def next_api() -> Optional[IntezerApiClient]:
+    """The API to send the next operation with, None to use the global API"""
+    if not _global_balancer:
+        return None
+    return _global_balancer.next_api()
+
+
+def get_apis() -> List[IntezerApiClient]:
+    """The APIs of all the profiles of the run, empty when the run uses the global API alone"""
+    if not _global_balancer:
+        return []
+    return [profile.api for profile in _global_balancer.profiles]
+
+
+def remove_from_rotation(api: Optional[IntezerApiClient], error: sdk_errors.IntezerError) -> bool:
+    """
+    Take the profile of the API out of the rotation because of the error.
+
+    :return: Whether the operation can be retried with another profile
+    """
+    if not _global_balancer or api is None:
+        return False
+    return _global_balancer.remove_from_rotation(api, error)
@@ -0,0 +1,209 @@
+import contextlib
+import datetime
+import functools
+import logging
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import TextIO
+
+import click
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+FAILED_RESULTS = frozenset(['failed'])
+SKIPPED_RESULTS = frozenset(['unsupported', 'skipped', 'not_found', 'unchanged', 'duplicate', 'known_good',
+                             'known_bad'])
+
+
+def _format_duration(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+class ProgressRenderer:
+    """
+    A single progress display for a whole run, that may span several directories and phases.
+
+    Besides the position it shows the throughput, the ETA and the number of items in flight, retrying, failed
+    and skipped. The display is redrawn at most every redraw_interval seconds, no matter how fast items complete.
+    When the stream isn't a TTY, a progress line is written every log_interval seconds instead.
+    It's used like click.progressbar: update() after every item, and the length may grow while the items are
+    discovered.
+    """
+
+    def __init__(self,
+                 label: str,
+                 length: int = None,
+                 unit: str = 'files',
+                 stream: TextIO = None,
+                 redraw_interval: float = None,
+                 log_interval: float = None,
+                 is_tty: bool = None):
+        self.label = label
+        self.length = length
+        self.unit = unit
+        self._stream = stream or click.get_text_stream('stdout')
+        self._is_tty = self._stream.isatty() if is_tty is None else is_tty
+        self._render_interval = ((redraw_interval or default_config.progress_redraw_interval) if self._is_tty
+                                 else (log_interval or default_config.progress_log_interval))
+        self._lock = threading.Lock()
+        self.position = 0
+        self.size = 0
+        self.in_flight = 0
+        self.retrying = 0
+        self.failed = 0
+        self.skipped = 0
+        self._started_at = time.monotonic()
+        self._rendered_at = None
+        self._last_line_length = 0
+        self._paused = False
+        # The messages that were echoed while the display was paused
+        self._paused_messages = []
+
+    def __enter__(self) -> 'ProgressRenderer':
+        if not self._is_tty:
+            self._write_line(self.label)
+        self._rendered_at = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self.finish()
+
+    def start_phase(self, label: str, length: int = None):
+        """Continue with the next phase of the run on the same display, the failed and skipped counts are kept"""
+        with self._lock:
+            self.label = label
+            self.length = length
+            self.position = 0
+            self.size = 0
+            self._started_at = time.monotonic()
+            self._render(force=True)
+
+    def add_length(self, length: int):
+        """Grow the length when more items are discovered"""
+        with self._lock:
+            self.length = (self.length or 0) + length
+            self._render()
+
+    def set_retrying(self, retrying: int):
+        with self._lock:
+            self.retrying = retrying
+
+    def update(self, n_steps: int = 1, result: str = None, size: int = 0):
+        """
+        Count completed items.
+
+        :param result: The result of the items, counted as failed or skipped by FAILED_RESULTS and SKIPPED_RESULTS
+        :param size: The number of bytes the items processed, for the bytes throughput
+        """
+        with self._lock:
+            self.position += n_steps
+            self.size += size
+            if result in FAILED_RESULTS:
+                self.failed += n_steps
+            elif result in SKIPPED_RESULTS:
+                self.skipped += n_steps
+            self._render()
+
+    def track_in_flight(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a function that processes an item on a worker thread, to count the items in flight"""
+        @functools.wraps(func)
+        def tracked(*args, **kwargs):
+            with self._lock:
+                self.in_flight += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+        return tracked
+
+    @contextlib.contextmanager
+    def paused(self) -> Iterator[None]:
+        """Clear the display while something else is written to the terminal, e.g. a question, and redraw it after"""
+        with self._lock:
+            self._paused = True
+            self._clear_line()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._paused = False
+                for message in self._paused_messages:
+                    self._write_line(message)
+                self._paused_messages = []
+                self._render(force=True)
+
+    def echo(self, message: str):
+        """Write a message above the display, e.g. the result of an item, instead of over the progress line"""
+        with self._lock:
+            if self._paused:
+                self._paused_messages.append(message)
+                return
+            self._clear_line()
+            self._write_line(message)
+            if self._is_tty:
+                self._render(force=True)
+
+    def format_line(self) -> str:
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        rate = self.position / elapsed
+        position = f'{self.position}/{self.length}' if self.length is not None else str(self.position)
+        if self.length:
+            position += f' ({min(self.position * 100 // self.length, 100)}%)'
+
+        parts = [self.label, position, f'{rate:.1f} {self.unit}/s']
+        if self.size:
+            parts.append(f'{self.size / elapsed / (1024 * 1024):.1f} MB/s')
+        if self.length is not None and rate > 0:
+            parts.append(f'ETA {_format_duration(max(self.length - self.position, 0) / rate)}')
+        parts.extend([f'in-flight {self.in_flight}',
+                      f'retrying {self.retrying}',
+                      f'failed {self.failed}',
+                      f'skipped {self.skipped}'])
+        return '  '.join(parts)
+
+    def _render(self, force: bool = False):
+        now = time.monotonic()
+        if self._paused or self._rendered_at is None or (not force and now - self._rendered_at < self._render_interval):
+            return
+        self._rendered_at = now
+        line = self.format_line()
+        if self._is_tty:
+            self._stream.write('\r' + line.ljust(self._last_line_length))
+            self._stream.flush()
+            self._last_line_length = len(line)
+        else:
+            self._write_line(line)
+            logger.info('Progress', extra=dict(label=self.label,
+                                               position=self.position,
+                                               length=self.length,
+                                               failed=self.failed,
+                                               skipped=self.skipped))
+
+    def _clear_line(self):
+        if self._is_tty and self._last_line_length:
+            self._stream.write('\r' + ' ' * self._last_line_length + '\r')
+            self._stream.flush()
+            self._last_line_length = 0
+
+    def _write_line(self, line: str):
+        self._stream.write(line + '\n')
+        self._stream.flush()
+
+    def finish(self):
+        """Draw the final state, the display isn't updated anymore"""
+        with self._lock:
+            if self._rendered_at is None:
+                return
+            if self._is_tty:
+                self._render(force=True)
+                self._stream.write('\n')
+                self._stream.flush()
+            self._rendered_at = None
+
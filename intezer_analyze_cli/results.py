@@ -0,0 +1,88 @@
+import collections
+import contextvars
+import datetime
+import json
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger('intezer_cli')
+
+_results_writer: contextvars.ContextVar[Optional['ResultsWriter']] = contextvars.ContextVar('results_writer',
+                                                                                          default=None)
+_results_counter: contextvars.ContextVar[Optional['ResultsCounter']] = contextvars.ContextVar('results_counter',
+                                                                                             default=None)
+
+
+class ResultsWriter:
+    """
+    Append the result of every item to a JSON lines file, one line per item, so the result files of several
+    runs can be merged by concatenating them. The results recorded while it's entered are written to it, it's
+    closed on exit.
+    """
+
+    def __init__(self, results_path: str, **run_fields):
+        self.results_path = results_path
+        self._run_fields = run_fields
+        self._lock = threading.Lock()
+        self._results_file = open(results_path, 'a', encoding='utf-8')
+        self._token = None
+
+    def __enter__(self) -> 'ResultsWriter':
+        self._token = _results_writer.set(self)
+        return self
+
+    def __exit__(self, *args):
+        _results_writer.reset(self._token)
+        self.close()
+
+    def record(self, command: str, item: str, status: str, **fields):
+        result = dict(time=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                      command=command,
+                      item=item,
+                      status=status,
+                      **self._run_fields,
+                      **fields)
+        with self._lock:
+            self._results_file.write(json.dumps(result, default=str) + '\n')
+            self._results_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._results_file.close()
+
+
+class ResultsCounter:
+    """
+    Counts the statuses of the results recorded while it's entered, by the calling thread and by the threads it
+    starts with its context, e.g. the results of the items of a single job of run-jobs.
+    """
+
+    def __init__(self):
+        self.counter = collections.Counter()
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __enter__(self) -> 'ResultsCounter':
+        self._token = _results_counter.set(self)
+        return self
+
+    def __exit__(self, *args):
+        _results_counter.reset(self._token)
+
+    def add(self, status: str):
+        with self._lock:
+            self.counter[status] += 1
+
+
+def record_result(command: str, item: str, status: str, **fields):
+    """Record the result of an item when the run writes a results file"""
+    results_counter = _results_counter.get()
+    if results_counter:
+        results_counter.add(status)
+    results_writer = _results_writer.get()
+    if results_writer:
+        try:
+            results_writer.record(command, item, status, **fields)
+        except (OSError, ValueError):
+            logger.exception('Failed to record result', extra=dict(command=command, item=item))
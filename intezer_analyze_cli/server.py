@@ -0,0 +1,344 @@
+import collections
+import errno
+import hmac
+import http.server
+import json
+import logging
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http import HTTPStatus
+from typing import Optional
+from typing import Tuple
+
+from intezer_sdk import api
+from intezer_sdk import errors as sdk_errors
+
+from intezer_analyze_cli import commands
+from intezer_analyze_cli import key_store
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+
+class _RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class SubmissionHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handles the submissions of the local clients:
+
+    POST /analyze  {"path": "/file/to/analyze"} or {"hash": "<sha256>"}, returns {"analysis_id": "..."}
+    GET  /health   Returns the state of the server
+    """
+    protocol_version = 'HTTP/1.1'
+    server: 'SubmissionServerMixin'
+
+    def do_GET(self):
+        try:
+            self.server.check_request(self.headers)
+        except _RequestError as e:
+            self._send_json(e.status, dict(error=str(e)), e.headers)
+            return
+        if self.path.rstrip('/') != '/health':
+            self._send_json(HTTPStatus.NOT_FOUND, dict(error='Not found'))
+            return
+        self._send_json(HTTPStatus.OK, self.server.get_health())
+
+    def do_POST(self):
+        try:
+            self.server.check_request(self.headers)
+        except _RequestError as e:
+            # The body of a request that isn't trusted is not read
+            self.close_connection = True
+            self._send_json(e.status, dict(error=str(e)), e.headers)
+            return
+        if self.path.rstrip('/') != '/analyze':
+            self._discard_body()
+            self._send_json(HTTPStatus.NOT_FOUND, dict(error='Not found'))
+            return
+
+        try:
+            if self.headers.get_content_type() != 'application/json':
+                self.close_connection = True
+                raise _RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, 'Content-Type should be application/json')
+            submission = self._read_json_body()
+            analysis_id = self.server.submit(submission)
+            self._send_json(HTTPStatus.OK, dict(analysis_id=analysis_id))
+        except _RequestError as e:
+            self._send_json(e.status, dict(error=str(e)), e.headers)
+
+    def log_message(self, format_: str, *args):
+        logger.debug(format_ % args, extra=dict(client=self.client_address[0]))
+
+    def _discard_body(self):
+        content_length = self._get_content_length()
+        if content_length <= default_config.server_max_request_size:
+            self.rfile.read(content_length)
+        else:
+            self.close_connection = True
+
+    def _get_content_length(self) -> int:
+        try:
+            return int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return 0
+
+    def _read_json_body(self) -> dict:
+        content_length = self._get_content_length()
+        if content_length > default_config.server_max_request_size:
+            self.close_connection = True
+            raise _RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request is too large')
+        try:
+            submission = json.loads(self.rfile.read(content_length) or b'{}')
+        except ValueError:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, 'Request body should be a JSON object')
+        if not isinstance(submission, dict):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, 'Request body should be a JSON object')
+        return submission
+
+    def _send_json(self, status: HTTPStatus, content: dict, headers: dict = None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SubmissionServerMixin:
+    """
+    Sends the submissions with the warm global API. At most max_in_flight submissions are sent at the same time,
+    a submission that arrives when all of them are taken is rejected with 503 and Retry-After, so the clients
+    slow down instead of piling up connections.
+    """
+    daemon_threads = True
+
+    def init_submissions(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._in_flight_semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = collections.Counter()
+        self._started_at = time.monotonic()
+
+    def check_request(self, headers):
+        """
+        Check that the request comes from a client that may submit with the API key of the server.
+
+        :raises _RequestError: If the request should be rejected
+        """
+
+    def get_health(self) -> dict:
+        with self._stats_lock:
+            return dict(status='ok',
+                        uptime=round(time.monotonic() - self._started_at, 3),
+                        in_flight=self._in_flight,
+                        max_in_flight=self.max_in_flight,
+                        submitted=self._stats['submitted'],
+                        failed=self._stats['failed'],
+                        rejected=self._stats['rejected'])
+
+    def submit(self, submission: dict) -> str:
+        file_path = submission.get('path')
+        file_hash = submission.get('hash')
+        if bool(file_path) == bool(file_hash):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, 'Either "path" or "hash" is required')
+        if file_path and not os.path.isfile(file_path):
+            raise _RequestError(HTTPStatus.NOT_FOUND, f'File {file_path} does not exist')
+        if file_path and submission.get('no_unpacking') and not utilities.is_supported_file(file_path):
+            raise _RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, 'File is not PE, ELF, DEX or APK')
+
+        if not self._in_flight_semaphore.acquire(blocking=False):
+            self._count('rejected')
+            raise _RequestError(HTTPStatus.SERVICE_UNAVAILABLE,
+                                'Server is busy, retry later',
+                                {'Retry-After': default_config.server_busy_retry_after})
+
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            if file_path:
+                analysis_id = commands.send_file_for_analysis(
+                    file_path,
+                    disable_dynamic_unpacking=submission.get('no_unpacking') or None,
+                    disable_static_unpacking=submission.get('no_static_extraction') or None,
+                    code_item_type=submission.get('code_item_type'))
+            else:
+                analysis_id = commands.send_hash_for_analysis(file_hash)
+            self._count('submitted')
+            return analysis_id
+        except sdk_errors.HashDoesNotExistError:
+            self._count('failed')
+            raise _RequestError(HTTPStatus.NOT_FOUND, f'Hash {file_hash} was not found')
+        except (sdk_errors.InsufficientQuota, sdk_errors.AnalysisRateLimitError) as e:
+            self._count('failed')
+            raise _RequestError(HTTPStatus.TOO_MANY_REQUESTS,
+                                str(e),
+                                {'Retry-After': default_config.profile_throttling_cooldown})
+        except sdk_errors.IntezerError as e:
+            self._count('failed')
+            logger.info('Submission failed', extra=dict(submission=submission, error=str(e)))
+            raise _RequestError(HTTPStatus.BAD_GATEWAY, f'Analyze error: {e}')
+        except Exception:
+            self._count('failed')
+            logger.exception('Unexpected error occurred', extra=dict(submission=submission))
+            raise _RequestError(HTTPStatus.INTERNAL_SERVER_ERROR, 'Unexpected error occurred')
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._in_flight_semaphore.release()
+
+    def _count(self, stat_name: str):
+        with self._stats_lock:
+            self._stats[stat_name] += 1
+
+
+class LoopbackSubmissionServer(SubmissionServerMixin, socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Serves on the loopback interface, which every local user can reach, and so can the web pages the user browses,
+    with a simple POST or DNS rebinding. Every request should carry the token of the run, that is written to a file
+    only the user that runs the server can read, and the Host of the server.
+    """
+
+    def __init__(self, port: int, max_in_flight: int, token_path: str = None):
+        self.init_submissions(max_in_flight)
+        super().__init__(('127.0.0.1', port), SubmissionHandler)
+        self.token = secrets.token_urlsafe(32)
+        self.token_path = token_path or key_store.get_key_file_path(
+            default_config.server_token_file_name_template.format(port=self.server_address[1]))
+        _write_token_file(self.token_path, self.token)
+
+    @property
+    def address(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def check_request(self, headers):
+        port = self.server_address[1]
+        if headers.get('Host') not in (f'127.0.0.1:{port}', f'localhost:{port}'):
+            raise _RequestError(HTTPStatus.FORBIDDEN, 'Unexpected Host')
+        if not hmac.compare_digest(headers.get('Authorization', '').encode(), f'Bearer {self.token}'.encode()):
+            raise _RequestError(HTTPStatus.UNAUTHORIZED, f'The token of the server is required, it is in '
+                                                         f'{self.token_path}')
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.token_path)
+        except FileNotFoundError:
+            pass
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixSubmissionServer(SubmissionServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        def __init__(self, socket_path: str, max_in_flight: int):
+            self.init_submissions(max_in_flight)
+            _remove_stale_socket(socket_path)
+            # Only the user that runs the server can submit with its API key, the socket is created that way so
+            # there's no moment it's open to others
+            previous_umask = os.umask(0o177)
+            try:
+                super().__init__(socket_path, SubmissionHandler)
+            finally:
+                os.umask(previous_umask)
+
+        @property
+        def address(self) -> str:
+            return f'unix:{self.server_address}'
+
+        def get_request(self) -> Tuple[object, Tuple[str, int]]:
+            request, _ = super().get_request()
+            return request, ('local', 0)
+
+        def server_close(self):
+            super().server_close()
+            try:
+                os.remove(self.server_address)
+            except FileNotFoundError:
+                pass
+else:
+    UnixSubmissionServer = None
+
+
+def _remove_stale_socket(socket_path: str):
+    """
+    Remove the socket that a server which is not running anymore left behind.
+
+    :raises OSError: If a server still listens on the socket
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+        except FileNotFoundError:
+            return
+    raise OSError(errno.EADDRINUSE, f'A server already listens on {socket_path}')
+
+
+def _write_token_file(token_path: str, token: str):
+    """Write the token to a new file that only the user can read"""
+    os.makedirs(os.path.dirname(os.path.abspath(token_path)), mode=0o700, exist_ok=True)
+    try:
+        os.remove(token_path)
+    except FileNotFoundError:
+        pass
+    token_fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(token_fd, 'w') as token_file:
+        token_file.write(token)
+
+
+def create_server(socket_path: Optional[str],
+                  port: Optional[int],
+                  max_in_flight: int = None,
+                  token_path: str = None) -> SubmissionServerMixin:
+    """
+    Create the submission server on a Unix socket, or on the loopback interface when no socket is given.
+
+    :param token_path: The file the token of a loopback server is written to, defaults to a file in the key directory
+    :raises ValueError: If Unix sockets are not supported on this platform
+    """
+    max_in_flight = max_in_flight or default_config.server_max_in_flight
+    if socket_path:
+        if not UnixSubmissionServer:
+            raise ValueError('Unix sockets are not supported on this platform, use --port instead')
+        return UnixSubmissionServer(socket_path, max_in_flight)
+    return LoopbackSubmissionServer(default_config.server_default_port if port is None else port,
+                                    max_in_flight,
+                                    token_path)
+
+
+def serve_command(server: SubmissionServerMixin):
+    """Keep the session warm and serve the submissions until the server is shut down"""
+    # Authenticate before accepting submissions, so the first one doesn't pay for it
+    api.get_global_api().authenticate()
+    logger.info('Server started', extra=dict(address=server.address, max_in_flight=server.max_in_flight))
+    if threading.current_thread() is threading.main_thread():
+        # shutdown() waits for serve_forever() to return, so it can't be called on the serving thread
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info('Server stopped', extra=server.get_health())
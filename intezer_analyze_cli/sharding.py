@@ -0,0 +1,48 @@
+import hashlib
+import os
+from typing import NamedTuple
+from typing import Optional
+
+
+class Shard(NamedTuple):
+    """One of count disjoint parts of the work, index is 1 based"""
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> 'Shard':
+        """
+        Parse a shard in the I/N format.
+
+        :raises ValueError: If the value is not a valid shard
+        """
+        try:
+            index, count = (int(part) for part in value.split('/'))
+        except ValueError:
+            raise ValueError(f'{value} is not in the I/N format')
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f'{value} should satisfy 1 <= I <= N')
+        return cls(index, count)
+
+    def contains(self, key: str) -> bool:
+        # A stable hash, unlike hash() which is salted differently in every process
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.count == self.index - 1
+
+    def __str__(self) -> str:
+        return f'{self.index}/{self.count}'
+
+
+def is_in_shard(key: str, shard: Optional[Shard]) -> bool:
+    """Whether the item with this key belongs to the shard, always True when the run isn't sharded"""
+    return not shard or shard.contains(key)
+
+
+def get_hash_key(file_hash: str) -> str:
+    """The key of a hash, the same no matter how the hash is cased or padded in the list"""
+    return file_hash.strip().lower()
+
+
+def get_path_key(path: str, root_path: str) -> str:
+    """The key of a path under the root, the same on every host no matter where the root is mounted"""
+    return os.path.relpath(path, root_path).replace(os.sep, '/')
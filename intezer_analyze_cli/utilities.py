@@ -1,15 +1,37 @@
+import atexit
+import collections
+import concurrent.futures
+import contextvars
+import copy
 import csv
 import email
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 import zipfile
 from email import parser
+from typing import Any
 from typing import BinaryIO
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
 from typing import Tuple
 from typing import Union
 
 import click
 
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli.config import default_config
+
 log_file_path = ''
 
 
@@ -54,51 +76,184 @@ class ExtraFormatter(logging.Formatter):
         return super(ExtraFormatter, self).format(record)
 
 
-def init_log(logger_name, debug_mode=False):
+class JsonFormatter(logging.Formatter):
+    """Formats every record as a single JSON line, including the extra fields"""
+
+    def format(self, record):
+        entry = dict(time=self.formatTime(record, self.datefmt),
+                     level=record.levelname,
+                     module=record.module,
+                     line=record.lineno,
+                     message=record.getMessage())
+        entry.update(get_log_record_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=repr)
+
+
+class DuplicateTracebackFilter(logging.Filter):
+    """
+    Logs the traceback of a repeated exception at most once per interval. The repeating records are still logged,
+    but without the traceback, and the next traceback logged reports how many were suppressed.
+    """
+
+    max_tracked_tracebacks = 1000
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self._interval = interval
+        self._last_logged = {}
+        self._suppressed = collections.Counter()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not record.exc_info or not record.exc_info[0]:
+            return True
+
+        exc_type, _, traceback = record.exc_info
+        while traceback and traceback.tb_next:
+            traceback = traceback.tb_next
+        raised_at = (traceback.tb_frame.f_code.co_filename, traceback.tb_lineno) if traceback else None
+        key = (exc_type, raised_at, record.pathname, record.lineno)
+
+        now = time.monotonic()
+        with self._lock:
+            last_logged = self._last_logged.get(key)
+            if last_logged is None or now - last_logged >= self._interval:
+                if len(self._last_logged) >= self.max_tracked_tracebacks:
+                    self._last_logged.clear()
+                self._last_logged[key] = now
+                suppressed = self._suppressed.pop(key, 0)
+                if suppressed:
+                    record.suppressed_tracebacks = suppressed
+                return True
+
+            self._suppressed[key] += 1
+
+        record.exc_info = None
+        record.exc_text = None
+        record.traceback_suppressed = True
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands a copy of the records to the listener thread, and the listener handlers do the formatting. Like
+    QueueHandler.prepare, the message is merged with its args and the traceback is rendered to text, so no live
+    objects of the logging thread cross to the listener thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_QueueHandler] = None
+_is_stop_log_registered = False
+
+
+def init_log(logger_name, debug_mode=False, json_format=False):
+    """
+    Configure the CLI and SDK loggers. Records are queued by the logging thread and formatted and written
+    by a background listener thread to a size rotated log file.
+    :param logger_name: The CLI logger name
+    :param debug_mode: Also log to stderr and log the SDK debug records
+    :param json_format: Write the log file as JSON lines
+    """
     global log_file_path
+    global _log_listener
+    global _queue_handler
+    global _is_stop_log_registered
     cli_logger = logging.getLogger(logger_name)
     cli_logger.setLevel(logging.DEBUG)
+    handlers = []
 
     # file
     try:
         current_directory = os.getcwd()
         log_file_path = os.path.join(current_directory, 'intezer-analyze-cli.log')
-        handler = logging.FileHandler(log_file_path)
-        formatter = ExtraFormatter('%(asctime)s %(levelname)-8s %(module)s line: %(lineno)d: %(message)s. %(extra)s')
-
+        handler = logging.handlers.RotatingFileHandler(log_file_path,
+                                                       maxBytes=default_config.log_max_bytes,
+                                                       backupCount=default_config.log_backup_count)
+        if json_format:
+            formatter = JsonFormatter()
+        else:
+            formatter = ExtraFormatter(
+                '%(asctime)s %(levelname)-8s %(module)s line: %(lineno)d: %(message)s. %(extra)s')
+        is_file_handler = True
     except Exception:
         print('Failed to create logs directory, prints all logs to the screen')
         handler = logging.StreamHandler()
         formatter = ExtraFormatter('%(levelname)s %(message)s. %(extra)s', '%H:%M:%S')
+        is_file_handler = False
 
     handler.setFormatter(formatter)
     handler.setLevel(logging.DEBUG)
-    cli_logger.addHandler(handler)
+    handlers.append(handler)
     sdk_logger = logging.getLogger('intezer_sdk')
     sdk_logger.setLevel(logging.INFO)
-    sdk_logger.addHandler(handler)
 
     # stderr
-    if debug_mode and handler is not logging.StreamHandler:
+    if debug_mode and is_file_handler:
         console_formatter = ExtraFormatter('%(levelname)s %(message)s. %(extra)s', '%H:%M:%S')
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(console_formatter)
         console_handler.setLevel(logging.DEBUG)
-        cli_logger.addHandler(console_handler)
-        sdk_logger.addHandler(console_handler)
+        handlers.append(console_handler)
         sdk_logger.setLevel(logging.DEBUG)
 
+    # The handler of a previous init is removed before its listener stops, so no record is queued without a reader
+    if _queue_handler:
+        cli_logger.removeHandler(_queue_handler)
+        sdk_logger.removeHandler(_queue_handler)
+    if _log_listener:
+        _log_listener.stop()
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(DuplicateTracebackFilter(default_config.log_duplicate_traceback_interval))
+    cli_logger.addHandler(_queue_handler)
+    sdk_logger.addHandler(_queue_handler)
+
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    if not _is_stop_log_registered:
+        atexit.register(stop_log)
+        _is_stop_log_registered = True
+
+
+def stop_log():
+    """Flush the queued log records and stop the listener thread"""
+    global _log_listener
+    if _log_listener:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def is_supported_header(byte: bytes) -> bool:
+    """Whether the first 6 bytes of a file are of a supported file type"""
+    return (byte[:2] == b'MZ' or  # PE
+            byte[:4] == b'\x7fELF' or  # ELF
+            byte[:4] == b'dex\x0a' or  # Dex
+            byte[:4] == b'\x50\x4b\x03\x04' or  # Zip
+            byte[:3] == b'\x1f\x8b\x08' or  # Zip
+            byte[:6] == b'\x37\x7a\xbc\xaf\x27\x1c')  # 7-Zip
+
 
 def is_supported_file(file_path):
     try:
         with open(file_path, 'rb') as f:
-            byte = f.read(6)
-            is_supported = (byte[:2] == b'MZ' or  # PE
-                            byte[:4] == b'\x7fELF' or  # ELF
-                            byte[:4] == b'dex\x0a' or  # Dex
-                            byte[:4] == b'\x50\x4b\x03\x04' or  # Zip
-                            byte[:3] == b'\x1f\x8b\x08' or  # Zip
-                            byte[:6] == b'\x37\x7a\xbc\xaf\x27\x1c')  # 7-Zip
+            is_supported = is_supported_header(f.read(6))
     except IOError:
         logging.info('No read permissions for file', extra=dict(file_path=file_path))
         return False
@@ -109,6 +264,14 @@ def is_supported_file(file_path):
     return is_supported
 
 
+def get_file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
 def is_eml_file(stream: BinaryIO) -> Tuple[bool, Union[str, None]]:
     mail_parser = email.parser.BytesParser()
     received_headers = ['To', 'Received']
@@ -186,5 +349,151 @@ def is_hidden(path):
         return os.path.basename(path).startswith('.')
 
 
+class RetryQueue:
+    """
+    A delay queue of items waiting to be retried. Items are retried every retry_interval seconds until the
+    deadline, items that can't be retried before the deadline are moved to `expired`.
+    """
+
+    def __init__(self, retry_interval: float, deadline: float):
+        """
+        :param retry_interval: Seconds to wait before retrying an item
+        :param deadline: Seconds from now after which items are no longer retried
+        """
+        self.retry_interval = retry_interval
+        self.expired: List[Any] = []
+        self._deadline = time.monotonic() + deadline
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def schedule(self, item: Any) -> bool:
+        """
+        Schedule the item for a retry.
+        :return: False if the retry would pass the deadline and the item was expired instead
+        """
+        due_time = time.monotonic() + self.retry_interval
+        with self._lock:
+            if due_time > self._deadline:
+                self.expired.append(item)
+                return False
+            heapq.heappush(self._heap, (due_time, next(self._counter), item))
+            return True
+
+    def pop_due(self, limit: int = None) -> List[Any]:
+        """Pop up to limit items that are due for a retry."""
+        now = time.monotonic()
+        due_items = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due_items) < limit):
+                due_items.append(heapq.heappop(self._heap)[2])
+        return due_items
+
+    def seconds_until_next(self) -> Optional[float]:
+        """Seconds until the next item is due, None if the queue is empty."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(self._heap[0][0] - time.monotonic(), 0)
+
+
+def read_stream_items(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Yield the newline or NUL separated items of a stream as soon as they arrive, without waiting for the
+    stream to end. The first separator in the stream determines which one is used for the whole stream, so
+    both `find` and `find -print0` can be piped. Empty items are skipped.
+    """
+    read_chunk = getattr(stream, 'read1', stream.read)
+    separator = None
+    remainder = b''
+    while True:
+        chunk = read_chunk(chunk_size)
+        if not chunk:
+            break
+        remainder += chunk
+        if separator is None:
+            separators_positions = [position for position in (remainder.find(b'\0'), remainder.find(b'\n'))
+                                    if position != -1]
+            if not separators_positions:
+                continue
+            separator = remainder[min(separators_positions):min(separators_positions) + 1]
+
+        *items, remainder = remainder.split(separator)
+        for item in items:
+            item = _decode_stream_item(item, separator)
+            if item:
+                yield item
+
+    item = _decode_stream_item(remainder, separator)
+    if item:
+        yield item
+
+
+def _decode_stream_item(item: bytes, separator: Optional[bytes]) -> str:
+    if separator != b'\0':
+        item = item.strip()
+    return os.fsdecode(item)
+
+
+def imap_unordered_bounded(func: Callable[[Any], Any],
+                           items: Iterable[Any],
+                           max_workers: int,
+                           max_pending: Optional[int] = None,
+                           retry_queue: Optional[RetryQueue] = None) -> Iterator[Any]:
+    """
+    Apply func to every item using a pool of threads, yielding the results as they complete.
+    Items are pulled lazily, so no more than max_pending items are held in memory at once, and results are
+    yielded on the calling thread so the caller can aggregate them without locking.
+    :param func: The function to apply, it should handle its own errors. It runs in the context of the caller.
+    :param items: An iterable of items, it may be a generator of unknown length
+    :param max_workers: The number of worker threads
+    :param max_pending: The maximal number of submitted items that were not yielded yet, defaults to twice max_workers
+    :param retry_queue: Items the caller schedules on this queue are submitted again once they are due, ahead
+                        of new items. The iteration ends only after the queue is drained.
+    """
+    max_workers = max(max_workers, 1)
+    max_pending = max_pending or max_workers * 2
+    items = iter(items)
+    items_exhausted = False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        try:
+            while True:
+                if retry_queue is not None:
+                    for item in retry_queue.pop_due(limit=max_pending - len(pending)):
+                        pending.add(executor.submit(contextvars.copy_context().run, func, item))
+
+                while not items_exhausted and len(pending) < max_pending:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        items_exhausted = True
+                        break
+                    pending.add(executor.submit(contextvars.copy_context().run, func, item))
+
+                next_retry_in = retry_queue.seconds_until_next() if retry_queue is not None else None
+                if not pending:
+                    if next_retry_in is None:
+                        return
+                    deadlines.sleep(next_retry_in)
+                    continue
+
+                done, pending = concurrent.futures.wait(pending,
+                                                        timeout=next_retry_in,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        except BaseException:
+            # Don't start the items that are still queued, e.g. when the deadline of the run passed
+            for future in pending:
+                future.cancel()
+            raise
+
+
 if __name__ == '__main__':
     is_supported_file('/home/david/Downloads/lsass_pe.7z')
@@ -0,0 +1,147 @@
+import fnmatch
+import logging
+import os
+import re
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import utilities
+
+logger = logging.getLogger('intezer_cli')
+
+_SIZE_PATTERN = re.compile(r'^\s*(\d+)\s*([KMGT]?)B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a size in bytes, with an optional K, M, G or T suffix, e.g. 512K or 2G.
+
+    :raises ValueError: If the value is not a valid size
+    """
+    match = _SIZE_PATTERN.match(value)
+    if not match:
+        raise ValueError(f'{value} is not a size, e.g. 4096, 512K or 2G')
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+def _to_glob(pattern: str) -> str:
+    # A bare extension, such as .exe, matches the files with this extension
+    if pattern.startswith('.') and not any(char in pattern for char in '*?[/'):
+        return f'*{pattern}'
+    return pattern
+
+
+class WalkFilter(NamedTuple):
+    """
+    Filters that are evaluated while a directory is walked, from the metadata of its entries only, so the files
+    that are filtered out are never opened and the directories that are pruned are never listed.
+
+    Patterns are globs matched against the name of the entry and its path relative to the walked directory.
+    """
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = ()
+    prune: Tuple[str, ...] = ()
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+
+    @staticmethod
+    def _matches(patterns: Tuple[str, ...], name: str, relative_path: str) -> bool:
+        return any(fnmatch.fnmatch(name, _to_glob(pattern)) or fnmatch.fnmatch(relative_path, _to_glob(pattern))
+                   for pattern in patterns)
+
+    def should_prune(self, entry: os.DirEntry, relative_path: str) -> bool:
+        return self._matches(self.prune, entry.name, relative_path)
+
+    def accepts_name(self, name: str, relative_path: str) -> bool:
+        """Whether the include and exclude patterns accept the entry, without its size"""
+        if self.include and not self._matches(self.include, name, relative_path):
+            return False
+        return not self._matches(self.exclude, name, relative_path)
+
+    def accepts_size(self, size: int) -> bool:
+        return ((self.min_size is None or size >= self.min_size) and
+                (self.max_size is None or size <= self.max_size))
+
+    def accepts(self, entry: os.DirEntry, relative_path: str) -> bool:
+        if not self.accepts_name(entry.name, relative_path):
+            return False
+        if self.min_size is None and self.max_size is None:
+            return True
+
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            return False
+        return self.accepts_size(size)
+
+    def should_prune_path(self, directory_path: str, top: str) -> bool:
+        """Like should_prune, for a directory that is known by its path only, e.g. from a directory event"""
+        return self._matches(self.prune, os.path.basename(directory_path), get_relative_path(directory_path, top))
+
+    def accepts_path(self, file_path: str, top: str) -> bool:
+        """Like accepts, for a file that is known by its path only, e.g. from a directory event"""
+        if not self.accepts_name(os.path.basename(file_path), get_relative_path(file_path, top)):
+            return False
+        if self.min_size is None and self.max_size is None:
+            return True
+
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return False
+        return self.accepts_size(size)
+
+
+def get_relative_path(path: str, top: str) -> str:
+    """The path under the walked directory that the patterns are matched against"""
+    return os.path.relpath(path, top).replace(os.sep, '/')
+
+
+def walk(top: str, walk_filter: WalkFilter = None) -> Iterator[Tuple[str, List[str], List[str]]]:
+    """
+    Walk a directory tree top down like os.walk, without hidden entries and with the walk filter applied.
+    The yielded directory names may be removed in place to skip their subtrees.
+
+    :param walk_filter: The filter to apply, by default every file and directory is walked
+    """
+    walk_filter = walk_filter or WalkFilter()
+    directories = [top]
+    while directories:
+        deadlines.check()
+        root = directories.pop()
+        try:
+            with os.scandir(root) as scanner:
+                entries = list(scanner)
+        except OSError:
+            logger.warning('Failed to list directory', extra=dict(path=root), exc_info=True)
+            continue
+
+        dir_names = []
+        file_names = []
+        symlink_dir_names = set()
+        for entry in entries:
+            if utilities.is_hidden(entry.path):
+                continue
+            relative_path = get_relative_path(entry.path, top)
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if not walk_filter.should_prune(entry, relative_path):
+                    dir_names.append(entry.name)
+                    if entry.is_symlink():
+                        symlink_dir_names.add(entry.name)
+            elif walk_filter.accepts(entry, relative_path):
+                file_names.append(entry.name)
+
+        yield root, dir_names, file_names
+        # Like os.walk, symbolic links to directories are listed but not followed
+        directories.extend(os.path.join(root, dir_name)
+                           for dir_name in reversed(dir_names) if dir_name not in symlink_dir_names)
+
@@ -0,0 +1,294 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+# inotify(7) event masks
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_MOVED_FROM | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR
+_EVENT_HEADER = struct.Struct('iIII')
+
+# How often the thread that reads the inotify events checks whether watching stopped
+_READ_STOP_CHECK_INTERVAL = 0.5
+
+FileSignature = Tuple[int, int]
+
+
+def _get_signature(file_path: str) -> Optional[FileSignature]:
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+
+class _Inotify:
+    """A minimal inotify binding, only available on Linux"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watched_directories: Dict[int, str] = {}
+
+    def add_watch(self, directory_path: str):
+        watch_descriptor = self._add_watch(self.fd, os.fsencode(directory_path), _WATCH_MASK)
+        if watch_descriptor < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory_path}')
+        self.watched_directories[watch_descriptor] = directory_path
+
+    def read_events(self, timeout: Optional[float]) -> Iterator[Tuple[str, int]]:
+        """Yield the (path, mask) of the events that arrive within the timeout"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, _, name_length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & _IN_IGNORED:
+                self.watched_directories.pop(watch_descriptor, None)
+                continue
+            directory_path = self.watched_directories.get(watch_descriptor, '')
+            yield os.path.join(directory_path, os.fsdecode(name)) if name else directory_path, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Watch a directory tree for new files, and yield them once they are completely written.
+
+    On Linux inotify reports a file as soon as its writer closes it or it's moved into the directory, and a file
+    that is created without being closed after a write, e.g. a hard link, is sent once it settles. The events are
+    read on a thread of their own, so the kernel queue doesn't overflow while a batch is sent. Elsewhere, or when
+    inotify is unavailable, the tree is polled and a file is considered written once its size and modification time
+    didn't change for settle_time seconds. Files that exist when watching starts are ignored.
+
+    The walk filter applies like in a walk of the directory: pruned directories aren't watched, and a file is
+    yielded only if the filter accepts it once it's written.
+    """
+
+    def __init__(self,
+                 path: str,
+                 settle_time: float = None,
+                 poll_interval: float = None,
+                 use_inotify: bool = None,
+                 walk_filter: walk_filters.WalkFilter = None):
+        self.path = path
+        self.walk_filter = walk_filter or walk_filters.WalkFilter()
+        self.settle_time = default_config.watch_settle_time if settle_time is None else settle_time
+        self.poll_interval = poll_interval or default_config.watch_poll_interval
+        self._use_inotify = sys.platform.startswith('linux') if use_inotify is None else use_inotify
+        self._inotify: Optional[_Inotify] = None
+        self._known_files: Dict[str, FileSignature] = {}
+        self._unsettled_files: Dict[str, Tuple[FileSignature, float]] = {}
+        self._events: queue.Queue = queue.Queue()
+        self._reader_failed = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Stop watching, the watch iteration ends within a poll interval"""
+        self._stop_event.set()
+
+    def watch(self) -> Iterator[List[str]]:
+        """Block until new files are completely written, and yield them in batches"""
+        events_reader = None
+        reader_stop_event = threading.Event()
+        if self._use_inotify:
+            try:
+                self._inotify = _Inotify()
+                events_reader = threading.Thread(target=self._read_events,
+                                                 args=(self._inotify, reader_stop_event),
+                                                 name='watcher-events-reader',
+                                                 daemon=True)
+                events_reader.start()
+            except (OSError, AttributeError):
+                logger.warning('inotify is unavailable, polling the directory instead', exc_info=True)
+
+        try:
+            # Start listening before the first scan, so a file that arrives in between isn't missed
+            self._scan(self.path, is_initial_scan=True)
+            while not self._stop_event.is_set():
+                settled_files = self._wait_for_settled_files()
+                if settled_files:
+                    yield settled_files
+        finally:
+            if events_reader:
+                reader_stop_event.set()
+                events_reader.join()
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+
+    def _read_events(self, inotify: _Inotify, reader_stop_event: threading.Event):
+        """Move the inotify events to the events queue as they arrive, runs on a thread of its own"""
+        try:
+            while not reader_stop_event.is_set():
+                for event in inotify.read_events(_READ_STOP_CHECK_INTERVAL):
+                    self._events.put(event)
+        except Exception:
+            logger.exception('Failed to read directory events, polling the directory instead',
+                             extra=dict(path=self.path))
+            self._reader_failed.set()
+
+    def _wait_for_settled_files(self) -> List[str]:
+        if self._inotify and self._reader_failed.is_set():
+            self._inotify.close()
+            self._inotify = None
+        if not self._inotify:
+            self._stop_event.wait(self.poll_interval)
+            self._scan(self.path)
+            return self._pop_settled_files()
+
+        timeout = min(self.poll_interval, self.settle_time) if self._unsettled_files else self.poll_interval
+        settled_files = []
+        for event_path, mask in self._get_events(timeout):
+            if mask & _IN_Q_OVERFLOW:
+                logger.warning('Missed directory events, rescanning', extra=dict(path=self.path))
+                self._scan(self.path)
+            elif mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and self._is_watched_directory(event_path):
+                    # Files written to a new directory before it's watched are caught by the scan
+                    self._scan(event_path)
+            elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                self._known_files.pop(event_path, None)
+                self._unsettled_files.pop(event_path, None)
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                self._unsettled_files.pop(event_path, None)
+                if self._is_watched_file(event_path) and self._is_new(event_path):
+                    settled_files.append(event_path)
+            elif mask & _IN_CREATE and self._is_watched_file(event_path):
+                # A writer usually closes the file soon, otherwise the file is sent once it settles, like in polling
+                signature = _get_signature(event_path)
+                if signature and self._known_files.get(event_path) != signature:
+                    self._unsettled_files[event_path] = (signature, time.monotonic())
+
+        return settled_files + self._pop_settled_files()
+
+    def _get_events(self, timeout: float) -> Iterator[Tuple[str, int]]:
+        """Yield the events read so far, waits up to the timeout for the first one"""
+        try:
+            yield self._events.get(timeout=timeout)
+            while True:
+                yield self._events.get_nowait()
+        except queue.Empty:
+            return
+
+    def _scan(self, directory_path: str, is_initial_scan: bool = False):
+        now = time.monotonic()
+        seen_files = set()
+        directories = [directory_path]
+        while directories:
+            current_directory = directories.pop()
+            if self._inotify:
+                try:
+                    self._inotify.add_watch(current_directory)
+                except OSError:
+                    logger.warning('Failed to watch directory', extra=dict(path=current_directory), exc_info=True)
+            try:
+                entries = list(os.scandir(current_directory))
+            except OSError:
+                continue
+
+            for entry in entries:
+                if utilities.is_hidden(entry.path):
+                    continue
+                relative_path = walk_filters.get_relative_path(entry.path, self.path)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.walk_filter.should_prune(entry, relative_path):
+                            directories.append(entry.path)
+                        continue
+                    if not entry.is_file() or not self.walk_filter.accepts_name(entry.name, relative_path):
+                        continue
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+
+                seen_files.add(entry.path)
+                signature = (entry_stat.st_size, entry_stat.st_mtime_ns)
+                if is_initial_scan:
+                    self._known_files[entry.path] = signature
+                elif self._known_files.get(entry.path) != signature:
+                    unsettled = self._unsettled_files.get(entry.path)
+                    if not unsettled or unsettled[0] != signature:
+                        self._unsettled_files[entry.path] = (signature, now)
+
+        if directory_path == self.path and not is_initial_scan:
+            # Forget deleted files, so a file that is written again with the same name is sent again
+            for file_path in set(self._known_files) - seen_files:
+                del self._known_files[file_path]
+            for file_path in set(self._unsettled_files) - seen_files:
+                del self._unsettled_files[file_path]
+
+    def _pop_settled_files(self) -> List[str]:
+        now = time.monotonic()
+        settled_files = []
+        for file_path, (signature, changed_at) in list(self._unsettled_files.items()):
+            if now - changed_at < self.settle_time:
+                continue
+            del self._unsettled_files[file_path]
+            current_signature = _get_signature(file_path)
+            if current_signature != signature:
+                if current_signature:
+                    # Still being written, without inotify events or a scan to notice it, so check it again
+                    self._unsettled_files[file_path] = (current_signature, now)
+            elif self._is_new(file_path):
+                settled_files.append(file_path)
+        return settled_files
+
+    def _is_watched_directory(self, directory_path: str) -> bool:
+        return (not utilities.is_hidden(directory_path) and
+                not self.walk_filter.should_prune_path(directory_path, self.path))
+
+    def _is_watched_file(self, file_path: str) -> bool:
+        return (not utilities.is_hidden(file_path) and
+                self.walk_filter.accepts_name(os.path.basename(file_path),
+                                              walk_filters.get_relative_path(file_path, self.path)))
+
+    def _is_new(self, file_path: str) -> bool:
+        signature = _get_signature(file_path)
+        if signature is None or self._known_files.get(file_path) == signature:
+            return False
+        # A file the size filters reject is known too, so it's checked again only once it changes
+        self._known_files[file_path] = signature
+        return self.walk_filter.accepts_size(signature[0])
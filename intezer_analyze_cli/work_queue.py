@@ -0,0 +1,220 @@
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+from intezer_analyze_cli.config import default_config
+
+logger = logging.getLogger('intezer_cli')
+
+ITEM_KINDS = ('file', 'hash', 'endpoint-scan', 'alert')
+ITEM_STATUSES = ('pending', 'leased', 'done', 'failed')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_availability ON items (status, available_at);
+'''
+
+
+class WorkItem(NamedTuple):
+    item_id: int
+    kind: str
+    payload: dict
+    attempts: int  # The number of times the item was leased, including the current lease
+
+    @property
+    def name(self) -> str:
+        return str(self.payload.get('path') or self.payload.get('hash') or self.payload.get('id'))
+
+
+class WorkQueue:
+    """
+    A durable queue of work items in an SQLite file, shared by any number of worker processes, on one host or
+    on several hosts with a shared filesystem.
+
+    A worker leases items for a while, and acks them once they are processed. The lease of an item whose worker
+    died expires, and the item is leased again by another worker. An item is leased at most max_attempts times.
+    Pending and leased items share the available_at column: when a pending item may be leased, or when the
+    lease of a leased item expires.
+
+    The rollback journal is used rather than WAL, since WAL requires shared memory that network filesystems
+    don't provide. Every change is a short transaction, so the file lock is held briefly.
+    """
+
+    def __init__(self, queue_path: str, busy_timeout: float = None, max_attempts: int = None):
+        self.queue_path = queue_path
+        self.max_attempts = max_attempts or default_config.work_queue_max_attempts
+        queue_directory = os.path.dirname(os.path.abspath(queue_path))
+        os.makedirs(queue_directory, exist_ok=True)
+        # Transactions are managed explicitly, so leasing can take the write lock before it reads
+        self._connection = sqlite3.connect(queue_path,
+                                           timeout=busy_timeout or default_config.work_queue_busy_timeout,
+                                           isolation_level=None)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'WorkQueue':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+    def enqueue(self, kind: str, payloads: Iterable[dict], batch_size: int = None) -> int:
+        """
+        Add items to the queue, in batches so workers can lease the first items while the rest are added.
+
+        :return: The number of items that were added
+        """
+        if kind not in ITEM_KINDS:
+            raise ValueError(f'Unknown item kind "{kind}", choose from: {", ".join(ITEM_KINDS)}')
+        batch_size = batch_size or default_config.work_queue_enqueue_batch_size
+        enqueued_number = 0
+        batch = []
+        for payload in payloads:
+            batch.append(payload)
+            if len(batch) >= batch_size:
+                enqueued_number += self._insert(kind, batch)
+                batch = []
+        if batch:
+            enqueued_number += self._insert(kind, batch)
+        return enqueued_number
+
+    def _insert(self, kind: str, payloads: List[dict]) -> int:
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT INTO items (kind, payload, status, available_at, created_at, updated_at) '
+                "VALUES (?, ?, 'pending', ?, ?, ?)",
+                ((kind, json.dumps(payload), now, now, now) for payload in payloads))
+        return len(payloads)
+
+    def lease(self, owner: str, limit: int, lease_duration: float = None) -> List[WorkItem]:
+        """Lease up to limit pending items, and items whose lease expired, for lease_duration seconds"""
+        lease_duration = lease_duration or default_config.work_queue_lease_duration
+        now = time.time()
+        with self._transaction() as connection:
+            # An item whose lease keeps expiring probably takes its workers down with it
+            connection.execute(
+                "UPDATE items SET status = 'failed', lease_owner = NULL, error = ?, updated_at = ? "
+                "WHERE status = 'leased' AND available_at <= ? AND attempts >= ?",
+                (f'The lease expired {self.max_attempts} times', now, now, self.max_attempts))
+            rows = connection.execute(
+                'SELECT id, kind, payload, attempts, status FROM items '
+                "WHERE status IN ('pending', 'leased') AND available_at <= ? "
+                'ORDER BY available_at, id LIMIT ?',
+                (now, limit)).fetchall()
+            connection.executemany(
+                "UPDATE items SET status = 'leased', lease_owner = ?, available_at = ?, attempts = attempts + 1, "
+                'updated_at = ? WHERE id = ?',
+                ((owner, now + lease_duration, now, row[0]) for row in rows))
+
+        reclaimed_number = sum(1 for row in rows if row[4] == 'leased')
+        if reclaimed_number:
+            logger.info('Reclaimed items with expired leases', extra=dict(owner=owner, reclaimed=reclaimed_number))
+        return [WorkItem(item_id, kind, json.loads(payload), attempts + 1)
+                for item_id, kind, payload, attempts, _ in rows]
+
+    def extend_leases(self, items: Iterable[WorkItem], owner: str, lease_duration: float = None):
+        """Extend the leases of items that are still processed, so they don't expire"""
+        lease_duration = lease_duration or default_config.work_queue_lease_duration
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                'UPDATE items SET available_at = ?, updated_at = ? '
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                ((now + lease_duration, now, item.item_id, owner) for item in items))
+
+    def ack(self, item: WorkItem, owner: str, result: dict = None) -> bool:
+        """
+        Mark a leased item as done.
+
+        :return: False if the lease was lost, because it expired and the item was leased by another worker
+        """
+        return self._finish_lease(item,
+                                  owner,
+                                  "status = 'done', result = ?, error = NULL",
+                                  (json.dumps(result) if result is not None else None,))
+
+    def fail(self, item: WorkItem, owner: str, error: str, retry_delay: float = None) -> str:
+        """
+        Mark a leased item as failed. When retry_delay is given and the item has attempts left, it is returned
+        to the queue and may be leased again after retry_delay seconds.
+
+        :return: The new status of the item
+        """
+        if retry_delay is not None and item.attempts < self.max_attempts:
+            self._finish_lease(item,
+                               owner,
+                               "status = 'pending', available_at = ?, error = ?",
+                               (time.time() + retry_delay, error))
+            return 'pending'
+
+        self._finish_lease(item, owner, "status = 'failed', error = ?", (error,))
+        return 'failed'
+
+    def release(self, item: WorkItem, owner: str, delay: float = 0):
+        """Return a leased item to the queue without counting the attempt, to lease it again after delay seconds"""
+        self._finish_lease(item,
+                           owner,
+                           "status = 'pending', available_at = ?, attempts = attempts - 1",
+                           (time.time() + delay,))
+
+    def _finish_lease(self, item: WorkItem, owner: str, assignments: str, parameters: tuple) -> bool:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f'UPDATE items SET {assignments}, lease_owner = NULL, updated_at = ? '
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (*parameters, time.time(), item.item_id, owner))
+
+        if not cursor.rowcount:
+            logger.warning('The lease of the item was lost', extra=dict(item_id=item.item_id, owner=owner))
+            return False
+        return True
+
+    def count_by_status(self) -> Dict[str, int]:
+        counts = dict.fromkeys(ITEM_STATUSES, 0)
+        counts.update(self._connection.execute('SELECT status, COUNT(*) FROM items GROUP BY status'))
+        return counts
+
+    def has_unfinished_items(self) -> bool:
+        """Whether some items are pending or leased, by this worker or by others"""
+        return self._connection.execute(
+            "SELECT EXISTS (SELECT 1 FROM items WHERE status IN ('pending', 'leased'))").fetchone()[0] == 1
+
+    def get_failed_items(self) -> List[Tuple[str, str, str]]:
+        """The (kind, name, error) of the items that failed"""
+        rows = self._connection.execute(
+            "SELECT kind, payload, error FROM items WHERE status = 'failed' ORDER BY id").fetchall()
+        return [(kind, WorkItem(0, kind, json.loads(payload), 0).name, error) for kind, payload, error in rows]
+
+    def close(self):
+        self._connection.close()
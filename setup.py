@@ -19,7 +19,8 @@ with open(rel('intezer_analyze_cli', '__init__.py'), 'r') as f:
 
 install_requires = [
     'click==7.1.2',
-    'intezer-sdk>=1.23.0,<2'
+    # The API client of the CLI overrides private methods of the SDK client, which may change in a minor version
+    'intezer-sdk>=1.23.0,<1.24'
 ]
 tests_require = [
     'pytest==8.4.1',
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from intezer_analyze_cli import analysis_cache
+
+
+class AnalysisCacheSpec(unittest.TestCase):
+    def setUp(self):
+        super(AnalysisCacheSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_path = os.path.join(temp_dir.name, 'cache', 'analysis-cache.sqlite')
+
+    def test_get_returns_analysis_within_max_age(self):
+        # Arrange
+        with analysis_cache.AnalysisCache('https://analyze.intezer.com/api/', self.cache_path) as cache:
+            cache.set('A' * 64, 'analysis-id')
+
+        # Act
+        with analysis_cache.AnalysisCache('https://analyze.intezer.com/api/', self.cache_path) as cache:
+            cached_analysis = cache.get('a' * 64, max_age=60)
+        with analysis_cache.AnalysisCache('https://other.intezer.com/api/', self.cache_path) as cache:
+            other_account_analysis = cache.get('a' * 64, max_age=60)
+
+        # Assert
+        self.assertEqual(cached_analysis.analysis_id, 'analysis-id')
+        self.assertIsNone(other_account_analysis)
+
+    def test_get_ignores_analysis_older_than_max_age(self):
+        # Arrange
+        with analysis_cache.AnalysisCache('api_url', self.cache_path) as cache:
+            with patch('time.time', return_value=time.time() - 120):
+                cache.set('a' * 64, 'analysis-id')
+
+            # Act
+            recent_analysis = cache.get('a' * 64, max_age=60)
+            old_analysis = cache.get('a' * 64, max_age=600)
+
+        # Assert
+        self.assertIsNone(recent_analysis)
+        self.assertEqual(old_analysis.analysis_id, 'analysis-id')
+
+    def test_evict_removes_expired_entries(self):
+        # Arrange
+        with analysis_cache.AnalysisCache('api_url', self.cache_path, ttl=60) as cache:
+            with patch('time.time', return_value=time.time() - 120):
+                cache.set('a' * 64, 'expired')
+            cache.set('b' * 64, 'fresh')
+
+            # Act
+            removed_number = cache.evict()
+
+            # Assert
+            self.assertEqual(removed_number, 1)
+            self.assertIsNone(cache.get('a' * 64, max_age=3600))
+            self.assertEqual(cache.get('b' * 64, max_age=3600).analysis_id, 'fresh')
+
+    def test_evict_removes_least_recently_used_entries_above_max_entries(self):
+        # Arrange
+        now = time.time()
+        with analysis_cache.AnalysisCache('api_url', self.cache_path, max_entries=2) as cache:
+            for index, file_hash in enumerate(('a' * 64, 'b' * 64, 'c' * 64)):
+                with patch('time.time', return_value=now - 30 + index):
+                    cache.set(file_hash, file_hash[0])
+            with patch('time.time', return_value=now):
+                cache.get('a' * 64, max_age=3600)
+
+            # Act
+            removed_number = cache.evict()
+
+            # Assert
+            self.assertEqual(removed_number, 1)
+            self.assertIsNone(cache.get('b' * 64, max_age=3600))
+            self.assertIsNotNone(cache.get('a' * 64, max_age=3600))
+            self.assertIsNotNone(cache.get('c' * 64, max_age=3600))
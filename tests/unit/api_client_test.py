@@ -0,0 +1,249 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import requests
+import responses
+
+from intezer_analyze_cli import api_client
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import key_store
+from intezer_analyze_cli.api_client import CliApiClient
+from intezer_analyze_cli.config import default_config
+
+API_URL = 'https://analyze.intezer.com/api/'
+API_VERSION = 'v2-0'
+ACCESS_TOKEN_URL = f'{API_URL}{API_VERSION}/get-access-token'
+
+
+class CliApiClientTokenCacheSpec(unittest.TestCase):
+    def setUp(self):
+        super(CliApiClientTokenCacheSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        key_file_path_patcher = patch.object(key_store,
+                                             'get_key_file_path',
+                                             side_effect=lambda name: os.path.join(temp_dir.name, name))
+        key_file_path_patcher.start()
+        self.addCleanup(key_file_path_patcher.stop)
+
+    @staticmethod
+    def _create_api(api_key='api_key') -> CliApiClient:
+        return CliApiClient(api_key=api_key, api_version=API_VERSION, base_url=API_URL)
+
+    @responses.activate
+    def test_authenticate_uses_token_cached_by_another_process(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        self._create_api().authenticate()
+
+        # Act
+        api = self._create_api()
+        api.authenticate()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(api._session.headers['Authorization'], 'Bearer token')
+
+    @responses.activate
+    def test_authenticate_refreshes_token_near_expiry(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'old-token', 'expire_at': time.time() + 10})
+        self._create_api().authenticate()
+        responses.replace(responses.POST, ACCESS_TOKEN_URL,
+                          json={'result': 'new-token', 'expire_at': time.time() + 3600})
+
+        # Act
+        api = self._create_api()
+        api.authenticate()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(api._session.headers['Authorization'], 'Bearer new-token')
+        self.assertEqual(key_store.get_cached_token(api._token_cache_path)['token'], 'new-token')
+
+    @responses.activate
+    def test_tokens_are_cached_per_api_key(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        self._create_api('api_key').authenticate()
+
+        # Act
+        self._create_api('another_api_key').authenticate()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_rejected_cached_token_is_refreshed(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        api = self._create_api()
+        api.authenticate()
+
+        # Act
+        api._set_access_token()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_deleted_cached_tokens_of_api_key_are_not_used(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        self._create_api('api_key').authenticate()
+        self._create_api('another_api_key').authenticate()
+
+        # Act
+        key_store.delete_cached_tokens('api_key')
+        self._create_api('api_key').authenticate()
+        self._create_api('another_api_key').authenticate()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_token_is_not_cached_when_the_lock_is_not_taken(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        api = self._create_api()
+
+        # Act
+        # The lock of msvcrt gives up after about 10 seconds of contention
+        msvcrt_mock = MagicMock()
+        msvcrt_mock.locking.side_effect = OSError()
+        with patch.object(key_store.os, 'name', 'nt'), patch.dict('sys.modules', msvcrt=msvcrt_mock):
+            api.authenticate()
+
+        # Assert
+        self.assertEqual(api._session.headers['Authorization'], 'Bearer token')
+        self.assertIsNone(key_store.get_cached_token(api._token_cache_path))
+
+
+class CliApiClientTokenRefreshSpec(unittest.TestCase):
+    @staticmethod
+    def _create_api() -> CliApiClient:
+        return CliApiClient(api_key='api_key', api_version=API_VERSION, base_url=API_URL, use_token_cache=False)
+
+    @responses.activate
+    def test_concurrent_workers_refresh_token_once(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        api = self._create_api()
+        api.authenticate()
+        stale_generation = api._token_generation
+        workers = [threading.Thread(target=api._refresh_access_token, args=(stale_generation,)) for _ in range(8)]
+
+        # Act
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Assert
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(api._token_generation, stale_generation + 1)
+
+    @responses.activate
+    def test_request_rejected_with_expired_token_is_sent_again_once(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        responses.add(responses.GET, f'{API_URL}{API_VERSION}/some-path', status=401)
+        responses.add(responses.GET, f'{API_URL}{API_VERSION}/some-path', status=200)
+        api = self._create_api()
+
+        # Act
+        response = api.request_with_refresh_expired_access_token('GET', '/some-path')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([call for call in responses.calls if call.request.url == ACCESS_TOKEN_URL]), 2)
+
+    @responses.activate
+    def test_request_is_sent_again_on_connection_error(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        responses.add(responses.GET, f'{API_URL}{API_VERSION}/some-path',
+                      body=requests.exceptions.ConnectionError('Connection reset'))
+        responses.add(responses.GET, f'{API_URL}{API_VERSION}/some-path', status=200)
+        api = self._create_api()
+
+        # Act
+        response = api.request_with_refresh_expired_access_token('GET', '/some-path')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+
+class CliApiClientUploadSpec(unittest.TestCase):
+    def setUp(self):
+        super(CliApiClientUploadSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.file_path = os.path.join(temp_dir.name, 'sample.exe')
+        with open(self.file_path, 'wb') as file:
+            file.write(b'MZ' * 1000)
+
+    @staticmethod
+    def _create_api() -> CliApiClient:
+        return CliApiClient(api_key='api_key', api_version=API_VERSION, base_url=API_URL, use_token_cache=False)
+
+    @responses.activate
+    def test_file_is_streamed_in_chunks(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        responses.add(responses.POST, f'{API_URL}{API_VERSION}/analyze', status=201)
+        uploaded_chunks = []
+
+        # Act
+        with open(self.file_path, 'rb') as file, \
+                patch.object(default_config, 'upload_chunk_size', 512), \
+                api_client.track_upload_progress(uploaded_chunks.append):
+            self._create_api().request_with_refresh_expired_access_token('POST',
+                                                                         '/analyze',
+                                                                         {'code_item_type': 'file'},
+                                                                         files={'file': ('sample.exe', file)})
+        request = responses.calls[-1].request
+        body = request.body
+
+        # Assert
+        self.assertEqual(int(request.headers['Content-Length']), len(body))
+        self.assertIn(b'name="code_item_type"\r\n\r\nfile\r\n', body)
+        self.assertIn(b'filename="sample.exe"\r\n\r\n' + b'MZ' * 1000 + b'\r\n', body)
+        self.assertEqual(uploaded_chunks, [512, 512, 512, 464])
+
+    @responses.activate
+    def test_file_over_the_upload_limit_is_not_sent(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        responses.add(responses.POST, f'{API_URL}{API_VERSION}/analyze', status=201)
+
+        # Act
+        with open(self.file_path, 'rb') as file, patch.object(default_config, 'max_upload_size', 1000):
+            with self.assertRaises(api_client.FileTooLargeError):
+                self._create_api().request_with_refresh_expired_access_token('POST',
+                                                                             '/analyze',
+                                                                             files={'file': ('sample.exe', file)})
+
+        # Assert
+        self.assertEqual([call.request.url for call in responses.calls], [ACCESS_TOKEN_URL])
+
+    @responses.activate
+    def test_no_request_is_sent_after_the_deadline(self):
+        # Arrange
+        responses.add(responses.POST, ACCESS_TOKEN_URL, json={'result': 'token', 'expire_at': time.time() + 3600})
+        responses.add(responses.POST, f'{API_URL}{API_VERSION}/analyze', status=201)
+
+        # Act
+        with deadlines.Deadline(0), open(self.file_path, 'rb') as file, self.assertRaises(deadlines.DeadlineExceeded):
+            self._create_api().request_with_refresh_expired_access_token('POST',
+                                                                         '/analyze',
+                                                                         files={'file': ('sample.exe', file)})
+
+        # Assert
+        self.assertNotIn(f'{API_URL}{API_VERSION}/analyze', [call.request.url for call in responses.calls])
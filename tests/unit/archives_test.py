@@ -0,0 +1,130 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from intezer_analyze_cli import archives
+
+PE_CONTENT = b'MZ' + b'\0' * 100
+TEXT_CONTENT = b'just some text'
+
+
+def _create_zip(members: dict) -> bytes:
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, member_content in members.items():
+            archive.writestr(name, member_content)
+    return content.getvalue()
+
+
+def _create_tar_gz(members: dict) -> bytes:
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode='w:gz') as archive:
+        for name, member_content in members.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(member_content)
+            archive.addfile(member, io.BytesIO(member_content))
+    return content.getvalue()
+
+
+class ArchiveExpanderSpec(unittest.TestCase):
+    def setUp(self):
+        super(ArchiveExpanderSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory_path = temp_dir.name
+
+    def _write_archive(self, file_name: str, content: bytes) -> str:
+        archive_path = os.path.join(self.directory_path, file_name)
+        with open(archive_path, 'wb') as archive_file:
+            archive_file.write(content)
+        return archive_path
+
+    def test_yields_supported_members_and_skips_unsupported(self):
+        # Arrange
+        archive_path = self._write_archive('evidence.zip', _create_zip({'bin/a.exe': PE_CONTENT,
+                                                                        'readme.txt': TEXT_CONTENT}))
+        expander = archives.ArchiveExpander()
+
+        # Act
+        members = list(expander.iter_members(archive_path))
+
+        # Assert
+        self.assertEqual([(m.path, m.name) for m in members], [(f'{archive_path}!bin/a.exe', 'a.exe')])
+        self.assertEqual(members[0].stream.read(), PE_CONTENT)
+        self.assertEqual(expander.skipped_members, [(f'{archive_path}!readme.txt', 'unsupported file type')])
+
+    def test_expands_nested_archives(self):
+        # Arrange
+        inner_zip = _create_zip({'inner.exe': PE_CONTENT})
+        archive_path = self._write_archive('evidence.tar.gz', _create_tar_gz({'inner.zip': inner_zip,
+                                                                              'outer.exe': PE_CONTENT}))
+
+        # Act
+        members = list(archives.ArchiveExpander().iter_members(archive_path))
+
+        # Assert
+        self.assertEqual(sorted(m.path for m in members),
+                         [f'{archive_path}!inner.zip!inner.exe', f'{archive_path}!outer.exe'])
+
+    def test_skips_archives_nested_too_deep(self):
+        # Arrange
+        inner_zip = _create_zip({'inner.exe': PE_CONTENT})
+        middle_zip = _create_zip({'inner.zip': inner_zip})
+        archive_path = self._write_archive('evidence.zip', _create_zip({'middle.zip': middle_zip}))
+        expander = archives.ArchiveExpander(max_depth=2)
+
+        # Act
+        members = list(expander.iter_members(archive_path))
+
+        # Assert
+        self.assertEqual(members, [])
+        self.assertEqual(expander.skipped_members[0][0], f'{archive_path}!middle.zip!inner.zip')
+
+    def test_skips_members_larger_than_limit(self):
+        # Arrange
+        archive_path = self._write_archive('evidence.zip', _create_zip({'large.exe': PE_CONTENT * 10,
+                                                                        'small.exe': PE_CONTENT}))
+        expander = archives.ArchiveExpander(max_member_size=len(PE_CONTENT) * 2)
+
+        # Act
+        members = list(expander.iter_members(archive_path))
+
+        # Assert
+        self.assertEqual([m.name for m in members], ['small.exe'])
+
+    def test_stops_after_total_size_limit(self):
+        # Arrange
+        archive_path = self._write_archive('evidence.zip', _create_zip({f'{i}.exe': PE_CONTENT for i in range(10)}))
+        expander = archives.ArchiveExpander(max_total_size=len(PE_CONTENT) * 3)
+
+        # Act
+        members = list(expander.iter_members(archive_path))
+
+        # Assert
+        self.assertLess(len(members), 10)
+        self.assertEqual(expander.skipped_members[-1][0], archive_path)
+
+    def test_yields_apk_member_as_file(self):
+        # Arrange
+        apk = _create_zip({'AndroidManifest.xml': b'<manifest/>', 'classes.dex': b'dex\n035\0'})
+        archive_path = self._write_archive('evidence.zip', _create_zip({'app.apk': apk}))
+
+        # Act
+        members = list(archives.ArchiveExpander().iter_members(archive_path))
+
+        # Assert
+        self.assertEqual([m.name for m in members], ['app.apk'])
+
+    def test_is_expandable_archive(self):
+        # Arrange
+        zip_path = self._write_archive('evidence.zip', _create_zip({'a.exe': PE_CONTENT}))
+        tar_path = self._write_archive('evidence.tar.gz', _create_tar_gz({'a.exe': PE_CONTENT}))
+        pe_path = self._write_archive('a.exe', PE_CONTENT)
+
+        # Assert
+        self.assertTrue(archives.is_expandable_archive(zip_path))
+        self.assertTrue(archives.is_expandable_archive(tar_path))
+        self.assertFalse(archives.is_expandable_archive(pe_path))
@@ -1,16 +1,24 @@
+import json
 import os
 import tempfile
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import click
 import requests
 from click.testing import CliRunner
 from intezer_sdk import errors as sdk_errors
 
 import intezer_analyze_cli.key_store as key_store
 from intezer_analyze_cli import cli
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import estimates
+from intezer_analyze_cli import results
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli.config import default_config
 
 
 class CliSpec(unittest.TestCase):
@@ -39,10 +47,75 @@ class CliLoginSpec(CliSpec):
         with patch('intezer_analyze_cli.commands.login') as mock:
             result = self.runner.invoke(cli.main_cli, [cli.login.name, api_key, analyze_url])
             # Assert
-            mock.assert_called_once_with(api_key, analyze_url + '/api/')
+            mock.assert_called_once_with(api_key, analyze_url + '/api/', profile_name=None, weight=1)
 
         self.assertEqual(result.exit_code, 0)
 
+    def test_login_with_profile(self):
+        # Arrange
+        api_key = '123e4567-e89b-12d3-a456-426655440000'
+
+        # Act
+        with patch('intezer_analyze_cli.commands.login') as mock:
+            result = self.runner.invoke(cli.main_cli,
+                                        [cli.login.name, '--profile', 'secondary', '--weight', '3', api_key])
+            # Assert
+            mock.assert_called_once_with(api_key, None, profile_name='secondary', weight=3)
+
+        self.assertEqual(result.exit_code, 0)
+
+    def test_login_with_invalid_profile_name(self):
+        # Arrange
+        api_key = '123e4567-e89b-12d3-a456-426655440000'
+
+        # Act
+        with patch('intezer_analyze_cli.commands.login') as mock:
+            result = self.runner.invoke(cli.main_cli, [cli.login.name, '--profile', '../other', api_key])
+            # Assert
+            mock.assert_not_called()
+
+        self.assertEqual(result.exit_code, 2)
+
+    def test_list_profiles(self):
+        # Arrange
+        stored_profiles = dict(main=dict(api_url=None, weight=3),
+                               on_prem=dict(api_url='http://127.0.0.1/api/', weight=1))
+
+        # Act
+        with patch('intezer_analyze_cli.key_store.list_profiles', return_value=sorted(stored_profiles)), \
+                patch('intezer_analyze_cli.key_store.get_stored_profile', side_effect=stored_profiles.get):
+            result = self.runner.invoke(cli.main_cli, ['profiles'])
+
+        # Assert
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.splitlines(),
+                         [f'main\t{default_config.api_url}\tweight 3', 'on_prem\thttp://127.0.0.1/api/\tweight 1'])
+
+    def test_delete_profile(self):
+        # Act
+        with patch('intezer_analyze_cli.key_store.list_profiles', return_value=['main']), \
+                patch('intezer_analyze_cli.key_store.delete_profile') as delete_profile_mock:
+            result = self.runner.invoke(cli.main_cli, ['delete-profile', 'main'])
+            unknown_profile_result = self.runner.invoke(cli.main_cli, ['delete-profile', '../main'])
+
+        # Assert
+        self.assertEqual(result.exit_code, 0)
+        delete_profile_mock.assert_called_once_with('main')
+        self.assertEqual(unknown_profile_result.exit_code, 1)
+
+    def test_cli_is_added_to_the_user_agent_once(self):
+        # Arrange
+        key_store.get_stored_api_key = MagicMock(return_value='api_key')
+        key_store.get_stored_default_url = MagicMock(return_value=None)
+        self.addCleanup(setattr, cli.sdk_consts, 'USER_AGENT', cli.sdk_consts.USER_AGENT)
+
+        # Act
+        cli.create_global_api()
+        cli.create_global_api()
+
+        # Assert
+        self.assertEqual(cli.sdk_consts.USER_AGENT.count('/CLI-'), 1)
+
     def test_login_invalid_key(self):
         # Arrange
         api_key = '123e4567-e89b-12d3-a456-426655440000'
@@ -100,7 +173,8 @@ class CliAnalyzeSpec(CliSpec):
         self.create_analyze_file_command_mock.assert_called_once_with(file_path=file_path,
                                                                       disable_dynamic_unpacking=True,
                                                                       disable_static_unpacking=True,
-                                                                      code_item_type=None)
+                                                                      code_item_type=None,
+                                                                      hash_lists=None)
 
     def test_analyze_file(self):
         # Arrange
@@ -114,7 +188,8 @@ class CliAnalyzeSpec(CliSpec):
         self.create_analyze_file_command_mock.assert_called_once_with(file_path=file_path,
                                                                       disable_dynamic_unpacking=None,
                                                                       disable_static_unpacking=None,
-                                                                      code_item_type=None)
+                                                                      code_item_type=None,
+                                                                      hash_lists=None)
 
     def test_analyze_memory_module(self):
         # Arrange
@@ -128,7 +203,8 @@ class CliAnalyzeSpec(CliSpec):
         self.create_analyze_file_command_mock.assert_called_once_with(file_path=file_path,
                                                                       disable_dynamic_unpacking=None,
                                                                       disable_static_unpacking=None,
-                                                                      code_item_type='file')
+                                                                      code_item_type='file',
+                                                                      hash_lists=None)
 
     @patch('intezer_analyze_cli.commands.analyze_directory_command')
     def test_analyze_directory(self, create_analyze_directory_command_mock):
@@ -147,7 +223,142 @@ class CliAnalyzeSpec(CliSpec):
                                                                       disable_dynamic_unpacking=None,
                                                                       disable_static_unpacking=None,
                                                                       code_item_type=None,
-                                                                      ignore_directory_count_limit=False)
+                                                                      ignore_directory_count_limit=False,
+                                                                      dry_run=False,
+                                                                      throughput_model=None,
+                                                                      shard=None,
+                                                                      walk_filter=walk_filters.WalkFilter(),
+                                                                      hash_lists=None)
+
+    @patch('intezer_analyze_cli.cli.create_global_api')
+    @patch('intezer_analyze_cli.commands.analyze_directory_command')
+    def test_analyze_directory_dry_run_does_not_login(self,
+                                                      create_analyze_directory_command_mock,
+                                                      create_global_api_mock):
+        # Arrange
+        directory_path = os.path.dirname(__file__)
+
+        # Act
+        result = self.runner.invoke(cli.main_cli,
+                                    [cli.analyze.name,
+                                     '--dry-run',
+                                     '--assume-rate', '10',
+                                     '--assume-bandwidth', '1M',
+                                     directory_path])
+
+        # Assert
+        self.assertEqual(result.exit_code, 0, result.exception)
+        create_global_api_mock.assert_not_called()
+        self.assertTrue(create_analyze_directory_command_mock.call_args[1]['dry_run'])
+        self.assertEqual(create_analyze_directory_command_mock.call_args[1]['throughput_model'],
+                         estimates.ThroughputModel(10, 1024 * 1024))
+
+    @patch('intezer_analyze_cli.metrics.MetricsServer')
+    def test_analyze_serves_metrics_on_the_loopback_address_unless_a_host_is_given(self, metrics_server_mock):
+        # Arrange
+        file_path = __file__
+
+        # Act
+        default_host_result = self.runner.invoke(cli.main_cli, [cli.analyze.name, '--metrics-port', '9464', file_path])
+        given_host_result = self.runner.invoke(cli.main_cli,
+                                               [cli.analyze.name,
+                                                '--metrics-port', '9464',
+                                                '--metrics-host', '0.0.0.0',
+                                                file_path])
+
+        # Assert
+        self.assertEqual(default_host_result.exit_code, 0, default_host_result.exception)
+        self.assertEqual(given_host_result.exit_code, 0, given_host_result.exception)
+        self.assertEqual([call_args[0][2] for call_args in metrics_server_mock.call_args_list],
+                         ['127.0.0.1', '0.0.0.0'])
+
+    @patch('intezer_analyze_cli.commands.analyze_paths_stream_command')
+    def test_analyze_paths_from_stdin(self, analyze_paths_stream_command_mock):
+        # Arrange
+        streamed_paths = []
+        analyze_paths_stream_command_mock.side_effect = lambda file_paths, **kwargs: streamed_paths.extend(file_paths)
+
+        # Act
+        result = self.runner.invoke(cli.main_cli, [cli.analyze.name, '-'], input=b'/tmp/a.exe\0/tmp/b c.exe\0')
+
+        # Assert
+        self.assertEqual(result.exit_code, 0, result.exception)
+        self.assertEqual(streamed_paths, ['/tmp/a.exe', '/tmp/b c.exe'])
+        self.create_analyze_file_command_mock.assert_not_called()
+
+    @patch('intezer_analyze_cli.commands.analyze_by_txt_file_command')
+    def test_analyze_by_list_reuses_cached_analyses_only_with_max_age(self, analyze_by_txt_file_command_mock):
+        # Act
+        default_result = self.runner.invoke(cli.main_cli, ['analyze-by-list', __file__])
+        max_age_result = self.runner.invoke(cli.main_cli, ['analyze-by-list', '--max-age', '3600', __file__])
+
+        # Assert
+        self.assertEqual(default_result.exit_code, 0, default_result.exception)
+        self.assertEqual(max_age_result.exit_code, 0, max_age_result.exception)
+        self.assertEqual([call_args[1]['max_age'] for call_args in analyze_by_txt_file_command_mock.call_args_list],
+                         [None, 3600])
+
+    @patch('intezer_analyze_cli.commands.analyze_hashes_stream_command')
+    def test_analyze_by_list_from_stdin(self, analyze_hashes_stream_command_mock):
+        # Arrange
+        streamed_hashes = []
+        analyze_hashes_stream_command_mock.side_effect = lambda hashes, **kwargs: streamed_hashes.extend(hashes)
+
+        # Act
+        result = self.runner.invoke(cli.main_cli, ['analyze-by-list', '-'], input='a' * 64 + '\n' + 'b' * 64 + '\n')
+
+        # Assert
+        self.assertEqual(result.exit_code, 0, result.exception)
+        self.assertEqual(streamed_hashes, ['a' * 64, 'b' * 64])
+
+
+class ShardSpec(CliSpec):
+    def setUp(self):
+        super(ShardSpec, self).setUp()
+        key_store.get_stored_api_key = MagicMock(return_value='api_key')
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        key_file_path_patcher = patch.object(key_store,
+                                             'get_key_file_path',
+                                             side_effect=lambda name: os.path.join(temp_dir.name, name))
+        key_file_path_patcher.start()
+        self.addCleanup(key_file_path_patcher.stop)
+
+    def test_analyze_by_list_with_shards_covers_every_hash_once(self):
+        # Arrange
+        hashes = [f'{i:064x}' for i in range(20)]
+        sent_hashes = []
+
+        with self.runner.isolated_filesystem():
+            with open('hashes.txt', 'w') as hashes_file:
+                hashes_file.write('\n'.join(hashes) + '\n')
+
+            # Act
+            with patch('intezer_analyze_cli.commands.send_hash_for_analysis',
+                       side_effect=lambda file_hash: sent_hashes.append(file_hash) or f'analysis-{file_hash}'):
+                shards_results = [
+                    self.runner.invoke(cli.main_cli, ['analyze-by-list', '--shard', f'{i}/3', 'hashes.txt'])
+                    for i in range(1, 4)]
+
+            with open('intezer-results-shard-2-of-3.jsonl') as results_file:
+                second_shard_results = [json.loads(line) for line in results_file]
+
+        # Assert
+        for result in shards_results:
+            self.assertEqual(result.exit_code, 0, result.exception)
+        self.assertEqual(sorted(sent_hashes), hashes)
+        self.assertTrue(second_shard_results)
+        self.assertTrue(all(result['shard'] == '2/3' and result['status'] == 'success'
+                            for result in second_shard_results))
+        self.assertEqual(second_shard_results[0]['analysis_id'], f'analysis-{second_shard_results[0]["item"]}')
+
+    def test_invalid_shard(self):
+        # Act
+        result = self.runner.invoke(cli.main_cli, ['analyze-by-list', '--shard', '4/3', __file__])
+
+        # Assert
+        self.assertEqual(result.exit_code, 2)
 
 
 class UploadOfflineEndpointScanSpec(CliSpec):
@@ -214,7 +425,9 @@ class UploadOfflineEndpointScanSpec(CliSpec):
             self.assertTrue(upload_multiple_offline_endpoint_scans.called)
             upload_multiple_offline_endpoint_scans.assert_called_once_with(offline_scans_root_directory=directory_path,
                                                                            force=False,
-                                                                           max_concurrent_uploads=0)
+                                                                           max_concurrent_uploads=0,
+                                                                           shard=None,
+                                                                           walk_filter=walk_filters.WalkFilter())
 
     @patch('intezer_analyze_cli.commands.upload_multiple_offline_endpoint_scans')
     def test_upload_multiple_offline_endpoint_scans_force(self, upload_multiple_offline_endpoint_scans):
@@ -233,7 +446,9 @@ class UploadOfflineEndpointScanSpec(CliSpec):
             self.assertTrue(upload_multiple_offline_endpoint_scans.called)
             upload_multiple_offline_endpoint_scans.assert_called_once_with(offline_scans_root_directory=directory_path,
                                                                            force=True,
-                                                                           max_concurrent_uploads=0)
+                                                                           max_concurrent_uploads=0,
+                                                                           shard=None,
+                                                                           walk_filter=walk_filters.WalkFilter())
 
 
 class UploadPhishingSpec(CliSpec):
@@ -252,7 +467,10 @@ class UploadPhishingSpec(CliSpec):
             self.assertEqual(result.exit_code, 0, result.exception)
             self.assertTrue(send_phishing_emails_from_directory_command.called)
             send_phishing_emails_from_directory_command.assert_called_once_with(path=directory_path,
-                                                                                ignore_directory_count_limit=False)
+                                                                                ignore_directory_count_limit=False,
+                                                                                dry_run=False,
+                                                                                throughput_model=None,
+                                                                                walk_filter=walk_filters.WalkFilter())
 
     @patch('intezer_analyze_cli.commands.send_phishing_emails_from_directory_command')
     def test_upload_multiple_eml_files_ignore(self, send_phishing_emails_from_directory_command):
@@ -270,7 +488,10 @@ class UploadPhishingSpec(CliSpec):
             self.assertEqual(result.exit_code, 0, result.exception)
             self.assertTrue(send_phishing_emails_from_directory_command.called)
             send_phishing_emails_from_directory_command.assert_called_once_with(path=directory_path,
-                                                                                ignore_directory_count_limit=True)
+                                                                                ignore_directory_count_limit=True,
+                                                                                dry_run=False,
+                                                                                throughput_model=None,
+                                                                                walk_filter=walk_filters.WalkFilter())
 
 
 class AlertsSpec(CliSpec):
@@ -298,7 +519,31 @@ class AlertsSpec(CliSpec):
             # Assert
             self.assertEqual(result.exit_code, 0, result.exception)
             self.assertTrue(notify_alerts_from_csv_command_mock.called)
-            notify_alerts_from_csv_command_mock.assert_called_once_with(csv_path=csv_file_path)
+            notify_alerts_from_csv_command_mock.assert_called_once_with(csv_path=csv_file_path,
+                                                                        max_concurrent=10,
+                                                                        in_progress_deadline=0,
+                                                                        in_progress_retry_interval=30,
+                                                                        replay_file_path=None)
+
+    @patch('intezer_analyze_cli.commands.notify_alerts_from_csv_command')
+    def test_alerts_notify_from_csv_with_max_concurrent(self, notify_alerts_from_csv_command_mock):
+        # Arrange
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, 'alerts.csv')
+            with open(csv_file_path, 'w') as f:
+                f.write('id,environment\ntest-alert-1,production\n')
+
+            # Act
+            result = self.runner.invoke(cli.main_cli,
+                                        ['alerts', 'notify-from-csv', csv_file_path, '--max-concurrent', '3'])
+
+            # Assert
+            self.assertEqual(result.exit_code, 0, result.exception)
+            notify_alerts_from_csv_command_mock.assert_called_once_with(csv_path=csv_file_path,
+                                                                        max_concurrent=3,
+                                                                        in_progress_deadline=0,
+                                                                        in_progress_retry_interval=30,
+                                                                        replay_file_path=None)
 
     def test_alerts_notify_from_csv_file_not_exists_returns_error(self):
         # Arrange
@@ -336,7 +581,8 @@ class CliIndexSpec(CliSpec):
         self.assertTrue(self.create_global_api_patcher_mock.called)
         create_index_file_command_mock.assert_called_once_with(file_path=file_path,
                                                                index_as=index_as,
-                                                               family_name=None)
+                                                               family_name=None,
+                                                               hash_lists=None)
 
     @patch('intezer_analyze_cli.commands.index_directory_command')
     def test_index_directory(self, create_index_directory_command_mock):
@@ -352,7 +598,34 @@ class CliIndexSpec(CliSpec):
         create_index_directory_command_mock.assert_called_once_with(directory_path=directory_path,
                                                                     index_as=index_as,
                                                                     family_name=None,
-                                                                    ignore_directory_count_limit=False)
+                                                                    ignore_directory_count_limit=False,
+                                                                    dry_run=False,
+                                                                    throughput_model=None,
+                                                                    shard=None,
+                                                                    walk_filter=walk_filters.WalkFilter(),
+                                                                    hash_lists=None)
+
+    @patch('intezer_analyze_cli.commands.index_directory_command')
+    def test_index_directory_with_stage_workers(self, create_index_directory_command_mock):
+        # Arrange
+        directory_path = os.path.dirname(__file__)
+        default_pipeline_workers = default_config.pipeline_workers
+        pipeline_workers_of_run = []
+        create_index_directory_command_mock.side_effect = lambda **kwargs: pipeline_workers_of_run.append(
+            default_config.pipeline_workers)
+
+        # Act
+        result = self.runner.invoke(cli.main_cli, ['--stage-workers', 'submit=8', '--stage-workers', 'poll=16',
+                                                   cli.index.name, directory_path, '--index-as=trusted'])
+        invalid_result = self.runner.invoke(cli.main_cli, ['--stage-workers', 'upload=8',
+                                                           cli.index.name, directory_path, '--index-as=trusted'])
+
+        # Assert
+        self.assertEqual(result.exit_code, 0, result.exception)
+        self.assertEqual((pipeline_workers_of_run[0]['submit'], pipeline_workers_of_run[0]['poll']), (8, 16))
+        self.assertEqual(pipeline_workers_of_run[0]['classify'], default_pipeline_workers['classify'])
+        self.assertIs(default_config.pipeline_workers, default_pipeline_workers)
+        self.assertEqual(invalid_result.exit_code, 2)
 
     def test_index_file_with_wrong_index_name_raise_error(self):
         # Arrange
@@ -383,7 +656,33 @@ class CliIndexSpec(CliSpec):
         self.assertTrue(self.create_global_api_patcher_mock.called)
         create_index_by_txt_file_command_mock.assert_called_once_with(path=file_path,
                                                                       index_as=index_as,
-                                                                      family_name=None)
+                                                                      family_name=None,
+                                                                      dry_run=False,
+                                                                      throughput_model=None,
+                                                                      shard=None)
+
+    @patch('intezer_analyze_cli.commands.index_by_txt_file_command')
+    def test_index_by_list_exits_with_the_deadline_exit_code(self, create_index_by_txt_file_command_mock):
+        # Arrange
+        dir_name = Path(__file__).parent.parent.absolute()
+        file_path = os.path.join(dir_name, 'resources/test_hashes.txt')
+        deadlines_of_run = []
+
+        def index_until_deadline(**kwargs):
+            deadlines_of_run.append(deadlines.get_deadline())
+            raise deadlines.DeadlineExceeded()
+
+        create_index_by_txt_file_command_mock.side_effect = index_until_deadline
+
+        # Act
+        result = self.runner.invoke(cli.main_cli,
+                                    ['--deadline', '2h', cli.index_by_list.name, file_path, '--index-as=trusted'])
+
+        # Assert
+        self.assertEqual(result.exit_code, deadlines.EXIT_CODE, result.exception)
+        self.assertEqual(deadlines_of_run[0].seconds, 2 * 60 * 60)
+        self.assertIsNone(deadlines.get_deadline())
+        self.assertIn('The deadline of the run passed', result.output)
 
     def test_index_by_txt_file_command_family_none(self):
         # Arrange
@@ -413,3 +712,106 @@ class CliIndexSpec(CliSpec):
         self.assertTrue(b'Try \'main-cli index-by-list -h\' for help.' in result.stdout_bytes)
         self.assertTrue(b'Error: Invalid value for \'--index-as\': invalid choice: wrong_index_name. '
                         b'(choose from malicious, trusted)' in result.stdout_bytes)
+
+
+class RunJobsSpec(CliSpec):
+    def setUp(self):
+        super(RunJobsSpec, self).setUp()
+
+        create_global_api_patcher = patch('intezer_analyze_cli.cli.create_global_api')
+        self.create_global_api_patcher_mock = create_global_api_patcher.start()
+        self.addCleanup(create_global_api_patcher.stop)
+
+    @patch('intezer_analyze_cli.commands.index_by_txt_file_command')
+    @patch('intezer_analyze_cli.commands.analyze_by_txt_file_command')
+    def test_run_jobs_runs_all_jobs_and_writes_report(self,
+                                                      analyze_by_txt_file_command_mock,
+                                                      index_by_txt_file_command_mock):
+        # Arrange
+        index_by_txt_file_command_mock.side_effect = Exception('Some error')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            job_file_path = os.path.join(temp_dir, 'jobs.json')
+            report_path = os.path.join(temp_dir, 'report.json')
+            with open(job_file_path, 'w') as f:
+                json.dump({'jobs': [{'command': 'analyze-by-list', 'path': '/tmp/hashes.txt'},
+                                    {'command': 'index_by_list', 'path': '/tmp/hashes.txt', 'index_as': 'trusted'}]},
+                          f)
+
+            # Act
+            result = self.runner.invoke(cli.main_cli, ['run-jobs', job_file_path, '--report', report_path])
+
+            # Assert
+            self.assertEqual(result.exit_code, 0, result.exception)
+            self.create_global_api_patcher_mock.assert_called_once()
+            analyze_by_txt_file_command_mock.assert_called_once_with(path='/tmp/hashes.txt')
+            index_by_txt_file_command_mock.assert_called_once_with(path='/tmp/hashes.txt',
+                                                                   index_as='trusted',
+                                                                   family_name=None)
+            with open(report_path) as f:
+                report = json.load(f)
+            self.assertEqual(report['succeeded'], 1)
+            self.assertEqual(report['failed'], 1)
+            self.assertEqual([job['status'] for job in report['jobs']], ['succeeded', 'failed'])
+
+    @patch('intezer_analyze_cli.commands.analyze_by_txt_file_command')
+    def test_run_jobs_fails_the_job_with_failed_items_and_holds_its_output(self, analyze_by_txt_file_command_mock):
+        # Arrange
+        def analyze_by_txt_file_command(path: str):
+            for line_number in range(3):
+                click.echo(f'{path} line {line_number}')
+                time.sleep(0.01)
+            results.record_result('analyze-by-list', path, 'failed' if path == 'failed.txt' else 'success')
+
+        analyze_by_txt_file_command_mock.side_effect = analyze_by_txt_file_command
+        with tempfile.TemporaryDirectory() as temp_dir:
+            job_file_path = os.path.join(temp_dir, 'jobs.json')
+            report_path = os.path.join(temp_dir, 'report.json')
+            with open(job_file_path, 'w') as f:
+                json.dump([{'command': 'analyze-by-list', 'path': 'failed.txt'},
+                           {'command': 'analyze-by-list', 'path': 'succeeded.txt'}], f)
+
+            # Act
+            result = self.runner.invoke(cli.main_cli, ['run-jobs', job_file_path, '--report', report_path])
+
+            # Assert
+            self.assertEqual(result.exit_code, 0, result.exception)
+            with open(report_path) as f:
+                report = json.load(f)
+            self.assertEqual([(job['status'], job['results']) for job in report['jobs']],
+                             [('failed', dict(failed=1)), ('succeeded', dict(success=1))])
+            output_lines = result.output.splitlines()
+            for path in ('failed.txt', 'succeeded.txt'):
+                first_line_index = output_lines.index(f'{path} line 0')
+                self.assertEqual(output_lines[first_line_index:first_line_index + 3],
+                                 [f'{path} line {line_number}' for line_number in range(3)])
+
+    def test_run_jobs_with_unknown_option_aborts(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as temp_dir:
+            job_file_path = os.path.join(temp_dir, 'jobs.json')
+            with open(job_file_path, 'w') as f:
+                json.dump([{'command': 'index', 'path': '/tmp', 'index_as': 'trusted', 'family': 'name'},
+                           {'command': 'index', 'path': '/tmp'}], f)
+
+            # Act
+            result = self.runner.invoke(cli.main_cli, ['run-jobs', job_file_path])
+
+            # Assert
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn(b'has unknown options for index: family', result.stdout_bytes)
+            self.create_global_api_patcher_mock.assert_not_called()
+
+    def test_run_jobs_with_unknown_command_aborts(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as temp_dir:
+            job_file_path = os.path.join(temp_dir, 'jobs.json')
+            with open(job_file_path, 'w') as f:
+                json.dump([{'command': 'unknown', 'path': '/tmp'}], f)
+
+            # Act
+            result = self.runner.invoke(cli.main_cli, ['run-jobs', job_file_path])
+
+            # Assert
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn(b'has unknown command', result.stdout_bytes)
+            self.create_global_api_patcher_mock.assert_not_called()
@@ -1,7 +1,10 @@
+import csv
+import json
 import os
 import tempfile
 import unittest.mock
 import uuid
+import zipfile
 from pathlib import Path
 from tempfile import tempdir
 from unittest.mock import MagicMock
@@ -10,10 +13,22 @@ from unittest.mock import patch
 import click.exceptions
 import intezer_sdk.endpoint_analysis
 import intezer_sdk.base_analysis
+from intezer_sdk import consts as sdk_consts
 from intezer_sdk import errors as sdk_errors
 import intezer_analyze_cli.key_store as key_store
 from intezer_analyze_cli import commands
+from intezer_analyze_cli import deadlines
+from intezer_analyze_cli import failures
+from intezer_analyze_cli import hash_index
+from intezer_analyze_cli import metrics
+from intezer_analyze_cli import profiles
+from intezer_analyze_cli import results
+from intezer_analyze_cli import sharding
+from intezer_analyze_cli import utilities
+from intezer_analyze_cli import walk_filters
+from intezer_analyze_cli import work_queue
 from intezer_analyze_cli.cli import create_global_api
+from intezer_analyze_cli.config import default_config
 from tests.unit.cli_test import CliSpec
 
 
@@ -31,6 +46,12 @@ class CommandsAnalyzeSpec(CliSpec):
         self.send_analyze_mock = send_analyze_patcher.start()
         self.addCleanup(send_analyze_patcher.stop)
 
+        # The failures files are written to the working directory
+        working_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(working_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_dir.name)
+
     def test_analyze_exec_file(self):
         # Arrange
         create_global_api()
@@ -78,6 +99,471 @@ class CommandsAnalyzeSpec(CliSpec):
         # Assert
         self.send_analyze_mock.assert_not_called()
 
+    def test_analyze_paths_stream_sends_every_file(self):
+        # Arrange
+        create_global_api()
+        dir_name = Path(__file__).parent.parent.absolute()
+        file_paths = (file_path for file_path in [__file__,
+                                                  os.path.join(dir_name, 'resources/sample_1.exe.sample'),
+                                                  os.path.join(dir_name, 'resources/missing_file.exe')])
+
+        # Act
+        commands.analyze_paths_stream_command(file_paths, None, None, 'file')
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+
+    def test_analyze_paths_stream_records_the_results_of_its_shard(self):
+        # Arrange
+        create_global_api()
+        dir_name = Path(__file__).parent.parent.absolute()
+        file_names = ('sample_1.exe.sample', 'doc_sample_file.doc', 'missing_file.exe')
+        file_paths = [os.path.join(dir_name, 'resources', file_name) for file_name in file_names] + [__file__]
+        shard = sharding.Shard(1, 2)
+        with tempfile.TemporaryDirectory() as results_directory_path:
+            results_path = os.path.join(results_directory_path, 'results.jsonl')
+
+            # Act
+            with results.ResultsWriter(results_path):
+                commands.analyze_paths_stream_command(iter(file_paths), None, None, 'file', shard=shard)
+
+            with open(results_path) as results_file:
+                recorded_results = [json.loads(line) for line in results_file]
+
+        # Assert
+        self.assertEqual(sorted(result['item'] for result in recorded_results),
+                         sorted(file_path for file_path in file_paths if shard.contains(file_path)))
+        self.assertEqual(self.send_analyze_mock.call_count,
+                         sum(result['status'] == 'success' for result in recorded_results))
+
+    @patch('intezer_sdk.analysis.FileAnalysis.send')
+    def test_analyze_hashes_stream_continues_after_missing_hash(self, send_mock):
+        # Arrange
+        create_global_api()
+        send_mock.side_effect = [sdk_errors.HashDoesNotExistError(MagicMock()), None]
+
+        # Act
+        with tempfile.TemporaryDirectory() as cache_directory_path:
+            commands.analyze_hashes_stream_command(iter(['a' * 64, 'b' * 64]),
+                                                   max_concurrent=1,
+                                                   cache_path=os.path.join(cache_directory_path, 'cache.sqlite'))
+
+        # Assert
+        self.assertEqual(send_mock.call_count, 2)
+
+    @patch('intezer_analyze_cli.commands.send_hash_for_analysis', return_value='analysis-id')
+    def test_analyze_by_list_uses_cached_analyses_only_with_max_age(self, send_mock):
+        # Arrange
+        create_global_api()
+        self.addCleanup(os.chdir, os.getcwd())
+        with tempfile.TemporaryDirectory() as directory_path:
+            hashes_path = os.path.join(directory_path, 'hashes.txt')
+            with open(hashes_path, 'w') as hashes_file:
+                hashes_file.write('a' * 64 + '\n' + 'b' * 64 + '\n')
+            cache_path = os.path.join(directory_path, 'cache.sqlite')
+            os.chdir(directory_path)
+
+            # Act
+            commands.analyze_by_txt_file_command(hashes_path, cache_path=cache_path)
+            commands.analyze_by_txt_file_command(hashes_path, max_age=3600, cache_path=cache_path)
+            commands.analyze_by_txt_file_command(hashes_path, cache_path=cache_path)
+
+        # Assert
+        self.assertEqual(send_mock.call_count, 4)
+
+    def test_analyze_directory_applies_walk_filter(self):
+        # Arrange
+        create_global_api()
+        walk_filter = walk_filters.WalkFilter(exclude=('*.log',), prune=('skipped',))
+        with tempfile.TemporaryDirectory() as directory_path:
+            os.mkdir(os.path.join(directory_path, 'skipped'))
+            for relative_path in ('a.exe', 'b.log', os.path.join('skipped', 'c.exe')):
+                with open(os.path.join(directory_path, relative_path), 'wb') as file:
+                    file.write(b'MZ')
+
+            # Act
+            commands.analyze_directory_command(directory_path, None, None, 'file', True, walk_filter=walk_filter)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 1)
+
+    def test_analyze_directory_does_not_send_files_in_hash_lists(self):
+        # Arrange
+        create_global_api()
+        with tempfile.TemporaryDirectory() as directory_path:
+            for file_name in ('good.exe', 'bad.exe', 'new.exe'):
+                with open(os.path.join(directory_path, file_name), 'wb') as file:
+                    file.write(b'MZ' + file_name.encode())
+            hashes_directory_path = os.path.join(directory_path, '.hashes')
+            os.mkdir(hashes_directory_path)
+            hash_lists = hash_index.HashLists()
+            for file_name, lists in (('good.exe', hash_lists.allowlists), ('bad.exe', hash_lists.blocklists)):
+                list_path = os.path.join(hashes_directory_path, f'{file_name}.txt')
+                with open(list_path, 'w') as list_file:
+                    list_file.write(utilities.get_file_sha256(os.path.join(directory_path, file_name)))
+                index_path = os.path.join(hashes_directory_path, f'{file_name}.idx')
+                hash_index.build_hash_index([list_path], index_path)
+                lists.append(hash_index.HashIndex(index_path))
+
+            # Act
+            with patch('click.echo') as mock_echo:
+                commands.analyze_directory_command(directory_path, None, None, 'file', True, hash_lists=hash_lists)
+            hash_lists.close()
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 1)
+        mock_echo.assert_any_call('1 files are in the allowlist and were not sent')
+        mock_echo.assert_any_call('1 files are in the blocklist and were not sent')
+
+    def test_analyze_modes_do_not_send_files_in_hash_lists(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = lambda *args, **kwargs: None
+        with tempfile.TemporaryDirectory() as directory_path, tempfile.TemporaryDirectory() as work_directory_path:
+            files_paths = []
+            for file_name in ('good.exe', 'bad.exe', 'new.exe'):
+                files_paths.append(os.path.join(directory_path, file_name))
+                with open(files_paths[-1], 'wb') as file:
+                    file.write(b'MZ' + file_name.encode())
+            list_path = os.path.join(work_directory_path, 'blocklist.txt')
+            with open(list_path, 'w') as list_file:
+                list_file.write(utilities.get_file_sha256(files_paths[1]))
+            index_path = os.path.join(work_directory_path, 'blocklist.idx')
+            hash_index.build_hash_index([list_path], index_path)
+            hash_lists = hash_index.HashLists()
+            hash_lists.blocklists.append(hash_index.HashIndex(index_path))
+            modes = dict(
+                stdin=lambda: commands.analyze_paths_stream_command(iter(files_paths),
+                                                                    None,
+                                                                    None,
+                                                                    'file',
+                                                                    hash_lists=hash_lists),
+                dedup=lambda: commands.analyze_directory_dedup_command(
+                    directory_path, None, None, 'file', True, os.path.join(work_directory_path, 'mapping.csv'),
+                    hash_lists=hash_lists),
+                incremental=lambda: commands.analyze_directory_incremental_command(
+                    directory_path, None, None, 'file', True, os.path.join(work_directory_path, 'index.sqlite'),
+                    hash_lists=hash_lists),
+                expand_archives=lambda: commands.analyze_expanding_archives_command(directory_path,
+                                                                                    None,
+                                                                                    None,
+                                                                                    'file',
+                                                                                    True,
+                                                                                    hash_lists=hash_lists))
+
+            for mode, run in modes.items():
+                with self.subTest(mode=mode):
+                    self.send_analyze_mock.reset_mock()
+
+                    # Act
+                    with patch('click.echo') as mock_echo:
+                        run()
+
+                    # Assert
+                    self.assertEqual(self.send_analyze_mock.call_count, 2)
+                    mock_echo.assert_any_call('1 files are in the blocklist and were not sent')
+            hash_lists.close()
+
+    def test_analyze_directory_dry_run_estimates_without_sending(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory_path:
+            with open(os.path.join(directory_path, 'a.exe'), 'wb') as file:
+                file.write(b'MZ' + b'\0' * 1022)
+            with open(os.path.join(directory_path, 'b.txt'), 'w') as file:
+                file.write('text')
+
+            # Act
+            with patch('click.echo') as mock_echo:
+                commands.analyze_directory_command(directory_path, True, None, 'file', True, dry_run=True)
+
+        # Assert
+        self.send_analyze_mock.assert_not_called()
+        mock_echo.assert_any_call('1 analyses would be sent, 1.0KB would be uploaded')
+        mock_echo.assert_any_call('1 unsupported files would not be sent')
+        mock_echo.assert_any_call('Projected quota use: 1 analyses')
+
+    def test_analyze_expanding_archives_sends_archive_members(self):
+        # Arrange
+        create_global_api()
+        with tempfile.TemporaryDirectory() as directory_path:
+            with zipfile.ZipFile(os.path.join(directory_path, 'evidence.zip'), 'w') as archive:
+                archive.writestr('a.exe', b'MZ' + b'\0' * 10)
+                archive.writestr('b.exe', b'MZ' + b'\1' * 10)
+                archive.writestr('readme.txt', b'text')
+            with open(os.path.join(directory_path, 'c.exe'), 'wb') as file:
+                file.write(b'MZ')
+
+            # Act
+            commands.analyze_expanding_archives_command(directory_path, None, None, 'file', True)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 3)
+
+    def test_analyze_directory_dedup_sends_unique_files_once(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = lambda *args, **kwargs: None
+        with tempfile.TemporaryDirectory() as directory_path:
+            for file_name, content in (('a.exe', b'MZ1'), ('copy_of_a.exe', b'MZ1'), ('b.exe', b'MZ2')):
+                with open(os.path.join(directory_path, file_name), 'wb') as file:
+                    file.write(content)
+            os.link(os.path.join(directory_path, 'b.exe'), os.path.join(directory_path, 'link_to_b.exe'))
+            mapping_path = os.path.join(directory_path, 'mapping.csv')
+
+            # Act
+            commands.analyze_directory_dedup_command(directory_path, None, None, 'file', True, mapping_path)
+
+            with open(mapping_path) as mapping_file:
+                mapping = list(csv.DictReader(mapping_file))
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+        self.assertEqual([os.path.basename(row['file_path']) for row in mapping],
+                         ['a.exe', 'b.exe', 'copy_of_a.exe', 'link_to_b.exe'])
+        self.assertEqual(mapping[0]['sha256'], mapping[2]['sha256'])
+        self.assertEqual(mapping[1]['sha256'], mapping[3]['sha256'])
+        self.assertTrue(all(row['status'] == 'success' for row in mapping))
+
+    def test_analyze_directory_incremental_sends_only_new_and_changed_files(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = lambda *args, **kwargs: None
+        with tempfile.TemporaryDirectory() as directory_path, tempfile.TemporaryDirectory() as index_directory_path:
+            index_path = os.path.join(index_directory_path, 'file-index.sqlite')
+            files_paths = [os.path.join(directory_path, file_name) for file_name in ('a.exe', 'b.exe', 'c.exe')]
+            for file_path in files_paths:
+                with open(file_path, 'wb') as file:
+                    file.write(b'MZ' + file_path.encode())
+            commands.analyze_directory_incremental_command(directory_path, None, None, 'file', True, index_path)
+            self.send_analyze_mock.reset_mock()
+
+            # Only touch the first file, change the content of the second one and add a new file
+            os.utime(files_paths[0], ns=(0, 0))
+            with open(files_paths[1], 'ab') as file:
+                file.write(b'changed')
+            with open(os.path.join(directory_path, 'd.exe'), 'wb') as file:
+                file.write(b'MZ new')
+
+            # Act
+            with patch('intezer_analyze_cli.utilities.get_file_sha256',
+                       wraps=utilities.get_file_sha256) as get_file_sha256_mock:
+                commands.analyze_directory_incremental_command(directory_path, None, None, 'file', True, index_path)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+        self.assertEqual(sorted(os.path.basename(call.args[0]) for call in get_file_sha256_mock.call_args_list),
+                         ['a.exe', 'b.exe', 'd.exe'])
+
+    def test_analyze_directory_counts_run_metrics(self):
+        # Arrange
+        create_global_api()
+        run_metrics = metrics.RunMetrics('analyze')
+        with tempfile.TemporaryDirectory() as directory_path:
+            for file_name, content in (('a.exe', b'MZ' + b'\0' * 8), ('b.txt', b'text')):
+                with open(os.path.join(directory_path, file_name), 'wb') as file:
+                    file.write(content)
+
+            # Act
+            with patch('click.echo'), run_metrics:
+                commands.analyze_directory_command(directory_path, True, None, 'file', True)
+
+        # Assert
+        snapshot = run_metrics.snapshot()
+        self.assertEqual((snapshot['submitted'], snapshot['succeeded'], snapshot['unsupported']), (1, 1, 1))
+        self.assertEqual(snapshot['bytes_sent'], 10)
+
+    def test_analyze_directory_watch_sends_new_files(self):
+        # Arrange
+        create_global_api()
+        dir_name = Path(__file__).parent.parent.absolute()
+        exec_file_path = __file__
+        doc_file_path = os.path.join(dir_name, 'resources/doc_sample_file.doc')
+
+        with patch('intezer_analyze_cli.watcher.DirectoryWatcher.watch',
+                   return_value=(batch for batch in [[exec_file_path], [doc_file_path]])):
+            # Act
+            commands.analyze_directory_watch_command(str(dir_name), None, None, 'file', settle_time=0)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+
+    def test_analyze_paths_stream_writes_failed_files_to_a_failures_file(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = [sdk_errors.ServerError(500, MagicMock()), None]
+        files_paths = [__file__, os.path.join(os.path.dirname(__file__), '__init__.py')]
+
+        # Act
+        with patch('click.echo'):
+            commands.analyze_paths_stream_command(iter(files_paths), None, None, 'file', max_concurrent=1)
+
+        # Assert
+        failures_paths = [file_name for file_name in os.listdir('.') if file_name.startswith('intezer-failures-')]
+        self.assertEqual(len(failures_paths), 1)
+        with open(failures_paths[0]) as failures_file:
+            failed_items = [json.loads(line) for line in failures_file]
+        self.assertEqual([(failed_item['command'], failed_item['item']) for failed_item in failed_items],
+                         [('analyze', __file__)])
+
+    def test_analyze_directory_watch_stops_when_out_of_quota(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = sdk_errors.InsufficientQuota(MagicMock())
+
+        with patch('intezer_analyze_cli.watcher.DirectoryWatcher.watch',
+                   return_value=(batch for batch in [[__file__], [__file__]])):
+            # Act + Assert
+            with self.assertRaises(sdk_errors.InsufficientQuota):
+                commands.analyze_directory_watch_command(os.path.dirname(__file__), None, None, 'file')
+
+        self.assertEqual(self.send_analyze_mock.call_count, 1)
+
+class CommandRetryFailedSpec(CliSpec):
+    def setUp(self):
+        super(CommandRetryFailedSpec, self).setUp()
+
+        create_global_api_patcher = patch('intezer_analyze_cli.commands.login')
+        self.create_global_api_patcher_mock = create_global_api_patcher.start()
+        self.addCleanup(create_global_api_patcher.stop)
+
+        key_store.get_stored_api_key = MagicMock(return_value='api_key')
+
+        send_analyze_patcher = patch('intezer_sdk.analysis.FileAnalysis.send')
+        self.send_analyze_mock = send_analyze_patcher.start()
+        self.addCleanup(send_analyze_patcher.stop)
+
+        working_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(working_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_dir.name)
+        self.directory_path = os.path.join(working_dir.name, 'files')
+        os.mkdir(self.directory_path)
+        for file_name in ('a.exe', 'b.exe'):
+            with open(os.path.join(self.directory_path, file_name), 'wb') as file:
+                file.write(b'MZ' + file_name.encode())
+
+    def _get_failures_paths(self):
+        return sorted(os.path.abspath(file_name) for file_name in os.listdir('.') if file_name.endswith('.jsonl'))
+
+    def test_retry_failed_retries_only_failed_items(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = [None, sdk_errors.IntezerError('Server error')]
+        with patch('click.echo'):
+            commands.analyze_directory_command(self.directory_path, True, None, 'file', True)
+        [failures_path] = self._get_failures_paths()
+        with open(failures_path) as failures_file:
+            [failure] = [json.loads(line) for line in failures_file]
+        self.send_analyze_mock.reset_mock(side_effect=True)
+
+        # Act
+        with patch('click.echo') as mock_echo:
+            commands.retry_failed_command(failures_path, max_concurrent=2)
+
+        # Assert
+        self.assertEqual((failure['command'], failure['error_class'], failure['attempts']),
+                         ('analyze', 'IntezerError', 1))
+        self.assertEqual(failure['options'], dict(no_unpacking=True, no_static_extraction=None, code_item_type='file'))
+        self.assertEqual(self.send_analyze_mock.call_count, 1)
+        self.assertEqual(self._get_failures_paths(), [failures_path])
+        mock_echo.assert_called_with('1 items were retried successfully, 0 items failed again')
+
+    def test_retry_failed_writes_items_that_failed_again(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = sdk_errors.IntezerError('Server error')
+        failures_path = os.path.abspath('failures.jsonl')
+        with failures.FailuresWriter('analyze', failures_path, no_unpacking=True) as failures_writer, \
+                patch('click.echo'):
+            failures_writer.record(os.path.join(self.directory_path, 'a.exe'), 'Server error', attempts=2)
+
+        # Act
+        with patch('click.echo'):
+            commands.retry_failed_command(failures_path)
+
+        # Assert
+        [retry_failures_path] = [path for path in self._get_failures_paths() if path != failures_path]
+        [failure] = failures.read_failures(retry_failures_path)
+        self.assertEqual((failure['command'], failure['attempts'], failure['options']),
+                         ('analyze', 3, dict(no_unpacking=True)))
+
+
+class CommandDeadlineSpec(CliSpec):
+    def setUp(self):
+        super(CommandDeadlineSpec, self).setUp()
+
+        create_global_api_patcher = patch('intezer_analyze_cli.commands.login')
+        self.create_global_api_patcher_mock = create_global_api_patcher.start()
+        self.addCleanup(create_global_api_patcher.stop)
+
+        key_store.get_stored_api_key = MagicMock(return_value='api_key')
+
+        working_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(working_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_dir.name)
+        self.hashes_path = os.path.join(working_dir.name, 'hashes.txt')
+        self.hashes = [character * 64 for character in 'abc']
+        with open(self.hashes_path, 'w') as hashes_file:
+            hashes_file.write('\n'.join(self.hashes))
+
+    @patch('intezer_sdk.index.Index.send')
+    def test_index_by_list_records_pending_hashes_when_the_deadline_passes(self, _):
+        # Arrange
+        create_global_api()
+
+        # Act
+        with patch('intezer_analyze_cli.commands._wait_for_index',
+                   side_effect=[None, deadlines.DeadlineExceeded()]), \
+                patch('click.echo'), \
+                self.assertRaises(deadlines.DeadlineExceeded):
+            commands.index_by_txt_file_command(self.hashes_path, 'trusted', None)
+
+        # Assert
+        [failures_path] = [file_name for file_name in os.listdir('.') if file_name.endswith('.jsonl')]
+        not_done_failures = failures.read_failures(failures_path)
+        self.assertEqual([failure['item'] for failure in not_done_failures], self.hashes[1:])
+        self.assertEqual({failure['error_class'] for failure in not_done_failures}, {'DeadlineExceeded'})
+
+    @patch('intezer_sdk.index.Index.send')
+    def test_index_directory_records_pending_files_when_the_deadline_passes(self, _):
+        # Arrange
+        create_global_api()
+        directory_path = os.path.join(os.getcwd(), 'files')
+        os.mkdir(directory_path)
+        for file_name in ('a.exe', 'b.exe', 'c.exe'):
+            with open(os.path.join(directory_path, file_name), 'wb') as file:
+                file.write(b'MZ' + file_name.encode())
+
+        # Act
+        with patch('intezer_analyze_cli.commands._wait_for_index',
+                   side_effect=[None, deadlines.DeadlineExceeded()]), \
+                patch.dict(default_config.pipeline_workers, poll=1), \
+                patch('click.echo'), \
+                self.assertRaises(deadlines.DeadlineExceeded):
+            commands.index_directory_command(directory_path, 'trusted', None, True)
+
+        # Assert
+        [failures_path] = [file_name for file_name in os.listdir('.') if file_name.endswith('.jsonl')]
+        not_done_failures = failures.read_failures(failures_path)
+        self.assertEqual(len(not_done_failures), 2)
+        self.assertEqual({failure['error_class'] for failure in not_done_failures}, {'DeadlineExceeded'})
+
+    def test_wait_for_index_fails_after_the_operation_timeout(self):
+        # Arrange
+        index = MagicMock(status=sdk_consts.IndexStatusCode.CREATED, index_id='index-id')
+        index.check_status.return_value = sdk_consts.IndexStatusCode.IN_PROGRESS
+
+        # Act
+        with patch.object(default_config, 'operation_timeout', 0.05), \
+                patch.object(default_config, 'operation_poll_interval', 0.01), \
+                self.assertRaises(deadlines.OperationTimeoutError):
+            commands._wait_for_index(index)
+
+        # Assert
+        self.assertGreater(index.check_status.call_count, 1)
+
+
 class CommandEndpointAnalysisSpec(CliSpec):
     def setUp(self):
         super(CommandEndpointAnalysisSpec, self).setUp()
@@ -170,6 +656,21 @@ class CommandEndpointAnalysisSpec(CliSpec):
             # Assert
             self.assertTrue(self.send_analyze_mock.call_count == 2)
 
+    def test_offline_scan_upload_multiple_skips_the_scans_of_the_walk_filter(self):
+        # Arrange
+        create_global_api()
+        with tempfile.TemporaryDirectory() as root:
+            for scan_directory_name in ('host-1', 'host-2', 'test-host'):
+                os.makedirs(os.path.join(root, scan_directory_name))
+
+            # Act
+            commands.upload_multiple_offline_endpoint_scans(
+                root,
+                walk_filter=walk_filters.WalkFilter(include=('host-*', 'test-*'), prune=('test-*',)))
+
+            # Assert
+            self.assertEqual(self.send_analyze_mock.call_count, 2)
+
     def test_offline_scan_upload_multiple_but_some_were_sent(self):
         # Arrange
         create_global_api()
@@ -225,6 +726,22 @@ class CommandUploadPhishingSpec(CliSpec):
         # Assert
         self.assertEqual(self.send_phishing_mock.call_count, 2)
 
+    def test_send_email_files_from_watched_directory(self):
+        # Arrange
+        create_global_api()
+        dir_name = Path(__file__).parent.parent.absolute()
+        directory_path = os.path.join(dir_name, 'resources/emails_directory')
+        email_paths = [os.path.join(root, file_name)
+                       for root, _, files in os.walk(directory_path) for file_name in files]
+
+        with patch('intezer_analyze_cli.watcher.DirectoryWatcher.watch',
+                   return_value=(batch for batch in [email_paths])):
+            # Act
+            commands.send_phishing_emails_watch_command(directory_path)
+
+        # Assert
+        self.assertEqual(self.send_phishing_mock.call_count, 2)
+
 
 class CommandAlertsSpec(CliSpec):
     def setUp(self):
@@ -236,6 +753,12 @@ class CommandAlertsSpec(CliSpec):
 
         key_store.get_stored_api_key = MagicMock(return_value='api_key')
 
+        # Failures files are written to the current directory
+        working_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(working_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_dir.name)
+
     def test_notify_alerts_from_csv_command_handles_invalid_csv_no_id_column(self):
         # Arrange
         create_global_api()
@@ -360,7 +883,8 @@ class CommandAlertsSpec(CliSpec):
             # Assert
             mock_alert.notify.assert_called_once()
             mock_echo.assert_any_call('Alert test-alert-1 not found')
-            mock_echo.assert_any_call('1 alerts failed to notify')
+            mock_echo.assert_any_call('1 alerts were not found')
+            self.assertEqual([file_name for file_name in os.listdir('.') if file_name.endswith('.jsonl')], [])
 
     @patch('intezer_analyze_cli.commands.Alert')
     @patch('click.progressbar')
@@ -391,3 +915,283 @@ class CommandAlertsSpec(CliSpec):
             mock_echo.assert_any_call('Alert test-alert-1 is still in progress')
             mock_echo.assert_any_call('1 alerts failed to notify')
 
+
+    @patch('intezer_analyze_cli.commands.Alert')
+    def test_notify_alerts_from_csv_command_records_results(self, mock_alert_class):
+        # Arrange
+        create_global_api()
+        mock_alert_class.return_value.notify.return_value = ['email']
+        results_path = os.path.abspath('results.jsonl')
+        csv_file_path = os.path.abspath('alerts.csv')
+        with open(csv_file_path, 'w') as f:
+            f.write('id,environment\ntest-alert-1,production\ntest-alert-2,staging\n')
+
+        # Act
+        with patch('click.echo'), results.ResultsWriter(results_path):
+            commands.notify_alerts_from_csv_command(csv_file_path)
+
+        # Assert
+        with open(results_path) as results_file:
+            recorded_results = [json.loads(line) for line in results_file]
+        self.assertEqual(sorted((result['item'], result['status'], result['environment'])
+                                for result in recorded_results),
+                         [('test-alert-1', 'success', 'production'), ('test-alert-2', 'success', 'staging')])
+
+    def test_count_csv_rows_counts_multi_line_fields_once(self):
+        # Arrange
+        csv_file_path = os.path.abspath('alerts.csv')
+        with open(csv_file_path, 'w', newline='') as f:
+            f.write('id,environment,note\r\nalert-1,production,"first line\nsecond line"\r\nalert-2,staging,\r\n')
+
+        # Act
+        rows_number = commands._count_csv_rows(csv_file_path)
+
+        # Assert
+        self.assertEqual(rows_number, 2)
+
+    @patch('intezer_analyze_cli.commands.Alert')
+    @patch('intezer_analyze_cli.progress.ProgressRenderer.update', autospec=True)
+    def test_notify_alerts_from_csv_command_skips_duplicated_alerts(self, mock_progress_update, mock_alert_class):
+        # Arrange
+        create_global_api()
+
+        mock_alert = MagicMock()
+        mock_alert.notify.return_value = ['email']
+        mock_alert_class.return_value = mock_alert
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, 'test_alerts.csv')
+            with open(csv_file_path, 'w') as f:
+                f.write('id,environment\n'
+                        'test-alert-1,production\n'
+                        'test-alert-1,production\n'
+                        'test-alert-1,staging\n'
+                        'test-alert-2,production\n')
+
+            # Act
+            with patch('click.echo') as mock_echo:
+                commands.notify_alerts_from_csv_command(csv_file_path, max_concurrent=2)
+
+            # Assert
+            self.assertEqual(mock_alert_class.call_count, 3)
+            mock_echo.assert_any_call('3 alerts notified successfully')
+            self.assertEqual(sum(call.args[1] for call in mock_progress_update.call_args_list), 4)
+
+    @patch('intezer_analyze_cli.commands.Alert')
+    @patch('click.progressbar')
+    def test_notify_alerts_from_csv_command_retries_alert_in_progress(self, mock_progressbar, mock_alert_class):
+        # Arrange
+        create_global_api()
+
+        # Mock progress bar
+        mock_progress_context = MagicMock()
+        mock_progressbar.return_value.__enter__.return_value = mock_progress_context
+
+        mock_alert = MagicMock()
+        mock_alert.notify.side_effect = [sdk_errors.AlertInProgressError('test-alert-1'), ['email']]
+        mock_alert_class.return_value = mock_alert
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, 'test_alerts.csv')
+            with open(csv_file_path, 'w') as f:
+                f.write('id,environment\ntest-alert-1,production\n')
+
+            # Act
+            with patch('click.echo') as mock_echo:
+                commands.notify_alerts_from_csv_command(csv_file_path,
+                                                        in_progress_deadline=5,
+                                                        in_progress_retry_interval=0.01)
+
+            # Assert
+            self.assertEqual(mock_alert.notify.call_count, 2)
+            mock_echo.assert_any_call('1 alerts notified successfully')
+
+    @patch('intezer_analyze_cli.commands.Alert')
+    @patch('click.progressbar')
+    def test_notify_alerts_from_csv_command_writes_replay_file_at_deadline(self, mock_progressbar, mock_alert_class):
+        # Arrange
+        create_global_api()
+
+        # Mock progress bar
+        mock_progress_context = MagicMock()
+        mock_progressbar.return_value.__enter__.return_value = mock_progress_context
+
+        mock_alert = MagicMock()
+        mock_alert.notify.side_effect = sdk_errors.AlertInProgressError('test-alert-1')
+        mock_alert_class.return_value = mock_alert
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, 'test_alerts.csv')
+            replay_file_path = os.path.join(temp_dir, 'replay.csv')
+            with open(csv_file_path, 'w') as f:
+                f.write('id,environment\ntest-alert-1,production\n')
+
+            # Act
+            with patch('click.echo') as mock_echo:
+                commands.notify_alerts_from_csv_command(csv_file_path,
+                                                        in_progress_deadline=0.05,
+                                                        in_progress_retry_interval=0.01,
+                                                        replay_file_path=replay_file_path)
+
+            # Assert
+            self.assertGreater(mock_alert.notify.call_count, 1)
+            with open(replay_file_path) as f:
+                self.assertEqual(f.read().splitlines(), ['id,environment', 'test-alert-1,production'])
+            self.assertNotIn(unittest.mock.call('1 alerts failed to notify'), mock_echo.call_args_list)
+
+
+class CommandLoginSpec(CliSpec):
+    @patch('intezer_analyze_cli.commands.api')
+    def test_login_deletes_the_cached_tokens_of_the_new_and_the_replaced_key(self, _):
+        # Act
+        with patch('intezer_analyze_cli.key_store.get_stored_api_key', return_value='old_api_key'), \
+                patch('intezer_analyze_cli.key_store.store_api_key'), \
+                patch('intezer_analyze_cli.key_store.delete_default_url'), \
+                patch('intezer_analyze_cli.key_store.delete_cached_tokens') as delete_cached_tokens_mock, \
+                patch('click.echo'):
+            commands.login('api_key', None)
+
+        # Assert
+        self.assertEqual(sorted(call[0][0] for call in delete_cached_tokens_mock.call_args_list),
+                         ['api_key', 'old_api_key'])
+
+
+class CommandProfilesSpec(CliSpec):
+    def setUp(self):
+        super(CommandProfilesSpec, self).setUp()
+
+        self.first_api = MagicMock()
+        self.second_api = MagicMock()
+        self.balancer = profiles.ProfileBalancer([profiles.Profile('first', self.first_api, weight=2),
+                                                  profiles.Profile('second', self.second_api, weight=1)])
+        profiles.set_global_balancer(self.balancer)
+        self.addCleanup(profiles.set_global_balancer, None)
+
+    def test_profiles_are_picked_by_weight(self):
+        # Act
+        picked_apis = [profiles.next_api() for _ in range(6)]
+
+        # Assert
+        self.assertEqual(picked_apis.count(self.first_api), 4)
+        self.assertEqual(picked_apis.count(self.second_api), 2)
+
+    @patch('intezer_analyze_cli.commands.FileAnalysis')
+    def test_analyze_file_is_sent_again_with_another_profile_when_out_of_quota(self, file_analysis_mock):
+        # Arrange
+        response = MagicMock()
+        response.json.return_value = {}
+        sent_with_apis = []
+
+        def send_analysis(**kwargs):
+            analysis = MagicMock()
+            if kwargs['api'] is self.first_api:
+                analysis.send.side_effect = sdk_errors.InsufficientQuotaError(response)
+            sent_with_apis.append(kwargs['api'])
+            return analysis
+
+        file_analysis_mock.side_effect = send_analysis
+
+        # Act
+        with patch('click.echo'):
+            commands.analyze_file_command(__file__, None, None, 'file')
+            commands.analyze_file_command(__file__, None, None, 'file')
+
+        # Assert
+        self.assertEqual(sent_with_apis, [self.first_api, self.second_api, self.second_api])
+        self.assertTrue(self.balancer.profiles[0].is_exhausted)
+
+    @patch('intezer_analyze_cli.commands.FileAnalysis')
+    def test_analysis_url_is_of_the_profile_that_sent_it(self, file_analysis_mock):
+        # Arrange
+        self.first_api.base_url = 'https://first.example.com/api/'
+        self.second_api.base_url = 'https://second.example.com/api/'
+        file_analysis_mock.return_value.analysis_id = 'analysis-id'
+
+        # Act
+        with patch('click.echo') as echo_mock:
+            for _ in range(3):
+                commands.analyze_file_command(__file__, None, None, 'file')
+
+        # Assert
+        echoed_messages = [echo_call[0][0] for echo_call in echo_mock.call_args_list]
+        self.assertEqual([message.split(': ')[-1] for message in echoed_messages],
+                         ['https://first.example.com/analyses/analysis-id',
+                          'https://second.example.com/analyses/analysis-id',
+                          'https://first.example.com/analyses/analysis-id'])
+        self.assertEqual(commands._get_history_page_url('file'),
+                         'https://first.example.com/history?tab=file https://second.example.com/history?tab=file')
+
+
+class CommandWorkQueueSpec(CliSpec):
+    def setUp(self):
+        super(CommandWorkQueueSpec, self).setUp()
+
+        create_global_api_patcher = patch('intezer_analyze_cli.commands.login')
+        self.create_global_api_patcher_mock = create_global_api_patcher.start()
+        self.addCleanup(create_global_api_patcher.stop)
+
+        key_store.get_stored_api_key = MagicMock(return_value='api_key')
+
+        send_analyze_patcher = patch('intezer_sdk.analysis.FileAnalysis.send')
+        self.send_analyze_mock = send_analyze_patcher.start()
+        self.addCleanup(send_analyze_patcher.stop)
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory_path = temp_dir.name
+        self.queue_path = os.path.join(self.directory_path, 'queue', 'queue.sqlite')
+        self.files_directory_path = os.path.join(self.directory_path, 'files')
+        os.mkdir(self.files_directory_path)
+        for file_name in ('a.exe', 'b.exe', 'c.exe'):
+            with open(os.path.join(self.files_directory_path, file_name), 'wb') as file:
+                file.write(b'MZ' + file_name.encode())
+
+    def _get_counts(self):
+        with work_queue.WorkQueue(self.queue_path) as queue:
+            return queue.count_by_status()
+
+    def test_worker_processes_enqueued_files(self):
+        # Arrange
+        create_global_api()
+        with patch('click.echo'):
+            commands.enqueue_command(self.queue_path, 'file', self.files_directory_path, no_unpacking=True)
+        os.remove(os.path.join(self.files_directory_path, 'c.exe'))
+
+        # Act
+        with patch('click.echo') as mock_echo:
+            commands.run_worker_command(self.queue_path, max_concurrent=2, poll_interval=0.01, exit_when_empty=True)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+        self.assertEqual(self._get_counts(), dict(pending=0, leased=0, done=2, failed=1))
+        mock_echo.assert_called_with('2 items were processed, 1 items failed')
+
+    def test_worker_retries_failed_item(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = [sdk_errors.IntezerError('Server error'), None]
+        with patch('click.echo'):
+            commands.enqueue_command(self.queue_path, 'file', os.path.join(self.files_directory_path, 'a.exe'))
+
+        # Act
+        with patch('click.echo'), patch.object(default_config, 'work_queue_retry_delay', 0):
+            commands.run_worker_command(self.queue_path, poll_interval=0.01, exit_when_empty=True)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 2)
+        self.assertEqual(self._get_counts()['done'], 1)
+
+    def test_worker_stops_and_releases_items_when_out_of_quota(self):
+        # Arrange
+        create_global_api()
+        self.send_analyze_mock.side_effect = sdk_errors.InsufficientQuota(MagicMock())
+        with patch('click.echo'):
+            commands.enqueue_command(self.queue_path, 'file', self.files_directory_path)
+
+        # Act
+        with patch('click.echo'):
+            commands.run_worker_command(self.queue_path, max_concurrent=1, poll_interval=0.01)
+
+        # Assert
+        self.assertEqual(self.send_analyze_mock.call_count, 1)
+        self.assertEqual(self._get_counts()['pending'], 3)
@@ -0,0 +1,39 @@
+import time
+import unittest
+
+from intezer_analyze_cli import deadlines
+
+
+class DeadlineSpec(unittest.TestCase):
+    def test_parse_duration(self):
+        for value, seconds in (('90', 90), ('45m', 45 * 60), ('2h', 2 * 60 * 60), ('1.5d', 36 * 60 * 60)):
+            with self.subTest(value=value):
+                self.assertEqual(deadlines.parse_duration(value), seconds)
+        with self.assertRaises(ValueError):
+            deadlines.parse_duration('2 weeks')
+
+    def test_sleep_is_cut_short_by_the_deadline(self):
+        # Arrange
+        started_at = time.monotonic()
+
+        # Act
+        with deadlines.Deadline(0.05), self.assertRaises(deadlines.DeadlineExceeded):
+            deadlines.sleep(10)
+
+        # Assert
+        self.assertLess(time.monotonic() - started_at, 5)
+        with deadlines.Deadline(0), self.assertRaises(deadlines.DeadlineExceeded):
+            deadlines.check()
+        self.assertIsNone(deadlines.get_deadline())
+
+    def test_limit_timeout_to_the_time_left(self):
+        # Act
+        without_deadline_timeout = deadlines.limit_timeout(300)
+        with deadlines.Deadline(10):
+            limited_timeout = deadlines.limit_timeout(300)
+            shorter_timeout = deadlines.limit_timeout(5)
+
+        # Assert
+        self.assertEqual(without_deadline_timeout, 300)
+        self.assertLessEqual(limited_timeout, 10)
+        self.assertEqual(shorter_timeout, 5)
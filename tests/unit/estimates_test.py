@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import patch
+
+from intezer_analyze_cli import estimates
+
+
+class CostEstimateSpec(unittest.TestCase):
+    def test_project_duration_from_submissions_and_bytes(self):
+        # Arrange
+        throughput_model = estimates.ThroughputModel(submissions_per_second=2, upload_bytes_per_second=1024)
+        cost_estimate = estimates.CostEstimate('analyses', throughput_model)
+
+        # Act
+        for size in (1024, 2048, 0, 1024):
+            cost_estimate.add_submission(size)
+
+        # Assert
+        self.assertEqual(cost_estimate.submissions, 4)
+        self.assertEqual(cost_estimate.upload_bytes, 4096)
+        self.assertEqual(cost_estimate.projected_duration, 2 + 4)
+
+    def test_echo_prints_quota_use_and_duration(self):
+        # Arrange
+        cost_estimate = estimates.CostEstimate('emails', estimates.ThroughputModel(1, 1024 * 1024))
+        cost_estimate.add_submission(90 * 1024 * 1024)
+        cost_estimate.add_skipped('unsupported files', 3)
+
+        # Act
+        with patch('click.echo') as mock_echo:
+            cost_estimate.echo()
+
+        # Assert
+        mock_echo.assert_any_call('1 emails would be sent, 90.0MB would be uploaded')
+        mock_echo.assert_any_call('3 unsupported files would not be sent')
+        mock_echo.assert_any_call('Projected quota use: 1 emails')
+        self.assertTrue(mock_echo.call_args[0][0].startswith('Projected duration: 0:01:31 at 1 submissions/s'))
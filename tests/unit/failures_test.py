@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from intezer_analyze_cli import failures
+
+
+class FailuresSpec(unittest.TestCase):
+    def setUp(self):
+        super(FailuresSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.failures_path = os.path.join(temp_dir.name, 'failures.jsonl')
+
+    def test_run_without_failures_writes_no_file(self):
+        # Act
+        with patch('click.echo') as mock_echo:
+            with failures.FailuresWriter('analyze', self.failures_path, no_unpacking=True):
+                pass
+
+        # Assert
+        self.assertFalse(os.path.exists(self.failures_path))
+        mock_echo.assert_not_called()
+
+    def test_failures_are_read_back(self):
+        # Act
+        with patch('click.echo') as mock_echo:
+            with failures.FailuresWriter('index-by-list', self.failures_path, index_as='trusted') as failures_writer:
+                failures_writer.record('a' * 64, ValueError('Bad hash'))
+                failures_writer.record('b' * 64, 'Index failed', attempts=2, family_name='family')
+        read_failures = failures.read_failures(self.failures_path, commands=['index-by-list'])
+
+        # Assert
+        self.assertEqual([(f['item'], f['options'], f['error_class'], f['error'], f['attempts'])
+                          for f in read_failures],
+                         [('a' * 64, {'index_as': 'trusted'}, 'ValueError', 'Bad hash', 1),
+                          ('b' * 64, {'index_as': 'trusted', 'family_name': 'family'}, None, 'Index failed', 2)])
+        self.assertIn(f'retry-failed {self.failures_path}', mock_echo.call_args[0][0])
+
+    def test_read_failures_rejects_unknown_command(self):
+        # Arrange
+        with open(self.failures_path, 'w') as failures_file:
+            failures_file.write(json.dumps(dict(command='analyze', item='/file')) + '\n\n')
+            failures_file.write(json.dumps(dict(command='serve', item='/file')) + '\n')
+
+        # Act + Assert
+        with self.assertRaisesRegex(ValueError, 'Line 3'):
+            failures.read_failures(self.failures_path, commands=['analyze'])
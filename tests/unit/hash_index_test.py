@@ -0,0 +1,75 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from intezer_analyze_cli import hash_index
+
+
+class HashIndexSpec(unittest.TestCase):
+    def setUp(self):
+        super(HashIndexSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory_path = temp_dir.name
+        self.index_path = os.path.join(self.directory_path, 'hashes.idx')
+        self.hashes = [hashlib.sha256(str(number).encode()).hexdigest() for number in range(100)]
+
+    def _write_source(self, file_name: str, lines) -> str:
+        source_path = os.path.join(self.directory_path, file_name)
+        with open(source_path, 'w') as source_file:
+            source_file.write('\n'.join(lines) + '\n')
+        return source_path
+
+    def test_build_merges_sorted_runs_and_removes_duplicates(self):
+        # Arrange
+        plain_list_path = self._write_source('plain.txt', self.hashes[:60] + ['', 'not a hash'])
+        csv_list_path = self._write_source('nsrl.csv', [f'"{file_hash.upper()}","file-{index}.dll",1024'
+                                                        for index, file_hash in enumerate(self.hashes[40:])])
+
+        # Act
+        count = hash_index.build_hash_index([plain_list_path, csv_list_path], self.index_path, chunk_size=7)
+
+        # Assert
+        self.assertEqual(count, 100)
+        with hash_index.HashIndex(self.index_path) as index:
+            self.assertEqual(len(index), 100)
+            self.assertTrue(all(file_hash in index for file_hash in self.hashes))
+            self.assertNotIn(hashlib.sha256(b'missing').hexdigest(), index)
+            self.assertNotIn('abc', index)
+
+    def test_empty_index(self):
+        # Arrange
+        source_path = self._write_source('empty.txt', [])
+
+        # Act
+        count = hash_index.build_hash_index([source_path], self.index_path)
+
+        # Assert
+        self.assertEqual(count, 0)
+        with hash_index.HashIndex(self.index_path) as index:
+            self.assertNotIn(self.hashes[0], index)
+
+    def test_text_file_is_not_an_index(self):
+        # Arrange
+        source_path = self._write_source('plain.txt', self.hashes)
+
+        # Act + Assert
+        with self.assertRaises(ValueError):
+            hash_index.HashIndex(source_path)
+
+    def test_blocklist_match_comes_first(self):
+        # Arrange
+        hash_index.build_hash_index([self._write_source('good.txt', self.hashes[:10])], self.index_path)
+        blocklist_path = os.path.join(self.directory_path, 'bad.idx')
+        hash_index.build_hash_index([self._write_source('bad.txt', self.hashes[5:15])], blocklist_path)
+        hash_lists = hash_index.HashLists()
+        hash_lists.allowlists.append(hash_index.HashIndex(self.index_path))
+        hash_lists.blocklists.append(hash_index.HashIndex(blocklist_path))
+        self.addCleanup(hash_lists.close)
+
+        # Act
+        matches = [hash_lists.match(self.hashes[index]) for index in (0, 5, 20)]
+
+        # Assert
+        self.assertEqual(matches, [hash_index.KNOWN_GOOD, hash_index.KNOWN_BAD, None])
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+
+from intezer_analyze_cli import metrics
+
+
+class RunMetricsSpec(unittest.TestCase):
+    def test_track_submission_counts_succeeded_and_failed(self):
+        # Arrange
+        run_metrics = metrics.RunMetrics('analyze')
+
+        # Act
+        with run_metrics.track_submission():
+            in_flight_while_submitting = run_metrics.snapshot()['in_flight']
+        with self.assertRaises(ValueError):
+            with run_metrics.track_submission():
+                raise ValueError()
+        run_metrics.increment('bytes_sent', 10)
+
+        # Assert
+        snapshot = run_metrics.snapshot()
+        self.assertEqual(in_flight_while_submitting, 1)
+        self.assertEqual((snapshot['submitted'], snapshot['succeeded'], snapshot['failed'], snapshot['in_flight']),
+                         (2, 1, 1, 0))
+        self.assertEqual(snapshot['bytes_sent'], 10)
+        self.assertGreater(snapshot['rate'], 0)
+
+    def test_format_prometheus(self):
+        # Arrange
+        run_metrics = metrics.RunMetrics('analyze')
+        run_metrics.increment('unsupported', 3)
+
+        # Act
+        text = run_metrics.format_prometheus()
+
+        # Assert
+        self.assertIn('# TYPE intezer_cli_unsupported_total counter\n', text)
+        self.assertIn('intezer_cli_unsupported_total{command="analyze"} 3\n', text)
+        self.assertIn('intezer_cli_in_flight{command="analyze"} 0\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_global_helpers_are_noop_without_metrics(self):
+        # Act
+        metrics.increment('failed')
+        with metrics.track_submission():
+            pass
+
+        # Assert
+        self.assertIsNone(metrics.get_run_metrics())
+
+
+class StatusReportingSpec(unittest.TestCase):
+    def setUp(self):
+        super(StatusReportingSpec, self).setUp()
+        self.run_metrics = metrics.RunMetrics('upload-endpoint-scans-in-directory')
+        self.run_metrics.increment('quota_errors')
+
+    def test_status_file_is_replaced_with_final_status(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory_path:
+            status_file_path = os.path.join(directory_path, 'status.json')
+            status_file_writer = metrics.StatusFileWriter(status_file_path, self.run_metrics, interval=60)
+
+            # Act
+            status_file_writer.start()
+            with open(status_file_path) as status_file:
+                first_status = json.load(status_file)
+            status_file_writer.stop()
+            with open(status_file_path) as status_file:
+                final_status = json.load(status_file)
+            directory_files = os.listdir(directory_path)
+
+        # Assert
+        self.assertEqual((first_status['finished'], final_status['finished']), (False, True))
+        self.assertEqual(final_status['quota_errors'], 1)
+        self.assertEqual(directory_files, ['status.json'])
+
+    def test_metrics_server_serves_prometheus_text(self):
+        # Arrange
+        metrics_server = metrics.MetricsServer(0, self.run_metrics, host='127.0.0.1')
+        metrics_server.start()
+        self.addCleanup(metrics_server.stop)
+
+        # Act
+        with urllib.request.urlopen(f'http://127.0.0.1:{metrics_server.port}/metrics', timeout=5) as response:
+            content_type = response.headers['Content-Type']
+            text = response.read().decode()
+
+        # Assert
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn('intezer_cli_quota_errors_total{command="upload-endpoint-scans-in-directory"} 1', text)
+
+    def test_metrics_server_listens_on_the_loopback_address_by_default(self):
+        # Act
+        metrics_server = metrics.MetricsServer(0, self.run_metrics)
+        self.addCleanup(metrics_server.server_close)
+
+        # Assert
+        self.assertEqual(metrics_server.server_address[0], '127.0.0.1')
@@ -0,0 +1,51 @@
+import io
+import os
+import unittest
+
+import requests
+
+from intezer_analyze_cli import multipart
+
+
+class MultipartStreamSpec(unittest.TestCase):
+    def test_body_is_encoded_like_requests(self):
+        # Arrange
+        data = {'disable_dynamic_execution': True, 'code_item_type': 'file', 'zip_password': None}
+        body = multipart.MultipartStream(data, {'file': ('a "quoted".exe', io.BytesIO(b'MZ' * 100))}, chunk_size=7)
+        prepared_request = requests.Request('POST',
+                                            'https://analyze.intezer.com/api/v2-0/analyze',
+                                            data=data,
+                                            files={'file': ('a "quoted".exe', io.BytesIO(b'MZ' * 100))}).prepare()
+        requests_boundary = prepared_request.headers['Content-Type'].split('boundary=')[1]
+
+        # Act
+        encoded = body.read()
+
+        # Assert
+        self.assertEqual(encoded, prepared_request.body.replace(requests_boundary.encode(), body.boundary.encode()))
+        self.assertEqual(len(encoded), len(body))
+        self.assertEqual(body.file_size, 200)
+
+    def test_reads_are_bounded_and_body_can_be_read_again(self):
+        # Arrange
+        body = multipart.MultipartStream(None, {'file': ('a.exe', io.BytesIO(b'MZ' * 100))}, chunk_size=16)
+
+        # Act
+        first_chunk = body.read(1024)
+        body.seek(0)
+        first_read = body.read()
+        body.seek(0)
+        second_read = body.read()
+
+        # Assert
+        self.assertEqual(len(first_chunk), 16)
+        self.assertEqual(first_read, second_read)
+
+    def test_non_seekable_stream_is_rejected(self):
+        # Arrange
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, write_fd)
+
+        # Act + Assert
+        with os.fdopen(read_fd, 'rb') as stream, self.assertRaises(ValueError):
+            multipart.MultipartStream(None, {'file': ('a.exe', stream)})
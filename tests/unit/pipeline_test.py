@@ -0,0 +1,223 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from intezer_analyze_cli import pipeline
+from intezer_analyze_cli import progress
+from intezer_analyze_cli import sharding
+
+
+class PipelineSpec(unittest.TestCase):
+    def test_run_passes_items_through_the_stages_and_reports_every_item(self):
+        # Arrange
+        items = [pipeline.PipelineItem(f'/files/{file_name}', '/files') for file_name in ('a.exe', 'b.txt', 'c.exe')]
+        submitted_paths = []
+
+        def classify(item: pipeline.PipelineItem):
+            if not item.path.endswith('.exe'):
+                item.finish('unsupported')
+
+        def submit(item: pipeline.PipelineItem):
+            submitted_paths.append(item.path)
+            item.finish('success', analysis_id=item.file_name)
+
+        reported_items = []
+        items_pipeline = pipeline.Pipeline([pipeline.Stage('classify', classify, workers=2),
+                                            pipeline.Stage('submit', submit, workers=3)],
+                                           reported_items.append,
+                                           queue_size=1)
+
+        # Act
+        items_pipeline.run(items)
+
+        # Assert
+        self.assertEqual(sorted(submitted_paths), ['/files/a.exe', '/files/c.exe'])
+        self.assertEqual(sorted((item.file_name, item.result, item.fields) for item in reported_items),
+                         [('a.exe', 'success', dict(analysis_id='a.exe')),
+                          ('b.txt', 'unsupported', {}),
+                          ('c.exe', 'success', dict(analysis_id='c.exe'))])
+        self.assertEqual(items_pipeline.pending_paths, {})
+
+    def test_bounded_queues_hold_back_the_discovery(self):
+        # Arrange
+        discovered_paths = []
+        release_submit = threading.Event()
+
+        def discover():
+            for index in range(20):
+                discovered_paths.append(str(index))
+                yield pipeline.PipelineItem(str(index), '')
+
+        def submit(item: pipeline.PipelineItem):
+            release_submit.wait()
+            item.finish('success')
+
+        items_pipeline = pipeline.Pipeline([pipeline.Stage('submit', submit, workers=1)], MagicMock(), queue_size=2)
+        run_thread = threading.Thread(target=items_pipeline.run, args=(discover(),))
+
+        # Act
+        run_thread.start()
+        time.sleep(0.3)
+        discovered_while_blocked = len(discovered_paths)
+        release_submit.set()
+        run_thread.join()
+
+        # Assert
+        # The item in the worker, the items in the queue and the item that waits to be put on it
+        self.assertLessEqual(discovered_while_blocked, 4)
+        self.assertEqual(len(discovered_paths), 20)
+
+    def test_items_of_the_submit_stage_are_counted_as_in_flight(self):
+        # Arrange
+        progress_renderer = progress.ProgressRenderer('Sending', stream=io.StringIO(), is_tty=True)
+        submit_started = threading.Event()
+        release_submit = threading.Event()
+
+        def submit(item: pipeline.PipelineItem):
+            submit_started.set()
+            release_submit.wait(5)
+            item.finish('success')
+
+        items_pipeline = pipeline.Pipeline([pipeline.Stage('classify', lambda item: None),
+                                            pipeline.Stage('submit', submit)],
+                                           MagicMock(),
+                                           progress_renderer=progress_renderer)
+        run_thread = threading.Thread(target=items_pipeline.run, args=([pipeline.PipelineItem('a', '')],))
+
+        # Act
+        run_thread.start()
+        submit_started.wait(5)
+        in_flight_while_submitting = progress_renderer.in_flight
+        release_submit.set()
+        run_thread.join(5)
+
+        # Assert
+        self.assertEqual((in_flight_while_submitting, progress_renderer.in_flight), (1, 0))
+
+    def test_run_stops_on_the_error_of_a_stage_and_keeps_pending_items(self):
+        # Arrange
+        def submit(item: pipeline.PipelineItem):
+            if item.path == 'b':
+                raise KeyboardInterrupt()
+            item.finish('success')
+
+        reported_items = []
+        items_pipeline = pipeline.Pipeline([pipeline.Stage('submit', submit, workers=1)], reported_items.append)
+
+        # Act
+        with self.assertRaises(KeyboardInterrupt):
+            items_pipeline.run(pipeline.PipelineItem(path, '') for path in 'abc')
+
+        # Assert
+        self.assertEqual([item.path for item in reported_items], ['a'])
+        self.assertEqual(sorted(items_pipeline.pending_paths), ['b', 'c'])
+
+    def test_stage_may_replace_an_item_with_other_items(self):
+        # Arrange
+        def classify(item: pipeline.PipelineItem):
+            if item.path == 'archive.zip':
+                return (pipeline.PipelineItem(f'archive.zip!{name}', '') for name in ('a.exe', 'b.exe'))
+            return None
+
+        submitted_paths = []
+
+        def submit(item: pipeline.PipelineItem):
+            submitted_paths.append(item.path)
+            item.finish('success')
+
+        reported_items = []
+        items_pipeline = pipeline.Pipeline([pipeline.Stage('classify', classify), pipeline.Stage('submit', submit)],
+                                           reported_items.append,
+                                           queue_size=1)
+
+        # Act
+        items_pipeline.run(pipeline.PipelineItem(path, '') for path in ('archive.zip', 'c.exe'))
+
+        # Assert
+        self.assertEqual(sorted(submitted_paths), ['archive.zip!a.exe', 'archive.zip!b.exe', 'c.exe'])
+        self.assertEqual(sorted(item.path for item in reported_items), sorted(submitted_paths))
+        self.assertEqual(items_pipeline.pending_paths, {})
+
+    def test_stages_should_be_known_and_in_order(self):
+        # Act
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline([pipeline.Stage('submit', MagicMock()), pipeline.Stage('classify', MagicMock())],
+                              MagicMock())
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline([pipeline.Stage('report', MagicMock())], MagicMock())
+
+    def test_shard_filter_drops_files_of_other_shards_without_reporting_them(self):
+        # Arrange
+        shard = sharding.Shard(1, 2)
+        progress_renderer = MagicMock()
+        reported_items = []
+        items = [pipeline.PipelineItem(f'/files/{index}.exe', '/files') for index in range(20)]
+        in_shard_paths = [item.path for item in items if shard.contains(sharding.get_path_key(item.path, '/files'))]
+
+        # Act
+        pipeline.Pipeline([pipeline.shard_filter(progress_renderer, shard)], reported_items.append).run(items)
+
+        # Assert
+        self.assertEqual(sorted(item.path for item in reported_items), sorted(in_shard_paths))
+        self.assertEqual(progress_renderer.add_length.call_count, len(in_shard_paths))
+
+    def test_discover_walks_the_directory_tree(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory_path:
+            os.mkdir(os.path.join(directory_path, 'sub'))
+            for relative_path in ('a.exe', os.path.join('sub', 'b.exe')):
+                with open(os.path.join(directory_path, relative_path), 'wb') as file:
+                    file.write(b'MZ')
+
+            # Act
+            items = list(pipeline.discover(directory_path))
+
+        # Assert
+        self.assertEqual(sorted(os.path.relpath(item.path, directory_path) for item in items),
+                         ['a.exe', os.path.join('sub', 'b.exe')])
+
+    def test_discover_asks_once_about_large_directories_when_it_reaches_them(self):
+        # Arrange
+        progress_renderer = MagicMock()
+        with tempfile.TemporaryDirectory() as directory_path:
+            for sub_directory_name in ('sub1', 'sub2'):
+                os.mkdir(os.path.join(directory_path, sub_directory_name))
+                for file_name in ('a.exe', 'b.exe', 'c.exe'):
+                    with open(os.path.join(directory_path, sub_directory_name, file_name), 'wb') as file:
+                        file.write(b'MZ')
+
+            with patch('intezer_analyze_cli.utilities.check_should_continue_for_large_dir') as check_mock, \
+                    patch.object(pipeline.default_config, 'unusual_amount_in_dir', 2):
+                items = pipeline.discover(directory_path,
+                                          ignore_directory_count_limit=False,
+                                          progress_renderer=progress_renderer)
+
+                # Act
+                asked_before_the_walk = check_mock.called
+                items = list(items)
+
+            with patch('intezer_analyze_cli.utilities.check_should_continue_for_large_dir') as ignored_check_mock, \
+                    patch.object(pipeline.default_config, 'unusual_amount_in_dir', 2):
+                list(pipeline.discover(directory_path))
+
+        # Assert
+        self.assertFalse(asked_before_the_walk)
+        self.assertEqual(len(items), 6)
+        check_mock.assert_called_once_with(3, 2)
+        progress_renderer.paused.assert_called_once_with()
+        ignored_check_mock.assert_not_called()
+
+    def test_parse_stage_workers(self):
+        # Act
+        stage_workers = pipeline.parse_stage_workers('Submit=8')
+
+        # Assert
+        self.assertEqual(stage_workers, ('submit', 8))
+        for value in ('submit', 'submit=0', 'report=2', 'upload=4'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                pipeline.parse_stage_workers(value)
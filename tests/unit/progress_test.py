@@ -0,0 +1,129 @@
+import io
+import threading
+import unittest
+
+from intezer_analyze_cli.progress import ProgressRenderer
+
+
+class ProgressRendererSpec(unittest.TestCase):
+    def test_tty_redraw_is_throttled(self):
+        # Arrange
+        stream = io.StringIO()
+
+        # Act
+        with ProgressRenderer('Sending', length=10000, stream=stream, redraw_interval=60, is_tty=True) as renderer:
+            for _ in range(10000):
+                renderer.update(1)
+
+        # Assert
+        self.assertEqual(stream.getvalue().count('\r'), 1)
+        self.assertTrue(stream.getvalue().endswith('\n'))
+        self.assertIn('10000/10000 (100%)', stream.getvalue())
+
+    def test_line_shows_counts(self):
+        # Arrange
+        renderer = ProgressRenderer('Sending', length=4, stream=io.StringIO(), is_tty=True)
+
+        # Act
+        renderer.update(1, result='success', size=1024 * 1024)
+        renderer.update(1, result='failed')
+        renderer.update(1, result='unsupported')
+        renderer.set_retrying(2)
+        line = renderer.format_line()
+
+        # Assert
+        self.assertTrue(line.startswith('Sending  3/4 (75%)'))
+        for part in ('files/s', 'MB/s', 'ETA', 'in-flight 0', 'retrying 2', 'failed 1', 'skipped 1'):
+            self.assertIn(part, line)
+
+    def test_non_tty_writes_periodic_lines(self):
+        # Arrange
+        stream = io.StringIO()
+
+        # Act
+        with ProgressRenderer('Sending', stream=stream, log_interval=0.000001, is_tty=False) as renderer:
+            renderer.update(1)
+            renderer.update(1)
+
+        # Assert
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Sending')
+        self.assertTrue(lines[-1].startswith('Sending  2  '))
+        self.assertNotIn('\r', stream.getvalue())
+
+    def test_length_grows_and_phases_keep_failures(self):
+        # Arrange
+        renderer = ProgressRenderer('Hashing', length=0, stream=io.StringIO(), is_tty=True)
+
+        # Act
+        renderer.add_length(2)
+        renderer.add_length(3)
+        renderer.update(1, result='failed')
+        length_before_phase = renderer.length
+        renderer.start_phase('Sending', length=7)
+
+        # Assert
+        self.assertEqual(length_before_phase, 5)
+        self.assertEqual((renderer.label, renderer.length, renderer.position, renderer.failed), ('Sending', 7, 0, 1))
+
+    def test_track_in_flight(self):
+        # Arrange
+        renderer = ProgressRenderer('Sending', stream=io.StringIO(), is_tty=True)
+        started = threading.Event()
+        release = threading.Event()
+
+        def process():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=renderer.track_in_flight(process))
+
+        # Act
+        thread.start()
+        started.wait(5)
+        in_flight_while_processing = renderer.in_flight
+        release.set()
+        thread.join(5)
+
+        # Assert
+        self.assertEqual((in_flight_while_processing, renderer.in_flight), (1, 0))
+
+    def test_paused_clears_the_line_and_redraws_it_after(self):
+        # Arrange
+        stream = io.StringIO()
+        renderer = ProgressRenderer('Hashing', stream=stream, redraw_interval=60, is_tty=True)
+
+        # Act
+        with renderer:
+            renderer.start_phase('Sending', length=3)
+            renderer.update(1)
+            with renderer.paused():
+                output_when_paused = stream.getvalue()
+                renderer.update(1)
+                output_after_update = stream.getvalue()
+            output_after_resume = stream.getvalue()
+
+        # Assert
+        self.assertTrue(output_when_paused.endswith('\r'))
+        self.assertEqual(output_after_update, output_when_paused)
+        self.assertIn('2/3', output_after_resume[len(output_when_paused):])
+
+    def test_echo_writes_above_the_line_and_holds_messages_while_paused(self):
+        # Arrange
+        stream = io.StringIO()
+        renderer = ProgressRenderer('Sending', length=3, stream=stream, redraw_interval=60, is_tty=True)
+
+        # Act
+        with renderer:
+            renderer.start_phase('Sending', length=3)
+            renderer.echo('first message')
+            with renderer.paused():
+                renderer.echo('second message')
+                output_when_paused = stream.getvalue()
+
+        # Assert
+        lines = [line.strip() for line in stream.getvalue().split('\r') if line.strip()]
+        self.assertNotIn('second message', output_when_paused)
+        self.assertEqual(lines[1], 'first message')
+        self.assertTrue(lines[2].startswith('Sending'))
+        self.assertIn('second message', stream.getvalue()[len(output_when_paused):])
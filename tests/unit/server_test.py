@@ -0,0 +1,229 @@
+import http.client
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from intezer_sdk import errors as sdk_errors
+
+from intezer_analyze_cli import server
+
+
+class SubmissionServerSpec(unittest.TestCase):
+    def setUp(self):
+        super(SubmissionServerSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.file_path = os.path.join(temp_dir.name, 'file.exe')
+        with open(self.file_path, 'wb') as file:
+            file.write(b'MZ')
+
+        self.token_path = os.path.join(temp_dir.name, 'server-token')
+        self.server = server.create_server(None, 0, max_in_flight=1, token_path=self.token_path)
+        server_thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        server_thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _request(self, method: str, path: str, body: dict = None, headers: dict = None):
+        with open(self.token_path) as token_file:
+            request_headers = {'Authorization': f'Bearer {token_file.read()}', 'Content-Type': 'application/json'}
+        request_headers.update(headers or {})
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+        self.addCleanup(connection.close)
+        connection.request(method,
+                           path,
+                           body=json.dumps(body) if body is not None else None,
+                           headers={header: value for header, value in request_headers.items() if value is not None})
+        response = connection.getresponse()
+        return response, json.loads(response.read())
+
+    def test_submit_path_returns_analysis_id(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_file_for_analysis', return_value='analysis-id') as send_mock:
+            # Act
+            response, content = self._request('POST', '/analyze', {'path': self.file_path, 'no_unpacking': True})
+
+        # Assert
+        self.assertEqual(response.status, 200)
+        self.assertEqual(content, {'analysis_id': 'analysis-id'})
+        send_mock.assert_called_once_with(self.file_path,
+                                          disable_dynamic_unpacking=True,
+                                          disable_static_unpacking=None,
+                                          code_item_type=None)
+
+    def test_submit_hash_returns_analysis_id(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis', return_value='analysis-id') as send_mock:
+            # Act
+            response, content = self._request('POST', '/analyze', {'hash': 'a' * 64})
+
+        # Assert
+        self.assertEqual(response.status, 200)
+        self.assertEqual(content, {'analysis_id': 'analysis-id'})
+        send_mock.assert_called_once_with('a' * 64)
+
+    def test_submit_without_path_or_hash_is_rejected(self):
+        # Act
+        response, content = self._request('POST', '/analyze', {})
+
+        # Assert
+        self.assertEqual(response.status, 400)
+
+    def test_submit_missing_file_is_rejected(self):
+        # Act
+        response, content = self._request('POST', '/analyze', {'path': self.file_path + '.missing'})
+
+        # Assert
+        self.assertEqual(response.status, 404)
+
+    def test_submit_hash_that_does_not_exist(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis',
+                   side_effect=sdk_errors.HashDoesNotExistError(MagicMock())):
+            # Act
+            response, content = self._request('POST', '/analyze', {'hash': 'a' * 64})
+
+        # Assert
+        self.assertEqual(response.status, 404)
+        self.assertEqual(self.server.get_health()['failed'], 1)
+
+    def test_submit_when_busy_is_rejected_with_retry_after(self):
+        # Arrange
+        send_started = threading.Event()
+        release_send = threading.Event()
+
+        def send(file_hash):
+            send_started.set()
+            release_send.wait(5)
+            return 'analysis-id'
+
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis', side_effect=send):
+            first_submission = threading.Thread(target=self._request, args=('POST', '/analyze', {'hash': 'a' * 64}))
+            first_submission.start()
+            send_started.wait(5)
+
+            # Act
+            response, content = self._request('POST', '/analyze', {'hash': 'b' * 64})
+            release_send.set()
+            first_submission.join(5)
+
+        # Assert
+        self.assertEqual(response.status, 503)
+        self.assertIsNotNone(response.getheader('Retry-After'))
+        health = self.server.get_health()
+        self.assertEqual(health['rejected'], 1)
+        self.assertEqual(health['submitted'], 1)
+
+    def test_submit_without_the_token_is_rejected(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis') as send_mock:
+            # Act
+            missing_token_response, _ = self._request('POST', '/analyze', {'hash': 'a' * 64},
+                                                      headers={'Authorization': None})
+            wrong_token_response, _ = self._request('POST', '/analyze', {'hash': 'a' * 64},
+                                                    headers={'Authorization': 'Bearer wrong-token'})
+
+        # Assert
+        self.assertEqual(missing_token_response.status, 401)
+        self.assertEqual(wrong_token_response.status, 401)
+        send_mock.assert_not_called()
+        self.assertEqual(stat.S_IMODE(os.stat(self.token_path).st_mode), 0o600)
+
+    def test_submit_with_another_host_is_rejected(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis') as send_mock:
+            # Act
+            response, _ = self._request('POST', '/analyze', {'hash': 'a' * 64}, headers={'Host': 'attacker.example'})
+
+        # Assert
+        self.assertEqual(response.status, 403)
+        send_mock.assert_not_called()
+
+    def test_submit_that_is_not_json_is_rejected(self):
+        # Arrange
+        with patch('intezer_analyze_cli.commands.send_hash_for_analysis') as send_mock:
+            # Act
+            response, _ = self._request('POST', '/analyze', {'hash': 'a' * 64}, headers={'Content-Type': 'text/plain'})
+
+        # Assert
+        self.assertEqual(response.status, 415)
+        send_mock.assert_not_called()
+
+    def test_token_file_is_removed_when_the_server_closes(self):
+        # Act
+        self.server.shutdown()
+        self.server.server_close()
+
+        # Assert
+        self.assertFalse(os.path.exists(self.token_path))
+
+    def test_health(self):
+        # Act
+        response, content = self._request('GET', '/health')
+
+        # Assert
+        self.assertEqual(response.status, 200)
+        self.assertEqual(content['status'], 'ok')
+        self.assertEqual(content['max_in_flight'], 1)
+        self.assertEqual(content['in_flight'], 0)
+
+
+@unittest.skipUnless(server.UnixSubmissionServer, 'Unix sockets are not supported')
+class UnixSubmissionServerSpec(unittest.TestCase):
+    def test_serves_over_unix_socket(self):
+        # Arrange
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        socket_path = os.path.join(temp_dir.name, 'analyze.sock')
+        unix_server = server.create_server(socket_path, None)
+        threading.Thread(target=unix_server.serve_forever, args=(0.05,), daemon=True).start()
+
+        # Act
+        socket_mode = stat.S_IMODE(os.stat(socket_path).st_mode)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+            client.sendall(b'GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+            response = client.makefile('rb').read()
+        unix_server.shutdown()
+        unix_server.server_close()
+
+        # Assert
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        self.assertEqual(socket_mode, 0o600)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_socket_of_a_running_server_is_not_replaced(self):
+        # Arrange
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        socket_path = os.path.join(temp_dir.name, 'analyze.sock')
+        running_server = server.create_server(socket_path, None)
+        self.addCleanup(running_server.server_close)
+
+        # Act
+        with self.assertRaises(OSError):
+            server.create_server(socket_path, None)
+
+        # Assert
+        self.assertTrue(os.path.exists(socket_path))
+
+    def test_stale_socket_is_replaced(self):
+        # Arrange
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        socket_path = os.path.join(temp_dir.name, 'analyze.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale_socket:
+            stale_socket.bind(socket_path)
+
+        # Act
+        unix_server = server.create_server(socket_path, None)
+        unix_server.server_close()
+
+        # Assert
+        self.assertFalse(os.path.exists(socket_path))
@@ -0,0 +1,48 @@
+import unittest
+
+from intezer_analyze_cli import sharding
+
+
+class ShardSpec(unittest.TestCase):
+    def test_shards_partition_the_items(self):
+        # Arrange
+        keys = [f'directory/file_{i}.exe' for i in range(1000)]
+        shards = [sharding.Shard(index, 4) for index in range(1, 5)]
+
+        # Act
+        shards_keys = [{key for key in keys if shard.contains(key)} for shard in shards]
+
+        # Assert
+        self.assertEqual(sum(len(shard_keys) for shard_keys in shards_keys), len(keys))
+        self.assertEqual(set.union(*shards_keys), set(keys))
+        self.assertTrue(all(len(shard_keys) > 150 for shard_keys in shards_keys))
+
+    def test_parse(self):
+        # Act
+        shard = sharding.Shard.parse('2/4')
+
+        # Assert
+        self.assertEqual(shard, sharding.Shard(2, 4))
+        self.assertEqual(str(shard), '2/4')
+
+    def test_parse_invalid_shard(self):
+        for value in ('0/4', '5/4', '1/0', '1', 'a/b'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    sharding.Shard.parse(value)
+
+    def test_path_key_is_relative_to_root(self):
+        # Act
+        first_host_key = sharding.get_path_key('/mnt/share/directory/file.exe', '/mnt/share')
+        second_host_key = sharding.get_path_key('/data/share/directory/file.exe', '/data/share')
+
+        # Assert
+        self.assertEqual(first_host_key, 'directory/file.exe')
+        self.assertEqual(first_host_key, second_host_key)
+
+    def test_hash_key_ignores_case_and_padding(self):
+        # Act
+        hash_key = sharding.get_hash_key(' ' + 'AB' * 32 + '\r')
+
+        # Assert
+        self.assertEqual(hash_key, 'ab' * 32)
@@ -0,0 +1,133 @@
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+from intezer_analyze_cli import utilities
+
+
+class LogSpec(unittest.TestCase):
+    @staticmethod
+    def _create_exception_record(message: str) -> logging.LogRecord:
+        try:
+            raise ValueError('some error')
+        except ValueError:
+            return logging.LogRecord('intezer_cli', logging.ERROR, __file__, 10, message, None, sys.exc_info())
+
+    def test_duplicate_traceback_filter_suppresses_repeated_tracebacks(self):
+        # Arrange
+        log_filter = utilities.DuplicateTracebackFilter(interval=60)
+        first_record = self._create_exception_record('Failed to analyze file')
+        second_record = self._create_exception_record('Failed to analyze file')
+
+        # Act
+        first_result = log_filter.filter(first_record)
+        second_result = log_filter.filter(second_record)
+
+        # Assert
+        self.assertTrue(first_result)
+        self.assertTrue(second_result)
+        self.assertIsNotNone(first_record.exc_info)
+        self.assertIsNone(second_record.exc_info)
+        self.assertTrue(second_record.traceback_suppressed)
+
+    def test_duplicate_traceback_filter_logs_traceback_after_interval(self):
+        # Arrange
+        log_filter = utilities.DuplicateTracebackFilter(interval=0)
+        log_filter.filter(self._create_exception_record('Failed to analyze file'))
+        record = self._create_exception_record('Failed to analyze file')
+
+        # Act
+        log_filter.filter(record)
+
+        # Assert
+        self.assertIsNotNone(record.exc_info)
+        self.assertFalse(hasattr(record, 'suppressed_tracebacks'))
+
+    def test_json_formatter_includes_extra_fields_and_exception(self):
+        # Arrange
+        record = self._create_exception_record('Failed to analyze file')
+        record.file_path = '/tmp/file.exe'
+
+        # Act
+        entry = json.loads(utilities.JsonFormatter().format(record))
+
+        # Assert
+        self.assertEqual(entry['message'], 'Failed to analyze file')
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['file_path'], '/tmp/file.exe')
+        self.assertIn('ValueError: some error', entry['exception'])
+
+
+    def test_queue_handler_prepares_records_without_live_objects(self):
+        # Arrange
+        record = self._create_exception_record('Failed to analyze %s')
+        record.args = (object(),)
+
+        # Act
+        prepared_record = utilities._QueueHandler(None).prepare(record)
+
+        # Assert
+        self.assertIsNone(prepared_record.args)
+        self.assertIsNone(prepared_record.exc_info)
+        self.assertIn('ValueError: some error', prepared_record.exc_text)
+        self.assertTrue(prepared_record.msg.startswith('Failed to analyze <object object'))
+        self.assertIsNotNone(record.exc_info)
+
+    def test_init_log_again_replaces_the_queue_handler(self):
+        # Arrange
+        cli_logger = logging.getLogger('intezer_cli')
+        # Runs last, after the working directory is restored
+        self.addCleanup(utilities.init_log, 'intezer_cli')
+        self.addCleanup(os.chdir, os.getcwd())
+        with tempfile.TemporaryDirectory() as directory_path:
+            os.chdir(directory_path)
+
+            # Act
+            utilities.init_log('intezer_cli')
+            utilities.init_log('intezer_cli')
+            queue_handlers = [handler for handler in cli_logger.handlers
+                              if isinstance(handler, utilities._QueueHandler)]
+            utilities.stop_log()
+
+        # Assert
+        self.assertEqual(len(queue_handlers), 1)
+
+
+class ReadStreamItemsSpec(unittest.TestCase):
+    def test_reads_newline_separated_items(self):
+        # Arrange
+        stream = io.BytesIO(b'first\r\n\nsecond item\nthird')
+
+        # Act
+        items = list(utilities.read_stream_items(stream))
+
+        # Assert
+        self.assertEqual(items, ['first', 'second item', 'third'])
+
+    def test_reads_nul_separated_items(self):
+        # Arrange
+        stream = io.BytesIO(b'/files/first\0/files/second\nline\0')
+
+        # Act
+        items = list(utilities.read_stream_items(stream, chunk_size=4))
+
+        # Assert
+        self.assertEqual(items, ['/files/first', '/files/second\nline'])
+
+    def test_yields_items_before_stream_ends(self):
+        # Arrange
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, write_fd)
+        stream = os.fdopen(read_fd, 'rb')
+        self.addCleanup(stream.close)
+        os.write(write_fd, b'first\n')
+
+        # Act
+        first_item = next(utilities.read_stream_items(stream))
+
+        # Assert
+        self.assertEqual(first_item, 'first')
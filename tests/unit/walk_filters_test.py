@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from intezer_analyze_cli import walk_filters
+
+
+class WalkFiltersSpec(unittest.TestCase):
+    def setUp(self):
+        super(WalkFiltersSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory_path = temp_dir.name
+        for relative_path, size in (('a.exe', 10),
+                                    ('big.exe', 5000),
+                                    ('notes.log', 10),
+                                    ('.hidden.exe', 10),
+                                    ('lib/b.dll', 10),
+                                    ('node_modules/c.exe', 10),
+                                    ('cache/tmp/d.exe', 10)):
+            file_path = os.path.join(self.directory_path, relative_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as file:
+                file.write(b'MZ' * (size // 2))
+
+    def _walk_relative_paths(self, walk_filter: walk_filters.WalkFilter = None):
+        return sorted(os.path.relpath(os.path.join(root, file_name), self.directory_path).replace(os.sep, '/')
+                      for root, _, files in walk_filters.walk(self.directory_path, walk_filter)
+                      for file_name in files)
+
+    def test_walk_without_filter_skips_hidden_files(self):
+        # Act
+        relative_paths = self._walk_relative_paths()
+
+        # Assert
+        self.assertEqual(relative_paths,
+                         ['a.exe', 'big.exe', 'cache/tmp/d.exe', 'lib/b.dll', 'node_modules/c.exe', 'notes.log'])
+
+    def test_walk_applies_filters_without_opening_files(self):
+        # Arrange
+        walk_filter = walk_filters.WalkFilter(include=('*.exe', '.dll'),
+                                              prune=('node_modules', 'cache/*'),
+                                              max_size=walk_filters.parse_size('1K'))
+
+        # Act
+        with patch('builtins.open') as open_mock, patch('os.scandir', wraps=os.scandir) as scandir_mock:
+            relative_paths = self._walk_relative_paths(walk_filter)
+
+        # Assert
+        self.assertEqual(relative_paths, ['a.exe', 'lib/b.dll'])
+        open_mock.assert_not_called()
+        scanned_directories = {os.path.relpath(call.args[0], self.directory_path)
+                               for call in scandir_mock.call_args_list}
+        self.assertEqual(scanned_directories, {'.', 'lib', 'cache'})
+
+    def test_exclude_and_min_size(self):
+        # Arrange
+        walk_filter = walk_filters.WalkFilter(exclude=('*.log', 'lib/*'), min_size=100)
+
+        # Act
+        relative_paths = self._walk_relative_paths(walk_filter)
+
+        # Assert
+        self.assertEqual(relative_paths, ['big.exe'])
+
+    def test_accepts_path_matches_the_relative_path_and_size(self):
+        # Arrange
+        walk_filter = walk_filters.WalkFilter(exclude=('lib/*',), prune=('cache/*',), max_size=1024)
+
+        # Act + Assert
+        self.assertTrue(walk_filter.accepts_path(os.path.join(self.directory_path, 'a.exe'), self.directory_path))
+        self.assertFalse(walk_filter.accepts_path(os.path.join(self.directory_path, 'big.exe'), self.directory_path))
+        self.assertFalse(walk_filter.accepts_path(os.path.join(self.directory_path, 'lib', 'b.dll'),
+                                                  self.directory_path))
+        self.assertTrue(walk_filter.should_prune_path(os.path.join(self.directory_path, 'cache', 'tmp'),
+                                                      self.directory_path))
+
+    def test_parse_size(self):
+        # Act + Assert
+        self.assertEqual([walk_filters.parse_size(value) for value in ('4096', '512K', '2g', '1MB')],
+                         [4096, 512 * 1024, 2 * 1024 ** 3, 1024 ** 2])
+        with self.assertRaises(ValueError):
+            walk_filters.parse_size('2 gigabytes')
@@ -0,0 +1,151 @@
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from intezer_analyze_cli.walk_filters import WalkFilter
+from intezer_analyze_cli.watcher import DirectoryWatcher
+
+
+class DirectoryWatcherSpec(unittest.TestCase):
+    use_inotify = False
+
+    def setUp(self):
+        super(DirectoryWatcherSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory_path = temp_dir.name
+        self.existing_file_path = self._write_file('existing.exe')
+
+        self.watcher = DirectoryWatcher(self.directory_path,
+                                        settle_time=0.1,
+                                        poll_interval=0.05,
+                                        use_inotify=self.use_inotify,
+                                        walk_filter=WalkFilter(exclude=('*.log',), prune=('pruned',)))
+        self.new_files = queue.Queue()
+        self.watcher_ready = threading.Event()
+        self.watcher_thread = threading.Thread(target=self._watch, daemon=True)
+        self.watcher_thread.start()
+        self.watcher_ready.wait(5)
+        self.addCleanup(self.watcher_thread.join, 5)
+        self.addCleanup(self.watcher.stop)
+
+    def _watch(self):
+        batches = self.watcher.watch()
+        original_scan = self.watcher._scan
+
+        def scan(*args, **kwargs):
+            original_scan(*args, **kwargs)
+            self.watcher_ready.set()
+
+        self.watcher._scan = scan
+        for batch in batches:
+            for file_path in batch:
+                self.new_files.put(file_path)
+
+    def _write_file(self, *file_name: str) -> str:
+        file_path = os.path.join(self.directory_path, *file_name)
+        with open(file_path, 'wb') as file:
+            file.write(b'MZ')
+        return file_path
+
+    def test_yields_new_files_only(self):
+        # Act
+        new_file_path = self._write_file('new.exe')
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), new_file_path)
+        self.assertTrue(self.new_files.empty())
+
+    def test_yields_files_in_new_subdirectories(self):
+        # Act
+        os.mkdir(os.path.join(self.directory_path, 'subdirectory'))
+        new_file_path = self._write_file('subdirectory', 'new.exe')
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), new_file_path)
+
+    def test_ignores_hidden_files(self):
+        # Act
+        self._write_file('.hidden')
+        new_file_path = self._write_file('new.exe')
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), new_file_path)
+        self.watcher.stop()
+        self.watcher_thread.join(5)
+        self.assertTrue(self.new_files.empty())
+
+    def test_skips_files_and_directories_of_the_walk_filter(self):
+        # Act
+        os.mkdir(os.path.join(self.directory_path, 'pruned'))
+        self._write_file('pruned', 'new.exe')
+        self._write_file('new.log')
+        new_file_path = self._write_file('new.exe')
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), new_file_path)
+        time.sleep(0.3)
+        self.watcher.stop()
+        self.watcher_thread.join(5)
+        self.assertTrue(self.new_files.empty())
+
+    def test_yields_file_moved_into_directory(self):
+        # Arrange
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        outside_file_path = os.path.join(temp_dir.name, 'moved.exe')
+        with open(outside_file_path, 'wb') as file:
+            file.write(b'MZ')
+
+        # Act
+        moved_file_path = os.path.join(self.directory_path, 'moved.exe')
+        os.replace(outside_file_path, moved_file_path)
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), moved_file_path)
+
+    def test_yields_hard_linked_file_once_it_settles(self):
+        # Arrange
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        outside_file_path = os.path.join(temp_dir.name, 'linked.exe')
+        with open(outside_file_path, 'wb') as file:
+            file.write(b'MZ')
+
+        # Act
+        linked_file_path = os.path.join(self.directory_path, 'linked.exe')
+        os.link(outside_file_path, linked_file_path)
+
+        # Assert
+        self.assertEqual(self.new_files.get(timeout=5), linked_file_path)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is only available on Linux')
+class InotifyDirectoryWatcherSpec(DirectoryWatcherSpec):
+    use_inotify = True
+
+    def test_events_are_read_while_a_batch_is_sent(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory_path:
+            watcher = DirectoryWatcher(directory_path, settle_time=0.1, poll_interval=0.05, use_inotify=True)
+            batches = watcher.watch()
+            first_file_path = os.path.join(directory_path, 'first.exe')
+            threading.Timer(0.5, lambda: open(first_file_path, 'wb').close()).start()
+            next(batches)
+
+            # Act
+            with open(os.path.join(directory_path, 'second.exe'), 'wb') as file:
+                file.write(b'MZ')
+            for _ in range(50):
+                if not watcher._events.empty():
+                    break
+                time.sleep(0.1)
+            is_event_read = not watcher._events.empty()
+            batches.close()
+
+        # Assert
+        self.assertTrue(is_event_read)
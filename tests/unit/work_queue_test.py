@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+
+from intezer_analyze_cli.work_queue import WorkQueue
+
+
+class WorkQueueSpec(unittest.TestCase):
+    def setUp(self):
+        super(WorkQueueSpec, self).setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.queue_path = os.path.join(temp_dir.name, 'queue.sqlite')
+        self.queue = WorkQueue(self.queue_path, max_attempts=2)
+        self.addCleanup(self.queue.close)
+
+    def test_items_are_leased_once(self):
+        # Arrange
+        self.queue.enqueue('hash', ({'hash': str(i)} for i in range(3)), batch_size=2)
+        other_queue = WorkQueue(self.queue_path)
+        self.addCleanup(other_queue.close)
+
+        # Act
+        first_items = self.queue.lease('worker-1', limit=2, lease_duration=60)
+        second_items = other_queue.lease('worker-2', limit=2, lease_duration=60)
+
+        # Assert
+        self.assertEqual([item.name for item in first_items], ['0', '1'])
+        self.assertEqual([item.name for item in second_items], ['2'])
+        self.assertEqual(self.queue.count_by_status(), dict(pending=0, leased=3, done=0, failed=0))
+
+    def test_acked_items_are_done(self):
+        # Arrange
+        self.queue.enqueue('file', [{'path': '/a.exe'}])
+        item, = self.queue.lease('worker-1', limit=1, lease_duration=60)
+
+        # Act
+        acked = self.queue.ack(item, 'worker-1', {'analysis_id': 'id'})
+
+        # Assert
+        self.assertTrue(acked)
+        self.assertEqual(self.queue.count_by_status()['done'], 1)
+        self.assertFalse(self.queue.has_unfinished_items())
+
+    def test_expired_lease_is_reclaimed_by_another_worker(self):
+        # Arrange
+        self.queue.enqueue('file', [{'path': '/a.exe'}])
+        item, = self.queue.lease('dead-worker', limit=1, lease_duration=0.01)
+        time.sleep(0.02)
+
+        # Act
+        reclaimed_items = self.queue.lease('worker-2', limit=1, lease_duration=60)
+
+        # Assert
+        self.assertEqual([(i.item_id, i.attempts) for i in reclaimed_items], [(item.item_id, 2)])
+        self.assertFalse(self.queue.ack(item, 'dead-worker'))
+        self.assertTrue(self.queue.ack(reclaimed_items[0], 'worker-2'))
+
+    def test_extended_lease_is_not_reclaimed(self):
+        # Arrange
+        self.queue.enqueue('file', [{'path': '/a.exe'}])
+        items = self.queue.lease('worker-1', limit=1, lease_duration=0.05)
+
+        # Act
+        self.queue.extend_leases(items, 'worker-1', lease_duration=60)
+        time.sleep(0.06)
+
+        # Assert
+        self.assertEqual(self.queue.lease('worker-2', limit=1, lease_duration=60), [])
+
+    def test_item_fails_after_its_lease_expired_max_attempts_times(self):
+        # Arrange
+        self.queue.enqueue('file', [{'path': '/a.exe'}])
+        for _ in range(2):
+            self.queue.lease('dead-worker', limit=1, lease_duration=0.01)
+            time.sleep(0.02)
+
+        # Act
+        items = self.queue.lease('worker-2', limit=1, lease_duration=60)
+
+        # Assert
+        self.assertEqual(items, [])
+        self.assertEqual(self.queue.get_failed_items(), [('file', '/a.exe', 'The lease expired 2 times')])
+
+    def test_failed_item_is_retried_until_max_attempts(self):
+        # Arrange
+        self.queue.enqueue('hash', [{'hash': 'a'}])
+
+        # Act
+        item, = self.queue.lease('worker-1', limit=1, lease_duration=60)
+        first_status = self.queue.fail(item, 'worker-1', 'error', retry_delay=0)
+        item, = self.queue.lease('worker-1', limit=1, lease_duration=60)
+        second_status = self.queue.fail(item, 'worker-1', 'error', retry_delay=0)
+
+        # Assert
+        self.assertEqual((first_status, second_status), ('pending', 'failed'))
+        self.assertEqual(self.queue.get_failed_items(), [('hash', 'a', 'error')])
+
+    def test_released_item_is_not_leased_before_delay(self):
+        # Arrange
+        self.queue.enqueue('alert', [{'id': 'alert', 'environment': 'env'}])
+        item, = self.queue.lease('worker-1', limit=1, lease_duration=60)
+
+        # Act
+        self.queue.release(item, 'worker-1', delay=60)
+
+        # Assert
+        self.assertEqual(self.queue.lease('worker-1', limit=1, lease_duration=60), [])
+        self.assertEqual(self.queue.count_by_status()['pending'], 1)
+
+    def test_enqueue_unknown_kind_raises(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('unknown', [{}])